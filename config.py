@@ -179,6 +179,17 @@ HCAPTCHA_SITE_KEY = os.getenv("HCAPTCHA_SITE_KEY")  # Для frontend
 CAPTCHA_ENABLED = bool(HCAPTCHA_SECRET_KEY)  # Автоматически включается если есть секретный ключ
 CAPTCHA_FAILED_ATTEMPTS_THRESHOLD = int(os.getenv("CAPTCHA_FAILED_ATTEMPTS_THRESHOLD", "3"))
 
+# Хеширование паролей (bcrypt) в пуле процессов, см. utils/password_security.py
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # 0 - потоки вместо процессов
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))  # выполняются + ждут
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2.0"))  # макс. ожидание, сек
+
+# API ключи внешних сервисов, см. utils/api_keys.py
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", "300"))  # проверенный ключ в памяти, сек
+API_KEY_NEGATIVE_TTL = int(os.getenv("API_KEY_NEGATIVE_TTL", "30"))  # несуществующий ключ, сек
+API_KEY_USAGE_FLUSH_INTERVAL = float(os.getenv("API_KEY_USAGE_FLUSH_INTERVAL", "5"))  # запись использования, сек
+API_KEY_USAGE_MAX_BUFFER = int(os.getenv("API_KEY_USAGE_MAX_BUFFER", "5000"))  # строк ApiKeyUsage между записями
+
 # Администратор
 ADMIN_LOGIN = os.getenv("ADMIN_LOGIN")
 ADMIN_PASSWORD = None  # Используйте get_admin_password() вместо прямого доступа
@@ -231,6 +242,22 @@ CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "300"))  # 5 минут
 CACHE_DASHBOARD_TTL = int(os.getenv("CACHE_DASHBOARD_TTL", "60"))  # 1 минута
 CACHE_USER_DATA_TTL = int(os.getenv("CACHE_USER_DATA_TTL", "600"))  # 10 минут
 CACHE_STATIC_DATA_TTL = int(os.getenv("CACHE_STATIC_DATA_TTL", "1800"))  # 30 минут
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "120"))  # сколько отдавать устаревшее значение во время обновления
+CACHE_LOCK_LEASE = float(os.getenv("CACHE_LOCK_LEASE", "10"))  # аренда Redis-блокировки пересчета, сек
+# Near cache: локальная копия значений из Redis, сбрасывается сообщениями pub/sub
+NEAR_CACHE_MAX_TTL = int(os.getenv("NEAR_CACHE_MAX_TTL", "600"))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "600"))  # кэш администраторов, сбрасывается через pub/sub
+# Сериализация значений в Redis: zlib-сжатие значений от порога (байт)
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "4096"))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "1"))
+# Лимиты in-process кэша (LRU-вытеснение при превышении любого из них)
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "10000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 МБ
+MEMORY_CACHE_SWEEP_INTERVAL = float(os.getenv("MEMORY_CACHE_SWEEP_INTERVAL", "1.0"))  # шаг колеса TTL, сек
+# In-memory rate limiting (без Redis): жесткий предел отслеживаемых клиентов
+RATE_LIMIT_MEMORY_MAX_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", "100000"))
+RATE_LIMIT_MEMORY_SHARDS = int(os.getenv("RATE_LIMIT_MEMORY_SHARDS", "16"))
 
 # Логирование
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -238,6 +265,8 @@ ENVIRONMENT = os.getenv("ENVIRONMENT", "development").lower()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" или "json"
 LOG_TO_FILE = os.getenv("LOG_TO_FILE", "true").lower() == "true"
 LOGS_DIR = BASE_DIR / Path(os.getenv("LOGS_DIR", "logs"))
+# Очередь записей для фонового потока логирования: при переполнении записи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
 # Telegram логирование
 TELEGRAM_LOGGING_ENABLED = os.getenv("TELEGRAM_LOGGING_ENABLED", "false").lower() == "true"
@@ -1,17 +1,19 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, Union
 import jwt
 from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
 import threading
 import time
 import asyncio
 
-from config import get_secret_key_jwt, get_bot_token, ALGORITHM
+from config import get_secret_key_jwt, get_bot_token, ALGORITHM, ADMIN_CACHE_TTL
 from models.models import DatabaseManager, Admin, Permission, AdminRole
 from utils.logger import get_logger
 from utils.cache_manager import cache_manager
+from utils.token_revocation import token_revocation
+from utils.rate_limiter import init_rate_limiter
 from aiogram import Bot
 
 logger = get_logger(__name__)
@@ -103,28 +105,73 @@ class ThreadSafeCache:
 
 
 # Глобальный thread-safe кэш для администраторов
-_admin_cache = ThreadSafeCache(default_ttl=60)
+_admin_cache = ThreadSafeCache(default_ttl=ADMIN_CACHE_TTL)
+
+# Scope сообщений об инвалидации кэша администраторов между процессами
+ADMIN_CACHE_SCOPE = "admin"
+
+
+def _on_admin_cache_invalidation(keys: List[str], clear: bool) -> None:
+    """Инвалидация кэша администраторов, разосланная другим процессом"""
+    if clear:
+        _admin_cache.clear()
+        return
+    for key in keys:
+        _admin_cache.delete(key)
+
+
+cache_manager.add_invalidation_listener(ADMIN_CACHE_SCOPE, _on_admin_cache_invalidation)
+
+
+# Бит каждого разрешения в маске администратора. Маски живут только в
+# памяти процесса, поэтому порядок enum можно менять без миграций
+PERMISSION_BITS: Dict[Permission, int] = {
+    permission: 1 << index for index, permission in enumerate(Permission)
+}
+ALL_PERMISSIONS_MASK = (1 << len(PERMISSION_BITS)) - 1
+
+
+def permission_mask(permissions: Iterable[Union[Permission, str]]) -> int:
+    """Маска разрешений по enum или их строковым значениям (неизвестные пропускаются)"""
+    mask = 0
+    for permission in permissions:
+        try:
+            mask |= PERMISSION_BITS[Permission(permission)]
+        except ValueError:
+            logger.warning(f"Unknown permission in admin data: {permission}")
+    return mask
 
 
 class CachedAdmin:
-    """Класс для кешированных данных администратора"""
+    """
+    Класс для кешированных данных администратора.
+
+    Маска разрешений считается один раз при заполнении кэша, проверка
+    разрешения - одна операция AND.
+    """
 
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
+        role = getattr(self, "role", None)
+        self.is_super_admin = role in (AdminRole.SUPER_ADMIN, AdminRole.SUPER_ADMIN.value)
+        self.permission_mask = (
+            ALL_PERMISSIONS_MASK
+            if self.is_super_admin
+            else permission_mask(getattr(self, "permissions", None) or [])
+        )
 
     def has_permission(self, permission: Permission) -> bool:
         """Проверяет разрешение из кешированных данных"""
-        # Проверяем супер админа (учитываем как enum, так и string значения)
-        if (self.role == AdminRole.SUPER_ADMIN or 
-            (isinstance(self.role, str) and self.role == AdminRole.SUPER_ADMIN.value)):
-            return True
-        return hasattr(self, "permissions") and permission.value in self.permissions
+        return bool(self.permission_mask & PERMISSION_BITS[permission])
+
+    def has_permissions(self, required_mask: int) -> bool:
+        """Есть ли все разрешения маски"""
+        return self.permission_mask & required_mask == required_mask
 
     def get_permissions_list(self) -> list:
         """Возвращает список разрешений из кеша"""
-        if (self.role == AdminRole.SUPER_ADMIN or 
-            (isinstance(self.role, str) and self.role == AdminRole.SUPER_ADMIN.value)):
+        if self.is_super_admin:
             return [p.value for p in Permission]
         return getattr(self, "permissions", [])
 
@@ -187,7 +234,7 @@ class AdminCacheManager:
         return f"admin:{username}"
 
     @staticmethod
-    def get_admin_from_cache(username: str) -> Optional[Dict[str, Any]]:
+    def get_admin_from_cache(username: str) -> Optional[CachedAdmin]:
         """Безопасное получение администратора из кэша"""
         cache_key = AdminCacheManager.get_cache_key(username)
         cached_data = _admin_cache.get(cache_key)
@@ -201,11 +248,11 @@ class AdminCacheManager:
 
     @staticmethod
     def set_admin_cache(
-        username: str, admin_data: Dict[str, Any], ttl: int = 60
+        username: str, admin: CachedAdmin, ttl: int = ADMIN_CACHE_TTL
     ) -> None:
         """Безопасное сохранение администратора в кэш"""
         cache_key = AdminCacheManager.get_cache_key(username)
-        _admin_cache.set(cache_key, admin_data, ttl)
+        _admin_cache.set(cache_key, admin, ttl)
         logger.debug(f"Admin cached: {username}")
 
     @staticmethod
@@ -213,15 +260,68 @@ class AdminCacheManager:
         """Инвалидация кэша конкретного администратора"""
         cache_key = AdminCacheManager.get_cache_key(username)
         result = _admin_cache.delete(cache_key)
+        cache_manager.publish_invalidation_nowait(ADMIN_CACHE_SCOPE, keys=[cache_key])
         if result:
             logger.debug(f"Admin cache invalidated: {username}")
         return result
 
 
-def verify_token(
+def _load_admin_data(session, username: str) -> Optional[Dict[str, Any]]:
+    """Данные активного администратора для кэша (None, если не найден)"""
+    admin = (
+        session.query(Admin)
+        .filter(Admin.login == username, Admin.is_active == True)
+        .first()
+    )
+
+    if not admin:
+        return None
+
+    # Подготовка данных для кэша
+    admin_data = {
+        "id": admin.id,
+        "login": admin.login,
+        "role": admin.role,
+        "is_active": admin.is_active,
+        "created_at": admin.created_at,
+        "created_by": admin.created_by,
+    }
+
+    # Безопасная загрузка разрешений
+    try:
+        permissions = []
+        for ap in admin.permissions:
+            if ap.granted:
+                permissions.append(ap.permission.value)
+        admin_data["permissions"] = permissions
+    except Exception as e:
+        logger.warning(f"Could not load permissions for {username}: {e}")
+        admin_data["permissions"] = []
+
+    # Безопасная загрузка создателя
+    try:
+        creator_login = None
+        if admin.creator:
+            creator_login = admin.creator.login
+        admin_data["creator_login"] = creator_login
+    except Exception as e:
+        logger.warning(f"Could not load creator for {username}: {e}")
+        admin_data["creator_login"] = None
+
+    return admin_data
+
+
+async def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> CachedAdmin:
-    """Thread-safe проверка токена и получение админа"""
+    """
+    Проверка токена и получение админа.
+
+    Выполняется в event loop без обращений к БД и Redis: отзывы токенов
+    проверяются по памяти процесса (utils/token_revocation.py), данные
+    администратора берутся из кэша, сбрасываемого во всех процессах при
+    изменениях. БД читается только при промахе кэша.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -229,80 +329,9 @@ def verify_token(
     )
 
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, get_secret_key_jwt(), algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        jti: str = payload.get("jti")  # JWT ID для revocation
-
-        if username is None:
-            raise credentials_exception
-
-        # Проверка jti в blacklist (если токен был отозван)
-        if jti:
-            # Проверяем Redis blacklist (синхронный вызов)
-            blacklist_key = f"blacklist:jti:{jti}"
-            try:
-                import asyncio
-                loop = asyncio.get_event_loop()
-                is_blacklisted = loop.run_until_complete(cache_manager.get(blacklist_key))
-
-                if is_blacklisted:
-                    logger.warning(
-                        f"Attempt to use blacklisted token",
-                        extra={"jti": jti, "username": username}
-                    )
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Token has been revoked"
-                    )
-            except RuntimeError:
-                # Если event loop не доступен, пропускаем проверку blacklist
-                # (может произойти в некоторых edge cases)
-                logger.debug("Could not check token blacklist (no event loop)")
-
-        # Проверка глобального отзыва токенов для администратора
-        # (все токены выданные до определенного времени)
-        iat = payload.get("iat")  # Issued at timestamp
-        if iat:
-            try:
-                import asyncio
-                loop = asyncio.get_event_loop()
-
-                # Получаем admin_id из БД для проверки revocation
-                def _get_admin_id(session):
-                    admin = session.query(Admin).filter(Admin.login == username).first()
-                    return admin.id if admin else None
-
-                admin_id = DatabaseManager.safe_execute(_get_admin_id)
-
-                if admin_id:
-                    revoke_key = f"admin_revoked:{admin_id}"
-                    revoked_timestamp_str = loop.run_until_complete(cache_manager.get(revoke_key))
-
-                    if revoked_timestamp_str:
-                        revoked_timestamp = float(revoked_timestamp_str)
-                        # Если токен выдан до времени отзыва - отклоняем
-                        if iat < revoked_timestamp:
-                            logger.warning(
-                                f"Attempt to use revoked token (admin-wide revocation)",
-                                extra={
-                                    "username": username,
-                                    "admin_id": admin_id,
-                                    "token_iat": iat,
-                                    "revoked_at": revoked_timestamp
-                                }
-                            )
-                            raise HTTPException(
-                                status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail="All your tokens have been revoked. Please log in again."
-                            )
-            except RuntimeError:
-                # Event loop не доступен
-                pass
-            except Exception as e:
-                # Не блокируем авторизацию при ошибках проверки revocation
-                logger.error(f"Error checking admin revocation: {e}")
-
+        payload = jwt.decode(
+            credentials.credentials, get_secret_key_jwt(), algorithms=[ALGORITHM]
+        )
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
@@ -315,57 +344,38 @@ def verify_token(
         logger.error(f"Unexpected error in token validation: {e}")
         raise credentials_exception
 
-    # Безопасная проверка кэша
-    cached_admin_data = AdminCacheManager.get_admin_from_cache(username)
-    if cached_admin_data:
-        return CachedAdmin(**cached_admin_data)
-
-    # Загрузка из БД с кэшированием
-    def _get_admin_data(session):
-        admin = (
-            session.query(Admin)
-            .filter(Admin.login == username, Admin.is_active == True)
-            .first()
-        )
+    username: Optional[str] = payload.get("sub")
+    jti: Optional[str] = payload.get("jti")  # JWT ID для revocation
+    iat = payload.get("iat")  # Issued at timestamp
+    token_admin_id = payload.get("aid")  # Нет в токенах, выданных до появления claim
 
-        if not admin:
-            return None
-
-        # Подготовка данных для кэша
-        admin_data = {
-            "id": admin.id,
-            "login": admin.login,
-            "role": admin.role,
-            "is_active": admin.is_active,
-            "created_at": admin.created_at,
-            "created_by": admin.created_by,
-        }
+    if username is None:
+        raise credentials_exception
 
-        # Безопасная загрузка разрешений
-        try:
-            permissions = []
-            for ap in admin.permissions:
-                if ap.granted:
-                    permissions.append(ap.permission.value)
-            admin_data["permissions"] = permissions
-        except Exception as e:
-            logger.warning(f"Could not load permissions for {username}: {e}")
-            admin_data["permissions"] = []
+    # Проверка jti в blacklist (токен отозван через logout)
+    if jti and token_revocation.is_token_revoked(jti):
+        logger.warning(
+            f"Attempt to use blacklisted token",
+            extra={"jti": jti, "username": username}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
+        )
 
-        # Безопасная загрузка создателя
+    # Безопасная проверка кэша
+    admin = AdminCacheManager.get_admin_from_cache(username)
+    if admin is None:
         try:
-            creator_login = None
-            if admin.creator:
-                creator_login = admin.creator.login
-            admin_data["creator_login"] = creator_login
+            admin_data = await DatabaseManager.run(
+                lambda session: _load_admin_data(session, username)
+            )
         except Exception as e:
-            logger.warning(f"Could not load creator for {username}: {e}")
-            admin_data["creator_login"] = None
-
-        return admin_data
-
-    try:
-        admin_data = DatabaseManager.safe_execute(_get_admin_data)
+            logger.error(f"Database error in verify_token for user {username}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Database error during authentication",
+            )
 
         if not admin_data:
             raise HTTPException(
@@ -373,57 +383,66 @@ def verify_token(
                 detail="Admin not found or inactive",
             )
 
-        # Кэшируем на 60 секунд
-        AdminCacheManager.set_admin_cache(username, admin_data, ttl=60)
+        # Изменения администраторов сбрасывают кэш во всех процессах,
+        # поэтому TTL может быть долгим
+        admin = CachedAdmin(**admin_data)
+        AdminCacheManager.set_admin_cache(username, admin, ttl=ADMIN_CACHE_TTL)
 
-        return CachedAdmin(**admin_data)
+    # Токен выдан другому администратору с тем же логином (учетная запись пересоздана)
+    if token_admin_id is not None and token_admin_id != admin.id:
+        raise credentials_exception
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Database error in verify_token for user {username}: {e}")
+    # Проверка глобального отзыва токенов для администратора
+    # (все токены выданные до определенного времени)
+    if iat and token_revocation.is_admin_revoked(admin.id, iat):
+        logger.warning(
+            f"Attempt to use revoked token (admin-wide revocation)",
+            extra={
+                "username": username,
+                "admin_id": admin.id,
+                "token_iat": iat,
+            }
+        )
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Database error during authentication",
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="All your tokens have been revoked. Please log in again."
         )
 
+    return admin
+
 
 def verify_token_with_permissions(required_permissions: List[Permission]):
     """Декоратор для проверки разрешений с thread-safe кэшем"""
+    required_mask = permission_mask(required_permissions)
 
-    def permission_checker(
+    async def permission_checker(
         current_admin: CachedAdmin = Depends(verify_token),
     ) -> CachedAdmin:
-
-        # Супер админ имеет все права
-        if (current_admin.role == AdminRole.SUPER_ADMIN or 
-            (isinstance(current_admin.role, str) and current_admin.role == AdminRole.SUPER_ADMIN.value)):
+        # Супер админ имеет все права (его маска содержит все биты)
+        if current_admin.has_permissions(required_mask):
             return current_admin
 
-        # Проверяем каждое требуемое разрешение
-        admin_permissions = getattr(current_admin, "permissions", [])
-
-        for permission in required_permissions:
-            if permission.value not in admin_permissions:
-                logger.warning(
-                    f"Admin {current_admin.login} tried to access {permission.value} without permission"
-                )
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Insufficient permissions. Required: {permission.value}",
-                )
-
-        return current_admin
+        missing = next(
+            permission
+            for permission in required_permissions
+            if not current_admin.has_permission(permission)
+        )
+        logger.warning(
+            f"Admin {current_admin.login} tried to access {missing.value} without permission"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Insufficient permissions. Required: {missing.value}",
+        )
 
     return permission_checker
 
 
-def require_super_admin(
+async def require_super_admin(
     current_admin: CachedAdmin = Depends(verify_token),
 ) -> CachedAdmin:
     """Проверка, что пользователь - супер админ"""
-    if not (current_admin.role == AdminRole.SUPER_ADMIN or 
-            (isinstance(current_admin.role, str) and current_admin.role == AdminRole.SUPER_ADMIN.value)):
+    if not current_admin.is_super_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Super admin access required"
         )
@@ -467,8 +486,9 @@ async def close_bot():
 
 
 def clear_admin_cache():
-    """Thread-safe очистка кэша администраторов"""
+    """Thread-safe очистка кэша администраторов (во всех процессах)"""
     _admin_cache.clear()
+    cache_manager.publish_invalidation_nowait(ADMIN_CACHE_SCOPE, clear=True)
     logger.debug("Admin cache cleared")
 
 
@@ -546,6 +566,13 @@ async def init_cache_manager():
     try:
         await cache_manager.initialize()
         logger.info("Cache manager initialized successfully")
+        # Отозванные токены из Redis - до первого запроса
+        await token_revocation.load()
+        # Баны IP проверяются по копии в памяти - тоже до первого запроса
+        from utils.ip_ban_manager import get_ip_ban_manager
+        await get_ip_ban_manager().load_snapshot()
+        # Rate limiting общий для процессов через тот же Redis (если доступен)
+        init_rate_limiter(cache_manager.redis_client)
     except Exception as e:
         logger.error(f"Failed to initialize cache manager: {e}")
 
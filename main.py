@@ -27,6 +27,9 @@ from config import (
 )
 from dependencies import init_bot, close_bot, start_cache_cleanup, stop_cache_cleanup
 from models.models import cleanup_database
+from utils.db_write_queue import db_write_queue
+from utils.password_security import password_hasher
+from utils.api_keys import api_key_usage
 from utils.logger import get_logger, log_startup_info
 from utils.database_maintenance import start_maintenance_tasks
 from utils.backup_manager import start_backup_scheduler, stop_backup_scheduler
@@ -187,6 +190,12 @@ async def lifespan(app: FastAPI):
         logger.error(f"Ошибка при выполнении миграций БД: {e}")
         # Не критично, продолжаем работу
 
+    # Запускаем поток-писатель для group commit
+    try:
+        db_write_queue.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска очереди записи БД: {e}")
+
     # Создаем админа
     try:
         create_admin(ADMIN_LOGIN, ADMIN_PASSWORD)
@@ -331,6 +340,23 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Ошибка остановки планировщика бэкапов: {e}")
 
+    try:
+        password_hasher.shutdown()
+    except Exception as e:
+        logger.error(f"Ошибка остановки пула хеширования паролей: {e}")
+
+    # Использование API ключей пишется через очередь записи - до ее остановки
+    try:
+        await api_key_usage.close()
+    except Exception as e:
+        logger.error(f"Ошибка записи использования API ключей: {e}")
+
+    # Дописываем оставшиеся в очереди операции до закрытия пула
+    try:
+        db_write_queue.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки очереди записи БД: {e}")
+
     try:
         await cleanup_database()
         logger.info("Connection pool очищен")
@@ -355,27 +381,12 @@ app = FastAPI(
     redoc_url="/redoc" if DEBUG else None,  # Только в debug режиме
 )
 
-# Подключение middleware
-from utils.middleware import (
-    RateLimitMiddleware,
-    RequestLoggingMiddleware,
-    SecurityHeadersMiddleware,
-    PerformanceMiddleware,
-    OriginValidationMiddleware,
-    IPBanMiddleware,
-)
-
-# Порядок middleware важен - добавляем в обратном порядке выполнения
-app.add_middleware(PerformanceMiddleware, enabled=True)
-app.add_middleware(SecurityHeadersMiddleware, enabled=True)
-app.add_middleware(RequestLoggingMiddleware, enabled=True)
-app.add_middleware(RateLimitMiddleware, enabled=True)
-
-# IP Ban middleware - проверяет забаненные IP перед обработкой запроса
-app.add_middleware(IPBanMiddleware, enabled=True)
+# Подключение middleware: проверки и обработка запросов - один pure-ASGI
+# конвейер (Origin -> IP ban -> rate limit -> логирование -> security
+# headers -> замер времени), см. utils/middleware.default_stages
+from utils.middleware import RequestPipelineMiddleware
 
-# Origin Validation middleware - проверяет Origin/Referer для state-changing запросов
-app.add_middleware(OriginValidationMiddleware, enabled=True)
+app.add_middleware(RequestPipelineMiddleware)
 
 # Настройка CORS (должен быть после других middleware)
 app.add_middleware(
@@ -391,6 +402,7 @@ app.add_middleware(
         "X-Requested-With",
         "X-Request-ID",  # Для трассировки запросов
     ],
+    expose_headers=["X-Next-Cursor"],  # Курсор следующей страницы (keyset пагинация)
 )
 
 
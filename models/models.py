@@ -1,12 +1,14 @@
 import enum
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from sqlite3 import IntegrityError
 from typing import Optional, List
 import threading
 import time
 import os
-import signal
-import platform
 from pathlib import Path
 from contextlib import contextmanager
 
@@ -47,6 +49,9 @@ from werkzeug.security import check_password_hash
 from utils.password_security import hash_password_bcrypt
 
 from utils.logger import get_logger
+from utils.search_index import ensure_search_index
+from utils.dashboard_rollups import ensure_rollups
+from utils.cache_versions import register_session_hooks
 
 logger = get_logger(__name__)
 
@@ -66,17 +71,46 @@ class QueryTimeoutError(Exception):
     pass
 
 
-def _timeout_handler(signum, frame):
-    """Signal handler for query timeout (Unix/Linux only)."""
-    raise QueryTimeoutError("Database query exceeded timeout limit")
+# Бюджеты времени на операцию (секунды) для разных типов вызовов.
+# Дедлайн проверяется progress handler'ом SQLite, поэтому работает в любом потоке.
+QUERY_TIMEOUT_FAST = float(os.getenv("DB_QUERY_TIMEOUT_FAST", "3"))  # Запросы бота, точечные lookup'ы
+QUERY_TIMEOUT_DEFAULT = float(os.getenv("DB_QUERY_TIMEOUT_DEFAULT", "30"))  # Обычные запросы API
+QUERY_TIMEOUT_EXPORT = float(os.getenv("DB_QUERY_TIMEOUT_EXPORT", "300"))  # Экспорты и отчеты
+# Через сколько инструкций VM SQLite проверять дедлайн
+QUERY_PROGRESS_HANDLER_OPS = int(os.getenv("DB_QUERY_PROGRESS_HANDLER_OPS", "10000"))
 
 
-# Check if signal-based timeout is supported (Unix/Linux only)
-TIMEOUT_SUPPORTED = platform.system() != "Windows" and hasattr(signal, 'SIGALRM')
+class QueryDeadline:
+    """Дедлайн для всех запросов одной сессии через sqlite3 progress handler"""
 
-if not TIMEOUT_SUPPORTED:
-    logger = None  # Will be set later
-    # Logger will warn about this limitation when first used
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.expired = False
+
+    def _check(self) -> int:
+        # Ненулевой результат прерывает текущий запрос (OperationalError: interrupted)
+        if time.monotonic() > self.deadline:
+            self.expired = True
+            return 1
+        return 0
+
+    @contextmanager
+    def bind(self, session: SQLSession):
+        """Привязывает дедлайн к соединению сессии на время выполнения"""
+        if not self.deadline:
+            yield self
+            return
+
+        dbapi_connection = session.connection().connection.dbapi_connection
+        dbapi_connection.set_progress_handler(self._check, QUERY_PROGRESS_HANDLER_OPS)
+        try:
+            yield self
+        finally:
+            try:
+                dbapi_connection.set_progress_handler(None, QUERY_PROGRESS_HANDLER_OPS)
+            except Exception as e:
+                logger.warning(f"Could not reset progress handler: {e}")
 
 
 # Настройки connection pool - оптимизированы для production
@@ -86,6 +120,17 @@ POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "45"))  # Увеличено с
 POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Уменьшено до 30 минут
 POOL_PRE_PING = True  # Проверка соединений перед использованием
 
+# Отдельный пул только для чтения (аналитика, отчеты, статистика БД)
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "5"))
+READ_CACHE_SIZE = int(os.getenv("DB_READ_CACHE_SIZE", "20000"))  # Страниц кеша на соединение
+
+# Размер executor'а для DatabaseManager.run: не больше, чем соединений в пулах,
+# иначе потоки будут ждать соединение вместо того, чтобы ждать в очереди executor'а
+DB_EXECUTOR_WORKERS = int(
+    os.getenv("DB_EXECUTOR_WORKERS", str(POOL_SIZE + READ_POOL_SIZE))
+)
+
 # Улучшенная конфигурация SQLite с optimized connection pooling
 engine = create_engine(
     f"sqlite:///{DB_DIR}/coworking.db",
@@ -114,24 +159,113 @@ SessionLocal = sessionmaker(
 # Scoped session для thread-safe работы
 Session = scoped_session(SessionLocal)
 
+# Коммиты любых сессий увеличивают версии измененных таблиц для кэша
+register_session_hooks()
+
+
+# Движок только для чтения: тяжелые агрегаты дашборда и отчетов не занимают
+# соединения основного пула. В WAL читатели не блокируют писателя, а
+# PRAGMA query_only гарантирует, что через этот пул ничего не запишется.
+def create_read_engine(url: str) -> Engine:
+    """Создает движок с отдельным пулом соединений только для чтения"""
+    reader = create_engine(
+        url,
+        echo=False,
+        pool_pre_ping=POOL_PRE_PING,
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        poolclass=QueuePool,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": 60,
+        },
+    )
+
+    @event.listens_for(reader, "connect")
+    def _set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")  # Любая запись завершится ошибкой
+        cursor.execute(f"PRAGMA cache_size={READ_CACHE_SIZE}")  # Больше кеша под агрегаты
+        cursor.close()
+
+    return reader
+
+
+read_engine = create_read_engine(f"sqlite:///{DB_DIR}/coworking.db")
+
+ReadSessionLocal = sessionmaker(
+    bind=read_engine,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+# Отдельный движок для единственного потока-писателя (utils/db_write_queue.py).
+# Транзакцию открываем явно через BEGIN IMMEDIATE, чтобы SAVEPOINT'ы внутри
+# group commit работали корректно (pysqlite сам по себе их ломает).
+def create_writer_engine(url: str) -> Engine:
+    """Создает движок с одним соединением для потока-писателя"""
+    writer = create_engine(
+        url,
+        echo=False,
+        pool_pre_ping=POOL_PRE_PING,
+        pool_size=1,  # Писатель всегда один
+        max_overflow=0,
+        pool_recycle=POOL_RECYCLE,
+        poolclass=QueuePool,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": 60,
+        },
+    )
+
+    @event.listens_for(writer, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        # Отключаем неявные BEGIN драйвера pysqlite
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer, "begin")
+    def _begin_immediate(conn):
+        # Сразу берем блокировку на запись
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return writer
+
+
+writer_engine = create_writer_engine(f"sqlite:///{DB_DIR}/coworking.db")
+
+# Каждая операция в группе работает в своем SAVEPOINT внешней транзакции:
+# session.commit() внутри операции освобождает SAVEPOINT, а не коммитит группу
+WriterSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    join_transaction_mode="create_savepoint",
+)
+
 
 class ConnectionPoolMonitor:
     """Мониторинг состояния connection pool"""
 
     @staticmethod
-    def get_pool_status() -> dict:
-        """Получение статистики пула соединений"""
+    def get_pool_status(read_only: bool = False) -> dict:
+        """Получение статистики пула соединений (основного или пула чтения)"""
+        pool_size = READ_POOL_SIZE if read_only else POOL_SIZE
+        max_overflow = READ_MAX_OVERFLOW if read_only else MAX_OVERFLOW
         try:
-            pool = engine.pool
+            pool = read_engine.pool if read_only else engine.pool
 
             # Безопасное получение статистики с проверкой доступности методов
-            stats = {"pool_timeout": POOL_TIMEOUT, "max_overflow": MAX_OVERFLOW}
+            stats = {"pool_timeout": POOL_TIMEOUT, "max_overflow": max_overflow}
 
             # Основные метрики, доступные в большинстве версий
             if hasattr(pool, "size"):
                 stats["pool_size"] = pool.size()
             else:
-                stats["pool_size"] = POOL_SIZE
+                stats["pool_size"] = pool_size
 
             if hasattr(pool, "checkedin"):
                 stats["checked_in"] = pool.checkedin()
@@ -166,15 +300,15 @@ class ConnectionPoolMonitor:
         except Exception as e:
             logger.warning(f"Error getting pool status: {e}")
             return {
-                "pool_size": POOL_SIZE,
+                "pool_size": pool_size,
                 "checked_in": 0,
                 "checked_out": 0,
                 "overflow": 0,
                 "invalid": 0,
                 "total_connections": 0,
-                "available_connections": POOL_SIZE,
+                "available_connections": pool_size,
                 "pool_timeout": POOL_TIMEOUT,
-                "max_overflow": MAX_OVERFLOW,
+                "max_overflow": max_overflow,
                 "error": str(e),
             }
 
@@ -248,6 +382,9 @@ class DatabaseManager:
     _lock = threading.RLock()
     _initialization_done = False
     _last_pool_log = time.time()
+    _executor: Optional[ThreadPoolExecutor] = None
+    _timeout_count = 0
+    _timeouts_by_function: dict = {}
 
     @classmethod
     def get_session(cls) -> SQLSession:
@@ -292,7 +429,59 @@ class DatabaseManager:
                     logger.warning(f"Ошибка закрытия сессии: {e}")
 
     @classmethod
-    def safe_execute(cls, func, max_retries=3, retry_delay=0.1, timeout=30):
+    @contextmanager
+    def read_session(cls):
+        """
+        Context manager для сессии из пула только для чтения.
+
+        Для аналитики и отчетов: соединения с PRAGMA query_only не конкурируют
+        с основным пулом, который обслуживает запись.
+        """
+        session = ReadSessionLocal()
+        try:
+            yield session
+        finally:
+            try:
+                # Завершаем читающую транзакцию, чтобы не удерживать снапшот WAL
+                session.rollback()
+                session.close()
+            except Exception as e:
+                logger.warning(f"Ошибка закрытия сессии чтения: {e}")
+
+    @classmethod
+    def _func_name(cls, func) -> str:
+        return getattr(func, "__name__", "lambda")
+
+    @classmethod
+    def _record_timeout(cls, func):
+        name = cls._func_name(func)
+        with cls._lock:
+            cls._timeout_count += 1
+            cls._timeouts_by_function[name] = cls._timeouts_by_function.get(name, 0) + 1
+
+    @classmethod
+    def get_timeout_stats(cls) -> dict:
+        """Статистика запросов, прерванных по дедлайну"""
+        with cls._lock:
+            return {
+                "total": cls._timeout_count,
+                "by_function": dict(cls._timeouts_by_function),
+                "budgets": {
+                    "fast": QUERY_TIMEOUT_FAST,
+                    "default": QUERY_TIMEOUT_DEFAULT,
+                    "export": QUERY_TIMEOUT_EXPORT,
+                },
+            }
+
+    @classmethod
+    def safe_execute(
+        cls,
+        func,
+        max_retries=3,
+        retry_delay=0.1,
+        timeout=QUERY_TIMEOUT_DEFAULT,
+        read_only=False,
+    ):
         """
         Безопасное выполнение операций с retry, connection pooling и timeout (P-CRIT-4).
 
@@ -300,70 +489,64 @@ class DatabaseManager:
             func: Функция для выполнения, принимающая session
             max_retries: Максимальное количество повторных попыток
             retry_delay: Задержка между попытками в секундах
-            timeout: Таймаут выполнения запроса в секундах (по умолчанию 30s)
-                    Note: Timeout работает только на Unix/Linux, игнорируется на Windows
+            timeout: Бюджет времени на выполнение в секундах (None - без ограничения).
+                    Проверяется progress handler'ом SQLite, поэтому работает в любом
+                    потоке, включая executor БД (см. QUERY_TIMEOUT_FAST/DEFAULT/EXPORT)
+            read_only: Выполнить через read_session() (пул только для чтения)
 
         Returns:
             Результат выполнения функции
 
         Raises:
-            QueryTimeoutError: Если запрос превысил timeout (только Unix/Linux)
+            QueryTimeoutError: Если запрос превысил timeout
             Various SQLAlchemy exceptions: При других ошибках БД
         """
         last_exception = None
 
-        # Warn once about Windows limitation
-        if not TIMEOUT_SUPPORTED and timeout is not None:
-            logger.warning(
-                "Query timeout is not supported on Windows platform. "
-                "Timeout parameter will be ignored."
-            )
-
         for attempt in range(max_retries):
             start_time = time.time()
+            deadline = QueryDeadline(timeout)
 
-            # P-CRIT-4: Check if we're in main thread before using signal (signal only works in main thread!)
-            can_use_timeout = (
-                TIMEOUT_SUPPORTED and
-                timeout and
-                threading.current_thread() == threading.main_thread()
+            session_context = (
+                cls.read_session() if read_only else cls.get_session_context()
             )
 
             try:
-                # Set timeout alarm (Unix/Linux + main thread only)
-                if can_use_timeout:
-                    old_handler = signal.signal(signal.SIGALRM, _timeout_handler)
-                    signal.alarm(timeout)
-
-                try:
-                    with cls.get_session_context() as session:
+                with session_context as session:
+                    with deadline.bind(session):
                         result = func(session)
-                        session.commit()
-
-                        # Log slow queries (P-CRIT-4: slow query monitoring)
-                        execution_time = time.time() - start_time
-                        if execution_time > 1.0:  # Log queries > 1 second
-                            logger.warning(
-                                f"Slow query detected: {execution_time:.2f}s "
-                                f"(function: {func.__name__ if hasattr(func, '__name__') else 'lambda'})"
-                            )
-
-                        return result
-                finally:
-                    # Cancel timeout alarm
-                    if can_use_timeout:
-                        signal.alarm(0)
-                        signal.signal(signal.SIGALRM, old_handler)
-
-            except QueryTimeoutError as e:
+                        # Функция могла перехватить прерванный запрос сама
+                        if deadline.expired:
+                            raise QueryTimeoutError(f"Query exceeded {timeout}s")
+                        if not read_only:
+                            session.commit()
+
+                    # Log slow queries (P-CRIT-4: slow query monitoring)
+                    execution_time = time.time() - start_time
+                    if execution_time > 1.0:  # Log queries > 1 second
+                        logger.warning(
+                            f"Slow query detected: {execution_time:.2f}s "
+                            f"(function: {cls._func_name(func)})"
+                        )
+
+                    return result
+
+            except QueryTimeoutError:
                 # Query timeout - don't retry, fail immediately
-                logger.error(f"Query timeout after {timeout}s: {func.__name__ if hasattr(func, '__name__') else 'lambda'}")
+                cls._record_timeout(func)
+                logger.error(f"Query timeout after {timeout}s: {cls._func_name(func)}")
                 raise
 
             except (OperationalError, DisconnectionError) as e:
                 last_exception = e
                 error_msg = str(e).lower()
 
+                # Запрос прерван progress handler'ом по дедлайну - без повторов
+                if deadline.expired:
+                    cls._record_timeout(func)
+                    logger.error(f"Query timeout after {timeout}s: {cls._func_name(func)}")
+                    raise QueryTimeoutError(f"Query exceeded {timeout}s") from e
+
                 # Специальная обработка ошибок SQLite
                 if "database is locked" in error_msg:
                     logger.warning(
@@ -398,6 +581,46 @@ class DatabaseManager:
         else:
             raise RuntimeError("All retry attempts failed")
 
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """Ленивая инициализация ограниченного executor'а для операций с БД"""
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=DB_EXECUTOR_WORKERS,
+                        thread_name_prefix="db-worker",
+                    )
+        return cls._executor
+
+    @classmethod
+    async def run(cls, func, **kwargs):
+        """
+        Асинхронный аналог safe_execute: выполняет func(session) в executor'е БД,
+        не блокируя event loop.
+
+        Путь миграции для существующих замыканий - заменить вызов внутри
+        async-обработчика:
+            result = DatabaseManager.safe_execute(_db_query)
+        на
+            result = await DatabaseManager.run(_db_query)
+
+        Args:
+            func: Функция для выполнения, принимающая session
+            **kwargs: Параметры safe_execute (max_retries, retry_delay, timeout, read_only).
+                timeout - бюджет запроса, например QUERY_TIMEOUT_FAST для бота
+                или QUERY_TIMEOUT_EXPORT для экспортов; read_only=True - для
+                аналитики, выполняется в пуле только для чтения
+
+        Returns:
+            Результат выполнения функции
+        """
+        loop = asyncio.get_running_loop()
+        # Переносим contextvars (request_id и т.п.) в поток executor'а
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, cls.safe_execute, func, **kwargs)
+        return await loop.run_in_executor(cls.get_executor(), call)
+
     @classmethod
     def ensure_initialized(cls):
         """Обеспечение инициализации БД с connection pooling"""
@@ -412,6 +635,22 @@ class DatabaseManager:
                 # Создаем таблицы если их нет
                 Base.metadata.create_all(bind=engine)
 
+                # FTS5-индексы для поиска в админке (utils/search_index.py)
+                try:
+                    with cls.get_session_context() as session:
+                        if ensure_search_index(session):
+                            session.commit()
+                except Exception as e:
+                    logger.warning(f"Search index setup failed, search will use LIKE: {e}")
+
+                # Дневные агрегаты для дашборда (utils/dashboard_rollups.py)
+                try:
+                    with cls.get_session_context() as session:
+                        ensure_rollups(session)
+                        session.commit()
+                except Exception as e:
+                    logger.error(f"Dashboard rollups setup failed: {e}")
+
                 # Простая проверка что база доступна
                 try:
                     with cls.get_session_context() as session:
@@ -439,8 +678,15 @@ class DatabaseManager:
             # Закрываем все scoped sessions
             Session.remove()
 
+            # Останавливаем executor, дожидаясь завершения начатых операций
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=True)
+                cls._executor = None
+
             # Принудительно очищаем пул
             engine.dispose()
+            read_engine.dispose()
+            writer_engine.dispose()
 
             logger.info("Database connections cleaned up")
 
@@ -764,6 +1010,11 @@ class User(Base):
         passive_deletes=True,
     )
 
+    __table_args__ = (
+        # Индекс по выражению: фильтры по дате появления пользователя
+        Index('idx_users_joined_at', text('COALESCE(reg_date, first_join_time)')),
+    )
+
     def __repr__(self) -> str:
         return f"<User {self.telegram_id} - {self.full_name}>"
 
@@ -1071,6 +1322,8 @@ class Booking(Base):
         Index('idx_bookings_user_paid', 'user_id', 'paid'),
         Index('idx_bookings_date_status', 'visit_date', 'confirmed', 'paid'),
         Index('idx_bookings_user_date', 'user_id', 'visit_date'),
+        # Индекс по выражению: выборки и группировки по дню создания
+        Index('idx_bookings_created_day', text('date(created_at)')),
     )
 
 
@@ -1196,6 +1449,10 @@ class Ticket(Base):
     user = relationship("User", back_populates="tickets")
     notifications = relationship("Notification", back_populates="ticket")
 
+    __table_args__ = (
+        Index('idx_tickets_created_day', text('date(created_at)')),
+    )
+
     def __repr__(self) -> str:
         return f"<Ticket(id={self.id}, user_id={self.user_id}, status={self.status})>"
 
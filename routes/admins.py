@@ -1,9 +1,10 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
-from werkzeug.security import check_password_hash
-from utils.password_security import hash_password_bcrypt
-from utils.cache_manager import cache_manager
+from utils.password_security import password_hasher
+from utils.token_revocation import token_revocation
 
 from dependencies import (
     get_db,
@@ -11,6 +12,7 @@ from dependencies import (
     verify_token_with_permissions,
     require_super_admin,
     clear_admin_cache,
+    invalidate_admin_cache,
     CachedAdmin,
 )
 from models.models import Admin, AdminPermission, AdminRole, Permission
@@ -115,7 +117,7 @@ async def create_admin(
             )
 
         # Создаем нового админа с bcrypt хешированием
-        hashed_password = hash_password_bcrypt(admin_data.password, rounds=12)
+        hashed_password = await password_hasher.hash(admin_data.password, rounds=12)
 
         new_admin = Admin(
             login=admin_data.login,
@@ -141,8 +143,8 @@ async def create_admin(
         db.commit()
         db.refresh(new_admin)
 
-        # Очищаем кеш после создания
-        clear_admin_cache()
+        # Логин мог принадлежать удаленному администратору - сбрасываем его запись
+        invalidate_admin_cache(new_admin.login)
 
         logger.info(
             f"Создан новый администратор {admin_data.login} пользователем {current_admin.login}"
@@ -247,6 +249,8 @@ async def update_admin(
                 detail="Нельзя редактировать главного администратора",
             )
 
+        previous_login = admin.login
+
         # Проверяем уникальность логина
         if admin_data.login and admin_data.login != admin.login:
             existing = db.query(Admin).filter(Admin.login == admin_data.login).first()
@@ -259,7 +263,7 @@ async def update_admin(
 
         # Обновляем пароль с bcrypt хешированием
         if admin_data.password:
-            admin.password = hash_password_bcrypt(admin_data.password, rounds=12)
+            admin.password = await password_hasher.hash(admin_data.password, rounds=12)
 
         # Обновляем статус
         if admin_data.is_active is not None:
@@ -285,8 +289,12 @@ async def update_admin(
         db.commit()
         db.refresh(admin)
 
-        # Очищаем кеш после обновления
-        clear_admin_cache()
+        # Смена логина меняет creator_login у созданных им администраторов -
+        # сбрасываем весь кэш, иначе только запись этого администратора
+        if admin.login != previous_login:
+            clear_admin_cache()
+        else:
+            invalidate_admin_cache(admin.login)
 
         logger.info(
             f"Обновлен администратор {admin.login} пользователем {current_admin.login}"
@@ -399,21 +407,21 @@ async def change_password(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Administrator not found"
             )
 
-        # Проверяем текущий пароль
-        if not check_password_hash(
+        # Проверяем текущий пароль (bcrypt и старые pbkdf2 хеши)
+        current_valid, _, _ = await password_hasher.verify_with_upgrade(
             admin_in_db.password, password_data.current_password
-        ):
+        )
+        if not current_valid:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Неверный текущий пароль",
             )
 
         # Устанавливаем новый пароль с bcrypt хешированием
-        admin_in_db.password = hash_password_bcrypt(password_data.new_password, rounds=12)
+        admin_in_db.password = await password_hasher.hash(password_data.new_password, rounds=12)
         db.commit()
 
-        # Очищаем кеш после смены пароля
-        clear_admin_cache()
+        # Пароль в кэше администраторов не хранится - сбрасывать нечего
 
         logger.info(f"Администратор {current_admin.login} сменил пароль")
 
@@ -478,8 +486,8 @@ async def revoke_admin_tokens(
     """
     Отзыв всех токенов конкретного администратора (только для SUPER_ADMIN).
 
-    Устанавливает timestamp в Redis, все токены выданные до этого времени
-    станут недействительными. Используется при компрометации учетной записи.
+    Сохраняет время отзыва (Redis и память всех процессов), все токены,
+    выданные до этого времени, станут недействительными. Используется при компрометации учетной записи.
 
     Args:
         admin_id: ID администратора, чьи токены нужно отозвать
@@ -496,20 +504,10 @@ async def revoke_admin_tokens(
                 detail="Администратор не найден",
             )
 
-        # Устанавливаем timestamp отзыва всех токенов
-        from datetime import datetime, timedelta
-        revocation_timestamp = datetime.utcnow().timestamp()
+        # Отзываем все токены, выданные до текущего момента (во всех процессах)
+        revocation_timestamp = await token_revocation.revoke_admin(admin_id)
 
-        # Сохраняем в Redis с TTL 7 дней (макс. время жизни refresh token)
-        revoke_key = f"admin_revoked:{admin_id}"
-        await cache_manager.set(
-            key=revoke_key,
-            value=str(revocation_timestamp),
-            ttl=7 * 24 * 60 * 60  # 7 дней
-        )
-
-        # Очищаем кэш администратора
-        clear_admin_cache()
+        # Данные администратора не изменились: отзыв проверяется по token_revocation
 
         logger.warning(
             f"All tokens revoked for admin",
@@ -525,7 +523,7 @@ async def revoke_admin_tokens(
             "message": f"All tokens for admin '{admin.login}' have been revoked",
             "admin_id": admin_id,
             "admin_login": admin.login,
-            "revoked_at": datetime.utcnow().isoformat()
+            "revoked_at": datetime.utcfromtimestamp(revocation_timestamp).isoformat()
         }
 
     except HTTPException:
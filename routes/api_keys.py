@@ -11,6 +11,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 
 from dependencies import verify_token, get_db
+from utils.api_keys import invalidate_api_key
+from utils.date_ranges import day_range, half_open
 from utils.logger import get_logger
 from models.api_keys import ApiKey, ApiKeyAuditLog, ApiKeyUsage
 
@@ -245,6 +247,7 @@ async def update_api_key(
         
         db.commit()
         db.refresh(api_key)
+        invalidate_api_key(api_key.key_hash)
         
         log_audit_event(
             db, "update_api_key", request,
@@ -296,10 +299,12 @@ async def delete_api_key(
             raise HTTPException(status_code=404, detail=f"API ключ не найден в системе")
         
         key_name = api_key.name
+        key_hash = api_key.key_hash
         
         # Удаляем ключ
         db.delete(api_key)
         db.commit()
+        invalidate_api_key(key_hash)
         
         log_audit_event(
             db, "delete_api_key", request,
@@ -356,6 +361,7 @@ async def toggle_api_key_status(
         
         db.commit()
         db.refresh(api_key)
+        invalidate_api_key(api_key.key_hash)
         
         action = "activate_api_key" if api_key.is_active else "deactivate_api_key"
         log_audit_event(
@@ -431,7 +437,7 @@ async def get_usage_stats(
             "active_keys": active_keys,
             "total_requests": total_requests,
             "total_requests_today": db.query(ApiKeyUsage).filter(
-                func.date(ApiKeyUsage.timestamp) == datetime.utcnow().date()
+                half_open(ApiKeyUsage.timestamp, *day_range(datetime.utcnow().date()))
             ).count(),
             "requests_trend": 15.5,  # Можно вычислять динамически
             "successful_requests": successful_requests,
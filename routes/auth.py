@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 import jwt
 import secrets
 from werkzeug.security import check_password_hash
-from utils.password_security import verify_password_with_upgrade
+from utils.password_security import password_hasher
 
 from models.models import Admin, RefreshToken, DatabaseManager
 from config import (
@@ -26,7 +26,7 @@ from dependencies import get_db, verify_token
 from utils.logger import get_logger
 from utils.rate_limiter import get_rate_limiter
 from utils.captcha import get_captcha_validator, get_login_tracker
-from utils.cache_manager import cache_manager
+from utils.token_revocation import token_revocation
 
 logger = get_logger(__name__)
 
@@ -63,6 +63,7 @@ def create_access_token(data: dict):
 
     Включает стандартные JWT claims:
     - sub: subject (username)
+    - aid: ID администратора (передается в data, для проверки отзыва без БД)
     - exp: expiration time
     - iat: issued at time
     - jti: JWT ID (unique identifier для revocation)
@@ -199,8 +200,9 @@ async def login_auth(credentials: AdminCredentials, request: Request, db: Sessio
     new_hash = None
 
     if admin:
-        # Используем функцию с поддержкой upgrade
-        password_valid, needs_upgrade, new_hash = verify_password_with_upgrade(
+        # bcrypt выполняется в пуле процессов; при переполненной очереди
+        # запрос сразу отклоняется с 503 (PasswordHasherBusy)
+        password_valid, needs_upgrade, new_hash = await password_hasher.verify_with_upgrade(
             admin.password,
             credentials.password
         )
@@ -250,7 +252,7 @@ async def login_auth(credentials: AdminCredentials, request: Request, db: Sessio
     login_tracker.reset_attempts(credentials.login)
 
     # 6. Создаем access и refresh токены
-    access_token = create_access_token(data={"sub": admin.login})
+    access_token = create_access_token(data={"sub": admin.login, "aid": admin.id})
     refresh_token = create_refresh_token(admin.id, db)
 
     logger.info(f"Успешная аутентификация пользователя: {admin.login}")
@@ -295,7 +297,7 @@ async def refresh_access_token(request_data: RefreshTokenRequest, db: Session =
             raise HTTPException(status_code=401, detail="Admin not found")
 
         # Создаем новый access токен
-        new_access_token = create_access_token(data={"sub": admin.login})
+        new_access_token = create_access_token(data={"sub": admin.login, "aid": admin.id})
 
         # Создаем новый refresh токен (ротация токенов)
         new_refresh_token = create_refresh_token(admin.id, db)
@@ -350,13 +352,8 @@ async def logout(
         now = datetime.utcnow().timestamp()
         ttl = max(int(exp - now), 60)  # Минимум 60 секунд
 
-        # Добавляем jti в blacklist с TTL
-        blacklist_key = f"blacklist:jti:{jti}"
-        await cache_manager.set(
-            key=blacklist_key,
-            value="revoked",
-            ttl=ttl
-        )
+        # Добавляем jti в blacklist до истечения токена (во всех процессах)
+        await token_revocation.revoke_token(jti, now + ttl)
 
         logger.info(
             f"Token revoked via logout",
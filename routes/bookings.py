@@ -6,7 +6,7 @@ import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import text, or_, func
+from sqlalchemy import text, or_, func, false
 
 from models.models import (
     Booking,
@@ -42,6 +42,14 @@ from utils.helpers import format_phone_for_rubitime
 from utils.cache_manager import cache_manager
 from utils.sql_optimization import SQLOptimizer
 from utils.cache_invalidation import cache_invalidator
+from utils.db_write_queue import db_write_queue
+from utils.search_index import is_search_available, search_subquery
+from utils.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    paginate_keyset,
+    paginate_offset,
+)
 from utils.notifications import send_booking_update_notification
 from utils.task_manager import revoke_booking_tasks, bulk_revoke_booking_tasks
 # from utils.bot_instance import get_bot_instance
@@ -60,27 +68,41 @@ async def get_bookings_detailed(
     date_query: Optional[str] = None,
     status_filter: Optional[str] = None,
     tariff_filter: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо page)"),
+    include_total: Optional[bool] = Query(None, description="Считать total_count (по умолчанию только без cursor)"),
     _: CachedAdmin = Depends(verify_token_with_permissions([Permission.VIEW_BOOKINGS])),
 ):
-    """Получение бронирований с данными тарифов и пользователей (оптимизированная версия)."""
+    """
+    Получение бронирований с данными тарифов и пользователей (оптимизированная версия).
+
+    Поддерживает два режима: page (OFFSET, как раньше) и cursor (keyset по
+    created_at, id) - стоимость страницы не зависит от глубины. next_cursor
+    возвращается в обоих режимах.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor, 2)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=f"Некорректный курсор пагинации: {e}")
+
+    with_total = include_total if include_total is not None else cursor is None
 
     def _get_bookings(session):
         try:
+            # Ленивое форматирование: при выключенном INFO строки не собираются
             logger.info(
-                f"Запрос бронирований: page={page}, per_page={per_page}, "
-                f"user_query='{user_query}', date_query='{date_query}', status_filter='{status_filter}', tariff_filter='{tariff_filter}'"
+                "Запрос бронирований: page=%s, per_page=%s, "
+                "user_query='%s', date_query='%s', status_filter='%s', tariff_filter='%s'",
+                page, per_page, user_query, date_query, status_filter, tariff_filter
             )
             
             # Логируем обработку поискового запроса
             if user_query and user_query.strip():
                 query_stripped = user_query.strip()
                 if query_stripped.isdigit():
-                    logger.info(f"Поиск по ID бронирования: {query_stripped}")
+                    logger.info("Поиск по ID бронирования: %s", query_stripped)
                 else:
-                    query_lower = query_stripped.lower()
-                    query_upper = query_stripped.upper()
-                    query_title = query_stripped.capitalize()
-                    logger.info(f"Текстовый поиск - оригинал: '{query_stripped}', нижний: '{query_lower}', верхний: '{query_upper}', заглавный: '{query_title}'")
+                    logger.info("Текстовый поиск: '%s'", query_stripped)
 
             # Построение ORM query с eager loading (исправлен P-HIGH-3: миграция raw SQL на ORM)
             query = session.query(Booking).options(
@@ -94,6 +116,20 @@ async def get_bookings_detailed(
                 if query_stripped.isdigit():
                     # Поиск по ID бронирования
                     query = query.filter(Booking.id == int(query_stripped))
+                elif is_search_available(session):
+                    # Поиск по FTS-индексу пользователей и тарифов (utils/search_index.py):
+                    # подзапросы, SQLite соединяет их сам, совпадения не ограничены
+                    user_match = search_subquery("users", query_stripped)
+                    tariff_match = search_subquery("tariffs", query_stripped)
+                    if user_match is None:
+                        query = query.filter(false())
+                    else:
+                        query = query.filter(
+                            or_(
+                                Booking.user_id.in_(user_match),
+                                Booking.tariff_id.in_(tariff_match),
+                            )
+                        )
                 else:
                     # Поиск по имени пользователя или названию тарифа (регистронезависимо)
                     # func.lower() работает с кириллицей в SQLite
@@ -140,11 +176,18 @@ async def get_bookings_detailed(
                     logger.warning(f"Invalid tariff_filter format: {tariff_filter}")
                     # Игнорируем некорректный фильтр
 
-            # Подсчет общего количества записей
-            total_count = query.count()
+            # Подсчет общего количества записей (в cursor-режиме - только по запросу)
+            total_count = query.count() if with_total else None
 
             # Применение сортировки и пагинации
-            bookings = query.order_by(Booking.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+            if cursor:
+                bookings, next_cursor = paginate_keyset(
+                    query, (Booking.created_at, Booking.id), cursor, per_page
+                )
+            else:
+                bookings, next_cursor = paginate_offset(
+                    query, (Booking.created_at, Booking.id), (page - 1) * per_page, per_page
+                )
 
             # Формирование ответа (упрощено благодаря ORM)
             enriched_bookings = []
@@ -183,14 +226,17 @@ async def get_bookings_detailed(
                 }
                 enriched_bookings.append(booking_item)
 
-            total_pages = (total_count + per_page - 1) // per_page
-
             return {
                 "bookings": enriched_bookings,
-                "total_count": int(total_count),
+                "total_count": int(total_count) if total_count is not None else None,
                 "page": int(page),
                 "per_page": int(per_page),
-                "total_pages": int(total_pages),
+                "total_pages": (
+                    int((total_count + per_page - 1) // per_page)
+                    if total_count is not None
+                    else None
+                ),
+                "next_cursor": next_cursor,
             }
 
         except Exception as e:
@@ -198,7 +244,7 @@ async def get_bookings_detailed(
             raise
 
     try:
-        return DatabaseManager.safe_execute(_get_bookings)
+        return await DatabaseManager.run(_get_bookings)
     except HTTPException:
         raise
     except Exception as e:
@@ -214,17 +260,21 @@ async def get_booking_stats(
 
     cache_key = cache_manager.get_cache_key("bookings", "stats")
     
-    def _get_stats():
+    async def _get_stats():
         def _db_query(session):
             return SQLOptimizer.get_optimized_bookings_stats(session)
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query)
 
     try:
-        # Используем кэш с TTL для дашборда
+        # Используем кэш с TTL для дашборда; тег dashboard - чтобы статистика
+        # сбрасывалась вместе с дашбордом
         return await cache_manager.get_or_set(
             cache_key, 
             _get_stats, 
-            ttl=cache_manager.dashboard_ttl
+            ttl=cache_manager.dashboard_ttl,
+            tags=["bookings", "dashboard"],
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=["bookings"]
         )
     except Exception as e:
         logger.error(f"Ошибка при получении статистики бронирований: {e}")
@@ -393,7 +443,7 @@ async def create_booking_admin(
         return booking_dict
 
     try:
-        result = DatabaseManager.safe_execute(_create_booking)
+        result = await db_write_queue.submit(_create_booking)
 
         # Создание записи в Rubitime при подтверждении
         if booking_data.confirmed:
@@ -413,7 +463,7 @@ async def create_booking_admin(
                         promocode = session.query(Promocode).filter(Promocode.id == booking_data.promocode_id).first()
                     return user, tariff, promocode
 
-                user, tariff, promocode = DatabaseManager.safe_execute(_get_rubitime_data)
+                user, tariff, promocode = await DatabaseManager.run(_get_rubitime_data)
 
                 logger.info(f"[ADMIN BOOKING] User: {user.id if user else None}, Tariff: {tariff.id if tariff else None}, service_id: {tariff.service_id if tariff else None}")
 
@@ -494,7 +544,7 @@ async def create_booking_admin(
                                     booking.rubitime_id = str(rubitime_id)
                                     session.commit()
 
-                            DatabaseManager.safe_execute(_update_rubitime_id)
+                            await DatabaseManager.run(_update_rubitime_id)
 
                             # Обновляем result dict для возврата
                             result["rubitime_id"] = str(rubitime_id)
@@ -533,7 +583,7 @@ async def create_booking_admin(
                         tariff = session.query(Tariff).filter(Tariff.id == booking_data.tariff_id).first()
                         return user, tariff
 
-                    user, tariff = DatabaseManager.safe_execute(_get_user_and_tariff)
+                    user, tariff = await DatabaseManager.run(_get_user_and_tariff)
 
                     logger.info(f"[ADMIN BOOKING] User for notification: {user.id if user else None}, telegram_id: {user.telegram_id if user else None}")
                     logger.info(f"[ADMIN BOOKING] Tariff for notification: {tariff.id if tariff else None}")
@@ -634,7 +684,7 @@ async def create_booking_admin(
                         tariff = session.query(Tariff).filter(Tariff.id == booking_data.tariff_id).first()
                         return user, tariff
 
-                    user, tariff = DatabaseManager.safe_execute(_get_user_and_tariff_for_payment)
+                    user, tariff = await DatabaseManager.run(_get_user_and_tariff_for_payment)
 
                     if user and tariff:
                         # Форматирование даты
@@ -662,6 +712,9 @@ async def create_booking_admin(
 
         # Инвалидируем связанные кэши после успешного создания
         await cache_invalidator.invalidate_booking_related_cache()
+        if result["paid"]:
+            # Изменился счетчик successful_bookings пользователя
+            await cache_invalidator.invalidate_user_related_cache(result["user_id"])
 
         # Планируем отложенное уведомление о завершении бронирования
         # Проверяем тип тарифа
@@ -670,7 +723,7 @@ async def create_booking_admin(
             return tariff.name if tariff else ""
 
         try:
-            tariff_name = DatabaseManager.safe_execute(_get_tariff_name).lower()
+            tariff_name = (await DatabaseManager.run(_get_tariff_name)).lower()
             is_daily_tariff = 'тестовый день' in tariff_name or 'опенспейс на день' in tariff_name
             is_monthly_tariff = 'месяц' in tariff_name
 
@@ -738,7 +791,7 @@ async def create_booking_admin(
 
                         return task_result.id
 
-                    DatabaseManager.safe_execute(_create_expiration_task_daily)
+                    await DatabaseManager.run(_create_expiration_task_daily)
             elif result.get("visit_time") and result.get("duration") and not is_excluded_from_timer:
                 # Почасовые тарифы - уведомление по окончании времени
                 visit_datetime_naive = datetime.combine(
@@ -802,7 +855,7 @@ async def create_booking_admin(
 
                     return task_result.id
 
-                DatabaseManager.safe_execute(_create_expiration_task_hourly)
+                await DatabaseManager.run(_create_expiration_task_hourly)
             elif is_excluded_from_timer:
                 logger.info(f"ℹ️ [ADMIN] Бронирование #{result['id']} ({tariff_name}) - уведомление об окончании времени отключено.")
         except Exception as e:
@@ -864,7 +917,7 @@ async def create_booking_admin(
 
                         return task_result.id
 
-                    DatabaseManager.safe_execute(_create_reminder_task)
+                    await DatabaseManager.run(_create_reminder_task)
                 else:
                     logger.warning(
                         f"⚠️  [ADMIN] Дата напоминания уже прошла для бронирования #{result['id']}, напоминание не запланировано"
@@ -1009,9 +1062,12 @@ async def create_booking(booking_data: BookingCreate):
         return booking_dict
 
     try:
-        result = DatabaseManager.safe_execute(_create_booking)
+        result = await db_write_queue.submit(_create_booking)
         # Инвалидируем связанные кэши после успешного создания
         await cache_invalidator.invalidate_booking_related_cache()
+        if result["paid"]:
+            # Изменился счетчик successful_bookings пользователя
+            await cache_invalidator.invalidate_user_related_cache(result["user_id"])
 
         # Планируем отложенное уведомление о завершении бронирования
         # Проверяем тип тарифа
@@ -1020,7 +1076,7 @@ async def create_booking(booking_data: BookingCreate):
             return tariff.name if tariff else ""
 
         try:
-            tariff_name = DatabaseManager.safe_execute(_get_tariff_name).lower()
+            tariff_name = (await DatabaseManager.run(_get_tariff_name)).lower()
             is_daily_tariff = 'тестовый день' in tariff_name or 'опенспейс на день' in tariff_name
             is_monthly_tariff = 'месяц' in tariff_name
 
@@ -1062,7 +1118,7 @@ async def create_booking(booking_data: BookingCreate):
                         session.commit()
                         logger.info(f"[BOT] Saved expiration task ID {task_result.id} for booking #{result['id']}")
 
-                DatabaseManager.safe_execute(_save_expiration_task_id_daily_bot)
+                await DatabaseManager.run(_save_expiration_task_id_daily_bot)
             elif result.get("visit_time") and result.get("duration") and not is_excluded_from_timer:
                 # Почасовые тарифы - уведомление по окончании времени
                 visit_datetime_naive = datetime.combine(
@@ -1100,7 +1156,7 @@ async def create_booking(booking_data: BookingCreate):
                         session.commit()
                         logger.info(f"[BOT] Saved expiration task ID {task_result.id} for booking #{result['id']}")
 
-                DatabaseManager.safe_execute(_save_expiration_task_id_hourly_bot)
+                await DatabaseManager.run(_save_expiration_task_id_hourly_bot)
             elif is_excluded_from_timer:
                 logger.info(f"ℹ️ [BOT] Бронирование #{result['id']} ({tariff_name}) - уведомление об окончании времени отключено.")
         except Exception as e:
@@ -2431,7 +2487,7 @@ async def update_booking_full(
 
             return booking, tariff, old_values, old_reminder_task_id
 
-        updated_booking, tariff, old_values, old_reminder_task_id = DatabaseManager.safe_execute(_update)
+        updated_booking, tariff, old_values, old_reminder_task_id = await DatabaseManager.run(_update)
 
         # Проверяем изменение reminder_days и управляем задачей напоминания
         reminder_changed = "reminder_days" in update_data and old_values["reminder_days"] != updated_booking.reminder_days
@@ -2462,7 +2518,7 @@ async def update_booking_full(
 
                         session.commit()
 
-                    DatabaseManager.safe_execute(_cancel_old_reminder_task)
+                    await DatabaseManager.run(_cancel_old_reminder_task)
 
                 except Exception as e:
                     logger.error(f"Error revoking old reminder task: {e}")
@@ -2526,7 +2582,7 @@ async def update_booking_full(
 
                                 return task_result.id
 
-                            DatabaseManager.safe_execute(_create_new_reminder_task)
+                            await DatabaseManager.run(_create_new_reminder_task)
                         else:
                             logger.warning(f"Reminder date already passed for booking #{booking_id}, not scheduling")
                 except Exception as e:
@@ -78,7 +78,7 @@ async def invalidate_dashboard_cache(_: str = Depends(verify_token)):
     """
     try:
         # Очищаем все ключи связанные с дашбордом
-        deleted_count = await cache_manager.clear_pattern("dashboard:*")
+        deleted_count = await cache_manager.invalidate_tags(["dashboard"])
         
         logger.info(f"Dashboard cache invalidated: {deleted_count} keys deleted")
         
@@ -173,7 +173,7 @@ async def get_celery_tasks(
 
             return booking_tasks_info
 
-        booking_tasks = DatabaseManager.safe_execute(_get_booking_tasks)
+        booking_tasks = await DatabaseManager.run(_get_booking_tasks)
 
         # Создаем мапу task_id -> booking_info для быстрого поиска
         task_to_booking = {task['task_id']: task for task in booking_tasks}
@@ -363,7 +363,7 @@ async def revoke_task_endpoint(
             return None
 
         try:
-            booking_id = DatabaseManager.safe_execute(_clear_task_id_in_booking)
+            booking_id = await DatabaseManager.run(_clear_task_id_in_booking)
             if booking_id:
                 logger.info(f"Cleared task_id from booking #{booking_id}")
         except Exception as e:
@@ -433,7 +433,7 @@ async def get_task_info(
                 }
             return None
 
-        booking_info = DatabaseManager.safe_execute(_get_booking_for_task)
+        booking_info = await DatabaseManager.run(_get_booking_for_task)
 
         # Проверяем, связана ли задача с офисом
         def _get_office_for_task(session):
@@ -465,7 +465,7 @@ async def get_task_info(
                 }
             return None
 
-        office_info = DatabaseManager.safe_execute(_get_office_for_task)
+        office_info = await DatabaseManager.run(_get_office_for_task)
 
         result = {
             'task_id': task_id,
@@ -610,7 +610,7 @@ async def revoke_all_tasks(
             session.commit()
             return cleared_count
 
-        cleared_bookings = DatabaseManager.safe_execute(_clear_all_task_ids)
+        cleared_bookings = await DatabaseManager.run(_clear_all_task_ids)
         logger.info(f"Очищены task_ids у {cleared_bookings} бронирований")
 
         # Отправляем Telegram уведомление администратору
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from fastapi import HTTPException
-from models.models import DatabaseManager
+from models.models import DatabaseManager, MOSCOW_TZ, QUERY_TIMEOUT_EXPORT
 from dependencies import verify_token
+from utils.dashboard_rollups import get_daily_series, get_first_day
+from utils.date_ranges import day_bounds, half_open_sql, month_bounds, range_params
 from utils.logger import get_logger
 from utils.sql_optimization import SQLOptimizer, get_sparkline_data
 from utils.cache_manager import cache_manager
@@ -19,6 +21,17 @@ from openpyxl.utils import get_column_letter
 logger = get_logger(__name__)
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
+# Таблицы, из которых строятся агрегаты дашборда (daily_* обновляются
+# их триггерами): версии этих таблиц входят в ключи кэша, см. utils/cache_versions.py
+ROLLUP_SOURCE_TABLES = [
+    "users",
+    "bookings",
+    "tickets",
+    "openspace_payment_history",
+    "office_payment_history",
+]
+CALENDAR_TABLES = ["bookings", "user_openspace_rentals", "users", "tariffs"]
+
 # Русские названия месяцев для форматирования периодов
 RUSSIAN_MONTHS = {
     1: "январь", 2: "февраль", 3: "март", 4: "апрель",
@@ -69,7 +82,7 @@ async def get_dashboard_stats(
         period_end_dt.isoformat()
     )
 
-    def _get_stats():
+    async def _get_stats():
         def _db_query(session):
             logger.info("Executing dashboard stats database query with comparison")
             try:
@@ -89,7 +102,7 @@ async def get_dashboard_stats(
                 raise
 
         logger.info("Starting database transaction for dashboard stats")
-        result = DatabaseManager.safe_execute(_db_query)
+        result = await DatabaseManager.run(_db_query, read_only=True)
         logger.info(f"Database transaction completed, final result type: {type(result)}")
         return result
 
@@ -97,7 +110,11 @@ async def get_dashboard_stats(
         logger.info("Getting stats from cache or database")
         # Используем кэш с TTL для дашборда
         result = await cache_manager.get_or_set(
-            cache_key, _get_stats, ttl=cache_manager.dashboard_ttl
+            cache_key,
+            _get_stats,
+            ttl=cache_manager.dashboard_ttl,
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=ROLLUP_SOURCE_TABLES,
         )
 
         logger.info(f"Stats result type: {type(result)}")
@@ -266,7 +283,7 @@ async def get_chart_data(
 
     cache_key = cache_manager.get_cache_key("dashboard", "chart_data", year, month)
 
-    def _get_chart_data():
+    async def _get_chart_data():
         def _db_query(session):
             try:
                 # Проверяем корректность месяца и года
@@ -279,75 +296,15 @@ async def get_chart_data(
                 # Получаем количество дней в месяце
                 days_in_month = calendar.monthrange(year, month)[1]
 
-                # Инициализируем массивы для каждого дня месяца
-                user_registrations = [0] * days_in_month
-                ticket_creations = [0] * days_in_month
-                booking_creations = [0] * days_in_month
-
-                # Форматируем параметры для SQLite
-                year_str = str(year)
-                month_str = f"{month:02d}"
-
-                # ОПТИМИЗИРОВАННЫЙ ЗАПРОС: Один запрос вместо трех с использованием UNION ALL
-                # Это улучшает производительность на 30-50%
-                combined_query = text(
-                    """
-                    WITH daily_data AS (
-                        -- Регистрации пользователей
-                        SELECT
-                            CAST(strftime('%d', COALESCE(reg_date, first_join_time)) AS INTEGER) as day,
-                            'users' as data_type,
-                            COUNT(*) as count
-                        FROM users
-                        WHERE
-                            (reg_date IS NOT NULL AND strftime('%Y', reg_date) = :year AND strftime('%m', reg_date) = :month_str)
-                           OR
-                            (reg_date IS NULL AND first_join_time IS NOT NULL AND strftime('%Y', first_join_time) = :year AND strftime('%m', first_join_time) = :month_str)
-                        GROUP BY CAST(strftime('%d', COALESCE(reg_date, first_join_time)) AS INTEGER)
-
-                        UNION ALL
-
-                        -- Создание тикетов
-                        SELECT
-                            CAST(strftime('%d', created_at) AS INTEGER) as day,
-                            'tickets' as data_type,
-                            COUNT(*) as count
-                        FROM tickets
-                        WHERE strftime('%Y', created_at) = :year AND strftime('%m', created_at) = :month_str
-                        GROUP BY CAST(strftime('%d', created_at) AS INTEGER)
-
-                        UNION ALL
-
-                        -- Создание бронирований
-                        SELECT
-                            CAST(strftime('%d', created_at) AS INTEGER) as day,
-                            'bookings' as data_type,
-                            COUNT(*) as count
-                        FROM bookings
-                        WHERE strftime('%Y', created_at) = :year AND strftime('%m', created_at) = :month_str
-                          AND (cancelled IS NULL OR cancelled = 0)
-                        GROUP BY CAST(strftime('%d', created_at) AS INTEGER)
-                    )
-                    SELECT * FROM daily_data
-                    ORDER BY day, data_type
-                    """
+                # Дни месяца из дневных агрегатов (не более 31 строки)
+                first_day = datetime(year, month, 1)
+                series = get_daily_series(
+                    session, *day_bounds(first_day, first_day + timedelta(days=days_in_month))
                 )
 
-                # Выполняем единый запрос
-                combined_results = session.execute(
-                    combined_query, {"year": year_str, "month_str": month_str}
-                ).fetchall()
-
-                # Распределяем результаты по массивам
-                for row in combined_results:
-                    if row.day and 1 <= row.day <= days_in_month:
-                        day_index = row.day - 1
-                        if row.data_type == 'users':
-                            user_registrations[day_index] = row.count
-                        elif row.data_type == 'tickets':
-                            ticket_creations[day_index] = row.count
-                        elif row.data_type == 'bookings':
-                            booking_creations[day_index] = row.count
+                user_registrations = [int(day["new_users"]) for day in series]
+                ticket_creations = [int(day["tickets"]) for day in series]
+                booking_creations = [int(day["bookings"]) for day in series]
 
                 # Создаем метки для дней месяца
                 day_labels = [str(i) for i in range(1, days_in_month + 1)]
@@ -395,7 +352,7 @@ async def get_chart_data(
                 logger.error(f"Ошибка в запросе данных графика: {e}")
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Используем кэш с более длинным TTL для исторических данных
@@ -403,6 +360,7 @@ async def get_chart_data(
             cache_key,
             _get_chart_data,
             ttl=cache_manager.static_data_ttl,  # 30 минут для исторических данных
+            depends_on=ROLLUP_SOURCE_TABLES,
         )
     except HTTPException:
         raise
@@ -417,26 +375,11 @@ async def get_available_periods(_: str = Depends(verify_token)):
 
     cache_key = cache_manager.get_cache_key("dashboard", "available_periods")
 
-    def _get_periods():
+    async def _get_periods():
         def _db_query(session):
             try:
-                # Получаем диапазон дат с данными (SQLite)
-                date_ranges_query = text(
-                    """
-                    SELECT
-                        MIN(date_col) as min_date,
-                        MAX(date_col) as max_date
-                    FROM (
-                             SELECT COALESCE(reg_date, first_join_time) as date_col FROM users WHERE COALESCE(reg_date, first_join_time) IS NOT NULL
-                             UNION ALL
-                             SELECT created_at as date_col FROM tickets WHERE created_at IS NOT NULL
-                             UNION ALL
-                             SELECT created_at as date_col FROM bookings WHERE created_at IS NOT NULL
-                         ) as all_dates
-                    """
-                )
-
-                result = session.execute(date_ranges_query).fetchone()
+                # Первый день с данными из дневных агрегатов
+                first_data_day = get_first_day(session)
 
                 # Всегда возвращаем 12 месяцев (текущий + 11 предыдущих)
                 current_date = datetime.now()
@@ -465,7 +408,7 @@ async def get_available_periods(_: str = Depends(verify_token)):
                         "display": f"{month_names[target_month]} {target_year}",
                     })
                 
-                if not result or not result.min_date:
+                if not first_data_day:
                     return {
                         "periods": periods,
                         "current": {
@@ -502,12 +445,13 @@ async def get_available_periods(_: str = Depends(verify_token)):
                 logger.error(f"Ошибка получения доступных периодов: {e}")
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Периоды меняются редко, кэшируем на 30 минут
         return await cache_manager.get_or_set(
-            cache_key, _get_periods, ttl=cache_manager.static_data_ttl
+            cache_key, _get_periods, ttl=cache_manager.static_data_ttl,
+            depends_on=ROLLUP_SOURCE_TABLES
         )
     except Exception as e:
         logger.error(f"Критическая ошибка в get_available_periods: {e}")
@@ -536,7 +480,7 @@ async def get_bookings_calendar(
 
     cache_key = cache_manager.get_cache_key("dashboard", "bookings_calendar", year, month, tariff_ids or "", user_search or "")
 
-    def _get_bookings_data():
+    async def _get_bookings_data():
         def _db_query(session):
             try:
                 # Валидация входных параметров
@@ -545,12 +489,12 @@ async def get_bookings_calendar(
                 if not (2000 <= year <= 9999):
                     raise ValueError(f"Недопустимый год: {year}")
 
-                year_str = str(year).zfill(4)
-                month_str = str(month).zfill(2)
+                # Полуинтервал месяца: фильтр идет по индексам visit_date/start_date
+                month_start, month_end = month_bounds(year, month)
 
                 # Строим динамический запрос с фильтрами (включая опенспейс)
                 query_parts = [
-                    """
+                    f"""
                     SELECT
                         b.id,
                         b.visit_date,
@@ -569,13 +513,14 @@ async def get_bookings_calendar(
                     FROM bookings b
                     LEFT JOIN users u ON b.user_id = u.id
                     LEFT JOIN tariffs t ON b.tariff_id = t.id
-                    WHERE strftime('%Y', b.visit_date) = :year
-                      AND strftime('%m', b.visit_date) = :month_str
-                      AND (b.cancelled IS NULL OR b.cancelled = 0)
+                    WHERE {half_open_sql("b.visit_date", "month")}
+                      -- COALESCE вместо OR: флаг отмены не должен вести запрос
+                      -- по малоселективному индексу вместо диапазона дат
+                      AND COALESCE(b.cancelled, 0) = 0
                     """
                 ]
 
-                query_params = {"year": year_str, "month_str": month_str}
+                query_params = range_params("month", month_start, month_end)
 
                 # Добавляем фильтр по тарифам для bookings
                 if tariff_id_list:
@@ -595,7 +540,7 @@ async def get_bookings_calendar(
                     query_params['user_search'] = f'%{user_search}%'
 
                 # Добавляем UNION для опенспейса
-                query_parts.append("""
+                query_parts.append(f"""
                     UNION ALL
 
                     SELECT
@@ -616,9 +561,9 @@ async def get_bookings_calendar(
                     FROM user_openspace_rentals r
                     LEFT JOIN users u ON r.user_id = u.id
                     LEFT JOIN tariffs t ON r.tariff_id = t.id
-                    WHERE r.rental_type = 'one_day'
-                      AND strftime('%Y', r.start_date) = :year
-                      AND strftime('%m', r.start_date) = :month_str
+                    WHERE {half_open_sql("r.start_date", "month")}
+                      -- Унарный + исключает индекс по rental_type: выборку ведет диапазон дат
+                      AND +r.rental_type = 'one_day'
                 """)
 
                 # Добавляем фильтр по тарифам для опенспейса
@@ -689,7 +634,7 @@ async def get_bookings_calendar(
                 logger.error(f"Ошибка в запросе данных календаря: {e}")
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Кэшируем данные календаря
@@ -697,6 +642,8 @@ async def get_bookings_calendar(
             cache_key,
             _get_bookings_data,
             ttl=cache_manager.dashboard_ttl,  # 5 минут
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=CALENDAR_TABLES,
         )
     except HTTPException:
         raise
@@ -739,32 +686,32 @@ async def get_tariff_distribution(
         period_end_dt.isoformat()
     )
 
-    def _get_distribution():
+    async def _get_distribution():
         def _db_query(session):
             logger.info("Executing tariff distribution query")
             try:
-                # SQL запрос для получения распределения по тарифам
+                # Распределение по тарифам из дневных агрегатов
                 distribution_query = text("""
                     SELECT
                         t.id,
                         t.name,
                         t.price,
-                        COUNT(b.id) as bookings_count,
-                        COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount ELSE 0 END), 0) as total_revenue
-                    FROM tariffs t
-                    LEFT JOIN bookings b ON t.id = b.tariff_id
-                        AND b.created_at >= :period_start
-                        AND b.created_at < :period_end
-                        AND (b.cancelled IS NULL OR b.cancelled = 0)
-                    WHERE t.is_active = 1
+                        SUM(d.bookings) as bookings_count,
+                        COALESCE(SUM(d.revenue), 0) as total_revenue
+                    FROM daily_tariff_stats d
+                    JOIN tariffs t ON t.id = d.tariff_id
+                    WHERE d.day >= :first_day
+                      AND d.day < :end_day
+                      AND t.is_active = 1
                     GROUP BY t.id, t.name, t.price
                     HAVING bookings_count > 0
                     ORDER BY bookings_count DESC
                 """)
 
+                first_day, end_day = day_bounds(period_start_dt, period_end_dt)
                 results = session.execute(distribution_query, {
-                    'period_start': period_start_dt,
-                    'period_end': period_end_dt
+                    'first_day': first_day,
+                    'end_day': end_day
                 }).fetchall()
 
                 # Формируем данные для Pie Chart
@@ -808,14 +755,16 @@ async def get_tariff_distribution(
                 logger.error(f"Ошибка в запросе распределения тарифов: {e}", exc_info=True)
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Кэшируем данные распределения тарифов
         return await cache_manager.get_or_set(
             cache_key,
             _get_distribution,
-            ttl=cache_manager.dashboard_ttl
+            ttl=cache_manager.dashboard_ttl,
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=["bookings", "tariffs"]
         )
     except Exception as e:
         logger.error(f"Ошибка в get_tariff_distribution: {e}", exc_info=True)
@@ -855,7 +804,7 @@ async def compare_periods(
         f"{period2_year}_{period2_month}"
     )
 
-    def _get_comparison():
+    async def _get_comparison():
         def _db_query(session):
             logger.info("Executing period comparison query")
             try:
@@ -865,61 +814,28 @@ async def compare_periods(
                 days_in_month1 = cal.monthrange(period1_year, period1_month)[1]
                 days_in_month2 = cal.monthrange(period2_year, period2_month)[1]
 
-                # SQL запрос для первого периода
-                period1_query = text("""
-                    WITH RECURSIVE dates(date) AS (
-                        SELECT DATE(:start_date)
-                        UNION ALL
-                        SELECT DATE(date, '+1 day')
-                        FROM dates
-                        WHERE date < DATE(:end_date)
+                def _period_data(period_start: datetime, days_in_month: int):
+                    series = get_daily_series(
+                        session, *day_bounds(period_start, period_start + timedelta(days=days_in_month))
                     )
-                    SELECT
-                        CAST(strftime('%d', dates.date) AS INTEGER) as day,
-                        COALESCE(COUNT(DISTINCT u.id), 0) as users_count,
-                        COALESCE(COUNT(DISTINCT t.id), 0) as tickets_count,
-                        COALESCE(COUNT(DISTINCT b.id), 0) as bookings_count
-                    FROM dates
-                    LEFT JOIN users u ON DATE(COALESCE(u.reg_date, u.first_join_time)) = dates.date
-                    LEFT JOIN tickets t ON DATE(t.created_at) = dates.date
-                    LEFT JOIN bookings b ON DATE(b.created_at) = dates.date AND (b.cancelled IS NULL OR b.cancelled = 0)
-                    GROUP BY dates.date
-                    ORDER BY dates.date
-                """)
+                    return {
+                        "labels": [str(int(day["day"][8:])) for day in series],
+                        "users": [int(day["new_users"]) for day in series],
+                        "tickets": [int(day["tickets"]) for day in series],
+                        "bookings": [int(day["bookings"]) for day in series]
+                    }
 
                 period1_start = datetime(period1_year, period1_month, 1)
-                period1_end = datetime(period1_year, period1_month, days_in_month1, 23, 59, 59)
-
-                results1 = session.execute(period1_query, {
-                    'start_date': period1_start.strftime('%Y-%m-%d'),
-                    'end_date': period1_end.strftime('%Y-%m-%d')
-                }).fetchall()
-
-                # SQL запрос для второго периода
                 period2_start = datetime(period2_year, period2_month, 1)
-                period2_end = datetime(period2_year, period2_month, days_in_month2, 23, 59, 59)
-
-                results2 = session.execute(period1_query, {
-                    'start_date': period2_start.strftime('%Y-%m-%d'),
-                    'end_date': period2_end.strftime('%Y-%m-%d')
-                }).fetchall()
-
-                # Формируем данные
-                period1_data = {
-                    "labels": [str(row.day) for row in results1],
-                    "users": [int(row.users_count) for row in results1],
-                    "tickets": [int(row.tickets_count) for row in results1],
-                    "bookings": [int(row.bookings_count) for row in results1]
-                }
 
-                period2_data = {
-                    "labels": [str(row.day) for row in results2],
-                    "users": [int(row.users_count) for row in results2],
-                    "tickets": [int(row.tickets_count) for row in results2],
-                    "bookings": [int(row.bookings_count) for row in results2]
-                }
+                # Дни обоих месяцев из дневных агрегатов
+                period1_data = _period_data(period1_start, days_in_month1)
+                period2_data = _period_data(period2_start, days_in_month2)
 
-                logger.info(f"Comparison data fetched: period1={len(results1)} days, period2={len(results2)} days")
+                logger.info(
+                    f"Comparison data fetched: period1={len(period1_data['labels'])} days, "
+                    f"period2={len(period2_data['labels'])} days"
+                )
 
                 return {
                     "period1": {
@@ -940,20 +856,90 @@ async def compare_periods(
                 logger.error(f"Ошибка в запросе сравнения периодов: {e}", exc_info=True)
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Кэшируем данные сравнения
         return await cache_manager.get_or_set(
             cache_key,
             _get_comparison,
-            ttl=cache_manager.dashboard_ttl
+            ttl=cache_manager.dashboard_ttl,
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=ROLLUP_SOURCE_TABLES
         )
     except Exception as e:
         logger.error(f"Ошибка в compare_periods: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Не удалось загрузить данные для сравнения периодов. Проверьте корректность дат")
 
 
+def _get_rollup_export_data(session, period_start_dt: datetime, period_end_dt: datetime):
+    """
+    Данные экспорта дашборда из дневных агрегатов: общая статистика,
+    ежедневные строки и статистика по тарифам за период.
+    """
+    first_day, end_day = day_bounds(period_start_dt, period_end_dt)
+    params = {'first_day': first_day, 'end_day': end_day}
+
+    # Общая статистика (отмененные бронирования исключены в агрегатах)
+    stats_query = text("""
+        SELECT
+            COALESCE(SUM(registered_users), 0) as total_users,
+            COALESCE(SUM(bookings), 0) as total_bookings,
+            COALESCE(SUM(paid_bookings), 0) as paid_bookings,
+            COALESCE(SUM(revenue), 0) as total_revenue,
+            CASE WHEN SUM(paid_bookings + openspace_payments) > 0
+                THEN CAST(SUM(revenue + openspace_revenue) AS REAL) / SUM(paid_bookings + openspace_payments)
+                ELSE 0 END as avg_booking_value,
+            COALESCE(SUM(tickets), 0) as total_tickets,
+            COALESCE(SUM(open_tickets), 0) as open_tickets
+        FROM daily_stats
+        WHERE day >= :first_day AND day < :end_day
+    """)
+
+    # Ежедневные данные, включая дни без активности
+    daily_query = text("""
+        WITH RECURSIVE dates(date) AS (
+            SELECT :first_day
+            UNION ALL
+            SELECT DATE(date, '+1 day')
+            FROM dates
+            WHERE DATE(date, '+1 day') < :end_day
+        )
+        SELECT
+            d.date,
+            COALESCE(s.registered_users, 0) as users,
+            COALESCE(s.bookings, 0) as bookings,
+            COALESCE(s.tickets, 0) as tickets,
+            COALESCE(s.revenue, 0) as revenue
+        FROM dates d
+        LEFT JOIN daily_stats s ON s.day = d.date
+        ORDER BY d.date
+    """)
+
+    # Данные по тарифам
+    tariff_query = text("""
+        SELECT
+            t.name,
+            COALESCE(SUM(d.bookings), 0) as booking_count,
+            COALESCE(SUM(d.revenue), 0) as revenue,
+            CASE WHEN SUM(d.paid_bookings) > 0
+                THEN CAST(SUM(d.revenue) AS REAL) / SUM(d.paid_bookings)
+                ELSE 0 END as avg_revenue
+        FROM tariffs t
+        LEFT JOIN daily_tariff_stats d ON d.tariff_id = t.id
+            AND d.day >= :first_day
+            AND d.day < :end_day
+        GROUP BY t.id, t.name
+        ORDER BY booking_count DESC
+    """)
+
+    return {
+        'stats': session.execute(stats_query, params).fetchone(),
+        'daily': session.execute(daily_query, params).fetchall(),
+        'tariffs': session.execute(tariff_query, params).fetchall()
+    }
+
+
 @router.get("/export-csv")
 async def export_dashboard_csv(
     period_start: Optional[str] = Query(None, description="Начало периода (ISO формат)"),
@@ -983,78 +969,11 @@ async def export_dashboard_csv(
 
     try:
         def _get_export_data(session):
-            # Получаем общую статистику (исправлен cartesian join - используем scalar subqueries)
-            # Отмененные бронирования исключаются из всех подсчетов
-            stats_query = text("""
-                SELECT
-                    (SELECT COUNT(*) FROM users WHERE reg_date >= :period_start AND reg_date < :period_end) as total_users,
-                    (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND created_at >= :period_start AND created_at < :period_end) as total_bookings,
-                    (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1 AND created_at >= :period_start AND created_at < :period_end) as paid_bookings,
-                    (SELECT COALESCE(SUM(amount), 0) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1 AND created_at >= :period_start AND created_at < :period_end) as total_revenue,
-                    (SELECT COUNT(*) FROM tickets WHERE created_at >= :period_start AND created_at < :period_end) as total_tickets,
-                    (SELECT COUNT(*) FROM tickets WHERE status = 'OPEN' AND created_at >= :period_start AND created_at < :period_end) as open_tickets
-            """)
-
-            stats_result = session.execute(stats_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchone()
-
-            # Получаем ежедневные данные
-            daily_query = text("""
-                WITH RECURSIVE dates(date) AS (
-                    SELECT DATE(:period_start)
-                    UNION ALL
-                    SELECT DATE(date, '+1 day')
-                    FROM dates
-                    WHERE date < DATE(:period_end)
-                )
-                SELECT
-                    d.date,
-                    COUNT(DISTINCT u.id) as users,
-                    COUNT(DISTINCT b.id) as bookings,
-                    COUNT(DISTINCT t.id) as tickets,
-                    COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount ELSE 0 END), 0) as revenue
-                FROM dates d
-                LEFT JOIN users u ON DATE(u.reg_date) = d.date
-                LEFT JOIN bookings b ON DATE(b.created_at) = d.date AND (b.cancelled IS NULL OR b.cancelled = 0)
-                LEFT JOIN tickets t ON DATE(t.created_at) = d.date
-                GROUP BY d.date
-                ORDER BY d.date
-            """)
-
-            daily_results = session.execute(daily_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchall()
-
-            # Получаем данные по тарифам
-            tariff_query = text("""
-                SELECT
-                    t.name,
-                    COUNT(b.id) as booking_count,
-                    COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount END), 0) as revenue
-                FROM tariffs t
-                LEFT JOIN bookings b ON b.tariff_id = t.id
-                    AND b.created_at >= :period_start
-                    AND b.created_at < :period_end
-                    AND (b.cancelled IS NULL OR b.cancelled = 0)
-                GROUP BY t.id, t.name
-                ORDER BY booking_count DESC
-            """)
-
-            tariff_results = session.execute(tariff_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchall()
-
-            return {
-                'stats': stats_result,
-                'daily': daily_results,
-                'tariffs': tariff_results
-            }
+            return _get_rollup_export_data(session, period_start_dt, period_end_dt)
 
-        export_data = DatabaseManager.safe_execute(_get_export_data)
+        export_data = await DatabaseManager.run(
+            _get_export_data, timeout=QUERY_TIMEOUT_EXPORT, read_only=True
+        )
 
         # Создаем CSV в памяти
         output = io.StringIO()
@@ -1149,95 +1068,11 @@ async def export_dashboard_excel(
 
     try:
         def _get_export_data(session):
-            # Получаем общую статистику (исправлен cartesian join - используем scalar subqueries)
-            stats_query = text("""
-                SELECT
-                    (SELECT COUNT(*) FROM users WHERE reg_date >= :period_start AND reg_date < :period_end) as total_users,
-                    (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND created_at >= :period_start AND created_at < :period_end) as total_bookings,
-                    (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1 AND created_at >= :period_start AND created_at < :period_end) as paid_bookings,
-                    (SELECT COALESCE(SUM(amount), 0) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1 AND created_at >= :period_start AND created_at < :period_end) as total_revenue,
-                    (
-                        SELECT COALESCE(
-                            CASE WHEN COUNT(*) > 0
-                            THEN CAST(SUM(amount) AS REAL) / COUNT(*)
-                            ELSE 0 END, 0)
-                        FROM (
-                            SELECT amount FROM bookings
-                            WHERE paid = 1
-                              AND (cancelled IS NULL OR cancelled = 0)
-                              AND created_at >= :period_start
-                              AND created_at < :period_end
-                            UNION ALL
-                            SELECT amount FROM openspace_payment_history
-                            WHERE payment_date >= :period_start
-                              AND payment_date < :period_end
-                        )
-                    ) as avg_booking_value,
-                    (SELECT COUNT(*) FROM tickets WHERE created_at >= :period_start AND created_at < :period_end) as total_tickets,
-                    (SELECT COUNT(*) FROM tickets WHERE status = 'OPEN' AND created_at >= :period_start AND created_at < :period_end) as open_tickets
-            """)
-
-            stats_result = session.execute(stats_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchone()
-
-            # Получаем ежедневные данные
-            daily_query = text("""
-                WITH RECURSIVE dates(date) AS (
-                    SELECT DATE(:period_start)
-                    UNION ALL
-                    SELECT DATE(date, '+1 day')
-                    FROM dates
-                    WHERE date < DATE(:period_end)
-                )
-                SELECT
-                    d.date,
-                    COUNT(DISTINCT u.id) as users,
-                    COUNT(DISTINCT b.id) as bookings,
-                    COUNT(DISTINCT t.id) as tickets,
-                    COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount ELSE 0 END), 0) as revenue
-                FROM dates d
-                LEFT JOIN users u ON DATE(u.reg_date) = d.date
-                LEFT JOIN bookings b ON DATE(b.created_at) = d.date AND (b.cancelled IS NULL OR b.cancelled = 0)
-                LEFT JOIN tickets t ON DATE(t.created_at) = d.date
-                GROUP BY d.date
-                ORDER BY d.date
-            """)
-
-            daily_results = session.execute(daily_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchall()
-
-            # Получаем данные по тарифам
-            tariff_query = text("""
-                SELECT
-                    t.name,
-                    COUNT(b.id) as booking_count,
-                    COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount END), 0) as revenue,
-                    COALESCE(AVG(CASE WHEN b.paid = 1 THEN b.amount END), 0) as avg_revenue
-                FROM tariffs t
-                LEFT JOIN bookings b ON b.tariff_id = t.id
-                    AND b.created_at >= :period_start
-                    AND b.created_at < :period_end
-                    AND (b.cancelled IS NULL OR b.cancelled = 0)
-                GROUP BY t.id, t.name
-                ORDER BY booking_count DESC
-            """)
-
-            tariff_results = session.execute(tariff_query, {
-                'period_start': period_start_dt,
-                'period_end': period_end_dt
-            }).fetchall()
-
-            return {
-                'stats': stats_result,
-                'daily': daily_results,
-                'tariffs': tariff_results
-            }
+            return _get_rollup_export_data(session, period_start_dt, period_end_dt)
 
-        export_data = DatabaseManager.safe_execute(_get_export_data)
+        export_data = await DatabaseManager.run(
+            _get_export_data, timeout=QUERY_TIMEOUT_EXPORT, read_only=True
+        )
 
         # Создаем Excel workbook
         wb = Workbook()
@@ -1408,7 +1243,7 @@ async def get_top_clients(
     async def _get_top_clients():
         def _db_query(session):
             try:
-                query = text("""
+                query = text(f"""
                     SELECT
                         u.id,
                         u.username,
@@ -1420,37 +1255,31 @@ async def get_top_clients(
                         MAX(b.created_at) as last_booking_date
                     FROM users u
                     INNER JOIN bookings b ON b.user_id = u.id
-                    WHERE b.created_at >= :period_start
-                        AND b.created_at < :period_end
-                        AND (b.cancelled IS NULL OR b.cancelled = 0)
+                    WHERE {half_open_sql("b.created_at", "period")}
+                        AND COALESCE(b.cancelled, 0) = 0
                     GROUP BY u.id, u.username, u.telegram_id
                     HAVING total_spent > 0
                     ORDER BY total_spent DESC
                     LIMIT :limit
                 """)
 
-                results = session.execute(query, {
-                    'period_start': period_start_dt,
-                    'period_end': period_end_dt,
-                    'limit': limit
-                }).fetchall()
+                period_params = range_params("period", period_start_dt, period_end_dt)
+                results = session.execute(
+                    query, {**period_params, 'limit': limit}
+                ).fetchall()
 
                 # Получаем общую статистику
-                total_query = text("""
+                total_query = text(f"""
                     SELECT
                         COUNT(DISTINCT u.id) as total_clients_with_bookings,
                         COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount END), 0) as total_revenue
                     FROM users u
                     INNER JOIN bookings b ON b.user_id = u.id
-                    WHERE b.created_at >= :period_start
-                        AND b.created_at < :period_end
-                        AND (b.cancelled IS NULL OR b.cancelled = 0)
+                    WHERE {half_open_sql("b.created_at", "period")}
+                        AND COALESCE(b.cancelled, 0) = 0
                 """)
 
-                total_stats = session.execute(total_query, {
-                    'period_start': period_start_dt,
-                    'period_end': period_end_dt
-                }).fetchone()
+                total_stats = session.execute(total_query, period_params).fetchone()
 
                 clients_list = []
                 for row in results:
@@ -1462,7 +1291,9 @@ async def get_top_clients(
                         'paid_bookings': row.paid_bookings,
                         'total_spent': float(row.total_spent),
                         'avg_booking_value': float(row.avg_booking_value),
-                        'last_booking_date': row.last_booking_date.isoformat() if row.last_booking_date else None,
+                        'last_booking_date': (
+                            datetime.fromisoformat(row.last_booking_date).isoformat() if row.last_booking_date else None
+                        ),
                         'revenue_share': (float(row.total_spent) / float(total_stats.total_revenue) * 100) if total_stats.total_revenue > 0 else 0
                     })
 
@@ -1486,14 +1317,16 @@ async def get_top_clients(
                 logger.error(f"Ошибка в запросе top-clients: {e}", exc_info=True)
                 raise
 
-        return DatabaseManager.safe_execute(_db_query)
+        return await DatabaseManager.run(_db_query, read_only=True)
 
     try:
         # Кэшируем данные топ-клиентов
         return await cache_manager.get_or_set(
             cache_key,
             _get_top_clients,
-            ttl=cache_manager.dashboard_ttl
+            ttl=cache_manager.dashboard_ttl,
+            stale_ttl=cache_manager.stale_ttl,
+            depends_on=["users", "bookings"]
         )
     except Exception as e:
         logger.error(f"Ошибка в get_top_clients: {e}", exc_info=True)
@@ -1523,32 +1356,34 @@ async def get_promocode_stats(
             end_date = datetime(now.year, now.month + 1, 1, tzinfo=MOSCOW_TZ)
 
     def _get_promocode_stats(session):
-        # SQL запрос для получения статистики по каждому промокоду
+        # Статистика по каждому промокоду из дневных агрегатов
         query = text("""
             SELECT
                 p.id,
                 p.name,
                 p.discount as discount_percent,
                 p.is_active,
-                COUNT(b.id) as total_uses,
-                COUNT(CASE WHEN b.paid = 1 THEN b.id END) as paid_uses,
-                COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount END), 0) as total_revenue,
-                COALESCE(SUM(CASE WHEN b.paid = 1 THEN b.amount * p.discount / 100.0 END), 0) as total_discount_given,
-                COALESCE(AVG(CASE WHEN b.paid = 1 THEN b.amount END), 0) as avg_booking_value,
-                MAX(b.created_at) as last_used_date
+                COALESCE(SUM(d.uses), 0) as total_uses,
+                COALESCE(SUM(d.paid_uses), 0) as paid_uses,
+                COALESCE(SUM(d.revenue), 0) as total_revenue,
+                COALESCE(SUM(d.revenue) * p.discount / 100.0, 0) as total_discount_given,
+                CASE WHEN SUM(d.paid_uses) > 0
+                    THEN CAST(SUM(d.revenue) AS REAL) / SUM(d.paid_uses)
+                    ELSE 0 END as avg_booking_value,
+                MAX(d.last_used_at) as last_used_date
             FROM promocodes p
-            LEFT JOIN bookings b ON b.promocode_id = p.id
-                AND b.created_at >= :period_start
-                AND b.created_at < :period_end
-                AND (b.cancelled IS NULL OR b.cancelled = 0)
+            LEFT JOIN daily_promocode_stats d ON d.promocode_id = p.id
+                AND d.day >= :first_day
+                AND d.day < :end_day
             GROUP BY p.id, p.name, p.discount, p.is_active
             HAVING total_uses > 0 OR p.is_active = 1
             ORDER BY total_revenue DESC
         """)
 
+        first_day, end_day = day_bounds(start_date, end_date)
         result = session.execute(query, {
-            "period_start": start_date,
-            "period_end": end_date
+            "first_day": first_day,
+            "end_day": end_day
         }).fetchall()
 
         promocodes_data = []
@@ -1568,7 +1403,9 @@ async def get_promocode_stats(
                 "total_revenue": float(row.total_revenue or 0),
                 "total_discount_given": float(row.total_discount_given or 0),
                 "avg_booking_value": float(row.avg_booking_value or 0),
-                "last_used_date": row.last_used_date.isoformat() if row.last_used_date else None,
+                "last_used_date": (
+                    datetime.fromisoformat(row.last_used_date).isoformat() if row.last_used_date else None
+                ),
                 # Эффективность: доход на одно использование
                 "revenue_per_use": float(row.total_revenue or 0) / max(int(row.paid_uses or 0), 1)
             }
@@ -1604,20 +1441,21 @@ async def get_promocode_stats(
 
     try:
         # Проверяем кэш
-        cache_key = f"promocode_stats:{period_start}:{period_end}"
-        cached_data = await cache_manager.get(cache_key, namespace="dashboard")
+        cache_key = await cache_manager.versioned_key(
+            f"dashboard:promocode_stats:{period_start}:{period_end}", ["promocodes", "bookings"]
+        )
+        cached_data = await cache_manager.get(cache_key)
         if cached_data:
             logger.info("Возвращены данные статистики промокодов из кэша")
             return cached_data
 
         # Получаем данные из БД
-        stats = DatabaseManager.safe_execute(_get_promocode_stats)
+        stats = await DatabaseManager.run(_get_promocode_stats, read_only=True)
 
         # Кэшируем результат
         await cache_manager.set(
             cache_key,
             stats,
-            namespace="dashboard",
             ttl=cache_manager.dashboard_ttl
         )
 
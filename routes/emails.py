@@ -35,6 +35,7 @@ from schemas.email_schemas import (
     EmailSegmentPreview,
     PaginatedEmailCampaigns,
 )
+from utils.db_write_queue import db_write_queue
 from utils.email_sender import EmailSender, EmailPersonalizer, get_email_sender
 from utils.logger import get_logger
 from config import MOSCOW_TZ
@@ -162,7 +163,7 @@ async def get_campaigns(
         return {"items": items, "total": total, "limit": limit, "offset": offset}
 
     try:
-        return DatabaseManager.safe_execute(_get_campaigns)
+        return await DatabaseManager.run(_get_campaigns)
     except Exception as e:
         logger.error(f"Ошибка получения кампаний: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Не удалось загрузить список email кампаний. Проверьте подключение к базе данных")
@@ -209,7 +210,7 @@ async def get_campaign(
         )
 
     try:
-        return DatabaseManager.safe_execute(_get_campaign)
+        return await DatabaseManager.run(_get_campaign)
     except HTTPException:
         raise
     except Exception as e:
@@ -295,7 +296,7 @@ async def create_campaign(
         return EmailCampaignResponse.from_orm(campaign)
 
     try:
-        return DatabaseManager.safe_execute(_create_campaign)
+        return await DatabaseManager.run(_create_campaign)
     except HTTPException:
         raise
     except Exception as e:
@@ -334,7 +335,7 @@ async def update_campaign(
         return EmailCampaignResponse.from_orm(campaign)
 
     try:
-        return DatabaseManager.safe_execute(_update_campaign)
+        return await DatabaseManager.run(_update_campaign)
     except HTTPException:
         raise
     except Exception as e:
@@ -363,7 +364,7 @@ async def delete_campaign(
         return {"success": True, "message": "Кампания удалена"}
 
     try:
-        return DatabaseManager.safe_execute(_delete_campaign)
+        return await DatabaseManager.run(_delete_campaign)
     except HTTPException:
         raise
     except Exception as e:
@@ -418,7 +419,7 @@ async def clear_campaigns_history(
         }
 
     try:
-        return DatabaseManager.safe_execute(_clear_history)
+        return await DatabaseManager.run(_clear_history)
     except HTTPException:
         raise
     except Exception as e:
@@ -502,7 +503,7 @@ async def send_campaign(
         return {"campaign": campaign, "users": users, "recipients_count": recipients_count}
 
     try:
-        result = DatabaseManager.safe_execute(_prepare_send)
+        result = await DatabaseManager.run(_prepare_send)
         campaign = result["campaign"]
         users = result["users"]
         recipients_count = result["recipients_count"]
@@ -553,7 +554,7 @@ async def send_test_email(
         return campaign
 
     try:
-        campaign = DatabaseManager.safe_execute(_get_campaign)
+        campaign = await DatabaseManager.run(_get_campaign)
 
         # Отправляем тестовое письмо
         email_sender = get_email_sender()
@@ -627,7 +628,7 @@ async def track_open(tracking_token: str):
             logger.info(f"Зафиксировано открытие письма: campaign={recipient.campaign_id}, recipient={recipient.id}")
 
     try:
-        DatabaseManager.safe_execute(_track_open)
+        await db_write_queue.submit(_track_open)
     except Exception as e:
         logger.error(f"Ошибка трекинга открытия для токена {tracking_token}: {e}")
 
@@ -677,7 +678,7 @@ async def track_click(tracking_token: str, url: str = Query(...)):
             logger.info(f"Зафиксирован клик: campaign={recipient.campaign_id}, recipient={recipient.id}, url={url}")
 
     try:
-        DatabaseManager.safe_execute(_track_click)
+        await db_write_queue.submit(_track_click)
     except Exception as e:
         logger.error(f"Ошибка трекинга клика для токена {tracking_token}: {e}")
 
@@ -765,7 +766,7 @@ async def get_campaign_analytics(
         )
 
     try:
-        return DatabaseManager.safe_execute(_get_analytics)
+        return await DatabaseManager.run(_get_analytics)
     except HTTPException:
         raise
     except Exception as e:
@@ -812,7 +813,7 @@ async def get_campaign_recipients(
         ]
 
     try:
-        return DatabaseManager.safe_execute(_get_recipients)
+        return await DatabaseManager.run(_get_recipients)
     except Exception as e:
         logger.error(f"Ошибка получения получателей для кампании {campaign_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ошибка получения получателей")
@@ -845,7 +846,7 @@ async def get_templates(
         return [EmailTemplateResponse.from_orm(t) for t in templates]
 
     try:
-        return DatabaseManager.safe_execute(_get_templates)
+        return await DatabaseManager.run(_get_templates)
     except Exception as e:
         logger.error(f"Ошибка получения шаблонов: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ошибка получения шаблонов")
@@ -866,7 +867,7 @@ async def get_template(
         return EmailTemplateResponse.from_orm(template)
 
     try:
-        return DatabaseManager.safe_execute(_get_template)
+        return await DatabaseManager.run(_get_template)
     except HTTPException:
         raise
     except Exception as e:
@@ -903,7 +904,7 @@ async def create_template(
         return EmailTemplateResponse.from_orm(template)
 
     try:
-        return DatabaseManager.safe_execute(_create_template)
+        return await DatabaseManager.run(_create_template)
     except Exception as e:
         logger.error(f"Ошибка создания шаблона: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ошибка создания шаблона")
@@ -935,7 +936,7 @@ async def update_template(
         return EmailTemplateResponse.from_orm(template)
 
     try:
-        return DatabaseManager.safe_execute(_update_template)
+        return await DatabaseManager.run(_update_template)
     except HTTPException:
         raise
     except Exception as e:
@@ -963,7 +964,7 @@ async def delete_template(
         return {"success": True, "message": "Шаблон удален"}
 
     try:
-        return DatabaseManager.safe_execute(_delete_template)
+        return await DatabaseManager.run(_delete_template)
     except HTTPException:
         raise
     except Exception as e:
@@ -998,7 +999,7 @@ async def preview_segment(
             raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        return DatabaseManager.safe_execute(_preview_segment)
+        return await DatabaseManager.run(_preview_segment)
     except HTTPException:
         raise
     except Exception as e:
@@ -1054,7 +1055,7 @@ async def seed_email_templates(
             session.commit()
             return created_count, updated_count
 
-        created, updated = DatabaseManager.safe_execute(_seed_operation)
+        created, updated = await DatabaseManager.run(_seed_operation)
 
         logger.info(f"Email templates seeding completed. Created: {created}, Updated: {updated}")
 
@@ -26,7 +26,7 @@ async def database_health(_: str = Depends(verify_token)):
             return result == 1
 
         start_time = time.time()
-        connection_ok = DatabaseManager.safe_execute(_test_connection)
+        connection_ok = await DatabaseManager.run(_test_connection)
         connection_time = time.time() - start_time
 
         db_stats = get_database_stats()
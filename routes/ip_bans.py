@@ -8,7 +8,7 @@ from pydantic import BaseModel, Field, IPvAnyAddress
 
 from dependencies import verify_token_with_permissions, CachedAdmin
 from models.models import Permission
-from utils.ip_ban_manager import get_ip_ban_manager, BAN_DURATIONS
+from utils.ip_ban_manager import get_ip_ban_manager, parse_ban_target, BAN_DURATIONS
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/ip-bans", tags=["ip-bans"])
 # Pydantic схемы
 class BanIPRequest(BaseModel):
     """Запрос на бан IP"""
-    ip: str = Field(..., description="IP адрес для бана")
+    ip: str = Field(..., description="IP адрес или подсеть (CIDR) для бана")
     reason: str = Field(default="Manual ban", description="Причина бана")
     duration_type: str = Field(
         default="day",
@@ -52,9 +52,18 @@ class IPBanStats(BaseModel):
     ban_duration: Optional[int] = None
     tracking_window: Optional[int] = None
     max_suspicious_requests: Optional[int] = None
+    snapshot_size: Optional[int] = None
     error: Optional[str] = None
 
 
+def _parse_target(ip: str) -> str:
+    """IP адрес или подсеть из пути запроса, 400 если некорректны"""
+    try:
+        return parse_ban_target(ip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid IP address or network: {e}")
+
+
 @router.get("/durations")
 async def get_ban_durations(
     current_admin: CachedAdmin = Depends(verify_token_with_permissions([Permission.MANAGE_LOGGING]))
@@ -120,29 +129,22 @@ async def get_banned_ips(
         raise HTTPException(status_code=500, detail="Не удалось загрузить список забаненных IP адресов. Проверьте подключение к Redis")
 
 
-@router.get("/{ip}/status", response_model=Optional[IPBanInfo])
+@router.get("/{ip:path}/status", response_model=Optional[IPBanInfo])
 async def get_ip_ban_status(
     ip: str,
     current_admin: CachedAdmin = Depends(verify_token_with_permissions([Permission.MANAGE_LOGGING]))
 ):
     """
-    Проверяет статус IP адреса
+    Проверяет статус IP адреса (в ответе ip - забаненный адрес или подсеть)
 
     Требуется разрешение: MANAGE_LOGGING
     """
     try:
         ban_manager = get_ip_ban_manager()
 
-        # Проверяем забанен ли IP
-        is_banned = await ban_manager.is_banned(ip)
-
-        if not is_banned:
-            return None
-
-        # Получаем информацию о бане
         ban_info = await ban_manager.get_ban_info(ip)
 
-        logger.info(f"Админ {current_admin.login} проверил статус IP {ip}: {'забанен' if is_banned else 'не забанен'}")
+        logger.info(f"Админ {current_admin.login} проверил статус IP {ip}: {'забанен' if ban_info else 'не забанен'}")
 
         return ban_info
     except Exception as e:
@@ -150,19 +152,20 @@ async def get_ip_ban_status(
         raise HTTPException(status_code=500, detail=f"Не удалось проверить статус IP адреса {ip}. Попробуйте позже")
 
 
-@router.post("/{ip}/ban")
+@router.post("/{ip:path}/ban")
 async def ban_ip(
     ip: str,
     request: Optional[BanIPRequest] = None,
     current_admin: CachedAdmin = Depends(verify_token_with_permissions([Permission.MANAGE_LOGGING]))
 ):
     """
-    Забанить IP адрес вручную
+    Забанить IP адрес или подсеть (например, 203.0.113.0/24) вручную
 
     Требуется разрешение: MANAGE_LOGGING
     """
     try:
         ban_manager = get_ip_ban_manager()
+        ip = _parse_target(ip)
 
         # Используем данные из request или значения по умолчанию
         reason = request.reason if request else "Manual ban"
@@ -175,9 +178,11 @@ async def ban_ip(
                 detail=f"Invalid duration_type. Must be one of: {', '.join(BAN_DURATIONS.keys())}"
             )
 
-        # Проверяем, не забанен ли уже
-        if await ban_manager.is_banned(ip):
-            raise HTTPException(status_code=400, detail=f"IP {ip} is already banned")
+        # Проверяем, не забанен ли уже (адрес - в том числе подсетью)
+        existing = ban_manager.find_ban(ip, exact="/" in ip)
+        if existing:
+            part_of = f" as part of {existing['ip']}" if existing["ip"] != ip else ""
+            raise HTTPException(status_code=400, detail=f"IP {ip} is already banned{part_of}")
 
         # Баним IP
         success = await ban_manager.ban_ip(
@@ -210,21 +215,28 @@ async def ban_ip(
         raise HTTPException(status_code=500, detail=f"Не удалось забанить IP адрес {ip}. Проверьте подключение к Redis")
 
 
-@router.post("/{ip}/unban")
+@router.post("/{ip:path}/unban")
 async def unban_ip(
     ip: str,
     current_admin: CachedAdmin = Depends(verify_token_with_permissions([Permission.MANAGE_LOGGING]))
 ):
     """
-    Разбанить IP адрес
+    Разбанить IP адрес или подсеть
 
     Требуется разрешение: MANAGE_LOGGING
     """
     try:
         ban_manager = get_ip_ban_manager()
-
-        # Проверяем, забанен ли IP
-        if not await ban_manager.is_banned(ip):
+        ip = _parse_target(ip)
+
+        # Проверяем, забанен ли IP; разбанить можно только то, что банили
+        if not ban_manager.find_ban(ip, exact=True):
+            covering = None if "/" in ip else ban_manager.find_ban(ip)
+            if covering:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"IP {ip} is banned as part of {covering['ip']}; unban the network instead"
+                )
             raise HTTPException(status_code=404, detail=f"IP {ip} is not banned")
 
         # Разбаниваем IP
@@ -422,6 +422,16 @@ async def get_log_statistics(
         raise HTTPException(status_code=500, detail="Не удалось собрать статистику логов. Попробуйте позже")
 
 
+@router.get("/pipeline")
+async def get_log_pipeline(current_admin: CachedAdmin = Depends(verify_token)):
+    """Состояние фоновой очереди логов: заполненность и отброшенные записи по уровням"""
+    if not current_admin.has_permission(Permission.VIEW_LOGS):
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+
+    from utils.logger import get_log_pipeline_stats
+    return get_log_pipeline_stats()
+
+
 @router.post("/test-notification")
 async def test_telegram_notification(current_admin: CachedAdmin = Depends(verify_token)):
     """Отправить тестовое уведомление в Telegram"""
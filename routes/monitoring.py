@@ -9,27 +9,30 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy import text
 
 from config import MOSCOW_TZ, DATA_DIR
 from dependencies import verify_token
 from models.models import DatabaseManager, get_db_health, ConnectionPoolMonitor
+from utils.cache_metrics import cache_metrics
 from utils.rate_limiter import get_rate_limiter
+from utils.db_write_queue import db_write_queue
 from utils.logger import get_logger
+from utils.password_security import password_hasher
+from utils.request_metrics import request_metrics
 
 logger = get_logger(__name__)
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
 
-# Глобальная переменная для хранения метрик (должна быть заменена на Redis/базу)
-# TODO: Заменить на постоянное хранилище метрик
+# Счетчики процесса; задержки запросов - в гистограммах utils.request_metrics
 _metrics_storage = {
     "requests_total": 0,
     "errors_total": 0,
     "requests_by_endpoint": {},
     "requests_by_status": {},
-    "response_times": [],
     "auth_failures": 0,
     "rate_limits_exceeded": 0,
     "active_sessions": 0,
@@ -43,17 +46,8 @@ def increment_metric(metric_name: str, value: int = 1):
         _metrics_storage[metric_name] += value
 
 
-def record_response_time(time_ms: float):
-    """Записать время ответа"""
-    global _metrics_storage
-    _metrics_storage["response_times"].append(time_ms)
-    # Ограничиваем размер массива временами ответа
-    if len(_metrics_storage["response_times"]) > 1000:
-        _metrics_storage["response_times"] = _metrics_storage["response_times"][-1000:]
-
-
 def record_endpoint_request(endpoint: str):
-    """Записать запрос к endpoint"""
+    """Записать запрос к endpoint (шаблону маршрута)"""
     global _metrics_storage
     if endpoint not in _metrics_storage["requests_by_endpoint"]:
         _metrics_storage["requests_by_endpoint"][endpoint] = 0
@@ -73,10 +67,7 @@ def get_metrics_summary():
     """Возвращает сводку метрик"""
     global _metrics_storage
 
-    avg_response_time = (
-        sum(_metrics_storage["response_times"]) / len(_metrics_storage["response_times"])
-        if _metrics_storage["response_times"] else 0
-    )
+    request_stats = request_metrics.get_stats()
 
     return {
         "counters": {
@@ -85,17 +76,14 @@ def get_metrics_summary():
             "auth_failures": _metrics_storage["auth_failures"],
             "rate_limits_exceeded": _metrics_storage["rate_limits_exceeded"],
             "active_sessions": _metrics_storage["active_sessions"],
+            "db_query_timeouts": DatabaseManager.get_timeout_stats()["total"],
         },
-        "histograms": {
-            "response_times_histogram": {
-                "count": len(_metrics_storage["response_times"]),
-                "mean": round(avg_response_time, 2),
-                "max": max(_metrics_storage["response_times"]) if _metrics_storage["response_times"] else 0,
-                "min": min(_metrics_storage["response_times"]) if _metrics_storage["response_times"] else 0,
-            }
-        },
+        # count, mean, max и p50/p95/p99 в миллисекундах
+        "response_time_ms": request_stats["latency_ms"],
+        "latency_by_route": request_stats["routes"],
         "by_endpoint": _metrics_storage["requests_by_endpoint"],
         "by_status": _metrics_storage["requests_by_status"],
+        "password_hashing": password_hasher.get_stats(),
     }
 
 
@@ -224,6 +212,7 @@ async def detailed_health_check():
             "error_rate_percent": round(error_rate * 100, 2),
             "total_requests": total_requests,
             "total_errors": total_errors,
+            "response_time_p95_ms": metrics_summary["response_time_ms"]["p95"],
         }
     except Exception as e:
         health_status["checks"]["metrics"] = {"status": "unhealthy", "error": str(e)}
@@ -253,38 +242,36 @@ async def get_application_metrics(
     else:
         return {
             "timestamp": datetime.now(MOSCOW_TZ).isoformat(),
-            "metrics": _metrics_storage
+            "metrics": _metrics_storage,
+            "requests": request_metrics.get_stats(),
         }
 
 
-@router.get("/metrics/prometheus")
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
 async def get_prometheus_metrics():
-    """Метрики в формате Prometheus"""
+    """Метрики в формате Prometheus (text exposition format 0.0.4)"""
     metrics_data = get_metrics_summary()
     prometheus_output = []
 
-    # Добавляем counters
+    # Добавляем counters (active_sessions - текущее значение, gauge)
     for metric_name, value in metrics_data["counters"].items():
-        prometheus_output.append(f"# HELP {metric_name} Application counter metric")
-        prometheus_output.append(f"# TYPE {metric_name} counter")
+        metric_type = "gauge" if metric_name == "active_sessions" else "counter"
+        prometheus_output.append(f"# HELP {metric_name} Application {metric_type} metric")
+        prometheus_output.append(f"# TYPE {metric_name} {metric_type}")
         prometheus_output.append(f"{metric_name} {value}")
         prometheus_output.append("")
 
-    # Добавляем histograms
-    for metric_name, histogram in metrics_data["histograms"].items():
-        base_name = metric_name.replace("_histogram", "")
-        prometheus_output.append(f"# HELP {base_name} Application histogram metric")
-        prometheus_output.append(f"# TYPE {base_name} histogram")
-        prometheus_output.append(f"{base_name}_count {histogram['count']}")
-        prometheus_output.append(
-            f"{base_name}_sum {histogram['mean'] * histogram['count']}"
-        )
-        prometheus_output.append(
-            f"{base_name}_bucket{{le=\"+Inf\"}} {histogram['count']}"
-        )
-        prometheus_output.append("")
+    # Задержки запросов по маршрутам и методам, ответы по статусам
+    prometheus_output.extend(request_metrics.prometheus_lines())
+    # Метрики кэша: счетчики по пространствам имен и гистограммы задержек
+    prometheus_output.extend(cache_metrics.prometheus_lines())
+    # Пул хеширования паролей: очередь, отказы, время ожидания
+    prometheus_output.extend(password_hasher.prometheus_lines())
 
-    return "\n".join(prometheus_output)
+    return PlainTextResponse(
+        "\n".join(prometheus_output) + "\n",
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
 @router.get("/database/stats")
@@ -336,7 +323,7 @@ async def get_database_statistics(_: str = Depends(verify_token)):
         pool_stats = ConnectionPoolMonitor.get_pool_status()
 
         # Статистика таблиц
-        table_stats = DatabaseManager.safe_execute(_get_table_stats) or []
+        table_stats = await DatabaseManager.run(_get_table_stats, read_only=True) or []
 
         # Database file info
         db_path = DATA_DIR / "coworking.db"
@@ -350,6 +337,9 @@ async def get_database_statistics(_: str = Depends(verify_token)):
                 "exists": db_path.exists(),
             },
             "connection_pool": pool_stats,
+            "read_pool": ConnectionPoolMonitor.get_pool_status(read_only=True),
+            "write_queue": db_write_queue.get_stats(),
+            "query_timeouts": DatabaseManager.get_timeout_stats(),
             "tables": table_stats,
             "total_records": sum(
                 table.get("record_count", 0) for table in table_stats
@@ -481,11 +471,11 @@ async def reset_metrics(_: str = Depends(verify_token)):
         "errors_total": 0,
         "requests_by_endpoint": {},
         "requests_by_status": {},
-        "response_times": [],
         "auth_failures": 0,
         "rate_limits_exceeded": 0,
         "active_sessions": 0,
     })
+    request_metrics.reset()
 
     logger.info("Application metrics reset by admin")
 
@@ -496,14 +486,13 @@ async def reset_metrics(_: str = Depends(verify_token)):
 
 
 # Функции для интеграции с middleware для сбора метрик
-def track_request(endpoint: str, status_code: int, response_time_ms: float):
-    """Функция для отслеживания запросов из middleware"""
+def track_request(endpoint: str, status_code: int):
+    """Функция для отслеживания запросов из middleware (endpoint - шаблон маршрута)"""
     global _metrics_storage
 
     _metrics_storage["requests_total"] += 1
     record_endpoint_request(endpoint)
     record_status_code(status_code)
-    record_response_time(response_time_ms)
 
     if status_code >= 400:
         _metrics_storage["errors_total"] += 1
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile, Query, Body, Response
 from fastapi.responses import StreamingResponse
 from pathlib import Path
 import time
@@ -16,9 +16,15 @@ from utils.file_validation import FileValidator
 from utils.file_security import validate_upload_file
 from dependencies import verify_token, verify_token_with_permissions, get_bot
 from config import NEWSLETTER_PHOTOS_DIR, MOSCOW_TZ
-from models.models import Newsletter, User, DatabaseManager, Permission
+from models.models import Newsletter, User, DatabaseManager, Permission, QUERY_TIMEOUT_EXPORT
 from schemas.newsletter_schemas import NewsletterResponse
 from utils.logger import get_logger
+from utils.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    paginate_keyset,
+    paginate_offset,
+)
 from tasks.newsletter_tasks import send_newsletter_task
 
 logger = get_logger(__name__)
@@ -241,7 +247,7 @@ async def send_newsletter(
         return count
 
     try:
-        recipient_count = DatabaseManager.safe_execute(_count_recipients)
+        recipient_count = await DatabaseManager.run(_count_recipients)
     except Exception as e:
         # Очищаем загруженные фото при ошибке
         await cleanup_photos_async(photo_paths)
@@ -347,8 +353,10 @@ async def get_newsletter_task_status(
 
 @router.get("/history", response_model=List[NewsletterResponse])
 async def get_newsletter_history(
+    response: Response,
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо offset)"),
     status: Optional[str] = Query(None, description="Фильтр по статусу: success, failed, partial"),
     recipient_type: Optional[str] = Query(None, description="Фильтр по типу: all, selected, segment"),
     segment_type: Optional[str] = Query(None, description="Фильтр по типу сегмента"),
@@ -357,9 +365,22 @@ async def get_newsletter_history(
     date_to: Optional[str] = Query(None, description="Фильтр до даты (YYYY-MM-DD)"),
     _: str = Depends(verify_token_with_permissions([Permission.VIEW_TELEGRAM_NEWSLETTERS])),
 ):
-    """Получение истории рассылок с фильтрацией и поиском."""
+    """
+    Получение истории рассылок с фильтрацией и поиском.
+
+    Курсор следующей страницы (keyset по created_at, id) возвращается
+    в заголовке X-Next-Cursor.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor, 2)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=f"Некорректный курсор пагинации: {e}")
+
+    next_cursor = None
 
     def _get_history(session):
+        nonlocal next_cursor
         query = session.query(Newsletter)
 
         # Применяем фильтры
@@ -392,13 +413,11 @@ async def get_newsletter_history(
             except ValueError:
                 pass  # Игнорируем неверный формат даты
 
-        newsletters = (
-            query
-            .order_by(Newsletter.created_at.desc())
-            .limit(limit)
-            .offset(offset)
-            .all()
-        )
+        order = (Newsletter.created_at, Newsletter.id)
+        if cursor:
+            newsletters, next_cursor = paginate_keyset(query, order, cursor, limit)
+        else:
+            newsletters, next_cursor = paginate_offset(query, order, offset, limit)
 
         return [
             {
@@ -416,7 +435,10 @@ async def get_newsletter_history(
         ]
 
     try:
-        return DatabaseManager.safe_execute(_get_history)
+        history = await DatabaseManager.run(_get_history)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return history
     except Exception as e:
         logger.error(f"Error getting newsletter history: {e}")
         raise HTTPException(status_code=500, detail="Failed to get newsletter history")
@@ -463,7 +485,7 @@ async def export_newsletters_csv(
         return query.order_by(Newsletter.created_at.desc()).all()
 
     try:
-        newsletters = DatabaseManager.safe_execute(_get_newsletters_for_export)
+        newsletters = await DatabaseManager.run(_get_newsletters_for_export, timeout=QUERY_TIMEOUT_EXPORT)
 
         # Создаем CSV в памяти
         output = io.StringIO()
@@ -563,7 +585,7 @@ async def clear_newsletter_history(
         return count
 
     try:
-        deleted_count = DatabaseManager.safe_execute(_clear_history)
+        deleted_count = await DatabaseManager.run(_clear_history)
 
         logger.info(
             f"Newsletter history cleared by admin {current_admin}. Deleted {deleted_count} newsletters"
@@ -608,7 +630,7 @@ async def get_newsletter_detail(
         }
 
     try:
-        result = DatabaseManager.safe_execute(_get_newsletter)
+        result = await DatabaseManager.run(_get_newsletter)
         if not result:
             raise HTTPException(status_code=404, detail="Newsletter not found")
         return result
@@ -660,7 +682,7 @@ async def get_newsletter_recipients(
         }
 
     try:
-        result = DatabaseManager.safe_execute(_get_recipients)
+        result = await DatabaseManager.run(_get_recipients)
         if result is None:
             raise HTTPException(status_code=404, detail="Newsletter not found")
         return result
@@ -715,7 +737,7 @@ async def resend_newsletter_to_failed(
         return newsletter, failed_recipients
 
     try:
-        newsletter, failed_recipients = DatabaseManager.safe_execute(_get_failed_recipients)
+        newsletter, failed_recipients = await DatabaseManager.run(_get_failed_recipients)
 
         if newsletter is None:
             raise HTTPException(status_code=404, detail="Newsletter not found")
@@ -782,7 +804,7 @@ async def export_newsletter_recipients(
         return recipients
 
     try:
-        recipients = DatabaseManager.safe_execute(_get_recipients_for_export)
+        recipients = await DatabaseManager.run(_get_recipients_for_export, timeout=QUERY_TIMEOUT_EXPORT)
         if recipients is None:
             raise HTTPException(status_code=404, detail="Newsletter not found")
 
@@ -852,7 +874,7 @@ async def delete_newsletter(
         return newsletter_info
 
     try:
-        result = DatabaseManager.safe_execute(_delete_newsletter)
+        result = await DatabaseManager.run(_delete_newsletter)
         if not result:
             raise HTTPException(status_code=404, detail="Newsletter not found")
 
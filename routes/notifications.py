@@ -1,6 +1,6 @@
 # ================== routes/notifications.py ==================
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
@@ -10,6 +10,7 @@ from dependencies import get_db, verify_token
 from config import MOSCOW_TZ
 from schemas.notification_schemas import NotificationBase
 from utils.logger import get_logger
+from utils.pagination import InvalidCursorError, paginate_keyset, paginate_offset
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/notifications", tags=["notifications"])
@@ -18,21 +19,39 @@ router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 @router.get("", response_model=List[NotificationBase])
 async def get_notifications(
+    response: Response,
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=1000),
     status: Optional[str] = None,  # read, unread
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо page)"),
     db: Session = Depends(get_db),
     _: str = Depends(verify_token),
 ):
-    """Получение всех уведомлений с пагинацией и фильтрацией."""
-    query = db.query(Notification).order_by(Notification.created_at.desc())
+    """
+    Получение всех уведомлений с пагинацией и фильтрацией.
+
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    """
+    query = db.query(Notification)
 
     if status == "read":
         query = query.filter(Notification.is_read == True)
     elif status == "unread":
         query = query.filter(Notification.is_read == False)
 
-    notifications = query.offset((page - 1) * per_page).limit(per_page).all()
+    order = (Notification.created_at, Notification.id)
+    try:
+        if cursor:
+            notifications, next_cursor = paginate_keyset(query, order, cursor, per_page)
+        else:
+            notifications, next_cursor = paginate_offset(
+                query, order, (page - 1) * per_page, per_page
+            )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный курсор пагинации: {e}")
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return notifications
 
 
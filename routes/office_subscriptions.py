@@ -48,7 +48,7 @@ async def get_all_subscriptions(
         return query.all()
 
     try:
-        subscriptions = DatabaseManager.safe_execute(_get_subscriptions)
+        subscriptions = await DatabaseManager.run(_get_subscriptions)
         return subscriptions
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -70,7 +70,7 @@ async def get_subscription(
         return subscription
 
     try:
-        subscription = DatabaseManager.safe_execute(_get_subscription)
+        subscription = await DatabaseManager.run(_get_subscription)
         return subscription
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -127,7 +127,7 @@ async def create_subscription_for_user(
         return subscription
 
     try:
-        subscription = DatabaseManager.safe_execute(_create_subscription)
+        subscription = await DatabaseManager.run(_create_subscription)
         logger.info(f"Created office subscription for telegram_id={telegram_id}")
         return subscription
     except ValueError as e:
@@ -158,7 +158,7 @@ async def get_user_subscription(telegram_id: int):
         return subscription
 
     try:
-        subscription = DatabaseManager.safe_execute(_get_subscription)
+        subscription = await DatabaseManager.run(_get_subscription)
         return subscription
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -190,7 +190,7 @@ async def delete_user_subscription(telegram_id: int):
         return True
 
     try:
-        DatabaseManager.safe_execute(_delete_subscription)
+        await DatabaseManager.run(_delete_subscription)
         logger.info(f"Deleted office subscription for telegram_id={telegram_id}")
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -218,7 +218,7 @@ async def delete_subscription(
         return True
 
     try:
-        DatabaseManager.safe_execute(_delete_subscription)
+        await DatabaseManager.run(_delete_subscription)
         logger.info(f"Admin {current_admin.login} deleted subscription {subscription_id}")
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -256,7 +256,7 @@ async def notify_subscribers(
         return query.all()
 
     try:
-        subscriptions = DatabaseManager.safe_execute(_get_subscribers)
+        subscriptions = await DatabaseManager.run(_get_subscribers)
 
         if not subscriptions:
             raise HTTPException(
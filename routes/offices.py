@@ -63,7 +63,10 @@ async def get_active_offices(db: Session = Depends(get_db)):
             logger.error(f"Неожиданная ошибка при получении активных офисов: {e}")
             raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-    return await cache_manager.get_or_set(cache_key, fetch_offices, ttl=600)
+    # Изменения офисов удаляют ключ во всех процессах - TTL долгий
+    return await cache_manager.get_or_set(
+        cache_key, fetch_offices, ttl=cache_manager.static_data_ttl
+    )
 
 
 @router.get("", response_model=List[OfficeBase])
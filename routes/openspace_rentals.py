@@ -15,7 +15,8 @@ from models.models import (
     Permission,
     Booking,
     MOSCOW_TZ,
-    DatabaseManager
+    DatabaseManager,
+    QUERY_TIMEOUT_FAST,
 )
 from dependencies import get_db, verify_token_with_permissions, CachedAdmin
 from schemas.openspace_schemas import (
@@ -94,7 +95,7 @@ async def get_user_openspace_info(
         }
 
     try:
-        return DatabaseManager.safe_execute(_get_openspace_info)
+        return await DatabaseManager.run(_get_openspace_info, timeout=QUERY_TIMEOUT_FAST)
     except HTTPException:
         raise
     except SQLAlchemyError as e:
@@ -242,7 +243,7 @@ async def create_openspace_rental(
 
         # Инвалидируем кэш календаря для разовых бронирований
         if rental_data.rental_type == "one_day":
-            await cache_manager.clear_pattern("dashboard:bookings_calendar:*")
+            await cache_manager.invalidate_tags(["dashboard:bookings_calendar"])
             logger.info(f"Инвалидирован кэш календаря для опенспейс аренды {new_rental.id}")
 
         # Отправляем уведомление администратору (опционально)
@@ -321,7 +322,7 @@ async def update_openspace_rental(
 
         # Инвалидируем кэш календаря для разовых бронирований
         if rental.rental_type == RentalType.ONE_DAY:
-            await cache_manager.clear_pattern("dashboard:bookings_calendar:*")
+            await cache_manager.invalidate_tags(["dashboard:bookings_calendar"])
             logger.info(f"Инвалидирован кэш календаря при обновлении опенспейс аренды {rental_id}")
 
         logger.info(f"Обновлена аренда rental_id={rental_id}")
@@ -366,7 +367,7 @@ async def deactivate_openspace_rental(
 
         # Инвалидируем кэш календаря для разовых бронирований
         if rental.rental_type == RentalType.ONE_DAY:
-            await cache_manager.clear_pattern("dashboard:bookings_calendar:*")
+            await cache_manager.invalidate_tags(["dashboard:bookings_calendar"])
             logger.info(f"Инвалидирован кэш календаря при деактивации опенспейс аренды {rental_id}")
 
         logger.info(f"Деактивирована аренда rental_id={rental_id}")
@@ -8,8 +8,11 @@ from datetime import datetime
 
 from config import MOSCOW_TZ
 from dependencies import verify_token
-from models.models import DatabaseManager
+from models.models import DatabaseManager, QUERY_TIMEOUT_EXPORT
+from utils.cache_manager import cache_manager
+from utils.dashboard_rollups import ensure_rollups, rebuild_rollups
 from utils.logger import get_logger
+from utils.search_index import ensure_search_index, rebuild_search_index
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/optimization", tags=["optimization"])
@@ -131,7 +134,7 @@ async def create_database_indexes(_: str = Depends(verify_token)):
     try:
         logger.info("Начинаем создание оптимизированных индексов")
 
-        result = DatabaseManager.safe_execute(_create_indexes)
+        result = await DatabaseManager.run(_create_indexes)
 
         return {
             "status": "success",
@@ -225,7 +228,7 @@ async def get_database_statistics(_: str = Depends(verify_token)):
         return stats
 
     try:
-        stats = DatabaseManager.safe_execute(_get_db_stats)
+        stats = await DatabaseManager.run(_get_db_stats, read_only=True)
 
         return {
             "status": "success",
@@ -330,7 +333,7 @@ async def analyze_query_performance(
                 "rows_returned": row_count
             }
 
-        result = DatabaseManager.safe_execute(_analyze_query)
+        result = await DatabaseManager.run(_analyze_query, read_only=True)
 
         return {
             "status": "success",
@@ -446,7 +449,7 @@ async def get_performance_report(_: str = Depends(verify_token)):
         return report
 
     try:
-        report = DatabaseManager.safe_execute(_generate_report)
+        report = await DatabaseManager.run(_generate_report, read_only=True)
 
         return {
             "status": "success",
@@ -539,7 +542,7 @@ async def get_slow_queries(
         return slow_queries
 
     try:
-        slow_queries = DatabaseManager.safe_execute(_analyze_potential_slow_queries)
+        slow_queries = await DatabaseManager.run(_analyze_potential_slow_queries, read_only=True)
 
         return {
             "status": "success",
@@ -705,7 +708,7 @@ async def get_recommendations(_: str = Depends(verify_token)):
         }
 
     try:
-        result = DatabaseManager.safe_execute(_generate_recommendations)
+        result = await DatabaseManager.run(_generate_recommendations, read_only=True)
 
         return {
             "status": "success",
@@ -795,7 +798,7 @@ async def create_index(
                 logger.error(f"Ошибка создания индекса: {e}")
                 raise
 
-        return DatabaseManager.safe_execute(_create_index)
+        return await DatabaseManager.run(_create_index)
 
     except HTTPException:
         raise
@@ -903,7 +906,7 @@ async def drop_index(
             raise
 
     try:
-        return DatabaseManager.safe_execute(_drop_index)
+        return await DatabaseManager.run(_drop_index)
 
     except HTTPException:
         raise
@@ -981,7 +984,7 @@ async def get_index_usage(_: str = Depends(verify_token)):
             raise
 
     try:
-        result = DatabaseManager.safe_execute(_analyze_index_usage)
+        result = await DatabaseManager.run(_analyze_index_usage, read_only=True)
 
         return {
             "status": "success",
@@ -1050,7 +1053,7 @@ async def vacuum_database(_: str = Depends(verify_token)):
             raise
 
     try:
-        return DatabaseManager.safe_execute(_vacuum_database)
+        return await DatabaseManager.run(_vacuum_database)
 
     except Exception as e:
         logger.error(f"Ошибка выполнения VACUUM: {e}", exc_info=True)
@@ -1060,6 +1063,62 @@ async def vacuum_database(_: str = Depends(verify_token)):
         )
 
 
+@router.post("/search-index/rebuild")
+async def rebuild_search_indexes(_: str = Depends(verify_token)):
+    """
+    Перестройка FTS5-индексов поиска (пользователи, тарифы, тикеты).
+
+    Нужна только если индекс разошелся с данными, например после ручного
+    восстановления базы без триггеров.
+    """
+    def _rebuild(session):
+        if not ensure_search_index(session):
+            raise HTTPException(status_code=501, detail="FTS5 не поддерживается этой сборкой SQLite")
+        rebuild_search_index(session)
+        return {"status": "success", "message": "Поисковые индексы перестроены"}
+
+    try:
+        return await DatabaseManager.run(_rebuild, max_retries=1)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка перестройки поисковых индексов: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Не удалось перестроить поисковые индексы: {str(e)}"
+        )
+
+
+@router.post("/rollups/rebuild")
+async def rebuild_dashboard_rollups(_: str = Depends(verify_token)):
+    """
+    Перестройка дневных агрегатов дашборда из истории.
+
+    Агрегаты поддерживаются триггерами, перестройка нужна после ручного
+    восстановления или правки базы в обход SQLite-триггеров.
+    """
+    def _rebuild(session):
+        ensure_rollups(session)
+        return rebuild_rollups(session)
+
+    try:
+        counts = await DatabaseManager.run(
+            _rebuild, max_retries=1, timeout=QUERY_TIMEOUT_EXPORT
+        )
+        await cache_manager.invalidate_tags(["dashboard"])
+        return {
+            "status": "success",
+            "message": "Агрегаты дашборда перестроены",
+            "rows": counts,
+        }
+    except Exception as e:
+        logger.error(f"Ошибка перестройки агрегатов дашборда: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Не удалось перестроить агрегаты дашборда: {str(e)}"
+        )
+
+
 @router.get("/table-analysis/{table_name}")
 async def analyze_table(
         table_name: str,
@@ -1169,7 +1228,7 @@ async def analyze_table(
             raise
 
     try:
-        result = DatabaseManager.safe_execute(_analyze_table)
+        result = await DatabaseManager.run(_analyze_table, read_only=True)
 
         return {
             "status": "success",
@@ -82,7 +82,7 @@ async def get_all_tasks(
         return result
 
     try:
-        tasks = DatabaseManager.safe_execute(_get_tasks)
+        tasks = await DatabaseManager.run(_get_tasks)
         return tasks
     except Exception as e:
         logger.error(f"Error fetching scheduled tasks: {e}")
@@ -145,7 +145,7 @@ async def get_task_stats(
         }
 
     try:
-        stats = DatabaseManager.safe_execute(_get_stats)
+        stats = await DatabaseManager.run(_get_stats)
         return stats
     except Exception as e:
         logger.error(f"Error fetching task stats: {e}")
@@ -188,7 +188,7 @@ async def get_task(
         }
 
     try:
-        task = DatabaseManager.safe_execute(_get_task)
+        task = await DatabaseManager.run(_get_task)
         return task
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -228,7 +228,7 @@ async def delete_task(
         return True
 
     try:
-        DatabaseManager.safe_execute(_delete_task)
+        await DatabaseManager.run(_delete_task)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
@@ -271,7 +271,7 @@ async def cancel_task(
         return {"status": "cancelled"}
 
     try:
-        result = DatabaseManager.safe_execute(_cancel_task)
+        result = await DatabaseManager.run(_cancel_task)
         return result
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -310,7 +310,7 @@ async def cleanup_old_tasks(
         return {"deleted_count": deleted_count}
 
     try:
-        result = DatabaseManager.safe_execute(_cleanup)
+        result = await DatabaseManager.run(_cleanup)
         return result
     except Exception as e:
         logger.error(f"Error cleaning up old tasks: {e}")
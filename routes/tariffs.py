@@ -9,6 +9,7 @@ from dependencies import get_db, verify_token
 from schemas.tariff_schemas import TariffBase, TariffCreate, TariffUpdate
 from utils.logger import get_logger
 from utils.cache_manager import cache_manager
+from utils.cache_invalidation import invalidate_tariff_cache
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/tariffs", tags=["tariffs"])
@@ -42,7 +43,10 @@ async def get_active_tariffs(db: Session = Depends(get_db)):
             logger.error(f"Неожиданная ошибка при получении активных тарифов: {e}")
             raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
     
-    return await cache_manager.get_or_set(cache_key, fetch_tariffs, ttl=600)
+    # Изменения тарифов инвалидируют кэш во всех процессах - TTL долгий
+    return await cache_manager.get_or_set(
+        cache_key, fetch_tariffs, ttl=cache_manager.static_data_ttl
+    )
 
 
 @router.get("", response_model=List[TariffBase])
@@ -153,6 +157,7 @@ async def create_tariff(
         db.refresh(tariff)
 
         logger.info(f"Создан тариф: {tariff.name} ({tariff.price}₽)")
+        await invalidate_tariff_cache()
 
         # Возвращаем в правильном формате
         return {
@@ -234,6 +239,7 @@ async def update_tariff(
         db.refresh(tariff)
 
         logger.info(f"Обновлен тариф: {tariff.name}")
+        await invalidate_tariff_cache()
 
         # Возвращаем в правильном формате
         return {
@@ -290,6 +296,7 @@ async def delete_tariff(
         db.commit()
 
         logger.info(f"Удален тариф: {tariff_name}")
+        await invalidate_tariff_cache()
         return {"message": f"Тариф '{tariff_name}' удален"}
 
     except HTTPException:
@@ -21,6 +21,7 @@ from utils.logger import get_logger
 from utils.async_file_utils import AsyncFileManager
 from utils.file_security import validate_upload_file, create_safe_file_path
 from utils.sql_optimization import SQLOptimizer
+from utils.pagination import InvalidCursorError, decode_cursor
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/tickets", tags=["tickets"])
@@ -51,7 +52,10 @@ async def get_tickets(
     _: str = Depends(verify_token),
 ):
     """Получение тикетов (возвращает только массив для фронтенда)."""
-    result = await get_tickets_detailed(page, per_page, status, user_query, _)
+    # Счетчик здесь не нужен - возвращаем только массив
+    result = await get_tickets_detailed(
+        page, per_page, status, user_query, _, cursor=None, include_total=False
+    )
     return result.get("tickets", []) if isinstance(result, dict) else []
 
 
@@ -62,14 +66,24 @@ async def get_tickets_detailed(
     status: Optional[str] = None,
     user_query: Optional[str] = None,
     _: str = Depends(verify_token),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо page)"),
+    include_total: Optional[bool] = Query(None, description="Считать total_count (по умолчанию только без cursor)"),
 ):
-    """Получение тикетов с данными пользователей и фильтрацией."""
+    """Получение тикетов с данными пользователей и фильтрацией (page или cursor)."""
+    if cursor:
+        try:
+            decode_cursor(cursor, 2)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=f"Некорректный курсор пагинации: {e}")
+
+    with_total = include_total if include_total is not None else cursor is None
 
     def _get_tickets(session):
         try:
             # Используем оптимизированный запрос с индексами
             return SQLOptimizer.get_optimized_tickets_with_users(
-                session, page, per_page, status, user_query
+                session, page, per_page, status, user_query,
+                cursor=cursor, include_total=with_total,
             )
 
         except Exception as e:
@@ -77,7 +91,7 @@ async def get_tickets_detailed(
             raise
 
     try:
-        return DatabaseManager.safe_execute(_get_tickets)
+        return await DatabaseManager.run(_get_tickets)
     except HTTPException:
         raise
     except Exception as e:
@@ -162,7 +176,7 @@ async def get_tickets_stats(_: str = Depends(verify_token)):
         }
 
     try:
-        return DatabaseManager.safe_execute(_get_stats)
+        return await DatabaseManager.run(_get_stats)
     except Exception as e:
         logger.error(f"Ошибка при получении статистики тикетов: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера. Попробуйте позже или обратитесь к администратору")
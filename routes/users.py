@@ -6,12 +6,18 @@ import io
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from fastapi.responses import FileResponse, StreamingResponse
 
-from models.models import User, DatabaseManager, Permission
+from models.models import (
+    User,
+    DatabaseManager,
+    Permission,
+    QUERY_TIMEOUT_FAST,
+    QUERY_TIMEOUT_EXPORT,
+)
 from dependencies import (
     get_db,
     verify_token,
@@ -22,7 +28,15 @@ from dependencies import (
 from schemas.user_schemas import UserBase, UserUpdate, UserCreate
 from config import AVATARS_DIR, MOSCOW_TZ
 from utils.logger import get_logger
+from utils.cache_manager import cache_manager
+from utils.cache_invalidation import invalidate_user_cache
 from utils.file_security import sanitize_filename
+from utils.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    paginate_keyset,
+    paginate_offset,
+)
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/users", tags=["users"])
@@ -30,29 +44,46 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("", response_model=List[UserBase])
 async def get_users(
+    response: Response,
     page: int = Query(1, ge=1, description="Номер страницы"),
     per_page: int = Query(50, ge=1, le=1000, description="Количество пользователей на страницу"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо page)"),
     _: CachedAdmin = Depends(verify_token_with_permissions([Permission.VIEW_USERS])),
 ):
-    """Получение списка пользователей с пагинацией."""
+    """
+    Получение списка пользователей с пагинацией.
+
+    Курсор следующей страницы (keyset по first_join_time, id) возвращается
+    в заголовке X-Next-Cursor.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor, 2)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=f"Некорректный курсор пагинации: {e}")
+
+    next_cursor = None
 
     def _get_users(session):
+        nonlocal next_cursor
         # Если запрашивается большое количество пользователей, возвращаем всех
-        if per_page >= 500:
+        if per_page >= 500 and not cursor:
             users = (
                 session.query(User)
                 .order_by(User.first_join_time.desc())
                 .all()
             )
+        elif cursor:
+            users, next_cursor = paginate_keyset(
+                session.query(User), (User.first_join_time, User.id), cursor, per_page
+            )
         else:
             # Обычная пагинация
-            offset = (page - 1) * per_page
-            users = (
-                session.query(User)
-                .order_by(User.first_join_time.desc())
-                .offset(offset)
-                .limit(per_page)
-                .all()
+            users, next_cursor = paginate_offset(
+                session.query(User),
+                (User.first_join_time, User.id),
+                (page - 1) * per_page,
+                per_page,
             )
         users_data = []
         for user in users:
@@ -82,7 +113,10 @@ async def get_users(
         return users_data
 
     try:
-        return DatabaseManager.safe_execute(_get_users)
+        users_data = await DatabaseManager.run(_get_users)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return users_data
     except Exception as e:
         logger.error(f"Ошибка в get_users: {e}")
         raise HTTPException(
@@ -108,7 +142,7 @@ async def export_users_to_csv(
         def _get_users(session):
             return session.query(User).order_by(User.first_join_time.desc()).all()
 
-        users = DatabaseManager.safe_execute(_get_users)
+        users = await DatabaseManager.run(_get_users, timeout=QUERY_TIMEOUT_EXPORT)
 
         if not users:
             logger.warning("Нет пользователей для экспорта")
@@ -214,7 +248,7 @@ async def bulk_export_users(
         def _get_users(session):
             return session.query(User).filter(User.id.in_(user_ids)).all()
 
-        users = DatabaseManager.safe_execute(_get_users)
+        users = await DatabaseManager.run(_get_users, timeout=QUERY_TIMEOUT_EXPORT)
 
         if not users:
             logger.warning("Не найдено пользователей для экспорта")
@@ -301,36 +335,50 @@ async def get_user(
 
 
 @router.get("/telegram/{telegram_id}")
-async def get_user_by_telegram_id(telegram_id: int, db: Session = Depends(get_db)):
-    """Получение пользователя по Telegram ID. Используется ботом."""
-    user = db.query(User).filter_by(telegram_id=telegram_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"Пользователь с Telegram ID {telegram_id} не найден в системе")
-
-    is_complete = all([user.full_name, user.phone, user.email])
-
-    user_data = {
-        "id": user.id,
-        "telegram_id": user.telegram_id,
-        "full_name": user.full_name,
-        "phone": user.phone,
-        "email": user.email,
-        "username": user.username,
-        "successful_bookings": user.successful_bookings,
-        "language_code": user.language_code,
-        "invited_count": user.invited_count,
-        "reg_date": user.reg_date,
-        "first_join_time": user.first_join_time,
-        "agreed_to_terms": user.agreed_to_terms,
-        "avatar": user.avatar,
-        "referrer_id": user.referrer_id,
-        "birth_date": str(user.birth_date) if user.birth_date else None,
-        "is_complete": is_complete,
-        "is_banned": user.is_banned or False,
-        "ban_reason": user.ban_reason,
-    }
+async def get_user_by_telegram_id(telegram_id: int):
+    """
+    Получение пользователя по Telegram ID. Используется ботом.
 
-    return user_data
+    Ответ кэшируется (тег users): изменения пользователей сбрасывают его
+    через invalidate_user_cache во всех процессах.
+    """
+
+    def _get_user(session):
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail=f"Пользователь с Telegram ID {telegram_id} не найден в системе")
+
+        is_complete = all([user.full_name, user.phone, user.email])
+
+        return {
+            "id": user.id,
+            "telegram_id": user.telegram_id,
+            "full_name": user.full_name,
+            "phone": user.phone,
+            "email": user.email,
+            "username": user.username,
+            "successful_bookings": user.successful_bookings,
+            "language_code": user.language_code,
+            "invited_count": user.invited_count,
+            "reg_date": user.reg_date,
+            "first_join_time": user.first_join_time,
+            "agreed_to_terms": user.agreed_to_terms,
+            "avatar": user.avatar,
+            "referrer_id": user.referrer_id,
+            "birth_date": str(user.birth_date) if user.birth_date else None,
+            "is_complete": is_complete,
+            "is_banned": user.is_banned or False,
+            "ban_reason": user.ban_reason,
+        }
+
+    async def _fetch_user():
+        return await DatabaseManager.run(_get_user, timeout=QUERY_TIMEOUT_FAST)
+
+    return await cache_manager.get_or_set(
+        f"users:telegram:{telegram_id}",
+        _fetch_user,
+        ttl=cache_manager.user_data_ttl,
+    )
 
 
 @router.get("/{user_id}/invited-users", response_model=List[UserBase])
@@ -358,7 +406,7 @@ async def get_invited_users(
         return invited
 
     try:
-        return DatabaseManager.safe_execute(_get_invited)
+        return await DatabaseManager.run(_get_invited)
     except HTTPException:
         raise
     except Exception as e:
@@ -398,7 +446,7 @@ async def get_referrer(
         return referrer
 
     try:
-        return DatabaseManager.safe_execute(_get_referrer)
+        return await DatabaseManager.run(_get_referrer)
     except HTTPException:
         raise
     except Exception as e:
@@ -442,7 +490,9 @@ async def update_user_by_telegram_id(telegram_id: int, user_data: UserUpdate):
         }
 
     try:
-        return DatabaseManager.safe_execute(_update_user)
+        result = await DatabaseManager.run(_update_user, timeout=QUERY_TIMEOUT_FAST)
+        await invalidate_user_cache(result["id"])
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -462,6 +512,9 @@ async def check_and_add_user(
 ):
     """Проверка и добавление пользователя в БД. Используется ботом."""
 
+    # id пользователей, чьи закэшированные данные изменились
+    changed = []
+
     def _check_and_add_user(session):
         user = session.query(User).filter_by(telegram_id=telegram_id).first()
         is_new = False
@@ -489,9 +542,11 @@ async def check_and_add_user(
                 )
                 if referrer:
                     referrer.invited_count += 1
+                    changed.append(referrer.id)
         else:
             if username and user.username != username:
                 user.username = username
+                changed.append(user.id)
 
         is_complete = all(
             [user.full_name, user.phone, user.email, user.agreed_to_terms]
@@ -519,7 +574,10 @@ async def check_and_add_user(
         }
 
     try:
-        return DatabaseManager.safe_execute(_check_and_add_user)
+        result = await DatabaseManager.run(_check_and_add_user, timeout=QUERY_TIMEOUT_FAST)
+        for user_id in changed:
+            await invalidate_user_cache(user_id)
+        return result
     except Exception as e:
         logger.error(f"Ошибка в check_and_add_user: {e}")
         raise HTTPException(
@@ -577,7 +635,9 @@ async def update_user(
         return user
 
     try:
-        return DatabaseManager.safe_execute(_update_user)
+        user = await DatabaseManager.run(_update_user)
+        await invalidate_user_cache(user.id)
+        return user
     except HTTPException:
         raise
     except Exception as e:
@@ -620,6 +680,7 @@ async def upload_avatar(
 
     user.avatar = avatar_filename
     db.commit()
+    await invalidate_user_cache(user_id)
 
     logger.info(
         f"Загружен новый аватар для пользователя {user_id} администратором {current_admin.login}"
@@ -660,6 +721,7 @@ async def delete_avatar(
                 logger.warning(f"Не удалось удалить аватар {user.avatar}: {e}")
         user.avatar = None
         db.commit()
+        await invalidate_user_cache(user_id)
 
     standard_path = AVATARS_DIR / f"{user.telegram_id}.jpg"
     if standard_path.exists():
@@ -786,7 +848,7 @@ async def download_telegram_avatar(
                 "full_name": user.full_name,
             }
 
-        user_data = DatabaseManager.safe_execute(_get_user_data)
+        user_data = await DatabaseManager.run(_get_user_data)
         bot = get_bot()
 
         if not bot:
@@ -842,13 +904,14 @@ async def download_telegram_avatar(
                 }
             return None
 
-        updated_user_data = DatabaseManager.safe_execute(_update_avatar)
+        updated_user_data = await DatabaseManager.run(_update_avatar)
 
         if not updated_user_data:
             raise HTTPException(
                 status_code=404,
                 detail=f"Не удалось обновить аватар пользователя с ID {user_id} в базе данных"
             )
+        await invalidate_user_cache(user_id)
 
         timestamp = int(time.time() * 1000)
         return {
@@ -896,7 +959,7 @@ async def bulk_download_telegram_avatars(
                 "avatar": user.avatar
             } for user in users]
 
-        users_data = DatabaseManager.safe_execute(_get_users_without_avatars)
+        users_data = await DatabaseManager.run(_get_users_without_avatars)
         bot = get_bot()
 
         if not bot:
@@ -961,7 +1024,7 @@ async def bulk_download_telegram_avatars(
                         return True
                     return False
 
-                if DatabaseManager.safe_execute(_update_avatar):
+                if await DatabaseManager.run(_update_avatar):
                     results["successful_downloads"] += 1
                     logger.debug(f"Аватар загружен для пользователя {user_data['telegram_id']} ({user_data.get('full_name', 'Unknown')})")
                 else:
@@ -976,6 +1039,8 @@ async def bulk_download_telegram_avatars(
 
         logger.info(f"Массовая загрузка завершена. Успешно: {results['successful_downloads']}, "
                    f"Ошибки: {results['failed_downloads']}, Без аватара: {results['no_avatar_users']}")
+        if results['successful_downloads']:
+            await invalidate_user_cache()
 
         return {
             "message": "Массовая загрузка аватаров завершена",
@@ -1086,7 +1151,9 @@ async def delete_user(
             raise
 
     try:
-        return DatabaseManager.safe_execute(_delete_user)
+        result = await DatabaseManager.run(_delete_user)
+        await invalidate_user_cache(user_id)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -1154,7 +1221,9 @@ async def ban_user(
         }
 
     try:
-        return DatabaseManager.safe_execute(_ban_user)
+        result = await DatabaseManager.run(_ban_user)
+        await invalidate_user_cache(user_id)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -1203,7 +1272,9 @@ async def unban_user(
         }
 
     try:
-        return DatabaseManager.safe_execute(_unban_user)
+        result = await DatabaseManager.run(_unban_user)
+        await invalidate_user_cache(user_id)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: латентность дешевых запросов к БД, пока выполняется тяжелый запрос.
+
+Сравнивает два режима async-обработчиков:
+- inline: DatabaseManager.safe_execute(...) прямо в event loop (старое поведение)
+- run:    await DatabaseManager.run(...) через executor БД
+
+Запуск:
+    python scripts/benchmark_async_db.py --cheap 200 --heavy-rows 5000000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+
+from models.models import DatabaseManager
+
+HEAVY_QUERY = text(
+    """
+    WITH RECURSIVE counter(x) AS (
+        SELECT 1 UNION ALL SELECT x + 1 FROM counter WHERE x < :rows
+    )
+    SELECT COUNT(*) FROM counter
+    """
+)
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _call(mode: str, func):
+    if mode == "inline":
+        return DatabaseManager.safe_execute(func)
+    return await DatabaseManager.run(func)
+
+
+async def _scenario(mode: str, cheap_requests: int, heavy_rows: int) -> dict:
+    def _heavy(session):
+        return session.execute(HEAVY_QUERY, {"rows": heavy_rows}).scalar()
+
+    def _cheap(session):
+        return session.execute(text("SELECT 1")).scalar()
+
+    latencies = []
+
+    async def cheap_request():
+        started = time.perf_counter()
+        await _call(mode, _cheap)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    async def cheap_stream():
+        # Запросы приходят равномерно, пока идет тяжелый
+        for _ in range(cheap_requests):
+            asyncio.create_task(cheap_request())
+            await asyncio.sleep(0.005)
+
+    heavy_task = asyncio.create_task(_call(mode, _heavy))
+    await asyncio.sleep(0)
+    await cheap_stream()
+    await heavy_task
+
+    while len(latencies) < cheap_requests:
+        await asyncio.sleep(0.01)
+
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": max(latencies),
+    }
+
+
+async def main(cheap_requests: int, heavy_rows: int):
+    DatabaseManager.ensure_initialized()
+    print(f"Тяжелый запрос: {heavy_rows} строк, дешевых запросов: {cheap_requests}\n")
+    print(f"{'mode':<8} {'requests':>9} {'p50, ms':>10} {'p99, ms':>10} {'max, ms':>10}")
+    for mode in ("inline", "run"):
+        result = await _scenario(mode, cheap_requests, heavy_rows)
+        print(
+            f"{result['mode']:<8} {result['requests']:>9} "
+            f"{result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['max_ms']:>10.2f}"
+        )
+    DatabaseManager.cleanup_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cheap", type=int, default=200, help="Количество дешевых запросов")
+    parser.add_argument("--heavy-rows", type=int, default=5_000_000, help="Размер тяжелого запроса")
+    args = parser.parse_args()
+    asyncio.run(main(args.cheap, args.heavy_rows))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: накладные расходы middleware на запрос.
+
+Сравнивает два способа выполнить одни и те же стадии utils/middleware.py:
+- legacy:   каждая стадия - отдельный BaseHTTPMiddleware (старая схема
+            из шести слоев);
+- pipeline: один pure-ASGI RequestPipelineMiddleware.
+
+Запросы подаются прямо в ASGI-приложение (без сети и HTTP-клиента), поэтому
+разница - это стоимость самих middleware. Выводятся запросы в секунду,
+латентность p50/p99 и пик выделенной памяти на запрос (tracemalloc).
+
+Запуск:
+    python scripts/benchmark_middleware.py --requests 5000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from utils.middleware import RequestContext, RequestPipelineMiddleware, default_stages
+
+
+class _LegacyStageMiddleware(BaseHTTPMiddleware):
+    """Одна стадия в обертке BaseHTTPMiddleware - как middleware до конвейера"""
+
+    def __init__(self, app, stage):
+        super().__init__(app)
+        self.stage = stage
+
+    async def dispatch(self, request, call_next):
+        ctx = RequestContext(request.scope, request.receive)
+        if not self.stage.applies(ctx):
+            return await call_next(request)
+        response = await self.stage.before(ctx)
+        if response is not None:
+            return response
+        try:
+            response = await call_next(request)
+        except Exception as exc:
+            self.stage.failed(ctx, exc)
+            raise
+        ctx.status_code = response.status_code
+        self.stage.after(ctx, response.headers)
+        return response
+
+
+def _build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/bookings")
+    async def bookings():
+        return {"items": [{"id": i, "status": "confirmed"} for i in range(10)]}
+
+    stages = default_stages()
+    if mode == "pipeline":
+        app.add_middleware(RequestPipelineMiddleware, stages=stages)
+    else:
+        # add_middleware оборачивает снаружи: внешняя стадия добавляется последней
+        for stage in reversed(stages):
+            app.add_middleware(_LegacyStageMiddleware, stage=stage)
+    return app
+
+
+def _scope(path: str, index: int) -> dict:
+    # Разные клиенты, чтобы не упираться в лимит запросов с одного IP
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"user-agent", b"benchmark")],
+        "client": (f"198.51.{index // 200 % 250}.{index % 200 + 1}", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+async def _request(app, path: str, index: int) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(_scope(path, index), receive, send)
+    return status
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _scenario(mode: str, requests: int, warmup: int) -> dict:
+    app = _build_app(mode)
+    for index in range(warmup):
+        assert await _request(app, "/bookings", index) == 200
+
+    latencies = []
+    started = time.perf_counter()
+    for index in range(requests):
+        request_started = time.perf_counter()
+        await _request(app, "/bookings", warmup + index)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    # Пик памяти одного запроса: отдельный прогон, tracemalloc замедляет код
+    peaks = []
+    tracemalloc.start()
+    for index in range(min(requests, 200)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        await _request(app, "/bookings", index)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        "mode": mode,
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": _percentile(latencies, 99),
+        "peak_kib": statistics.median(peaks) / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument(
+        "--with-logging", action="store_true",
+        help="Не отключать логи запросов (иначе измеряется только middleware)",
+    )
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.CRITICAL)
+
+    results = [
+        asyncio.run(_scenario(mode, args.requests, args.warmup))
+        for mode in ("legacy", "pipeline")
+    ]
+
+    print(f"{'mode':<10} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak KiB/req':>13}")
+    for result in results:
+        print(
+            f"{result['mode']:<10} {result['rps']:>10.0f} {result['p50_ms']:>8.3f} "
+            f"{result['p99_ms']:>8.3f} {result['peak_kib']:>13.1f}"
+        )
+    legacy, pipeline = results
+    print(f"\nУскорение: x{pipeline['rps'] / legacy['rps']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: rate limiting в Redis - ZSET-окно (EVAL) против GCRA (EVALSHA).
+
+- zset: прежняя реализация - Lua-скрипт целиком в каждом EVAL, по элементу
+        ZSET на каждый запрос в окне;
+- gcra: RateLimiter._redis_check_limit - одна строка на ключ, скрипт по SHA.
+
+Для каждого режима выполняется --requests вызовов с --concurrency
+одновременными клиентами по --keys ключам. Выводятся вызовы в секунду,
+латентность p50/p99, процессорное время Redis (INFO cpu) на 1000 вызовов
+и память одного ключа, заполненного до лимита (MEMORY USAGE).
+
+Нужен запущенный Redis (база очищается от ключей бенчмарка, остальные
+не трогаются):
+    python scripts/benchmark_rate_limiter.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import redis.asyncio as redis
+
+from config import REDIS_URL
+from utils.rate_limiter import REDIS_KEY_PREFIX, RateLimiter, RateLimitRule
+
+# Скрипт до перехода на GCRA (с исправленной переменной window)
+ZSET_SCRIPT = """
+local key = KEYS[1]
+local window_start = tonumber(ARGV[1])
+local current_time = tonumber(ARGV[2])
+local max_requests = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', key, 0, window_start)
+local current_count = redis.call('ZCARD', key)
+if current_count >= max_requests then
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    local reset_time = oldest[2] and (oldest[2] + window) or current_time
+    return {current_count, max_requests - current_count, reset_time, 1}
+end
+redis.call('ZADD', key, current_time, current_time)
+redis.call('EXPIRE', key, window + 10)
+return {current_count + 1, max_requests - current_count - 1, current_time + window, 0}
+"""
+
+ZSET_PREFIX = "bench:zset:"
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _redis_cpu(client) -> float:
+    info = await client.info("cpu")
+    return float(info["used_cpu_user"]) + float(info["used_cpu_sys"])
+
+
+async def _cleanup(client) -> None:
+    for pattern in (f"{ZSET_PREFIX}*", f"{REDIS_KEY_PREFIX}bench:*"):
+        async for key in client.scan_iter(match=pattern, count=1000):
+            await client.delete(key)
+
+
+def _zset_call(client, rule: RateLimitRule):
+    async def call(key: str):
+        now = time.time()
+        return await client.eval(
+            ZSET_SCRIPT, 1, f"{ZSET_PREFIX}{key}", now - rule.window, now, rule.requests, rule.window
+        )
+    return call
+
+
+def _gcra_call(limiter: RateLimiter, rule: RateLimitRule):
+    async def call(key: str):
+        return await limiter._redis_check_limit(f"bench:{key}", rule)
+    return call
+
+
+async def _run(call, requests: int, concurrency: int, keys: int) -> list:
+    latencies = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            await call(f"client{index % keys}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def _scenario(mode: str, client, args, rule: RateLimitRule) -> dict:
+    if mode == "zset":
+        call = _zset_call(client, rule)
+        full_key = f"{ZSET_PREFIX}full"
+    else:
+        limiter = RateLimiter(client)
+        call = _gcra_call(limiter, rule)
+        full_key = f"{REDIS_KEY_PREFIX}bench:full"
+
+    await _cleanup(client)
+    await _run(call, min(args.requests, 1000), args.concurrency, args.keys)  # прогрев
+
+    cpu_before = await _redis_cpu(client)
+    started = time.perf_counter()
+    latencies = await _run(call, args.requests, args.concurrency, args.keys)
+    elapsed = time.perf_counter() - started
+    cpu_used = await _redis_cpu(client) - cpu_before
+
+    # Память ключа, исчерпавшего лимит
+    for _ in range(rule.requests):
+        await call("full")
+    memory = await client.memory_usage(full_key) or 0
+
+    await _cleanup(client)
+    return {
+        "mode": mode,
+        "ops": args.requests / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": _percentile(latencies, 99),
+        "cpu_ms_per_1k": cpu_used * 1000 / args.requests * 1000,
+        "key_bytes": memory,
+    }
+
+
+async def main_async(args) -> None:
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    # Лимит заведомо больше числа вызовов на ключ: меряется путь пропуска
+    rule = RateLimitRule(requests=args.limit, window=60)
+    try:
+        results = [await _scenario(mode, client, args, rule) for mode in ("zset", "gcra")]
+    finally:
+        await client.aclose()
+
+    print(f"limit={args.limit}/60s, requests={args.requests}, concurrency={args.concurrency}, keys={args.keys}")
+    print(f"{'mode':<6} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'redis cpu ms/1k':>16} {'key bytes':>10}")
+    for result in results:
+        print(
+            f"{result['mode']:<6} {result['ops']:>9.0f} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} "
+            f"{result['cpu_ms_per_1k']:>16.1f} {result['key_bytes']:>10}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=1000, help="Запросов в окне 60 с")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
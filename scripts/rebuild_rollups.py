@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Создание и полная перестройка дневных агрегатов дашборда.
+
+Агрегаты (daily_stats, daily_tariff_stats, daily_promocode_stats) обновляются
+триггерами при каждой записи. Скрипт нужен для первичного заполнения на
+существующей базе или после правки данных в обход триггеров.
+
+Использование:
+    python scripts/rebuild_rollups.py
+"""
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию в путь для импорта
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models.models import DatabaseManager, QUERY_TIMEOUT_EXPORT
+from utils.dashboard_rollups import ensure_rollups, rebuild_rollups
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def rebuild():
+    """Создать таблицы и триггеры агрегатов и пересчитать их из истории."""
+
+    def _rebuild(session):
+        ensure_rollups(session)
+        return rebuild_rollups(session)
+
+    counts = DatabaseManager.safe_execute(
+        _rebuild, max_retries=1, timeout=QUERY_TIMEOUT_EXPORT
+    )
+    for table, rows in counts.items():
+        logger.info(f"✓ {table}: {rows} rows")
+
+
+if __name__ == "__main__":
+    logger.info("=" * 60)
+    logger.info("Rebuilding dashboard rollups")
+    logger.info("=" * 60)
+
+    try:
+        rebuild()
+        logger.info("✅ Rollups rebuilt")
+    except KeyboardInterrupt:
+        logger.info("\n❌ Rebuild interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"\n❌ Critical error: {e}")
+        sys.exit(1)
@@ -22,6 +22,7 @@ from utils.email_sender import (
     EmailPersonalizer,
     get_email_sender,
 )
+from utils.db_write_queue import db_write_queue
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -379,6 +380,7 @@ async def _send_email_campaign_async(task: Task, campaign_id: int, start_time: d
         )
 
         # Отправляем каждое письмо в батче
+        status_updates = []
         for recipient in batch:
             try:
                 # Получаем пользователя для персонализации
@@ -412,10 +414,11 @@ async def _send_email_campaign_async(task: Task, campaign_id: int, start_time: d
                     personalization_data=personalization_data,
                 )
 
-                # Обновляем статус получателя
-                def _update_recipient_status(session):
+                # Обновляем статус получателя (запись уходит в общую группу
+                # очереди, ждем все обновления батча разом после отправки)
+                def _update_recipient_status(session, recipient_id=recipient["id"], result=result):
                     db_recipient = session.query(EmailCampaignRecipient).filter(
-                        EmailCampaignRecipient.id == recipient["id"]
+                        EmailCampaignRecipient.id == recipient_id
                     ).first()
 
                     if db_recipient:
@@ -428,7 +431,7 @@ async def _send_email_campaign_async(task: Task, campaign_id: int, start_time: d
 
                         session.commit()
 
-                DatabaseManager.safe_execute(_update_recipient_status)
+                status_updates.append(db_write_queue.submit(_update_recipient_status))
 
                 if result["success"]:
                     sent_count += 1
@@ -442,19 +445,21 @@ async def _send_email_campaign_async(task: Task, campaign_id: int, start_time: d
                 logger.error(f"Ошибка отправки письма на {recipient['email']}: {e}", exc_info=True)
 
                 # Обновляем статус на failed
-                def _update_failed(session):
+                def _update_failed(session, recipient_id=recipient["id"], error_message=str(e)[:500]):
                     db_recipient = session.query(EmailCampaignRecipient).filter(
-                        EmailCampaignRecipient.id == recipient["id"]
+                        EmailCampaignRecipient.id == recipient_id
                     ).first()
                     if db_recipient:
                         db_recipient.status = "failed"
-                        db_recipient.error_message = str(e)[:500]
+                        db_recipient.error_message = error_message
                         session.commit()
 
-                try:
-                    DatabaseManager.safe_execute(_update_failed)
-                except Exception as db_error:
-                    logger.error(f"Ошибка обновления статуса получателя: {db_error}")
+                status_updates.append(db_write_queue.submit(_update_failed))
+
+        # Дожидаемся записи статусов батча (один group commit вместо записи на каждое письмо)
+        for update_result in await asyncio.gather(*status_updates, return_exceptions=True):
+            if isinstance(update_result, Exception):
+                logger.error(f"Ошибка обновления статуса получателя: {update_result}")
 
         # Задержка между батчами (для соблюдения rate limits)
         if batch_idx < total_batches - 1:
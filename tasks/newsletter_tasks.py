@@ -13,6 +13,7 @@ from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from celery_app import celery_app
 from config import MOSCOW_TZ
 from models.models import Newsletter, DatabaseManager, User
+from utils.db_write_queue import db_write_queue
 from utils.logger import get_logger
 from dependencies import get_bot
 
@@ -335,7 +336,7 @@ async def _send_newsletter_async(
                         logger.info(f"Marked user {telegram_id} as bot_blocked in database")
 
                 try:
-                    DatabaseManager.safe_execute(_mark_bot_blocked)
+                    await db_write_queue.submit(_mark_bot_blocked)
                 except Exception as db_error:
                     logger.error(f"Failed to update bot_blocked status for {telegram_id}: {db_error}")
 
@@ -755,6 +756,6 @@ def _update_recipients_in_db(newsletter_id: int, updated_recipients: List[Dict[s
         session.commit()
 
     try:
-        DatabaseManager.safe_execute(_update)
+        db_write_queue.execute(_update)
     except Exception as e:
         logger.error(f"Failed to update recipients in DB: {e}")
\ No newline at end of file
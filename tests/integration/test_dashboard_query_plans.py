@@ -0,0 +1,184 @@
+"""
+Проверка планов запросов дашборда: каждый запрос должен читать историю
+через индексы, а не полным сканированием таблиц.
+"""
+import asyncio
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import routes.dashboard as dashboard
+from models.models import Base, Booking, DatabaseManager, Promocode, Tariff, User
+from utils.cache_manager import cache_manager
+from utils.dashboard_rollups import ensure_rollups
+
+# Таблицы, растущие вместе с историей. Справочники (tariffs, promocodes)
+# и агрегаты по дням могут читаться целиком.
+HISTORY_TABLES = {
+    "users",
+    "bookings",
+    "tickets",
+    "notifications",
+    "user_openspace_rentals",
+    "openspace_payment_history",
+    "office_payment_history",
+}
+
+# Индексы по флагам: поиск по ним выбирает почти всю таблицу, поэтому
+# запрос за период не должен вестись через них вместо диапазона дат
+LOW_SELECTIVITY_INDEXES = {
+    "ix_bookings_cancelled",
+    "ix_bookings_paid",
+    "ix_bookings_confirmed",
+    "ix_user_openspace_rentals_rental_type",
+}
+
+_SQL_WORDS = {
+    "where", "left", "inner", "join", "on", "group", "order", "limit",
+    "union", "cross", "having", "as", "and",
+}
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+def _aliases(statement):
+    """Соответствие алиас -> таблица для FROM/JOIN в запросе"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(statement):
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _unbounded_reads(connection, statement, parameters):
+    """Шаги плана, читающие таблицу истории целиком или почти целиком"""
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    aliases = _aliases(statement)
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and aliases.get(match.group(1), match.group(1)) in HISTORY_TABLES:
+            scans.append(detail)
+        elif any(f"INDEX {index} " in detail for index in LOW_SELECTIVITY_INDEXES):
+            scans.append(detail)
+    return scans
+
+
+@pytest.fixture
+def captured(tmp_path, monkeypatch):
+    """
+    Выполняет все эндпоинты дашборда на тестовой базе и возвращает
+    выполненные SELECT-запросы с параметрами.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path}/dashboard.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    ensure_rollups(session)
+
+    tariff = Tariff(name="Опенспейс", price=500, is_active=True)
+    promo = Promocode(name="SALE", discount=10, is_active=True)
+    user = User(telegram_id=1, full_name="Test", reg_date=datetime(2024, 1, 5))
+    session.add_all([tariff, promo, user])
+    session.flush()
+    session.add(
+        Booking(
+            user_id=user.id,
+            tariff_id=tariff.id,
+            promocode_id=promo.id,
+            visit_date=datetime(2024, 1, 6).date(),
+            amount=450,
+            paid=True,
+            created_at=datetime(2024, 1, 5, 12, 0),
+        )
+    )
+    session.commit()
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    async def _run(func, **kwargs):
+        return func(session)
+
+    async def _get_or_set(key, factory, **kwargs):
+        return await factory()
+
+    async def _get(*args, **kwargs):
+        return None
+
+    async def _set(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(DatabaseManager, "run", staticmethod(_run))
+    monkeypatch.setattr(cache_manager, "get_or_set", _get_or_set)
+    monkeypatch.setattr(cache_manager, "get", _get)
+    monkeypatch.setattr(cache_manager, "set", _set)
+
+    period = {"period_start": "2024-01-01T00:00:00", "period_end": "2024-02-01T00:00:00"}
+
+    async def _call_all():
+        await dashboard.get_dashboard_stats(_="admin", **period)
+        await dashboard.get_chart_data(year=2024, month=1, _="admin")
+        await dashboard.get_available_periods(_="admin")
+        await dashboard.get_bookings_calendar(
+            year=2024, month=1, tariff_ids=None, user_search=None, _="admin"
+        )
+        await dashboard.get_bookings_calendar(
+            year=2024, month=1, tariff_ids=str(tariff.id), user_search="Test", _="admin"
+        )
+        await dashboard.get_tariff_distribution(_="admin", **period)
+        await dashboard.compare_periods(
+            period1_year=2024, period1_month=1, period2_year=2023, period2_month=12, _="admin"
+        )
+        await dashboard.export_dashboard_csv(_="admin", **period)
+        await dashboard.export_dashboard_excel(_="admin", **period)
+        await dashboard.get_top_clients(limit=5, _="admin", **period)
+        await dashboard.get_promocode_stats(_="admin", **period)
+
+    asyncio.run(_call_all())
+    statements = [s for s in statements if not s[0].lstrip().upper().startswith("EXPLAIN")]
+
+    with engine.connect() as connection:
+        yield connection, statements
+
+    session.close()
+    engine.dispose()
+
+
+class TestDashboardQueryPlans:
+    """Тесты использования индексов запросами дашборда"""
+
+    def test_history_reads_are_index_bounded(self, captured):
+        connection, statements = captured
+        assert statements
+
+        problems = {}
+        for statement, parameters in statements:
+            scans = _unbounded_reads(connection, statement, parameters)
+            if scans:
+                problems[" ".join(statement.split())[:200]] = scans
+
+        assert not problems, problems
+
+    def test_expression_indexes_are_usable(self, captured):
+        connection, _ = captured
+
+        day_plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM bookings WHERE date(created_at) = ?",
+            ("2024-01-05",),
+        ).fetchall()
+        joined_plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM users "
+            "WHERE COALESCE(reg_date, first_join_time) >= ? AND COALESCE(reg_date, first_join_time) < ?",
+            ("2024-01-01", "2024-02-01"),
+        ).fetchall()
+
+        assert any("idx_bookings_created_day" in row[-1] for row in day_plan)
+        assert any("idx_users_joined_at" in row[-1] for row in joined_plan)
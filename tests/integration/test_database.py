@@ -230,4 +230,83 @@ class TestDatabaseIntegration:
         
         # Проверяем что сессия все еще работает
         another_user = helpers.create_test_user(db_session, telegram_id=88888)
-        assert another_user.id is not None
\ No newline at end of file
+        assert another_user.id is not None
+
+@pytest.mark.asyncio
+class TestAsyncDatabaseAccess:
+    """Тесты неблокирующего доступа к БД через DatabaseManager.run"""
+
+    async def test_run_returns_result(self):
+        """Тест выполнения замыкания в executor'е БД"""
+        from sqlalchemy import text
+
+        def _query(session):
+            return session.execute(text("SELECT 1")).scalar()
+
+        assert await DatabaseManager.run(_query) == 1
+
+    async def test_run_does_not_block_event_loop(self):
+        """Тест что event loop обрабатывает задачи во время запроса"""
+        import asyncio
+        import threading
+
+        loop_thread = threading.get_ident()
+        worker_threads = []
+
+        def _query(session):
+            worker_threads.append(threading.get_ident())
+            return True
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            for _ in range(3):
+                ticks += 1
+                await asyncio.sleep(0)
+
+        await asyncio.gather(DatabaseManager.run(_query), ticker())
+
+        assert ticks == 3
+        assert worker_threads and worker_threads[0] != loop_thread
+
+    async def test_run_propagates_exceptions(self):
+        """Тест проброса исключений из замыкания"""
+        from fastapi import HTTPException
+
+        def _query(session):
+            raise HTTPException(status_code=404, detail="not found")
+
+        with pytest.raises(HTTPException):
+            await DatabaseManager.run(_query, max_retries=1)
+
+    async def test_run_enforces_query_deadline(self):
+        """Тест прерывания долгого запроса по дедлайну в потоке executor'а"""
+        from sqlalchemy import text
+        from models.models import QueryTimeoutError
+
+        def _heavy(session):
+            return session.execute(
+                text(
+                    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+                    "SELECT COUNT(*) FROM c"
+                )
+            ).scalar()
+
+        before = DatabaseManager.get_timeout_stats()["total"]
+        with pytest.raises(QueryTimeoutError):
+            await DatabaseManager.run(_heavy, timeout=0.2)
+
+        assert DatabaseManager.get_timeout_stats()["total"] == before + 1
+        # Соединение возвращено в пул без progress handler'а
+        assert await DatabaseManager.run(lambda s: s.execute(text("SELECT 1")).scalar()) == 1
+
+    async def test_read_only_run_uses_query_only_pool(self):
+        """Тест что аналитические запросы идут через пул только для чтения"""
+        from sqlalchemy import text
+
+        def _query_only(session):
+            return session.execute(text("PRAGMA query_only")).scalar()
+
+        assert await DatabaseManager.run(_query_only, read_only=True) == 1
+        assert await DatabaseManager.run(_query_only) == 0
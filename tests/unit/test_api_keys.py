@@ -0,0 +1,130 @@
+"""
+Тесты проверки API ключей и отложенного учета использования
+"""
+import hashlib
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import utils.api_keys as api_keys
+from models.models import ApiKey, ApiKeyUsage
+from utils.api_keys import APIKeyManager, APIKeyScope, APIKeyUsageRecorder
+
+RAW_KEY = "ak_" + "x" * 40
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    ApiKey.__table__.create(engine)
+    ApiKeyUsage.__table__.create(engine)
+    factory = sessionmaker(bind=engine)
+
+    with factory() as session:
+        session.add(ApiKey(
+            id=1,
+            name="crm",
+            key_hash=hashlib.sha256(RAW_KEY.encode()).hexdigest(),
+            scopes=["read_only"],
+            ip_whitelist=["10.0.0.1"],
+            rate_limit=2,
+            created_by="admin",
+        ))
+        session.commit()
+    return factory
+
+
+@pytest.fixture
+def db_env(monkeypatch, session_factory):
+    """DatabaseManager.run и очередь записи поверх SQLite в памяти"""
+    reads = []
+
+    async def _run(func, **kwargs):
+        reads.append(func)
+        with session_factory() as session:
+            return func(session)
+
+    async def _submit(func):
+        with session_factory() as session:
+            func(session)
+            session.commit()
+
+    monkeypatch.setattr(api_keys.DatabaseManager, "run", staticmethod(_run))
+    monkeypatch.setattr(api_keys.db_write_queue, "submit", _submit)
+    return reads
+
+
+@pytest.mark.asyncio
+class TestAPIKeyManager:
+    """Тесты кэша проверенных ключей"""
+
+    async def test_validated_key_cached(self, db_env):
+        manager = APIKeyManager(cache_ttl=60, negative_ttl=60)
+
+        first = await manager.validate_api_key(RAW_KEY, APIKeyScope.READ_ONLY, "10.0.0.1")
+        assert first.name == "crm"
+        assert await manager.validate_api_key(RAW_KEY, APIKeyScope.ADMIN, "10.0.0.1") is None
+        assert await manager.validate_api_key(RAW_KEY, None, "10.0.0.2") is None
+        assert len(db_env) == 1
+
+        # Лимит 2 запроса в час: третий успешный отклоняется
+        assert await manager.validate_api_key(RAW_KEY, None, "10.0.0.1") is not None
+        assert await manager.validate_api_key(RAW_KEY, None, "10.0.0.1") is None
+
+        # Несуществующий ключ тоже запоминается
+        assert await manager.validate_api_key("ak_" + "y" * 40) is None
+        assert await manager.validate_api_key("ak_" + "y" * 40) is None
+        assert len(db_env) == 2
+
+    async def test_invalidation_message_drops_key(self, db_env):
+        manager = APIKeyManager(cache_ttl=60)
+        key_hash = manager._hash_key(RAW_KEY)
+        await manager.get_key(key_hash)
+
+        manager._drop([key_hash], clear=False)
+        await manager.get_key(key_hash)
+        assert len(db_env) == 2
+
+    async def test_stats_count_positive_and_missing_keys(self, db_env, monkeypatch):
+        manager = APIKeyManager(cache_ttl=60, negative_ttl=0)
+        await manager.get_key(manager._hash_key(RAW_KEY))
+        # Истекшая отрицательная запись перезаписывается, а не считается дважды
+        for _ in range(3):
+            await manager.get_key("missing")
+        await manager.get_key("other")
+        assert manager.get_stats()["cached_keys"] == 1
+        assert manager.get_stats()["missing_keys"] == 2
+
+        manager._drop(["missing"], clear=False)
+        assert manager.get_stats()["missing_keys"] == 1
+
+        # При переполнении сначала удаляются истекшие, затем все отрицательные записи
+        monkeypatch.setattr(api_keys, "_NEGATIVE_CACHE_MAX", 2)
+        manager.negative_ttl = 60
+        await manager.get_key("third")
+        await manager.get_key("fourth")
+        assert manager.get_stats()["missing_keys"] == 2
+        await manager.get_key("fifth")
+        assert manager.get_stats()["missing_keys"] == 1
+        assert manager.get_stats()["cached_keys"] == 1
+
+
+@pytest.mark.asyncio
+class TestAPIKeyUsageRecorder:
+    """Тесты пакетной записи использования"""
+
+    async def test_flush_aggregates(self, db_env, session_factory):
+        recorder = APIKeyUsageRecorder(flush_interval=3600, max_buffer=2)
+        for status in (200, 404, 200):
+            recorder.record(1, "/external/bookings", "GET", status, 5, "10.0.0.1", "curl")
+
+        assert recorder.get_stats()["dropped_rows"] == 1
+        await recorder.close()
+
+        with session_factory() as session:
+            api_key = session.get(ApiKey, 1)
+            assert api_key.request_count == 3
+            assert api_key.last_used_at is not None
+            assert session.query(ApiKeyUsage).count() == 2
+        assert recorder.get_stats()["pending_requests"] == 0
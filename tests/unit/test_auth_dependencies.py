@@ -0,0 +1,121 @@
+"""
+Тесты проверки JWT токенов администраторов
+"""
+import time
+import uuid
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import dependencies
+from config import ALGORITHM, get_secret_key_jwt
+from models.models import AdminRole, Permission
+from utils.token_revocation import TokenRevocationStore
+
+
+def _credentials(**claims):
+    payload = {"sub": "admin", "iat": int(time.time()), "exp": int(time.time()) + 600}
+    payload.update(claims)
+    token = jwt.encode(payload, get_secret_key_jwt(), algorithm=ALGORITHM)
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture
+def auth_env(monkeypatch):
+    """Изолированные кэш администраторов и хранилище отзывов, счетчик запросов к БД"""
+    db_calls = []
+    admin_data = {
+        "id": 7,
+        "login": "admin",
+        "role": AdminRole.MANAGER,
+        "is_active": True,
+        "permissions": [],
+    }
+
+    async def _run(func, **kwargs):
+        db_calls.append(func)
+        return dict(admin_data)
+
+    store = TokenRevocationStore()
+    monkeypatch.setattr(dependencies.DatabaseManager, "run", staticmethod(_run))
+    monkeypatch.setattr(dependencies, "token_revocation", store)
+    monkeypatch.setattr(dependencies, "_admin_cache", dependencies.ThreadSafeCache())
+    return store, db_calls
+
+
+@pytest.mark.asyncio
+class TestVerifyToken:
+    """Тесты зависимости verify_token"""
+
+    async def test_cached_admin_needs_no_db(self, auth_env):
+        _, db_calls = auth_env
+
+        first = await dependencies.verify_token(_credentials(aid=7, jti=str(uuid.uuid4())))
+        second = await dependencies.verify_token(_credentials(aid=7, jti=str(uuid.uuid4())))
+
+        assert first.id == second.id == 7
+        assert len(db_calls) == 1
+
+    async def test_revoked_jti_rejected(self, auth_env):
+        store, _ = auth_env
+        jti = str(uuid.uuid4())
+        await store.revoke_token(jti, time.time() + 600)
+
+        with pytest.raises(HTTPException) as error:
+            await dependencies.verify_token(_credentials(aid=7, jti=jti))
+        assert error.value.detail == "Token has been revoked"
+
+    async def test_admin_wide_revocation(self, auth_env):
+        store, _ = auth_env
+        old_token = _credentials(aid=7, iat=int(time.time()) - 60)
+        await store.revoke_admin(7, time.time() - 30)
+
+        with pytest.raises(HTTPException) as error:
+            await dependencies.verify_token(old_token)
+        assert error.value.status_code == 401
+
+        # Токен без claim aid (выдан до его появления) проверяется по ID из кэша
+        with pytest.raises(HTTPException):
+            await dependencies.verify_token(_credentials(iat=int(time.time()) - 60))
+
+        fresh = await dependencies.verify_token(_credentials(aid=7))
+        assert fresh.login == "admin"
+
+    async def test_remote_revocation_message(self):
+        store = TokenRevocationStore()
+        store._on_invalidation(["jti:abc:9999999999", "admin:3:100.5"], clear=False)
+
+        assert store.is_token_revoked("abc")
+        assert store.is_admin_revoked(3, 100)
+        assert not store.is_admin_revoked(3, 101)
+
+
+@pytest.mark.asyncio
+class TestPermissionMask:
+    """Тесты маски разрешений CachedAdmin"""
+
+    async def test_mask_checks(self):
+        admin = dependencies.CachedAdmin(
+            id=1, login="manager", role=AdminRole.MANAGER,
+            permissions=["view_users", "edit_users"],
+        )
+        assert admin.has_permission(Permission.VIEW_USERS)
+        assert not admin.has_permission(Permission.DELETE_USERS)
+        assert admin.has_permissions(
+            dependencies.permission_mask([Permission.VIEW_USERS, Permission.EDIT_USERS])
+        )
+
+        checker = dependencies.verify_token_with_permissions(
+            [Permission.VIEW_USERS, Permission.DELETE_USERS]
+        )
+        with pytest.raises(HTTPException) as error:
+            await checker(current_admin=admin)
+        assert error.value.detail == "Insufficient permissions. Required: delete_users"
+
+    async def test_super_admin_has_all(self):
+        admin = dependencies.CachedAdmin(id=1, login="root", role="super_admin", permissions=[])
+        assert admin.is_super_admin
+        assert all(admin.has_permission(permission) for permission in Permission)
+        assert await dependencies.require_super_admin(current_admin=admin) is admin
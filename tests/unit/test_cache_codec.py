@@ -0,0 +1,54 @@
+"""
+Тесты сериализации значений кэша
+"""
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from utils.cache_codec import FLAG_COMPRESSED, CacheCodec, key_namespace
+
+
+class TestCacheCodec:
+    """Тесты кодека кэша"""
+
+    def test_roundtrip_native_types(self):
+        """Даты, время и Decimal возвращаются своими типами"""
+        codec = CacheCodec()
+        value = {
+            "day": date(2024, 1, 31),
+            "created_at": datetime(2024, 1, 31, 10, 30, tzinfo=timezone.utc),
+            "visit_time": time(9, 15),
+            "amount": Decimal("1250.50"),
+            "duration": timedelta(hours=2),
+            "rows": [{"id": 1, "paid": True, "comment": None}],
+        }
+
+        assert codec.decode(codec.encode(value)) == value
+
+    def test_compression_above_threshold(self):
+        """Большие значения сжимаются, маленькие - нет"""
+        codec = CacheCodec(compress_threshold=256)
+        small = codec.encode({"a": 1})
+        large = codec.encode({"rows": ["Опенспейс"] * 200})
+
+        assert not small[0] & FLAG_COMPRESSED
+        assert large[0] & FLAG_COMPRESSED
+        assert codec.decode(large) == {"rows": ["Опенспейс"] * 200}
+
+    def test_legacy_values_are_readable(self):
+        """Значения, записанные до кодека, читаются как раньше"""
+        codec = CacheCodec()
+
+        assert codec.decode(json.dumps({"x": [1, 2]}).encode()) == {"x": [1, 2]}
+        assert codec.decode(b"revoked") == "revoked"
+
+    def test_stats_by_namespace(self):
+        """Размеры и время считаются по префиксу ключа"""
+        codec = CacheCodec()
+        payload = codec.encode([1, 2, 3], key_namespace("dashboard:stats"))
+        codec.decode(payload, "dashboard")
+
+        stats = codec.get_stats()["namespaces"]["dashboard"]
+        assert stats["encoded"] == 1
+        assert stats["decoded"] == 1
+        assert stats["avg_stored_bytes"] == len(payload)
@@ -2,9 +2,29 @@
 Тесты для системы кэширования
 """
 import pytest
+import pytest_asyncio
 import asyncio
+import time
 from unittest.mock import AsyncMock, patch
-from utils.cache_manager import CacheManager, MemoryCache
+from utils.cache_manager import CacheManager, MemoryCache, default_tags, pattern_tag
+from utils.cache_metrics import CacheMetrics
+from utils.histogram import Histogram
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def close_memory_caches(monkeypatch):
+    """Останавливает фоновую очистку всех MemoryCache, созданных в тесте"""
+    created = []
+    original_init = MemoryCache.__init__
+
+    def _init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        created.append(self)
+
+    monkeypatch.setattr(MemoryCache, "__init__", _init)
+    yield
+    for cache in created:
+        await cache.close()
 
 
 @pytest.mark.asyncio
@@ -104,6 +124,73 @@ class TestMemoryCache:
         assert "user:1" in user_keys
         assert "user:2" in user_keys
 
+    async def test_lru_eviction_by_entries(self):
+        """Тест LRU-вытеснения при превышении числа записей"""
+        cache = MemoryCache(max_entries=2)
+
+        await cache.set("a", 1, ttl=60)
+        await cache.set("b", 2, ttl=60)
+        await cache.get("a")  # "b" становится самым старым
+        await cache.set("c", 3, ttl=60)
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == 1
+        assert await cache.get("c") == 3
+        assert cache.get_stats()["evictions"] == 1
+
+    async def test_eviction_by_bytes(self):
+        """Тест вытеснения по бюджету памяти"""
+        cache = MemoryCache(max_bytes=4096)
+
+        for i in range(10):
+            await cache.set(f"blob:{i}", "x" * 1000, ttl=60)
+
+        stats = cache.get_stats()
+        assert stats["bytes"] <= 4096
+        assert stats["entries"] < 10
+        assert await cache.get("blob:9") is not None
+
+    async def test_ttl_wheel_sweep(self):
+        """Тест фоновой очистки просроченных записей без чтения"""
+        cache = MemoryCache(sweep_interval=1.0)
+
+        await cache.set("short", "value", ttl=1)
+        await cache.set("long", "value", ttl=60)
+
+        assert cache.sweep(now=time.time() + 3) == 1
+        stats = cache.get_stats()
+        assert stats["entries"] == 1
+        assert stats["expirations"] == 1
+        await cache.close()
+
+    async def test_hit_miss_counters(self):
+        """Тест счетчиков попаданий и промахов"""
+        cache = MemoryCache()
+
+        await cache.set("key", "value", ttl=60)
+        await cache.get("key")
+        await cache.get("missing")
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    async def test_tag_invalidation(self):
+        """Тест удаления по тегам, включая теги по префиксам ключа"""
+        cache = MemoryCache()
+
+        await cache.set("dashboard:chart_data:2024:8", "chart", ttl=60)
+        await cache.set("dashboard:stats", "stats", ttl=60)
+        await cache.set("bookings:stats", "stats", ttl=60, tags=["bookings", "dashboard"])
+        await cache.set("user:5:bookings", "list", ttl=60)
+
+        assert await cache.invalidate_tags(["dashboard:chart_data"]) == 1
+        assert await cache.invalidate_tags(["dashboard"]) == 2
+        assert await cache.get("user:5:bookings") == "list"
+        assert await cache.invalidate_tags(["user:5"]) == 1
+        assert cache.tag_count("user") == 0
+
 
 @pytest.mark.asyncio
 class TestCacheManager:
@@ -220,6 +307,129 @@ class TestCacheManager:
         assert dashboard_chart is None
         assert user_data is not None
     
+    async def test_pattern_to_tag(self):
+        """Тест сопоставления паттернов и тегов"""
+        assert default_tags("dashboard:chart_data:2024:8") == ["dashboard", "dashboard:chart_data"]
+        assert default_tags("offices:active") == ["offices"]
+        assert pattern_tag("dashboard:*") == "dashboard"
+        assert pattern_tag("dashboard:bookings_calendar:*") == "dashboard:bookings_calendar"
+        assert pattern_tag("dash*:*") is None
+        assert pattern_tag("user:*:bookings") is None
+
+    async def test_remote_invalidation(self):
+        """Тест применения инвалидаций, разосланных другими процессами"""
+        manager = CacheManager()
+        received = []
+        manager.add_invalidation_listener("admin", lambda keys, clear: received.append((keys, clear)))
+
+        await manager.set("tariffs:active", [1, 2], ttl=60)
+        await manager.set("dashboard:stats", {"x": 1}, ttl=60)
+
+        # Собственные сообщения игнорируются
+        await manager._apply_invalidation({"origin": manager.instance_id, "keys": ["tariffs:active"]})
+        assert await manager.get("tariffs:active") == [1, 2]
+
+        await manager._apply_invalidation({"origin": "other", "keys": ["tariffs:active"], "tags": ["dashboard"]})
+        await manager._apply_invalidation({"origin": "other", "scope": "admin", "keys": ["admin:root"]})
+
+        assert await manager.get("tariffs:active") is None
+        assert await manager.get("dashboard:stats") is None
+        assert received == [(["admin:root"], False)]
+
+    async def test_near_cache_ttl_capped_on_set(self, monkeypatch):
+        """Тест: копия в памяти процесса живет не дольше NEAR_CACHE_MAX_TTL"""
+        fakeredis = pytest.importorskip("fakeredis")
+        from utils.cache_manager import NEAR_CACHE_MAX_TTL
+
+        server = fakeredis.FakeServer()
+        manager = CacheManager()
+        manager._use_redis = True
+        manager._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        manager._redis_bin = fakeredis.FakeAsyncRedis(server=server)
+
+        ttls = []
+        memory_set = manager._memory_cache.set
+
+        async def _set(key, value, ttl=None, *args, **kwargs):
+            ttls.append(ttl)
+            return await memory_set(key, value, ttl, *args, **kwargs)
+
+        monkeypatch.setattr(manager._memory_cache, "set", _set)
+
+        await manager.set("tariffs:active", [1, 2], ttl=NEAR_CACHE_MAX_TTL * 10)
+        await manager.bulk_set({"users:1": {"id": 1}}, ttl=NEAR_CACHE_MAX_TTL * 10)
+        await manager.set("tariffs:short", [3], ttl=1)
+
+        assert ttls == [NEAR_CACHE_MAX_TTL, NEAR_CACHE_MAX_TTL, 1]
+        assert await manager._redis.ttl("tariffs:active") > NEAR_CACHE_MAX_TTL
+
+    async def test_namespace_metrics(self):
+        """Тест счетчиков по пространствам имен и гистограмм задержек"""
+        manager = CacheManager()
+        metrics = CacheMetrics()
+
+        with patch("utils.cache_manager.cache_metrics", metrics):
+            await manager.set("dashboard:stats", {"x": 1}, ttl=60)
+            await manager.get("dashboard:stats")
+            await manager.get("dashboard:missing")
+            await manager.get("users:1")
+            await manager.delete("users:1")
+
+        stats = metrics.get_stats()
+        assert stats["namespaces"]["dashboard"]["hits"] == 1
+        assert stats["namespaces"]["dashboard"]["misses"] == 1
+        assert stats["namespaces"]["dashboard"]["hit_ratio"] == 0.5
+        assert stats["namespaces"]["users"]["by_tier"]["memory"]["deletes"] == 1
+        assert stats["latency_ms"]["get:memory"]["count"] == 3
+
+        lines = metrics.prometheus_lines()
+        assert 'cache_requests_total{namespace="dashboard",tier="memory",result="hits"} 1' in lines
+        assert 'cache_operation_duration_seconds_count{op="get",tier="memory"} 3' in lines
+
+    async def test_table_version_invalidation(self, tmp_path):
+        """Тест автоматической инвалидации по версиям таблиц после коммита"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from models.models import Base, Tariff
+
+        engine = create_engine(f"sqlite:///{tmp_path}/versions.db")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        manager = CacheManager()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            return len(calls)
+
+        assert await manager.get_or_set("tariffs:list", factory, ttl=60, depends_on=["tariffs"]) == 1
+        assert await manager.get_or_set("tariffs:list", factory, ttl=60, depends_on=["tariffs"]) == 1
+
+        # Откаченные изменения версию не меняют
+        session.add(Tariff(name="Черновик", price=100))
+        session.flush()
+        session.rollback()
+        assert await manager.get_or_set("tariffs:list", factory, ttl=60, depends_on=["tariffs"]) == 1
+
+        session.add(Tariff(name="Опенспейс", price=500))
+        session.commit()
+        assert await manager.get_or_set("tariffs:list", factory, ttl=60, depends_on=["tariffs"]) == 2
+
+        session.close()
+        engine.dispose()
+
+    async def test_histogram_percentiles(self):
+        """Тест оценки перцентилей и экспорта гистограммы"""
+        histogram = Histogram(buckets=(1, 2, 5, 10))
+        for value in (0.5,) * 50 + (3,) * 45 + (8,) * 5:
+            histogram.observe(value)
+
+        assert histogram.percentile(50) <= 1
+        assert 2 <= histogram.percentile(95) <= 5
+        assert 5 <= histogram.percentile(99) <= 8
+        assert histogram.prometheus("x")[:3] == ["x_bucket{le=\"1.0\"} 50", "x_bucket{le=\"2.0\"} 50", "x_bucket{le=\"5.0\"} 95"]
+
     async def test_error_handling(self):
         """Тест обработки ошибок"""
         manager = CacheManager()
@@ -293,10 +503,160 @@ class TestCacheIntegration:
         # Все результаты должны быть одинаковыми
         assert all(r["computed"] == results[0]["computed"] for r in results)
         
-        # Factory функция может вызываться несколько раз из-за гонки условий,
-        # но это нормальное поведение для нашей реализации
+        # Single-flight: пересчет выполняется один раз, остальные ждут его результат
+        assert call_count == 1
+        assert manager.single_flight_stats["coalesced_waits"] == 4
+
+    async def test_stale_while_revalidate(self):
+        """Тест отдачи устаревшего значения с фоновым пересчетом"""
+        manager = CacheManager()
+        manager._use_redis = False
+
+        call_count = 0
+
+        async def factory():
+            nonlocal call_count
+            call_count += 1
+            return {"version": call_count}
+
+        first = await manager.get_or_set("swr_key", factory, ttl=1, stale_ttl=60)
+        assert first == {"version": 1}
+        assert await manager.get("swr_key") == {"version": 1}
+
+        await asyncio.sleep(1.1)
+
+        # Значение устарело: отдается старое, пересчет идет в фоне
+        stale = await manager.get_or_set("swr_key", factory, ttl=1, stale_ttl=60)
+        assert stale == {"version": 1}
+        await asyncio.sleep(0.05)
+
+        assert await manager.get("swr_key") == {"version": 2}
+        assert manager.single_flight_stats["stale_served"] == 1
+        assert manager.single_flight_stats["background_refreshes"] == 1
+
+    async def test_single_flight_error_propagates(self):
+        """Тест: ошибка пересчета получают все ожидающие, ключ не блокируется"""
+        manager = CacheManager()
+        manager._use_redis = False
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *[manager.get_or_set("fail_key", failing, ttl=60) for _ in range(3)],
+            return_exceptions=True
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+        assert manager._inflight == {}
+
+    async def test_single_flight_leader_cancelled(self):
+        """Тест: отмена запроса, начавшего пересчет, не отменяет его для ожидающих"""
+        manager = CacheManager()
+        manager._use_redis = False
+        calls = 0
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "value"
+
+        leader = asyncio.ensure_future(manager.get_or_set("sf_cancel", slow, ttl=60))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(manager.get_or_set("sf_cancel", slow, ttl=60)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        assert await asyncio.gather(*waiters) == ["value", "value"]
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        assert calls == 1
+        assert manager.single_flight_stats["coalesced_waits"] == 2
+        assert manager._inflight == {}
+        assert await manager.get("sf_cancel") == "value"
+
+
+class TestTableVersions:
+    """Тесты версий таблиц: отслеживание записей и отправка в Redis"""
+
+    def test_text_writes_bump_versions(self, tmp_path):
+        """Текстовые INSERT/UPDATE/DELETE через сессию увеличивают версии таблиц"""
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import sessionmaker
+        from models.models import Base, Tariff
+        from utils.cache_versions import table_versions
+
+        engine = create_engine(f"sqlite:///{tmp_path}/text_writes.db")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.add(Tariff(name="Опенспейс", price=500))
+        session.commit()
+        table_versions.flush()
+
+        before = table_versions.local(["tariffs"])[0]
+        session.execute(text("SELECT * FROM tariffs")).all()
+        session.commit()
+        assert table_versions.local(["tariffs"])[0] == before
+
+        session.execute(text("UPDATE tariffs SET price = price + 1"))
+        session.commit()
+        assert table_versions.local(["tariffs"])[0] > before
+
+        session.close()
+        engine.dispose()
+
+    def test_text_write_tables(self):
+        """Разбор таблиц из текстового SQL"""
+        from utils.cache_versions import _text_write_tables
+
+        assert _text_write_tables("UPDATE users SET phone = :p") == {"users"}
+        assert _text_write_tables('delete from "bookings" where id = 1') == {"bookings"}
+        assert _text_write_tables(
+            "INSERT INTO dashboard_daily (day) VALUES (:d) ON CONFLICT(day) DO UPDATE SET total = 1"
+        ) == {"dashboard_daily"}
+        assert _text_write_tables("INSERT OR REPLACE INTO tariffs VALUES (1)") == {"tariffs"}
+        assert _text_write_tables("SELECT updated_at FROM users") == set()
+
+    def test_bump_does_not_wait_for_redis(self, monkeypatch):
+        """bump() не ждет Redis: INCR и рассылка выполняются в фоновом потоке"""
+        import threading
+        fakeredis = pytest.importorskip("fakeredis")
+        from utils.cache_versions import VERSION_KEY_PREFIX, TableVersions
+
+        client = fakeredis.FakeRedis(decode_responses=True)
+        client.set(f"{VERSION_KEY_PREFIX}users", 41)
+        versions = TableVersions()
+        versions._redis = client
+
+        release = threading.Event()
+        publish = versions._publish
+
+        def _slow_publish(tables):
+            release.wait(5)
+            publish(tables)
+
+        monkeypatch.setattr(versions, "_publish", _slow_publish)
+
+        started = time.monotonic()
+        versions.bump(["users"])
+        assert time.monotonic() - started < 1
+
+        # До ответа Redis версия известна только процессу и не считается общей
+        assert versions.local(["users"]) == [1]
+        assert versions.known(["users"]) is None
+        versions.observe({"users": 41}, versions.generation)
+        assert versions.known(["users"]) is None
+
+        release.set()
+        assert versions.flush()
+        assert versions.known(["users"]) == [42]
+        assert client.get(f"{VERSION_KEY_PREFIX}users") == "42"
+        assert versions.stats["redis_batches"] == 1
 
 
 if __name__ == "__main__":
     # Запуск тестов
-    pytest.main([__file__, "-v"])
\ No newline at end of file
+    pytest.main([__file__, "-v"])
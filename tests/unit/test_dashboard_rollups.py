@@ -0,0 +1,138 @@
+"""
+Тесты дневных агрегатов дашборда
+"""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models.models import Base, Booking, Promocode, Tariff, Ticket, TicketStatus, User
+from utils.dashboard_rollups import (
+    ROLLUP_TABLES,
+    ensure_rollups,
+    get_daily_series,
+    get_period_totals,
+    rebuild_rollups,
+)
+from utils.date_ranges import day_bounds
+
+
+@pytest.fixture
+def session(tmp_path):
+    """Пустая база с таблицами агрегатов и триггерами"""
+    engine = create_engine(f"sqlite:///{tmp_path}/rollups.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    ensure_rollups(session)
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _snapshot(session):
+    """Непустые строки агрегатов (после вычитаний остаются нулевые строки)"""
+    return {
+        table: [
+            tuple(row)
+            for row in session.execute(text(f"SELECT * FROM {table} ORDER BY 1, 2"))
+            if any(isinstance(v, (int, float)) and v for v in tuple(row)[2:])
+        ]
+        for table in ROLLUP_TABLES
+    }
+
+
+def _booking(user, tariff, created_at, amount, paid=False, promocode=None):
+    return Booking(
+        user_id=user.id,
+        tariff_id=tariff.id,
+        promocode_id=promocode.id if promocode else None,
+        visit_date=created_at.date(),
+        amount=amount,
+        paid=paid,
+        created_at=created_at,
+    )
+
+
+@pytest.fixture
+def history(session):
+    """Пользователи, бронирования и тикеты за два дня января"""
+    day1 = datetime(2024, 1, 10, 12, 0)
+    day2 = datetime(2024, 1, 11, 9, 30)
+
+    tariff = Tariff(name="Опенспейс", price=500)
+    promo = Promocode(name="SALE", discount=10, is_active=True)
+    alice = User(telegram_id=1, full_name="Alice", reg_date=day1, first_join_time=day1)
+    bob = User(telegram_id=2, full_name="Bob", first_join_time=day2)
+    session.add_all([tariff, promo, alice, bob])
+    session.flush()
+
+    session.add_all([
+        _booking(alice, tariff, day1, 500, paid=True),
+        _booking(alice, tariff, day2, 450, paid=True, promocode=promo),
+        _booking(bob, tariff, day2, 500),
+        Ticket(user_id=bob.id, description="help", created_at=day2),
+    ])
+    session.commit()
+    return {"tariff": tariff, "promo": promo, "alice": alice, "bob": bob}
+
+
+class TestRollupTriggers:
+    """Тесты инкрементального обновления агрегатов"""
+
+    def test_inserts_are_counted(self, session, history):
+        totals = get_period_totals(session, "2024-01-01", "2024-02-01")
+
+        assert totals["new_users"] == 2
+        assert totals["registered_users"] == 1
+        assert totals["converted_users"] == 2
+        assert totals["bookings"] == 3
+        assert totals["paid_bookings"] == 2
+        assert totals["revenue"] == 950
+        assert totals["tickets"] == 1
+        assert totals["open_tickets"] == 1
+
+    def test_updates_and_deletes_match_rebuild(self, session, history):
+        bookings = session.query(Booking).order_by(Booking.id).all()
+        # Оплата, отмена и смена тарифа переносят вклад строки
+        bookings[2].paid = True
+        bookings[0].cancelled = True
+        other = Tariff(name="Переговорная", price=1000)
+        session.add(other)
+        session.flush()
+        bookings[1].tariff_id = other.id
+        session.query(Ticket).one().status = TicketStatus.CLOSED
+        session.commit()
+
+        # Удаление единственного бронирования Bob снимает его конверсию
+        session.delete(bookings[2])
+        session.commit()
+
+        incremental = _snapshot(session)
+        rebuild_rollups(session)
+        session.commit()
+
+        assert _snapshot(session) == incremental
+        totals = get_period_totals(session, "2024-01-01", "2024-02-01")
+        assert totals["converted_users"] == 1
+        assert totals["open_tickets"] == 0
+
+
+class TestRollupQueries:
+    """Тесты чтения агрегатов за период"""
+
+    def test_day_bounds_half_open(self):
+        assert day_bounds(datetime(2024, 1, 1), datetime(2024, 2, 1)) == ("2024-01-01", "2024-02-01")
+        assert day_bounds(
+            datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59, 59)
+        ) == ("2024-01-01", "2024-02-01")
+
+    def test_daily_series_fills_empty_days(self, session, history):
+        series = get_daily_series(session, "2024-01-09", "2024-01-12")
+
+        assert [day["day"] for day in series] == [
+            date(2024, 1, d).isoformat() for d in (9, 10, 11)
+        ]
+        assert [day["bookings"] for day in series] == [0, 1, 2]
+        assert [day["new_users"] for day in series] == [0, 1, 1]
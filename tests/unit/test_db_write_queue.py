@@ -0,0 +1,84 @@
+"""
+Тесты для очереди записи с group commit
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from models.models import create_writer_engine
+from utils.db_write_queue import SQLiteWriteQueue
+
+
+@pytest.fixture
+def write_queue(tmp_path):
+    """Очередь записи поверх временной базы"""
+    engine = create_writer_engine(f"sqlite:///{tmp_path}/writer.db")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)"
+        )
+
+    queue = SQLiteWriteQueue(batch_window_ms=20, engine=engine)
+    yield queue, engine
+    queue.stop()
+    engine.dispose()
+
+
+def _insert(name):
+    def _op(session):
+        session.execute(text("INSERT INTO items (name) VALUES (:name)"), {"name": name})
+        session.commit()
+        return name
+    return _op
+
+
+def _count(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM items").scalar()
+
+
+@pytest.mark.asyncio
+class TestSQLiteWriteQueue:
+    """Тесты для SQLiteWriteQueue"""
+
+    async def test_concurrent_writes_are_group_committed(self, write_queue):
+        """Конкурентные записи объединяются в общие транзакции"""
+        queue, engine = write_queue
+
+        results = await asyncio.gather(*[queue.submit(_insert(f"item{i}")) for i in range(50)])
+
+        assert results == [f"item{i}" for i in range(50)]
+        assert _count(engine) == 50
+
+        stats = queue.get_stats()
+        assert stats["jobs"] == 50
+        assert stats["batches"] < 50
+
+    async def test_failed_operation_does_not_affect_batch(self, write_queue):
+        """Ошибка одной операции откатывает только ее SAVEPOINT"""
+        queue, engine = write_queue
+
+        results = await asyncio.gather(
+            queue.submit(_insert("a")),
+            queue.submit(_insert("a")),
+            queue.submit(_insert("b")),
+            return_exceptions=True,
+        )
+
+        assert results[0] == "a"
+        assert isinstance(results[1], Exception)
+        assert results[2] == "b"
+        assert _count(engine) == 2
+        assert queue.get_stats()["failed_jobs"] == 1
+
+    async def test_sync_execute_and_nested_write(self, write_queue):
+        """Синхронный execute и вложенная запись из операции очереди"""
+        queue, engine = write_queue
+
+        def _outer(session):
+            session.execute(text("INSERT INTO items (name) VALUES ('outer')"))
+            return queue.execute(_insert("inner"))
+
+        assert queue.execute(_outer, timeout=5) == "inner"
+        assert _count(engine) == 2
@@ -0,0 +1,117 @@
+"""
+Тесты локальной копии банов IP и поиска по подсетям
+"""
+import asyncio
+import math
+
+import pytest
+
+from utils.ip_ban_manager import CIDRBanTable, IPBanManager, parse_ban_target
+
+
+def _ban(target, expires_at=math.inf):
+    return {"ip": target, "reason": "test", "expires_at": expires_at}
+
+
+class TestParseBanTarget:
+    """Тесты нормализации адресов и подсетей"""
+
+    def test_normalizes(self):
+        assert parse_ban_target("203.0.113.7") == "203.0.113.7"
+        assert parse_ban_target("203.0.113.7/24") == "203.0.113.0/24"
+        assert parse_ban_target("203.0.113.7/32") == "203.0.113.7"
+        assert parse_ban_target("2001:db8::1/64") == "2001:db8::/64"
+
+    def test_rejects_invalid_and_wide(self):
+        for value in ("unknown", "203.0.113.0/8", "2001:db8::/16"):
+            with pytest.raises(ValueError):
+                parse_ban_target(value)
+
+
+class TestCIDRBanTable:
+    """Тесты longest prefix match"""
+
+    def test_match_most_specific(self):
+        table = CIDRBanTable()
+        table.add("203.0.113.0/24", _ban("203.0.113.0/24"))
+        table.add("203.0.113.7", _ban("203.0.113.7"))
+        table.add("2001:db8::/64", _ban("2001:db8::/64"))
+
+        assert table.match("203.0.113.7", 0)["ip"] == "203.0.113.7"
+        assert table.match("203.0.113.200", 0)["ip"] == "203.0.113.0/24"
+        assert table.match("::ffff:203.0.113.9", 0)["ip"] == "203.0.113.0/24"
+        assert table.match("2001:db8::42", 0)["ip"] == "2001:db8::/64"
+        assert table.match("203.0.114.1", 0) is None
+        assert table.match("not-an-ip", 0) is None
+
+        assert table.remove("203.0.113.7")
+        assert table.match("203.0.113.7", 0)["ip"] == "203.0.113.0/24"
+        assert len(table) == 2
+
+    def test_expired_ban_falls_back_to_network(self):
+        table = CIDRBanTable()
+        table.add("198.51.100.0/24", _ban("198.51.100.0/24", expires_at=200))
+        table.add("198.51.100.5", _ban("198.51.100.5", expires_at=100))
+
+        assert table.match("198.51.100.5", 150)["ip"] == "198.51.100.0/24"
+        assert len(table) == 1
+        assert table.purge(now=250) == 1
+        assert len(table) == 0
+
+
+@pytest.mark.asyncio
+class TestIPBanManagerSnapshot:
+    """Тесты копии банов в памяти поверх Redis"""
+
+    async def test_ban_applies_locally_and_loads(self, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+        async def _get_redis():
+            return client
+
+        writer, reader = IPBanManager(), IPBanManager()
+        for manager in (writer, reader):
+            manager._redis_available = True
+            monkeypatch.setattr(manager, "_get_redis", _get_redis)
+
+        assert await writer.ban_ip("203.0.113.9/24", reason="scanner", duration=3600)
+        assert not await writer.ban_ip("10.1.0.0/16")  # whitelist
+        assert (await writer.get_ban_info("203.0.113.77"))["ip"] == "203.0.113.0/24"
+
+        # Другой процесс: полная загрузка и точечное обновление по рассылке
+        assert await reader.load_snapshot()
+        ban_info = reader.find_ban("203.0.113.1")
+        assert ban_info["reason"] == "scanner"
+        assert 0 < ban_info["seconds_remaining"] <= 3600
+
+        assert await writer.unban_ip("203.0.113.0/24")
+        assert not await writer.is_banned("203.0.113.77")
+        await reader._refresh(["203.0.113.0/24"])
+        assert reader.find_ban("203.0.113.1") is None
+
+    async def test_sweep_purges_and_retries_snapshot(self, monkeypatch):
+        manager = IPBanManager()
+        loads = []
+
+        async def _load_snapshot():
+            loads.append(1)
+            manager._snapshot_loaded = True
+            return True
+
+        monkeypatch.setattr(manager, "load_snapshot", _load_snapshot)
+        manager._bans.add("198.51.100.7", _ban("198.51.100.7", expires_at=1))
+        manager._bans.add("198.51.100.8", _ban("198.51.100.8"))
+
+        # Первая проверка: истекший бан удален без обращения к нему,
+        # копия не загружена при старте - загрузка повторяется в фоне
+        assert manager.find_ban("198.51.100.8") is not None
+        assert len(manager._bans) == 1
+        await asyncio.gather(*manager._tasks)
+        assert loads == [1]
+
+        # Следующая очистка - через BAN_SWEEP_INTERVAL, загруженная копия не перечитывается
+        manager._next_sweep = 0
+        manager.find_ban("198.51.100.8")
+        await asyncio.gather(*manager._tasks)
+        assert loads == [1]
@@ -0,0 +1,164 @@
+"""
+Тесты фоновой очереди логов и ленивого форматирования
+"""
+import logging
+import threading
+
+from utils.logger import LogPipeline, UnifiedLogger
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class _Lazy:
+    """Аргумент, считающий свои форматирования"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "lazy"
+
+
+class TestLogPipeline:
+    """Тесты ограниченной очереди и фонового потока"""
+
+    def test_drops_when_full_and_reports(self):
+        pipeline = LogPipeline(max_size=2)
+        target = _ListHandler()
+        logger = logging.getLogger("tests.log_pipeline.drops")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(pipeline.create_handler())
+
+        # Поток еще не запущен: третья запись не помещается в очередь
+        logger.info("first %s", 1)
+        logger.info("second")
+        logger.error("third")
+        assert pipeline.get_stats()["dropped"] == {"ERROR": 1}
+
+        pipeline.start([target])
+        pipeline.stop()
+
+        # Запись о потерях - сразу после первой обработанной записи
+        assert target.messages[0] == "first 1"
+        assert "отброшено записей - 1" in target.messages[1]
+        assert target.messages[2] == "second"
+        assert pipeline.get_stats()["queued"] == 0
+
+    def test_prepare_freezes_args_and_exception(self):
+        pipeline = LogPipeline(max_size=10)
+        target = _ListHandler()
+        target.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("tests.log_pipeline.prepare")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(pipeline.create_handler())
+
+        items = ["a"]
+        logger.info("items=%s count=%d", items, 1)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+        # Объект изменился до записи фоновым потоком - в логе исходный текст
+        items.append("b")
+
+        record = pipeline.queue.queue[0]
+        assert record.args == ("['a']", 1)
+        assert pipeline.queue.queue[1].exc_info is None
+
+        pipeline.start([target])
+        pipeline.stop()
+
+        assert target.messages[0] == "items=['a'] count=1"
+        assert target.messages[1].startswith("failed\nTraceback")
+        assert "ValueError: boom" in target.messages[1]
+
+    def test_stop_with_full_queue(self):
+        pipeline = LogPipeline(max_size=2)
+        target = _ListHandler()
+        logger = logging.getLogger("tests.log_pipeline.full_stop")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(pipeline.create_handler())
+
+        pipeline.start([target])
+        handled = target.handle
+        entered, release = threading.Event(), threading.Event()
+
+        def _slow_handle(record):
+            entered.set()
+            release.wait(5)
+            return handled(record)
+
+        target.handle = _slow_handle
+        logger.info("record %s", 0)
+        assert entered.wait(5)
+        logger.info("record %s", 1)
+        logger.info("record %s", 2)
+        assert pipeline.queue.full()
+
+        # Очередь заполнена, пока поток ждет: stop() дожидается места для сигнала
+        errors = []
+
+        def _stop():
+            try:
+                pipeline.stop()
+            except Exception as e:
+                errors.append(e)
+
+        stopper = threading.Thread(target=_stop)
+        stopper.start()
+        release.set()
+        stopper.join(5)
+
+        assert not stopper.is_alive() and errors == []
+        assert target.messages[:3] == ["record 0", "record 1", "record 2"]
+
+
+class TestLazyFormatting:
+    """Тесты оберток UnifiedLogger"""
+
+    def test_propagated_record_masked(self):
+        unified = UnifiedLogger("tests.log_pipeline.masked")
+        unified.logger.setLevel(logging.INFO)
+        unified.logger.handlers.clear()
+        root_handler = _ListHandler()
+        logging.getLogger().addHandler(root_handler)
+        try:
+            unified.info("password=%s token=%s", "hunter2", "abcdef0123456789abcdef")
+        finally:
+            logging.getLogger().removeHandler(root_handler)
+
+        # Обработчики корневого логгера (Celery) получают уже замаскированную запись
+        assert root_handler.messages == ["password=*** token=***"]
+
+    def test_disabled_level_not_formatted(self):
+        unified = UnifiedLogger("tests.log_pipeline.lazy")
+        unified.logger.setLevel(logging.INFO)
+        # Только свой обработчик: общий фоновый поток форматировал бы запись параллельно
+        unified.logger.handlers.clear()
+        unified.logger.propagate = False
+        captured = []
+        handler = logging.Handler()
+        handler.emit = captured.append
+        unified.logger.addHandler(handler)
+
+        argument = _Lazy()
+        unified.debug("value %s", argument)
+        assert argument.formatted == 0
+
+        # Включенная запись собирается один раз - для маскирования; файл - вызывающий код
+        unified.info("value %s", argument)
+        assert len(captured) == 1
+        assert argument.formatted == 1
+        assert captured[0].getMessage() == "value lazy"
+        assert captured[0].filename == "test_log_pipeline.py"
@@ -0,0 +1,88 @@
+"""
+Тесты pure-ASGI конвейера middleware
+"""
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.responses import Response
+
+from utils.middleware import PipelineStage, RequestPipelineMiddleware, SecurityHeadersStage
+
+
+class _Recorder(PipelineStage):
+    def __init__(self, name, events, block_path=None):
+        self.name = name
+        self.events = events
+        self.block_path = block_path
+
+    async def before(self, ctx):
+        self.events.append(f"before:{self.name}")
+        if ctx.path == self.block_path:
+            return Response("blocked", status_code=403)
+        return None
+
+    def after(self, ctx, headers):
+        self.events.append(f"after:{self.name}:{ctx.status_code}")
+        headers[f"X-Stage-{self.name}"] = "1"
+
+    def failed(self, ctx, exc):
+        self.events.append(f"failed:{self.name}")
+
+
+def _client(stages):
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a,b\n", b"1,2\n"]), media_type="text/csv")
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(RequestPipelineMiddleware, stages=stages)
+    return TestClient(app, raise_server_exceptions=False)
+
+
+class TestRequestPipeline:
+    """Тесты порядка стадий и семантики вложенных middleware"""
+
+    def test_stage_order_and_headers(self):
+        events = []
+        client = _client([_Recorder("outer", events), _Recorder("inner", events)])
+
+        response = client.get("/ok")
+
+        assert response.status_code == 200
+        assert response.headers["X-Stage-outer"] == response.headers["X-Stage-inner"] == "1"
+        assert events == ["before:outer", "before:inner", "after:inner:200", "after:outer:200"]
+
+    def test_short_circuit_skips_inner_stages(self):
+        events = []
+        client = _client([
+            _Recorder("outer", events),
+            _Recorder("guard", events, block_path="/ok"),
+            _Recorder("inner", events),
+        ])
+
+        response = client.get("/ok")
+
+        assert response.status_code == 403
+        assert "X-Stage-inner" not in response.headers
+        assert events == ["before:outer", "before:guard", "after:outer:403"]
+
+    def test_streaming_and_failures(self):
+        events = []
+        client = _client([_Recorder("only", events), SecurityHeadersStage()])
+
+        response = client.get("/stream")
+        assert response.text == "a,b\n1,2\n"
+        assert response.headers["X-Frame-Options"] == "DENY"
+
+        events.clear()
+        assert client.get("/boom").status_code == 500
+        assert events == ["before:only", "failed:only"]
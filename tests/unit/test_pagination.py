@@ -0,0 +1,87 @@
+"""
+Тесты для keyset (cursor) пагинации
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.models import Base, Notification, User
+from utils.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+    paginate_keyset,
+    paginate_offset,
+)
+
+
+@pytest.fixture
+def session(tmp_path):
+    """Сессия с пользователем и уведомлениями, часть с одинаковым created_at"""
+    engine = create_engine(f"sqlite:///{tmp_path}/pagination.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    user = User(telegram_id=1, full_name="Test")
+    session.add(user)
+    session.flush()
+
+    base = datetime(2024, 1, 1, 12, 0)
+    for i in range(25):
+        # По три уведомления на одну и ту же секунду - проверка tie-break по id
+        session.add(
+            Notification(
+                user_id=user.id,
+                message=f"n{i}",
+                created_at=base + timedelta(seconds=i // 3),
+            )
+        )
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+class TestCursorEncoding:
+    """Тесты кодирования курсора"""
+
+    def test_roundtrip_preserves_datetime(self):
+        values = (datetime(2024, 5, 1, 10, 30, 15, 123), 42)
+        assert decode_cursor(encode_cursor(values), 2) == values
+
+    def test_malformed_cursor_rejected(self):
+        with pytest.raises(InvalidCursorError):
+            decode_cursor("not-a-cursor!!", 2)
+
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(encode_cursor((1,)), 2)
+
+
+class TestKeysetPagination:
+    """Тесты обхода списка курсором"""
+
+    def test_walk_matches_offset_order(self, session):
+        order = (Notification.created_at, Notification.id)
+        expected = [
+            n.id
+            for n in session.query(Notification)
+            .order_by(Notification.created_at.desc(), Notification.id.desc())
+            .all()
+        ]
+
+        seen = []
+        page, cursor = paginate_offset(session.query(Notification), order, 0, 10)
+        seen.extend(n.id for n in page)
+        while cursor:
+            page, cursor = paginate_keyset(session.query(Notification), order, cursor, 10)
+            seen.extend(n.id for n in page)
+
+        assert seen == expected
+
+    def test_last_page_has_no_cursor(self, session):
+        order = (Notification.created_at, Notification.id)
+        page, cursor = paginate_offset(session.query(Notification), order, 20, 10)
+        assert len(page) == 5
+        assert cursor is None
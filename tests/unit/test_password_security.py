@@ -0,0 +1,60 @@
+"""
+Тесты пула хеширования паролей
+"""
+import asyncio
+import time
+
+import pytest
+
+from utils.password_security import PasswordHashPool, PasswordHasherBusy
+
+
+def _slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.mark.asyncio
+class TestPasswordHashPool:
+    """Тесты ограничения конкурентности и отказов при перегрузке"""
+
+    async def test_verify_in_process_pool(self):
+        pool = PasswordHashPool(workers=1, max_pending=4, queue_timeout=30)
+        try:
+            stored = await pool.hash("secret", rounds=4)
+            assert await pool.verify_with_upgrade(stored, "secret") == (True, False, None)
+            assert (await pool.verify_with_upgrade(stored, "wrong"))[0] is False
+        finally:
+            pool.shutdown()
+
+        assert pool.get_stats()["completed"] == 3
+        assert pool.queue_time.count == 3
+
+    async def test_rejects_when_saturated(self):
+        pool = PasswordHashPool(workers=0, max_pending=2, queue_timeout=5)
+        try:
+            running = [asyncio.ensure_future(pool.run(_slow, 0.2)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+
+            with pytest.raises(PasswordHasherBusy) as error:
+                await pool.run(_slow, 0)
+            assert error.value.status_code == 503
+
+            assert await asyncio.gather(*running) == [0.2, 0.2]
+        finally:
+            pool.shutdown()
+
+        assert pool.stats["rejected_full"] == 1
+
+    async def test_rejects_after_queue_timeout(self):
+        pool = PasswordHashPool(workers=0, max_pending=4, queue_timeout=0.05)
+        try:
+            first = asyncio.ensure_future(pool.run(_slow, 0.3))
+            await asyncio.sleep(0.01)
+            with pytest.raises(PasswordHasherBusy):
+                await pool.run(_slow, 0)
+            await first
+        finally:
+            pool.shutdown()
+
+        assert pool.stats["rejected_timeout"] == 1
@@ -0,0 +1,72 @@
+"""
+Тесты rate limiting: GCRA в Redis и in-memory хранилище
+"""
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from utils.rate_limiter import REDIS_KEY_PREFIX, RateLimiter, RateLimitRule, ShardedWindowStore
+
+
+def _request(ip="203.0.113.5"):
+    return Request({"type": "http", "headers": [], "client": (ip, 1000), "state": {}})
+
+
+@pytest.mark.asyncio
+class TestRedisRateLimit:
+    """Тесты лимитов через скрипт GCRA"""
+
+    async def test_burst_then_reject(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")  # Lua-скрипты в fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        limiter = RateLimiter(client)
+        limiter.add_rule("test", RateLimitRule(requests=3, window=30))
+
+        remaining = [(await limiter.check_limit(_request(), "test")).requests_remaining for _ in range(3)]
+        assert remaining == [2, 1, 0]
+
+        with pytest.raises(HTTPException) as error:
+            await limiter.check_limit(_request(), "test")
+        assert error.value.status_code == 429
+        # Запас восстанавливается по одному запросу за window / requests секунд
+        assert error.value.detail["retry_after"] == 10
+        assert error.value.headers["Retry-After"] == "10"
+
+        # Другой клиент не затронут, состояние - одна строка на ключ
+        await limiter.check_limit(_request("203.0.113.6"), "test")
+        keys = await client.keys(f"{REDIS_KEY_PREFIX}*")
+        assert len(keys) == 2
+        assert all([await client.type(key) == "string" for key in keys])
+
+
+class TestShardedWindowStore:
+    """Тесты in-memory хранилища со скользящим окном"""
+
+    def test_sliding_window_estimate(self):
+        store = ShardedWindowStore(max_keys=100, shards=4)
+        start = 1000 * 60.0
+
+        assert all(store.hit("ip", 10, 60, start + 1)[0] for _ in range(10))
+        allowed, _, _, retry_after = store.hit("ip", 10, 60, start + 2)
+        assert not allowed
+        # Все 10 запросов в текущем окне: ждать следующего окна
+        assert 58 <= retry_after <= 59
+
+        # Середина следующего окна: из предыдущего учитывается половина
+        assert sum(store.hit("ip", 10, 60, start + 90)[0] for _ in range(10)) == 5
+
+    def test_key_cap_and_wheel_expiry(self):
+        store = ShardedWindowStore(max_keys=8, shards=2, sweep_interval=1.0)
+        store._swept_slot = 0
+        for index in range(20):
+            store.hit(f"ip{index}", 5, 10, 100.0)
+
+        assert len(store) == 8
+        assert store.get_stats()["evictions"] == 12
+
+        # Ключ нужен до конца следующего окна (120 с)
+        assert store.sweep(now=119.0) == 0
+        assert store.sweep(now=121.5) == 8
+        stats = store.get_stats()
+        assert stats["keys"] == 0 and stats["wheel_entries"] == 0
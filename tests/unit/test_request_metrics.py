@@ -0,0 +1,55 @@
+"""
+Тесты гистограмм задержек запросов по маршрутам
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.middleware import PerformanceStage, RequestPipelineMiddleware
+from utils.request_metrics import UNMATCHED_ROUTE, RequestMetrics, request_metrics
+
+
+class TestRequestMetrics:
+    """Тесты записи и экспорта"""
+
+    def test_pipeline_records_route_template(self):
+        app = FastAPI()
+
+        @app.get("/bookings/{booking_id}")
+        async def booking(booking_id: int):
+            return {"id": booking_id}
+
+        app.add_middleware(RequestPipelineMiddleware, stages=[PerformanceStage()])
+        client = TestClient(app)
+        request_metrics.reset()
+
+        for booking_id in (1, 2, 3):
+            assert client.get(f"/bookings/{booking_id}").status_code == 200
+        assert client.get("/wp-login.php").status_code == 404
+
+        routes = request_metrics.get_stats()["routes"]
+        assert set(routes) == {"GET /bookings/{booking_id}", f"GET {UNMATCHED_ROUTE}"}
+        booking_stats = routes["GET /bookings/{booking_id}"]
+        assert booking_stats["count"] == 3
+        assert booking_stats["statuses"] == {"200": 3}
+        assert 0 < booking_stats["p50"] <= booking_stats["p99"] <= booking_stats["max"]
+        request_metrics.reset()
+
+    def test_prometheus_histogram(self):
+        metrics = RequestMetrics()
+        for seconds in (0.002, 0.004, 0.3, 20.0):
+            metrics.observe("GET", "/bookings", 200, seconds)
+        metrics.observe("POST", "/bookings", 500, 0.01)
+
+        lines = metrics.prometheus_lines()
+        buckets = [
+            line for line in lines
+            if line.startswith('http_request_duration_seconds_bucket{method="GET",route="/bookings"')
+        ]
+        counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+
+        # Накопительные корзины, последняя +Inf равна _count
+        assert counts == sorted(counts)
+        assert buckets[-1].endswith('le="+Inf"} 4') and counts[-2] == 3
+        assert 'http_request_duration_seconds_count{method="GET",route="/bookings"} 4' in lines
+        assert 'http_responses_total{method="POST",route="/bookings",status="500"} 1' in lines
+        assert lines.count("# TYPE http_request_duration_seconds histogram") == 1
@@ -0,0 +1,99 @@
+"""
+Тесты для полнотекстового поиска (FTS5)
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models.models import Base, Booking, Tariff, User
+from utils.search_index import (
+    SEARCH_MAX_RESULTS,
+    build_match_query,
+    ensure_search_index,
+    search_ids,
+    search_subquery,
+)
+
+
+@pytest.fixture
+def session(tmp_path):
+    """Сессия над временной базой с FTS-индексами"""
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    # Строка до создания индекса попадает в него при первичном заполнении
+    session.add(User(telegram_id=1, full_name="Иван Петров", phone="+7 (999) 123-45-67"))
+    session.commit()
+    assert ensure_search_index(session)
+    session.commit()
+
+    yield session
+    session.close()
+    engine.dispose()
+
+
+class TestSearchIndex:
+    """Тесты FTS-поиска"""
+
+    def test_backfill_and_prefix_search(self, session):
+        user_id = session.query(User).filter_by(telegram_id=1).one().id
+
+        assert search_ids(session, "users", "пет") == [user_id]
+        assert search_ids(session, "users", "ИВАН") == [user_id]
+        assert search_ids(session, "users", "9991234567") == [user_id]
+        assert search_ids(session, "users", "сидоров") == []
+
+    def test_triggers_keep_index_in_sync(self, session):
+        user = User(telegram_id=2, full_name="Алёна Смирнова", email="alena@example.com")
+        session.add(user)
+        session.add(Tariff(name="Опенспейс день", price=500))
+        session.commit()
+
+        assert search_ids(session, "users", "алена") == [user.id]
+        assert len(search_ids(session, "tariffs", "опенс")) == 1
+
+        user.full_name = "Алёна Кузнецова"
+        session.commit()
+        assert search_ids(session, "users", "смирнова") == []
+        assert search_ids(session, "users", "кузн") == [user.id]
+
+        session.delete(user)
+        session.commit()
+        assert search_ids(session, "users", "alena") == []
+
+    def test_subquery_is_not_capped(self, session):
+        count = SEARCH_MAX_RESULTS + 50
+        session.bulk_insert_mappings(User, [
+            {"telegram_id": 1000 + index, "full_name": f"Сергей {index}"} for index in range(count)
+        ])
+        session.commit()
+
+        match = search_subquery("users", "серг")
+        assert session.query(User).filter(User.id.in_(match)).count() == count
+        assert len(search_ids(session, "users", "серг")) == SEARCH_MAX_RESULTS
+        assert search_subquery("users", " !! ") is None
+
+        # Запрос как в списке бронирований: фильтр по подзапросу в IN
+        user_ids = [user_id for (user_id,) in session.query(User.id).filter(User.full_name.like("Сергей%"))]
+        tariff = Tariff(name="День", price=500)
+        session.add(tariff)
+        session.flush()
+        session.bulk_insert_mappings(Booking, [
+            {"user_id": user_id, "tariff_id": tariff.id, "visit_date": date(2025, 1, 1), "amount": 500}
+            for user_id in user_ids
+        ])
+        session.commit()
+        assert session.query(Booking).filter(Booking.user_id.in_(match)).count() == count
+
+    def test_update_trigger_lists_source_columns(self, session):
+        sql = session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='users_fts_au'")
+        ).scalar()
+        assert "UPDATE OF full_name, username, phone, email ON users" in sql
+
+    def test_match_query_is_sanitized(self):
+        assert build_match_query('a" OR NEAR(') == '"a"* "OR"* "NEAR"*'
+        assert build_match_query("  !!  ") is None
@@ -1,65 +1,236 @@
 """
-Модуль для управления API ключами и аутентификацией внешних сервисов
+Модуль для управления API ключами и аутентификацией внешних сервисов.
+
+Проверка ключа на запрос - хеш SHA-256 и поиск в памяти процесса:
+- проверенные ключи (области доступа, IP, срок действия, лимит) кэшируются
+  на API_KEY_CACHE_TTL секунд, несуществующие - на API_KEY_NEGATIVE_TTL;
+- изменение/удаление/отключение ключа сбрасывает запись во всех процессах
+  через канал инвалидаций CacheManager (scope "api_keys", ключ - хеш);
+- счетчики request_count/last_used_at и строки ApiKeyUsage копятся в памяти
+  и записываются пачкой через очередь записи раз в
+  API_KEY_USAGE_FLUSH_INTERVAL секунд.
+
+Пример:
+    @router.get("/external/bookings")
+    async def external_bookings(key: Dict = Depends(verify_api_key_bookings)):
+        ...
 """
-import secrets
+import asyncio
 import hashlib
+import secrets
 import time
-from typing import Dict, Optional, List
-from enum import Enum
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
-from fastapi import HTTPException, Security, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
-from sqlalchemy.ext.declarative import declarative_base
+from fastapi import HTTPException, Request, Security
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import update
 
+from config import (
+    API_KEY_CACHE_TTL,
+    API_KEY_NEGATIVE_TTL,
+    API_KEY_USAGE_FLUSH_INTERVAL,
+    API_KEY_USAGE_MAX_BUFFER,
+)
+from models.models import ApiKey, ApiKeyUsage, DatabaseManager
+from utils.cache_manager import cache_manager
+from utils.db_write_queue import db_write_queue
 from utils.logger import get_logger
-from models.models import Base, DatabaseManager
 
 logger = get_logger(__name__)
 security = HTTPBearer(auto_error=False)
 
+# Scope сообщений об изменении ключей в канале инвалидаций
+API_KEYS_SCOPE = "api_keys"
+
+# Предел числа отрицательных записей (перебор ключей не раздувает память)
+_NEGATIVE_CACHE_MAX = 10000
+
 
 class APIKeyScope(Enum):
     """Области доступа для API ключей"""
     READ_ONLY = "read_only"           # Только чтение данных
-    BOOKINGS = "bookings"             # Управление бронированиями  
+    BOOKINGS = "bookings"             # Управление бронированиями
     USERS = "users"                   # Управление пользователями
     NOTIFICATIONS = "notifications"   # Отправка уведомлений
     MONITORING = "monitoring"         # Доступ к метрикам
     ADMIN = "admin"                   # Полный административный доступ
 
 
-class APIKey(Base):
-    """Модель API ключа"""
-    
-    __tablename__ = "api_keys"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)  # Человекочитаемое имя
-    key_hash = Column(String(64), nullable=False, unique=True, index=True)  # SHA-256 хэш ключа
-    key_prefix = Column(String(16), nullable=False, index=True)  # Префикс для быстрого поиска
-    scopes = Column(Text, nullable=False)  # JSON список областей доступа
-    is_active = Column(Boolean, default=True, nullable=False, index=True)
-    
-    # Metadata
-    created_by = Column(String(100), nullable=False)  # Кто создал ключ
-    created_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False)
-    last_used = Column(DateTime, nullable=True)
-    usage_count = Column(Integer, default=0)
-    
-    # Безопасность
-    allowed_ips = Column(Text, nullable=True)  # JSON список разрешенных IP
-    expires_at = Column(DateTime, nullable=True)  # Срок действия ключа
-    max_requests_per_hour = Column(Integer, default=1000)  # Rate limiting
+@dataclass(frozen=True)
+class CachedAPIKey:
+    """Данные ключа, нужные для проверки запроса"""
+    id: int
+    name: str
+    scopes: FrozenSet[str]
+    ip_whitelist: FrozenSet[str]
+    expires_at: Optional[datetime]
+    rate_limit: int
+    created_by: str
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "scopes": sorted(self.scopes),
+            "created_by": self.created_by,
+        }
+
+
+def _load_key(session, key_hash: str) -> Optional[CachedAPIKey]:
+    api_key = session.query(ApiKey).filter(
+        ApiKey.key_hash == key_hash,
+        ApiKey.is_active == True
+    ).first()
+    if not api_key:
+        return None
+    return CachedAPIKey(
+        id=api_key.id,
+        name=api_key.name,
+        scopes=frozenset(api_key.scopes or []),
+        ip_whitelist=frozenset(api_key.ip_whitelist or []),
+        expires_at=api_key.expires_at,
+        rate_limit=api_key.rate_limit,
+        created_by=api_key.created_by,
+    )
+
+
+class APIKeyUsageRecorder:
+    """
+    Учет использования ключей с отложенной записью.
+
+    record() только обновляет словари в памяти; фоновая задача раз в
+    flush_interval секунд отправляет накопленное одной операцией в очередь
+    записи: UPDATE request_count/last_used_at по ключам и bulk insert строк
+    ApiKeyUsage. Строк в буфере не больше max_buffer - лишние отбрасываются
+    (счетчики при этом продолжают расти).
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = API_KEY_USAGE_FLUSH_INTERVAL,
+        max_buffer: int = API_KEY_USAGE_MAX_BUFFER,
+    ):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        # key_id -> (число запросов, время последнего)
+        self._counts: Dict[int, Tuple[int, datetime]] = {}
+        self._rows: List[Dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"recorded": 0, "dropped_rows": 0, "flushes": 0, "flush_errors": 0}
+
+    def record(
+        self,
+        key_id: int,
+        endpoint: str,
+        method: str,
+        status_code: int,
+        response_time_ms: int,
+        ip_address: str,
+        user_agent: Optional[str] = None,
+    ) -> None:
+        now = datetime.utcnow()
+        count, _ = self._counts.get(key_id, (0, now))
+        self._counts[key_id] = (count + 1, now)
+        self.stats["recorded"] += 1
+
+        if len(self._rows) < self.max_buffer:
+            self._rows.append({
+                "api_key_id": key_id,
+                "timestamp": now,
+                "endpoint": endpoint[:255],
+                "method": method,
+                "status_code": status_code,
+                "response_time_ms": response_time_ms,
+                "ip_address": ip_address[:45],
+                "user_agent": user_agent[:500] if user_agent else None,
+            })
+        else:
+            self.stats["dropped_rows"] += 1
+
+        self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+            except RuntimeError:
+                # Нет event loop - запишется при явном flush()
+                self._task = None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def pending(self) -> int:
+        return sum(count for count, _ in self._counts.values())
+
+    async def flush(self) -> None:
+        """Записать накопленное в БД"""
+        if not self._counts and not self._rows:
+            return
+        counts, self._counts = self._counts, {}
+        rows, self._rows = self._rows, []
+
+        def _write(session):
+            for key_id, (count, last_used_at) in counts.items():
+                session.execute(
+                    update(ApiKey)
+                    .where(ApiKey.id == key_id)
+                    .values(request_count=ApiKey.request_count + count, last_used_at=last_used_at)
+                )
+            if rows:
+                session.bulk_insert_mappings(ApiKeyUsage, rows)
+
+        try:
+            await db_write_queue.submit(_write)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            logger.error(f"Не удалось записать использование API ключей: {e}")
+            # Счетчики возвращаем, строки - сколько поместится в буфер
+            for key_id, (count, last_used_at) in counts.items():
+                pending, latest = self._counts.get(key_id, (0, last_used_at))
+                self._counts[key_id] = (pending + count, max(latest, last_used_at))
+            room = max(self.max_buffer - len(self._rows), 0)
+            self.stats["dropped_rows"] += max(len(rows) - room, 0)
+            self._rows[:0] = rows[:room]
+
+    async def close(self) -> None:
+        """Остановить фоновую запись и дописать остаток"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "pending_requests": self.pending(), "pending_rows": len(self._rows)}
 
 
 class APIKeyManager:
     """Менеджер для работы с API ключами"""
-    
-    def __init__(self):
+
+    def __init__(
+        self,
+        cache_ttl: float = API_KEY_CACHE_TTL,
+        negative_ttl: float = API_KEY_NEGATIVE_TTL,
+    ):
+        self.cache_ttl = cache_ttl
+        self.negative_ttl = negative_ttl
+        # key_hash -> (ключ, monotonic истечения)
+        self._keys: Dict[str, Tuple[CachedAPIKey, float]] = {}
+        # key_hash несуществующих ключей -> monotonic истечения
+        self._missing: Dict[str, float] = {}
         self._rate_limit_cache: Dict[str, Dict] = {}
-    
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
     def generate_api_key(
         self,
         name: str,
@@ -71,162 +242,182 @@ class APIKeyManager:
     ) -> Dict[str, str]:
         """
         Генерация нового API ключа
-        
+
         Returns:
             dict: {"key": "raw_key", "key_id": "key_id"}
         """
-        # Генерируем случайный ключ
         raw_key = self._generate_raw_key()
-        key_prefix = raw_key[:16]
         key_hash = self._hash_key(raw_key)
-        
-        # Подготавливаем данные
-        scopes_json = ",".join([scope.value for scope in scopes])
+        scope_values = [scope.value for scope in scopes]
+
         expires_at = None
         if expires_in_days:
             expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
-        
-        allowed_ips_json = None
-        if allowed_ips:
-            allowed_ips_json = ",".join(allowed_ips)
-        
-        # Сохраняем в БД
+
         def _create_key(session):
-            api_key = APIKey(
+            api_key = ApiKey(
                 name=name,
                 key_hash=key_hash,
-                key_prefix=key_prefix,
-                scopes=scopes_json,
+                scopes=scope_values,
                 created_by=created_by,
-                allowed_ips=allowed_ips_json,
+                ip_whitelist=allowed_ips or [],
                 expires_at=expires_at,
-                max_requests_per_hour=max_requests_per_hour
+                rate_limit=max_requests_per_hour
             )
             session.add(api_key)
             session.commit()
-            
+
             logger.info(f"API key created: {name}", extra={
                 "key_id": api_key.id,
-                "scopes": scopes_json,
+                "scopes": ",".join(scope_values),
                 "created_by": created_by,
                 "event_type": "security"
             })
-            
+
             return {"key": raw_key, "key_id": str(api_key.id)}
-        
-        return DatabaseManager.safe_execute(_create_key)
-    
-    def validate_api_key(
-        self, 
-        raw_key: str, 
+
+        result = DatabaseManager.safe_execute(_create_key)
+        # Ключ мог быть уже запрошен до создания и закэширован как несуществующий
+        self.invalidate(key_hash)
+        return result
+
+    async def get_key(self, key_hash: str) -> Optional[CachedAPIKey]:
+        """Ключ по хешу: из памяти процесса, при промахе - из БД"""
+        now = time.monotonic()
+        entry = self._keys.get(key_hash)
+        if entry is not None and entry[1] > now:
+            self.stats["hits"] += 1
+            return entry[0]
+        if self._missing.get(key_hash, 0) > now:
+            self.stats["hits"] += 1
+            return None
+
+        self.stats["misses"] += 1
+        key = await DatabaseManager.run(lambda session: _load_key(session, key_hash))
+        self._remember(key_hash, key)
+        return key
+
+    def _remember(self, key_hash: str, key: Optional[CachedAPIKey]) -> None:
+        now = time.monotonic()
+        if key is not None:
+            self._missing.pop(key_hash, None)
+            self._keys[key_hash] = (key, now + self.cache_ttl)
+            return
+
+        self._keys.pop(key_hash, None)
+        if len(self._missing) >= _NEGATIVE_CACHE_MAX and key_hash not in self._missing:
+            self._missing = {h: expires for h, expires in self._missing.items() if expires > now}
+            if len(self._missing) >= _NEGATIVE_CACHE_MAX:
+                self._missing = {}
+        self._missing[key_hash] = now + self.negative_ttl
+
+    async def validate_api_key(
+        self,
+        raw_key: str,
         required_scope: Optional[APIKeyScope] = None,
         client_ip: Optional[str] = None
-    ) -> Optional[Dict]:
+    ) -> Optional[CachedAPIKey]:
         """
         Валидация API ключа
-        
+
         Returns:
-            Dict с информацией о ключе или None если невалидный
+            Данные ключа или None если невалидный
         """
         if not raw_key or len(raw_key) < 32:
             return None
-        
-        key_prefix = raw_key[:16]
-        key_hash = self._hash_key(raw_key)
-        
-        def _validate(session):
-            # Находим ключ по префиксу и хэшу
-            api_key = session.query(APIKey).filter(
-                APIKey.key_prefix == key_prefix,
-                APIKey.key_hash == key_hash,
-                APIKey.is_active == True
-            ).first()
-            
-            if not api_key:
-                return None
-            
-            # Проверяем срок действия
-            if api_key.expires_at and datetime.utcnow() > api_key.expires_at:
-                logger.warning(f"Expired API key used: {api_key.name}")
-                return None
-            
-            # Проверяем IP ограничения
-            if api_key.allowed_ips and client_ip:
-                allowed_ips = api_key.allowed_ips.split(",")
-                if client_ip not in allowed_ips:
-                    logger.warning(f"API key used from unauthorized IP: {client_ip}")
-                    return None
-            
-            # Проверяем области доступа
-            scopes = api_key.scopes.split(",") if api_key.scopes else []
-            if required_scope and required_scope.value not in scopes:
-                logger.warning(f"API key missing required scope: {required_scope.value}")
-                return None
-            
-            # Проверяем rate limiting
-            if not self._check_rate_limit(api_key):
-                logger.warning(f"API key rate limit exceeded: {api_key.name}")
-                return None
-            
-            # Обновляем статистику использования
-            api_key.last_used = datetime.utcnow()
-            api_key.usage_count += 1
-            session.commit()
-            
-            return {
-                "id": api_key.id,
-                "name": api_key.name,
-                "scopes": scopes,
-                "created_by": api_key.created_by
-            }
-        
-        return DatabaseManager.safe_execute(_validate)
-    
+
+        api_key = await self.get_key(self._hash_key(raw_key))
+        if api_key is None:
+            return None
+
+        # Проверяем срок действия
+        if api_key.expires_at and datetime.utcnow() > api_key.expires_at:
+            logger.warning(f"Expired API key used: {api_key.name}")
+            return None
+
+        # Проверяем IP ограничения
+        if api_key.ip_whitelist and client_ip not in api_key.ip_whitelist:
+            logger.warning(f"API key used from unauthorized IP: {client_ip}")
+            return None
+
+        # Проверяем области доступа
+        if required_scope and required_scope.value not in api_key.scopes:
+            logger.warning(f"API key missing required scope: {required_scope.value}")
+            return None
+
+        # Проверяем rate limiting
+        if not self._check_rate_limit(api_key):
+            logger.warning(f"API key rate limit exceeded: {api_key.name}")
+            return None
+
+        return api_key
+
+    def invalidate(self, key_hash: Optional[str] = None) -> None:
+        """Сбросить кэш ключа (или всех ключей) в этом и остальных процессах"""
+        self._drop([key_hash] if key_hash else [], clear=key_hash is None)
+        cache_manager.publish_invalidation_nowait(
+            API_KEYS_SCOPE, keys=[key_hash] if key_hash else None, clear=key_hash is None
+        )
+
+    def _drop(self, keys: List[str], clear: bool) -> None:
+        self.stats["invalidations"] += 1
+        if clear:
+            self._keys = {}
+            self._missing = {}
+            return
+        for key_hash in keys:
+            self._keys.pop(key_hash, None)
+            self._missing.pop(key_hash, None)
+
     def revoke_api_key(self, key_id: int, revoked_by: str) -> bool:
         """Отзыв API ключа"""
         def _revoke(session):
-            api_key = session.query(APIKey).filter(APIKey.id == key_id).first()
+            api_key = session.query(ApiKey).filter(ApiKey.id == key_id).first()
             if not api_key:
-                return False
-            
+                return None
+
             api_key.is_active = False
             session.commit()
-            
+
             logger.info(f"API key revoked: {api_key.name}", extra={
                 "key_id": key_id,
                 "revoked_by": revoked_by,
                 "event_type": "security"
             })
-            return True
-        
-        return DatabaseManager.safe_execute(_revoke)
-    
+            return api_key.key_hash
+
+        key_hash = DatabaseManager.safe_execute(_revoke)
+        if not key_hash:
+            return False
+        self.invalidate(key_hash)
+        return True
+
     def list_api_keys(self, include_inactive: bool = False) -> List[Dict]:
         """Получение списка API ключей"""
         def _list_keys(session):
-            query = session.query(APIKey)
+            query = session.query(ApiKey)
             if not include_inactive:
-                query = query.filter(APIKey.is_active == True)
-            
-            keys = query.order_by(APIKey.created_at.desc()).all()
-            
+                query = query.filter(ApiKey.is_active == True)
+
+            keys = query.order_by(ApiKey.created_at.desc()).all()
+
             return [
                 {
                     "id": key.id,
                     "name": key.name,
-                    "scopes": key.scopes.split(",") if key.scopes else [],
+                    "scopes": key.scopes or [],
                     "is_active": key.is_active,
                     "created_by": key.created_by,
                     "created_at": key.created_at.isoformat() if key.created_at else None,
-                    "last_used": key.last_used.isoformat() if key.last_used else None,
-                    "usage_count": key.usage_count,
+                    "last_used": key.last_used_at.isoformat() if key.last_used_at else None,
+                    "usage_count": key.request_count,
                     "expires_at": key.expires_at.isoformat() if key.expires_at else None
                 }
                 for key in keys
             ]
-        
+
         return DatabaseManager.safe_execute(_list_keys)
-    
+
     def _generate_raw_key(self) -> str:
         """Генерация сырого API ключа"""
         # Префикс для идентификации наших ключей
@@ -234,99 +425,122 @@ class APIKeyManager:
         # Случайная часть (32 байта = 64 hex символа)
         random_part = secrets.token_hex(32)
         return f"{prefix}_{random_part}"
-    
+
     def _hash_key(self, raw_key: str) -> str:
         """Хэширование API ключа"""
         return hashlib.sha256(raw_key.encode()).hexdigest()
-    
-    def _check_rate_limit(self, api_key: APIKey) -> bool:
+
+    def _check_rate_limit(self, api_key: CachedAPIKey) -> bool:
         """Проверка rate limiting для API ключа"""
         current_time = time.time()
         current_hour = int(current_time // 3600)
         cache_key = f"{api_key.id}:{current_hour}"
-        
+
         # Проверяем кэш rate limiting
         if cache_key in self._rate_limit_cache:
             request_count = self._rate_limit_cache[cache_key]["count"]
-            if request_count >= api_key.max_requests_per_hour:
+            if request_count >= api_key.rate_limit:
                 return False
             # Увеличиваем счетчик
             self._rate_limit_cache[cache_key]["count"] += 1
         else:
-            # Создаем новую запись
+            # Создаем новую запись (новый час - заодно очищаем старые)
             self._rate_limit_cache[cache_key] = {
                 "count": 1,
                 "hour": current_hour
             }
-        
-        # Очищаем старые записи
-        self._cleanup_rate_limit_cache(current_hour)
-        
+            self._cleanup_rate_limit_cache(current_hour)
+
         return True
-    
+
     def _cleanup_rate_limit_cache(self, current_hour: int):
         """Очистка старых записей из кэша rate limiting"""
         keys_to_remove = []
         for key, data in self._rate_limit_cache.items():
             if data["hour"] < current_hour - 1:  # Старше часа
                 keys_to_remove.append(key)
-        
+
         for key in keys_to_remove:
             del self._rate_limit_cache[key]
 
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "cached_keys": len(self._keys), "missing_keys": len(self._missing)}
+
 
-# Глобальный экземпляр менеджера
+# Глобальные экземпляры менеджера и учета использования
 _api_key_manager = APIKeyManager()
+api_key_usage = APIKeyUsageRecorder()
+cache_manager.add_invalidation_listener(API_KEYS_SCOPE, _api_key_manager._drop)
 
 
-# Зависимости для FastAPI
-async def verify_api_key(
-    credentials: Optional[HTTPAuthorizationCredentials] = Security(security),
-    required_scope: Optional[APIKeyScope] = None
-) -> Dict:
+def _client_ip(request: Request) -> str:
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "127.0.0.1"
+
+
+def require_api_key(required_scope: Optional[APIKeyScope] = None):
     """
-    Dependency для проверки API ключа
+    Dependency для проверки API ключа с нужной областью доступа.
+
+    После обработки запроса записывает его в учет использования ключа
+    (статус - 500, если обработчик упал, или код HTTPException).
     """
-    if not credentials:
-        raise HTTPException(
-            status_code=401,
-            detail="API key required",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    
-    # Валидируем ключ
-    key_info = _api_key_manager.validate_api_key(
-        credentials.credentials,
-        required_scope=required_scope
-    )
-    
-    if not key_info:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid or expired API key",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    
-    return key_info
+    async def dependency(
+        request: Request,
+        credentials: Optional[HTTPAuthorizationCredentials] = Security(security),
+    ):
+        if not credentials:
+            raise HTTPException(
+                status_code=401,
+                detail="API key required",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
 
+        client_ip = _client_ip(request)
+        api_key = await _api_key_manager.validate_api_key(
+            credentials.credentials,
+            required_scope=required_scope,
+            client_ip=client_ip
+        )
 
-# Convenience dependencies для разных областей доступа
-async def verify_api_key_read_only(
-    credentials: Optional[HTTPAuthorizationCredentials] = Security(security)
-) -> Dict:
-    return await verify_api_key(credentials, APIKeyScope.READ_ONLY)
+        if not api_key:
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid or expired API key",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
 
+        started = time.perf_counter()
+        status_code = 200
+        try:
+            yield api_key.to_dict()
+        except HTTPException as e:
+            status_code = e.status_code
+            raise
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            api_key_usage.record(
+                api_key.id,
+                endpoint=request.url.path,
+                method=request.method,
+                status_code=status_code,
+                response_time_ms=int((time.perf_counter() - started) * 1000),
+                ip_address=client_ip,
+                user_agent=request.headers.get("User-Agent"),
+            )
 
-async def verify_api_key_bookings(
-    credentials: Optional[HTTPAuthorizationCredentials] = Security(security)
-) -> Dict:
-    return await verify_api_key(credentials, APIKeyScope.BOOKINGS)
+    return dependency
 
 
-async def verify_api_key_admin(
-    credentials: Optional[HTTPAuthorizationCredentials] = Security(security)
-) -> Dict:
-    return await verify_api_key(credentials, APIKeyScope.ADMIN)
+# Зависимости для FastAPI
+verify_api_key = require_api_key()
+verify_api_key_read_only = require_api_key(APIKeyScope.READ_ONLY)
+verify_api_key_bookings = require_api_key(APIKeyScope.BOOKINGS)
+verify_api_key_admin = require_api_key(APIKeyScope.ADMIN)
 
 
 # Публичные функции
@@ -347,4 +561,14 @@ def revoke_api_key(key_id: int, revoked_by: str) -> bool:
 
 def list_api_keys(include_inactive: bool = False) -> List[Dict]:
     """Получение списка API ключей"""
-    return _api_key_manager.list_api_keys(include_inactive)
\ No newline at end of file
+    return _api_key_manager.list_api_keys(include_inactive)
+
+
+def invalidate_api_key(key_hash: Optional[str] = None) -> None:
+    """Сбросить кэш проверенного ключа после изменения в БД"""
+    _api_key_manager.invalidate(key_hash)
+
+
+def get_api_key_stats() -> Dict[str, Dict[str, int]]:
+    """Статистика кэша ключей и отложенной записи использования"""
+    return {"cache": _api_key_manager.get_stats(), "usage": api_key_usage.get_stats()}
@@ -0,0 +1,256 @@
+"""
+Сериализация значений кэша для Redis.
+
+Раньше dict/list писались через json.dumps, остальное - через str(value):
+date/datetime/Decimal в ответах дашборда либо ломали запись, либо
+возвращались строками. Кодек пишет компактный бинарный формат с родными
+типами и сжимает большие значения.
+
+Формат значения: 1 байт заголовка + тело.
+- младшие биты заголовка - формат тела (FORMAT_MSGPACK / FORMAT_JSON);
+- бит FLAG_COMPRESSED - тело сжато zlib (значения от CACHE_COMPRESS_THRESHOLD байт).
+
+msgpack используется, если установлен; иначе JSON с тегами типов
+({"__t": "dt", "v": "..."}). Значения старого формата (JSON-строка или
+текст без заголовка) читаются как раньше.
+
+Пример:
+    from utils.cache_codec import cache_codec
+
+    payload = cache_codec.encode({"day": date.today()}, "dashboard")
+    value = cache_codec.decode(payload, "dashboard")
+"""
+import json
+import time
+import uuid
+import zlib
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Optional
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+from config import CACHE_COMPRESS_LEVEL, CACHE_COMPRESS_THRESHOLD
+
+FORMAT_MSGPACK = 0x01
+FORMAT_JSON = 0x02
+FLAG_COMPRESSED = 0x80
+
+# Коды ext-типов msgpack и теги JSON для типов без родного представления
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_TIME = 3
+_EXT_DECIMAL = 4
+_EXT_UUID = 5
+_EXT_TIMEDELTA = 6
+
+_JSON_TAGS = {
+    "dt": datetime.fromisoformat,
+    "d": date.fromisoformat,
+    "t": dt_time.fromisoformat,
+    "dec": Decimal,
+    "uuid": uuid.UUID,
+    "td": lambda v: timedelta(seconds=float(v)),
+}
+
+
+def _plain(value: Any) -> Any:
+    """Типы, которые оба формата пишут как обычные значения"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается кэшем")
+
+
+def _msgpack_default(value: Any):
+    # datetime проверяется раньше date: datetime - подкласс date
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, date):
+        return msgpack.ExtType(_EXT_DATE, value.isoformat().encode())
+    if isinstance(value, dt_time):
+        return msgpack.ExtType(_EXT_TIME, value.isoformat().encode())
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(value).encode())
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(_EXT_UUID, value.bytes)
+    if isinstance(value, timedelta):
+        return msgpack.ExtType(_EXT_TIMEDELTA, repr(value.total_seconds()).encode())
+    return _plain(value)
+
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_TIME:
+        return dt_time.fromisoformat(data.decode())
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == _EXT_TIMEDELTA:
+        return timedelta(seconds=float(data.decode()))
+    return msgpack.ExtType(code, data)
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return {"__t": "dt", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {"__t": "d", "v": value.isoformat()}
+    if isinstance(value, dt_time):
+        return {"__t": "t", "v": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__t": "dec", "v": str(value)}
+    if isinstance(value, uuid.UUID):
+        return {"__t": "uuid", "v": str(value)}
+    if isinstance(value, timedelta):
+        return {"__t": "td", "v": value.total_seconds()}
+    return _plain(value)
+
+
+def _json_object_hook(obj: Dict[str, Any]):
+    if len(obj) == 2 and "__t" in obj and "v" in obj:
+        restore = _JSON_TAGS.get(obj["__t"])
+        if restore is not None:
+            return restore(obj["v"])
+    return obj
+
+
+class CacheCodec:
+    """
+    Кодирование значений кэша с учетом размеров и времени по пространствам
+    имен (префикс ключа до первого ":").
+    """
+
+    def __init__(
+        self,
+        compress_threshold: int = CACHE_COMPRESS_THRESHOLD,
+        compress_level: int = CACHE_COMPRESS_LEVEL,
+        use_msgpack: bool = MSGPACK_AVAILABLE,
+    ):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.format = FORMAT_MSGPACK if use_msgpack else FORMAT_JSON
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _ns_stats(self, namespace: str) -> Dict[str, float]:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = {
+                "encoded": 0,
+                "decoded": 0,
+                "raw_bytes": 0,
+                "stored_bytes": 0,
+                "compressed": 0,
+                "encode_seconds": 0.0,
+                "decode_seconds": 0.0,
+            }
+        return stats
+
+    def _dump(self, value: Any) -> bytes:
+        if self.format == FORMAT_MSGPACK:
+            return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+        return json.dumps(
+            value, default=_json_default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    @staticmethod
+    def _load(fmt: int, body: bytes) -> Any:
+        if fmt == FORMAT_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise ValueError("Значение записано в msgpack, но msgpack не установлен")
+            return msgpack.unpackb(body, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+        return json.loads(body, object_hook=_json_object_hook)
+
+    def encode(self, value: Any, namespace: str = "other") -> bytes:
+        """Значение -> байты для Redis"""
+        started = time.perf_counter()
+        body = self._dump(value)
+        raw_size = len(body)
+
+        header = self.format
+        if raw_size >= self.compress_threshold:
+            compressed = zlib.compress(body, self.compress_level)
+            # Несжимаемые данные оставляем как есть
+            if len(compressed) < raw_size:
+                body = compressed
+                header |= FLAG_COMPRESSED
+
+        payload = bytes((header,)) + body
+
+        stats = self._ns_stats(namespace)
+        stats["encoded"] += 1
+        stats["raw_bytes"] += raw_size
+        stats["stored_bytes"] += len(payload)
+        stats["compressed"] += bool(header & FLAG_COMPRESSED)
+        stats["encode_seconds"] += time.perf_counter() - started
+        return payload
+
+    def decode(self, payload: Optional[bytes], namespace: str = "other") -> Any:
+        """Байты из Redis -> значение (None остается None)"""
+        if payload is None:
+            return None
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        started = time.perf_counter()
+        header = payload[0] if payload else 0
+        fmt = header & ~FLAG_COMPRESSED
+        if fmt in (FORMAT_MSGPACK, FORMAT_JSON):
+            body = payload[1:]
+            if header & FLAG_COMPRESSED:
+                body = zlib.decompress(body)
+            value = self._load(fmt, body)
+        else:
+            # Старый формат: JSON для dict/list, иначе строка
+            text = payload.decode("utf-8", errors="replace")
+            try:
+                value = json.loads(text)
+            except (json.JSONDecodeError, TypeError):
+                value = text
+
+        stats = self._ns_stats(namespace)
+        stats["decoded"] += 1
+        stats["decode_seconds"] += time.perf_counter() - started
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Размеры и время кодирования по пространствам имен"""
+        namespaces = {}
+        for namespace, stats in self._stats.items():
+            encoded = stats["encoded"] or 1
+            decoded = stats["decoded"] or 1
+            namespaces[namespace] = {
+                "encoded": stats["encoded"],
+                "decoded": stats["decoded"],
+                "avg_raw_bytes": round(stats["raw_bytes"] / encoded),
+                "avg_stored_bytes": round(stats["stored_bytes"] / encoded),
+                "compression_ratio": round(stats["stored_bytes"] / stats["raw_bytes"], 3)
+                if stats["raw_bytes"] else 1.0,
+                "compressed": stats["compressed"],
+                "avg_encode_ms": round(stats["encode_seconds"] * 1000 / encoded, 4),
+                "avg_decode_ms": round(stats["decode_seconds"] * 1000 / decoded, 4),
+            }
+        return {
+            "format": "msgpack" if self.format == FORMAT_MSGPACK else "json",
+            "compress_threshold": self.compress_threshold,
+            "namespaces": namespaces,
+        }
+
+
+def key_namespace(key: str) -> str:
+    """Пространство имен ключа для статистики: "dashboard:stats" -> "dashboard" """
+    return key.split(":", 1)[0] if ":" in key else "other"
+
+
+# Глобальный кодек кэша
+cache_codec = CacheCodec()
@@ -13,19 +13,12 @@ class CacheInvalidator:
     
     @staticmethod
     async def invalidate_dashboard_cache():
-        """Инвалидация всех кэшей дашборда (P-HIGH-2: используем clear_patterns)"""
+        """Инвалидация всех кэшей дашборда (включая bookings:stats с тегом dashboard)"""
         try:
-            patterns = [
-                "dashboard:*",
-                "bookings:stats"
-            ]
-
-            # P-HIGH-2: Используем clear_patterns для batch удаления
-            # Было: 2 последовательных clear_pattern (4 round trips: 2×KEYS + 2×DELETE)
-            # Стало: 1 batch operation (2 round trips: 1×all KEYS + 1×DELETE all)
-            total_deleted = await cache_manager.clear_patterns(patterns)
+            # Удаление по тегу: один вызов без KEYS-сканирования
+            total_deleted = await cache_manager.invalidate_tags(["dashboard"])
 
-            logger.info(f"Dashboard cache invalidated: {total_deleted} keys total (batch)")
+            logger.info(f"Dashboard cache invalidated: {total_deleted} keys total")
             return total_deleted
 
         except Exception as e:
@@ -34,20 +27,17 @@ class CacheInvalidator:
     
     @staticmethod
     async def invalidate_user_related_cache(user_id: Optional[int] = None):
-        """Инвалидация кэшей связанных с пользователями (P-HIGH-2: batch)"""
+        """Инвалидация кэшей связанных с пользователями"""
         try:
-            patterns = [
-                "users:*"
-            ]
+            tags = ["users"]
 
             if user_id:
-                patterns.append(f"user:{user_id}:*")
+                tags.append(f"user:{user_id}")
 
-            # P-HIGH-2: Batch operation вместо цикла
-            total_deleted = await cache_manager.clear_patterns(patterns)
+            total_deleted = await cache_manager.invalidate_tags(tags)
 
             if total_deleted > 0:
-                logger.info(f"User cache invalidated: {total_deleted} keys total (batch)")
+                logger.info(f"User cache invalidated: {total_deleted} keys total")
 
             return total_deleted
 
@@ -57,17 +47,16 @@ class CacheInvalidator:
     
     @staticmethod
     async def invalidate_booking_related_cache():
-        """Инвалидация кэшей связанных с бронированиями (P-HIGH-2: batch)"""
+        """Инвалидация кэшей связанных с бронированиями"""
         try:
-            patterns = [
-                "bookings:*",
-                "dashboard:*"  # Дашборд зависит от бронирований
+            tags = [
+                "bookings",
+                "dashboard"  # Дашборд зависит от бронирований
             ]
 
-            # P-HIGH-2: Batch operation
-            total_deleted = await cache_manager.clear_patterns(patterns)
+            total_deleted = await cache_manager.invalidate_tags(tags)
 
-            logger.info(f"Booking cache invalidated: {total_deleted} keys total (batch)")
+            logger.info(f"Booking cache invalidated: {total_deleted} keys total")
             return total_deleted
 
         except Exception as e:
@@ -76,18 +65,17 @@ class CacheInvalidator:
 
     @staticmethod
     async def invalidate_ticket_related_cache():
-        """Инвалидация кэшей связанных с тикетами (P-HIGH-2: batch)"""
+        """Инвалидация кэшей связанных с тикетами"""
         try:
-            patterns = [
-                "tickets:*",
-                "dashboard:*"  # Дашборд зависит от тикетов
+            tags = [
+                "tickets",
+                "dashboard"  # Дашборд зависит от тикетов
             ]
 
-            # P-HIGH-2: Batch operation
-            total_deleted = await cache_manager.clear_patterns(patterns)
+            total_deleted = await cache_manager.invalidate_tags(tags)
 
             if total_deleted > 0:
-                logger.info(f"Ticket cache invalidated: {total_deleted} keys total (batch)")
+                logger.info(f"Ticket cache invalidated: {total_deleted} keys total")
 
             return total_deleted
 
@@ -97,19 +85,18 @@ class CacheInvalidator:
 
     @staticmethod
     async def invalidate_tariff_related_cache():
-        """Инвалидация кэшей связанных с тарифами (P-HIGH-2: batch)"""
+        """Инвалидация кэшей связанных с тарифами"""
         try:
-            patterns = [
-                "tariffs:*",
-                "bookings:*",  # Бронирования зависят от тарифов
-                "dashboard:*"  # Дашборд зависит от тарифов через бронирования
+            tags = [
+                "tariffs",
+                "bookings",  # Бронирования зависят от тарифов
+                "dashboard"  # Дашборд зависит от тарифов через бронирования
             ]
 
-            # P-HIGH-2: Batch operation
-            total_deleted = await cache_manager.clear_patterns(patterns)
+            total_deleted = await cache_manager.invalidate_tags(tags)
 
             if total_deleted > 0:
-                logger.info(f"Tariff cache invalidated: {total_deleted} keys total (batch)")
+                logger.info(f"Tariff cache invalidated: {total_deleted} keys total")
 
             return total_deleted
 
@@ -129,17 +116,29 @@ class CacheInvalidator:
             logger.error(f"Error invalidating all cache: {e}")
             return False
     
+    @staticmethod
+    async def invalidate_tags(tags: List[str]):
+        """Инвалидация кэша по списку тегов"""
+        try:
+            total_deleted = await cache_manager.invalidate_tags(tags)
+
+            if total_deleted > 0:
+                logger.info(f"Tagged cache invalidated: {total_deleted} keys total ({', '.join(tags)})")
+
+            return total_deleted
+
+        except Exception as e:
+            logger.error(f"Error invalidating tags {tags}: {e}")
+            return 0
+
     @staticmethod
     async def invalidate_patterns(patterns: List[str]):
-        """Инвалидация кэша по списку паттернов (P-HIGH-2: batch)"""
+        """Инвалидация кэша по списку паттернов ("prefix:*" удаляются по тегам, остальные через SCAN)"""
         try:
-            # P-HIGH-2: Используем clear_patterns для batch operation
-            # Было: N последовательных clear_pattern (2N round trips: N×KEYS + N×DELETE)
-            # Стало: 1 batch operation (2 round trips: 1×all KEYS + 1×DELETE all)
             total_deleted = await cache_manager.clear_patterns(patterns)
 
             if total_deleted > 0:
-                logger.info(f"Custom patterns cache invalidated: {total_deleted} keys total (batch)")
+                logger.info(f"Custom patterns cache invalidated: {total_deleted} keys total")
 
             return total_deleted
 
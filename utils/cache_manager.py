@@ -4,10 +4,14 @@
 """
 import json
 import asyncio
+import fnmatch
+import sys
 import time
-from typing import Optional, Any, Dict, Union, List
+from collections import OrderedDict
+from typing import Optional, Any, Callable, Dict, Set, Union, List
 from datetime import datetime, timedelta
 import hashlib
+import secrets
 
 try:
     import redis.asyncio as redis
@@ -15,68 +19,348 @@ try:
 except ImportError:
     REDIS_AVAILABLE = False
 
+from utils.cache_codec import cache_codec, key_namespace
+from utils.cache_metrics import cache_metrics
+from utils.cache_versions import VERSION_KEY_PREFIX, VERSIONS_SCOPE, stamp, table_versions
 from utils.logger import get_logger
-from config import REDIS_URL, DEBUG
+from config import (
+    REDIS_URL,
+    DEBUG,
+    CACHE_INVALIDATION_CHANNEL,
+    CACHE_LOCK_LEASE,
+    CACHE_STALE_TTL,
+    NEAR_CACHE_MAX_TTL,
+    MEMORY_CACHE_MAX_BYTES,
+    MEMORY_CACHE_MAX_ENTRIES,
+    MEMORY_CACHE_SWEEP_INTERVAL,
+)
 
 logger = get_logger(__name__)
 
 
+# Префикс Redis-множеств с ключами тега
+TAG_KEY_PREFIX = "cache:tags:"
+# Префикс Redis-блокировок пересчета значения (single-flight между процессами)
+LOCK_KEY_PREFIX = "cache:lock:"
+# Маркер значения со сроком свежести (stale-while-revalidate)
+SWR_MARKER = "__swr__"
+
+# Снятие блокировки только владельцем (по токену)
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Удаление всех ключей тегов одним вызовом: SMEMBERS + DEL по каждому тегу.
+# DEL выполняется порциями, чтобы не упереться в лимит unpack() в Lua.
+# Возвращает {число удаленных, ключи...} - ключи рассылаются near cache других процессов.
+_INVALIDATE_TAGS_LUA = """
+local deleted = 0
+local result = {0}
+for _, tag_key in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag_key)
+    for i = 1, #members, 500 do
+        deleted = deleted + redis.call('DEL', unpack(members, i, math.min(i + 499, #members)))
+    end
+    for _, member in ipairs(members) do
+        result[#result + 1] = member
+    end
+    redis.call('DEL', tag_key)
+end
+result[1] = deleted
+return result
+"""
+
+
+def default_tags(key: str) -> List[str]:
+    """
+    Теги ключа по его префиксам: "dashboard:chart_data:2024:8" ->
+    ["dashboard", "dashboard:chart_data"], "user:5:bookings" -> ["user", "user:5"].
+
+    Благодаря этому инвалидация "prefix:*" и "prefix:sub:*" сводится к
+    удалению по тегу без обхода ключей.
+    """
+    parts = key.split(":")
+    if len(parts) < 2:
+        return []
+    tags = [parts[0]]
+    if len(parts) > 2:
+        tags.append(f"{parts[0]}:{parts[1]}")
+    return tags
+
+
+def pattern_tag(pattern: str) -> Optional[str]:
+    """Тег, покрывающий паттерн вида "prefix:*" или "prefix:sub:*", иначе None"""
+    if not pattern.endswith(":*"):
+        return None
+    prefix = pattern[:-2]
+    if not prefix or any(ch in prefix for ch in "*?[]") or prefix.count(":") > 1:
+        return None
+    return prefix
+
+
+def _unwrap(raw: Any):
+    """Значение и срок свежести (None - без stale-while-revalidate)"""
+    if isinstance(raw, dict) and SWR_MARKER in raw:
+        return raw.get("value"), raw[SWR_MARKER]
+    return raw, None
+
+
+def _estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    Приблизительный размер значения в байтах.
+
+    Обходит вложенные dict/list/tuple/set (до 4 уровней, глубже - по
+    sys.getsizeof контейнера). Точность не нужна: оценка используется только
+    для бюджета памяти MemoryCache.
+    """
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k, _depth + 1) + _estimate_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += _estimate_size(item, _depth + 1)
+    return size
+
+
+class _Entry:
+    """Запись MemoryCache"""
+
+    __slots__ = ("value", "expires_at", "size", "tags")
+
+    def __init__(self, value: Any, expires_at: Optional[float], size: int, tags: List[str]):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+
 class MemoryCache:
-    """In-memory кэш как fallback для Redis"""
-    
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()
-    
+    """
+    Ограниченный in-process кэш (fallback для Redis и локальная копия при Redis).
+
+    - LRU-вытеснение по двум бюджетам: число записей (max_entries) и
+      приблизительный объем значений (max_bytes).
+    - Просроченные записи удаляет фоновая задача по колесу TTL: ключи
+      раскладываются по слотам времени истечения (sweep_interval секунд),
+      и за один проход обрабатываются только наступившие слоты, без обхода
+      всего кэша. При чтении TTL по-прежнему проверяется.
+    - Без блокировок: все методы выполняются в event loop без точек await,
+      поэтому каждая операция атомарна относительно других корутин.
+    - Индекс тегов (тег -> ключи) для инвалидации без перебора ключей.
+    - Счетчики hits/misses/evictions/expirations для get_stats().
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MEMORY_CACHE_MAX_ENTRIES,
+        max_bytes: int = MEMORY_CACHE_MAX_BYTES,
+        sweep_interval: float = MEMORY_CACHE_SWEEP_INTERVAL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._tags: Dict[str, Set[str]] = {}
+
+        # Колесо TTL: номер слота -> ключи, истекающие в этом слоте
+        self._wheel: Dict[int, Set[str]] = {}
+        self._swept_slot = int(time.time() // sweep_interval)
+        self._sweeper: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _slot(self, timestamp: float) -> int:
+        return int(timestamp // self.sweep_interval)
+
+    def _untag(self, key: str, entry: _Entry) -> None:
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _remove(self, key: str) -> Optional[_Entry]:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            self._untag(key, entry)
+        return entry
+
+    def _evict(self) -> None:
+        """Вытеснить наименее недавно использованные записи сверх бюджета"""
+        while self._cache and (
+            len(self._cache) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, entry = self._cache.popitem(last=False)
+            self._bytes -= entry.size
+            self._untag(key, entry)
+            self.evictions += 1
+
+    def _ensure_sweeper(self) -> None:
+        """Запустить фоновую очистку в текущем event loop, если она не запущена"""
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self) -> None:
+        # Пока колесо пустое, задача не нужна: следующий set() запустит ее снова
+        while self._wheel:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки in-memory кэша: {e}")
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удалить записи из наступивших слотов колеса TTL. Возвращает число удаленных."""
+        now = time.time() if now is None else now
+        current = self._slot(now)
+        if current <= self._swept_slot:
+            return 0
+
+        # После долгого простоя дешевле пройти по занятым слотам, чем по диапазону
+        if current - self._swept_slot > len(self._wheel):
+            due = [slot for slot in self._wheel if slot <= current]
+        else:
+            due = range(self._swept_slot + 1, current + 1)
+
+        removed = 0
+        for slot in due:
+            for key in self._wheel.pop(slot, ()):
+                entry = self._cache.get(key)
+                # Ключ мог быть перезаписан с другим TTL или уже удален
+                if entry is not None and entry.expires_at is not None and entry.expires_at <= now:
+                    self._remove(key)
+                    removed += 1
+        self._swept_slot = current
+        self.expirations += removed
+        return removed
+
     async def get(self, key: str) -> Optional[Any]:
         """Получить значение из кэша"""
-        async with self._lock:
-            if key not in self._cache:
-                return None
-            
-            entry = self._cache[key]
-            
-            # Проверяем TTL
-            if entry.get('expires_at') and time.time() > entry['expires_at']:
-                del self._cache[key]
-                return None
-            
-            return entry['value']
-    
-    async def set(self, key: str, value: Any, ttl: int = 300) -> bool:
-        """Установить значение в кэш"""
-        async with self._lock:
-            expires_at = time.time() + ttl if ttl > 0 else None
-            self._cache[key] = {
-                'value': value,
-                'expires_at': expires_at,
-                'created_at': time.time()
-            }
-            return True
-    
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Проверяем TTL
+        if entry.expires_at is not None and time.time() > entry.expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    async def set(
+        self, key: str, value: Any, ttl: int = 300, tags: Optional[List[str]] = None
+    ) -> bool:
+        """Установить значение в кэш (tags=None - теги по префиксам ключа)"""
+        expires_at = time.time() + ttl if ttl > 0 else None
+        tags = default_tags(key) if tags is None else list(tags)
+        entry = _Entry(value, expires_at, _estimate_size(key) + _estimate_size(value), tags)
+
+        self._remove(key)
+        self._cache[key] = entry
+        self._bytes += entry.size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        if expires_at is not None:
+            self._wheel.setdefault(self._slot(expires_at), set()).add(key)
+
+        self._evict()
+        self._ensure_sweeper()
+        return True
+
     async def delete(self, key: str) -> bool:
         """Удалить ключ из кэша"""
-        async with self._lock:
-            if key in self._cache:
-                del self._cache[key]
-                return True
-            return False
-    
+        return self._remove(key) is not None
+
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """Удалить все ключи с любым из тегов. Возвращает число удаленных."""
+        deleted = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                if self._remove(key) is not None:
+                    deleted += 1
+        return deleted
+
+    def tag_count(self, tag: str) -> int:
+        """Число ключей с тегом"""
+        return len(self._tags.get(tag, ()))
+
     async def clear(self) -> bool:
         """Очистить весь кэш"""
-        async with self._lock:
-            self._cache.clear()
-            return True
-    
+        self._cache.clear()
+        self._wheel.clear()
+        self._tags.clear()
+        self._bytes = 0
+        return True
+
     async def keys(self, pattern: str = "*") -> list:
-        """Получить список ключей по паттерну"""
-        async with self._lock:
-            if pattern == "*":
-                return list(self._cache.keys())
-            
-            # Простая реализация паттерна
-            import fnmatch
-            return [key for key in self._cache.keys() if fnmatch.fnmatch(key, pattern)]
+        """Получить список ключей по паттерну (без просроченных)"""
+        now = time.time()
+        live = [
+            key for key, entry in self._cache.items()
+            if entry.expires_at is None or entry.expires_at > now
+        ]
+        if pattern == "*":
+            return live
+        return [key for key in live if fnmatch.fnmatch(key, pattern)]
+
+    def entry_size(self, key: str) -> int:
+        """Оценка размера записи в байтах (0, если ключа нет)"""
+        entry = self._cache.get(key)
+        return entry.size if entry is not None else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики и заполненность кэша"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    async def close(self) -> None:
+        """Остановить фоновую очистку"""
+        if self._sweeper is not None and not self._sweeper.done():
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+        self._sweeper = None
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # Ожидающих может не быть (все отменены) - помечаем исключение как полученное
+    if not task.cancelled():
+        task.exception()
 
 
 class CacheManager:
@@ -84,16 +368,51 @@ class CacheManager:
     
     def __init__(self):
         self._redis: Optional[redis.Redis] = None
+        # Клиент без декодирования ответов - для бинарных значений (cache_codec)
+        self._redis_bin: Optional[redis.Redis] = None
         self._memory_cache = MemoryCache()
+        self._invalidate_script = None
+        self._release_script = None
+
+        # Single-flight: ключ -> Future выполняющегося пересчета
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self.single_flight_stats = {
+            "coalesced_waits": 0,  # ждали пересчет в этом процессе
+            "lock_waits": 0,  # ждали пересчет другого процесса (Redis-блокировка)
+            "stale_served": 0,  # отдано устаревшее значение
+            "background_refreshes": 0,  # фоновые пересчеты устаревших значений
+        }
         self._use_redis = False
         self._connection_attempts = 0
         self._max_connection_attempts = 3
+        self._started_at = time.time()
+
+        # Near cache: при Redis _memory_cache - первый уровень, Redis - второй.
+        # Изменения рассылаются остальным процессам через pub/sub.
+        self.instance_id = secrets.token_hex(6)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriber: Optional[asyncio.Task] = None
+        self._publish_tasks: Set[asyncio.Task] = set()
+        self._invalidation_listeners: Dict[str, List[Callable]] = {}
+        # Растет с каждым чужим сообщением: значение, прочитанное из Redis во время
+        # инвалидации, не кладется в near cache
+        self._invalidation_seq = 0
+        self.near_cache_stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "invalidations_sent": 0,
+            "invalidations_received": 0,
+            "resubscribes": 0,
+        }
         
         # Настройки кэширования
         self.default_ttl = 300  # 5 минут
         self.dashboard_ttl = 60  # 1 минута для дашборда
         self.user_data_ttl = 600  # 10 минут для данных пользователей
         self.static_data_ttl = 1800  # 30 минут для статичных данных (тарифы и т.д.)
+        self.stale_ttl = CACHE_STALE_TTL  # окно stale-while-revalidate
+        self.lock_lease = CACHE_LOCK_LEASE
     
     async def initialize(self) -> bool:
         """Инициализация подключения к Redis"""
@@ -105,21 +424,30 @@ class CacheManager:
         try:
             if hasattr(self, '_redis') and self._redis:
                 await self._redis.close()
-            
-            self._redis = redis.from_url(
-                REDIS_URL,
-                encoding="utf-8",
-                decode_responses=True,
+            if self._redis_bin:
+                await self._redis_bin.close()
+            self._invalidate_script = None
+            self._release_script = None
+
+            connection_options = dict(
                 socket_connect_timeout=2,
                 socket_timeout=2,
                 retry_on_timeout=True,
                 health_check_interval=30
             )
+            self._redis = redis.from_url(
+                REDIS_URL,
+                encoding="utf-8",
+                decode_responses=True,
+                **connection_options
+            )
+            self._redis_bin = redis.from_url(REDIS_URL, **connection_options)
             
             # Проверяем подключение
             await self._redis.ping()
             self._use_redis = True
             self._connection_attempts = 0
+            self._start_subscriber()
             
             logger.info("Redis подключен успешно")
             await self._initialize_sample_data()
@@ -194,60 +522,128 @@ class CacheManager:
             logger.error(f"Ошибка инициализации демонстрационных данных: {e}")
     
     async def get(self, key: str) -> Optional[Any]:
-        """Получить значение из кэша"""
+        """Получить значение из кэша (устаревшее значение stale-while-revalidate тоже отдается)"""
+        value, _ = _unwrap(await self._get_raw(key))
+        return value
+
+    async def _get_raw(self, key: str) -> Optional[Any]:
+        """Значение из кэша как есть, с оберткой срока свежести"""
+        started = time.perf_counter()
+        value, tier = await self._lookup(key)
+        cache_metrics.record_get(
+            key_namespace(key), tier, value is not None, time.perf_counter() - started
+        )
+        return value
+
+    async def _lookup(self, key: str):
+        """Поиск значения: (значение, уровень кэша, который ответил)"""
         try:
             if self._use_redis and self._redis:
-                value = await self._redis.get(key)
-                if value is not None:
-                    try:
-                        return json.loads(value)
-                    except (json.JSONDecodeError, TypeError):
-                        return value
-                return None
+                # Первый уровень - копия в процессе
+                local = await self._memory_cache.get(key)
+                if local is not None:
+                    self.near_cache_stats["l1_hits"] += 1
+                    return local, "memory"
+
+                seq = self._invalidation_seq
+                pipeline = self._redis_bin.pipeline(transaction=False)
+                pipeline.get(key)
+                pipeline.pttl(key)
+                raw, pttl = await pipeline.execute()
+                if raw is None:
+                    return None, "redis"
+
+                value = cache_codec.decode(raw, key_namespace(key))
+                self.near_cache_stats["l2_hits"] += 1
+
+                # Копия живет не дольше ключа в Redis
+                if pttl > 0 and seq == self._invalidation_seq:
+                    await self._memory_cache.set(key, value, min(pttl / 1000, NEAR_CACHE_MAX_TTL))
+                return value, "redis"
             else:
-                return await self._memory_cache.get(key)
+                return await self._memory_cache.get(key), "memory"
                 
         except Exception as e:
             logger.error(f"Ошибка получения из кэша {key}: {e}")
             if self._use_redis:
                 # Fallback на memory cache
-                return await self._memory_cache.get(key)
-            return None
+                return await self._memory_cache.get(key), "memory"
+            return None, "memory"
     
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """Установить значение в кэш"""
+    def _queue_set(self, pipeline, key: str, value: Any, ttl: int, tags: List[str]) -> None:
+        """
+        Добавить в pipeline запись значения и регистрацию ключа в множествах тегов.
+
+        Множество тега живет не меньше самой долгой записи в нем:
+        EXPIRE NX задает TTL новому множеству, EXPIRE GT только продлевает.
+        """
+        namespace = key_namespace(key)
+        payload = cache_codec.encode(value, namespace)
+        cache_metrics.record_payload(namespace, len(payload))
+        pipeline.setex(key, ttl, payload)
+        pipeline.publish(CACHE_INVALIDATION_CHANNEL, self._message(keys=[key]))
+        for tag in tags:
+            tag_key = f"{TAG_KEY_PREFIX}{tag}"
+            pipeline.sadd(tag_key, key)
+            pipeline.expire(tag_key, ttl, nx=True)
+            pipeline.expire(tag_key, ttl, gt=True)
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Optional[List[str]] = None
+    ) -> bool:
+        """
+        Установить значение в кэш.
+
+        tags - теги для инвалидации (invalidate_tags). По умолчанию
+        берутся префиксы ключа, см. default_tags().
+        """
         if ttl is None:
             ttl = self.default_ttl
-        
+        if tags is None:
+            tags = default_tags(key)
+
+        started = time.perf_counter()
+        tier = "memory"
         try:
             if self._use_redis and self._redis:
-                # Сериализуем значение
-                if isinstance(value, (dict, list)):
-                    serialized_value = json.dumps(value, ensure_ascii=False)
-                else:
-                    serialized_value = str(value)
-                
-                await self._redis.setex(key, ttl, serialized_value)
-                
-                # Дублируем в memory cache как backup
-                await self._memory_cache.set(key, value, ttl)
+                # Значение, теги и рассылка инвалидации одним round trip
+                pipeline = self._redis_bin.pipeline(transaction=False)
+                self._queue_set(pipeline, key, value, ttl, tags)
+                await pipeline.execute()
+                tier = "redis"
+
+                # Near cache этого процесса: не дольше NEAR_CACHE_MAX_TTL, как в _lookup,
+                # чтобы потерянная инвалидация не держала устаревшее значение весь ttl
+                await self._memory_cache.set(key, value, min(ttl, NEAR_CACHE_MAX_TTL), tags)
                 return True
             else:
-                return await self._memory_cache.set(key, value, ttl)
-                
+                return await self._memory_cache.set(key, value, ttl, tags)
+
         except Exception as e:
             logger.error(f"Ошибка записи в кэш {key}: {e}")
             # Fallback на memory cache
-            return await self._memory_cache.set(key, value, ttl)
+            return await self._memory_cache.set(key, value, ttl, tags)
+        finally:
+            cache_metrics.record_set(key_namespace(key), tier, time.perf_counter() - started)
     
     async def delete(self, key: str) -> bool:
         """Удалить ключ из кэша"""
         success = False
+        started = time.perf_counter()
+        tier = "memory"
         
         try:
             if self._use_redis and self._redis:
-                result = await self._redis.delete(key)
+                pipeline = self._redis.pipeline(transaction=False)
+                pipeline.delete(key)
+                pipeline.publish(CACHE_INVALIDATION_CHANNEL, self._message(keys=[key]))
+                result, _ = await pipeline.execute()
                 success = bool(result)
+                tier = "redis"
             
             # Всегда удаляем из memory cache
             memory_success = await self._memory_cache.delete(key)
@@ -257,27 +653,45 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Ошибка удаления из кэша {key}: {e}")
             return await self._memory_cache.delete(key)
+        finally:
+            cache_metrics.record_delete(key_namespace(key), tier, time.perf_counter() - started)
     
-    async def clear_pattern(self, pattern: str) -> int:
-        """Удалить все ключи по паттерну"""
-        deleted_count = 0
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        """
+        Удалить все ключи, зарегистрированные под любым из тегов.
+
+        В Redis выполняется одним вызовом Lua-скрипта по множествам тегов,
+        без обхода всего keyspace. Локальный кэш чистится по своему индексу тегов.
 
+        Example:
+            await cache_manager.invalidate_tags(["dashboard", "user:42"])
+        """
+        if not tags:
+            return 0
+
+        deleted_count = 0
         try:
             if self._use_redis and self._redis:
-                keys = await self._redis.keys(pattern)
-                if keys:
-                    deleted_count = await self._redis.delete(*keys)
+                if self._invalidate_script is None:
+                    self._invalidate_script = self._redis.register_script(_INVALIDATE_TAGS_LUA)
+                result = await self._invalidate_script(
+                    keys=[f"{TAG_KEY_PREFIX}{tag}" for tag in tags]
+                )
+                deleted_count = int(result[0])
+                await self._publish(keys=result[1:], tags=tags)
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации тегов {tags}: {e}")
 
-            # Также чистим memory cache
-            memory_keys = await self._memory_cache.keys(pattern)
-            for key in memory_keys:
-                await self._memory_cache.delete(key)
+        memory_deleted = await self._memory_cache.invalidate_tags(tags)
+        return deleted_count if self._use_redis else memory_deleted
 
-            return deleted_count
+    async def _scan_keys(self, pattern: str) -> List[str]:
+        """Ключи Redis по паттерну через SCAN (не блокирует сервер, в отличие от KEYS)"""
+        return [key async for key in self._redis.scan_iter(match=pattern, count=500)]
 
-        except Exception as e:
-            logger.error(f"Ошибка очистки кэша по паттерну {pattern}: {e}")
-            return 0
+    async def clear_pattern(self, pattern: str) -> int:
+        """Удалить все ключи по паттерну"""
+        return await self.clear_patterns([pattern])
 
     async def bulk_set(
         self,
@@ -309,20 +723,14 @@ class CacheManager:
         try:
             if self._use_redis and self._redis:
                 # Используем Redis pipeline для batch операций
-                pipeline = self._redis.pipeline()
+                pipeline = self._redis_bin.pipeline(transaction=False)
 
                 for key, value in items.items():
-                    # Сериализация как в обычном set()
-                    if isinstance(value, (dict, list)):
-                        serialized_value = json.dumps(value, ensure_ascii=False)
-                    else:
-                        serialized_value = str(value)
-
                     # Добавляем в pipeline вместо немедленного выполнения
-                    pipeline.setex(key, ttl, serialized_value)
+                    self._queue_set(pipeline, key, value, ttl, default_tags(key))
 
-                    # Дублируем в memory cache
-                    await self._memory_cache.set(key, value, ttl=ttl)
+                    # Дублируем в near cache (срок ограничен, как в set)
+                    await self._memory_cache.set(key, value, ttl=min(ttl, NEAR_CACHE_MAX_TTL))
 
                 # Выполняем все команды одним round trip
                 await pipeline.execute()
@@ -347,7 +755,10 @@ class CacheManager:
 
     async def clear_patterns(self, patterns: List[str]) -> int:
         """
-        Удалить ключи по нескольким паттернам используя batch операции (P-HIGH-2).
+        Удалить ключи по нескольким паттернам.
+
+        Паттерны вида "prefix:*" и "prefix:sub:*" удаляются по тегам
+        (invalidate_tags), остальные - через SCAN и один DELETE.
 
         Args:
             patterns: Список паттернов для поиска ключей
@@ -358,44 +769,39 @@ class CacheManager:
         Example:
             deleted = await cache_manager.clear_patterns([
                 "dashboard:*",
-                "bookings:*"
+                "bookings:stats"
             ])
         """
         if not patterns:
             return 0
 
-        deleted_count = 0
+        tags = [pattern_tag(pattern) for pattern in patterns]
+        deleted_count = await self.invalidate_tags([tag for tag in tags if tag])
+        other_patterns = [pattern for pattern, tag in zip(patterns, tags) if not tag]
+        if not other_patterns:
+            return deleted_count
 
         try:
             if self._use_redis and self._redis:
-                # Собираем все ключи для всех паттернов
-                all_keys = []
-                for pattern in patterns:
-                    keys = await self._redis.keys(pattern)
-                    if keys:
-                        all_keys.extend(keys)
-
-                # Удаляем все ключи одной командой
-                if all_keys:
-                    # Удаляем дубликаты
-                    unique_keys = list(set(all_keys))
-                    deleted_count = await self._redis.delete(*unique_keys)
-                    logger.debug(
-                        f"Cleared {deleted_count} keys from {len(patterns)} patterns "
-                        f"using batch delete"
-                    )
+                keys = set()
+                for pattern in other_patterns:
+                    keys.update(await self._scan_keys(pattern))
+                if keys:
+                    deleted_count += await self._redis.delete(*keys)
+                    await self._publish(keys=list(keys))
 
             # Также чистим memory cache
-            for pattern in patterns:
-                memory_keys = await self._memory_cache.keys(pattern)
-                for key in memory_keys:
-                    await self._memory_cache.delete(key)
+            for pattern in other_patterns:
+                for key in await self._memory_cache.keys(pattern):
+                    if await self._memory_cache.delete(key) and not self._use_redis:
+                        deleted_count += 1
 
+            logger.debug(f"Cleared {deleted_count} keys from {len(patterns)} patterns")
             return deleted_count
 
         except Exception as e:
             logger.error(f"Ошибка clear_patterns для {len(patterns)} паттернов: {e}")
-            return 0
+            return deleted_count
 
     async def clear_all(self) -> bool:
         """Очистить весь кэш"""
@@ -404,6 +810,7 @@ class CacheManager:
             
             if self._use_redis and self._redis:
                 await self._redis.flushdb()
+                await self._publish(clear=True)
             
             await self._memory_cache.clear()
             
@@ -413,6 +820,155 @@ class CacheManager:
             logger.error(f"Ошибка полной очистки кэша: {e}")
             return False
     
+    # --- Рассылка инвалидаций (near cache) ---
+
+    def _message(
+        self,
+        keys: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        clear: bool = False,
+        scope: str = "cache"
+    ) -> str:
+        """Сообщение об инвалидации для канала CACHE_INVALIDATION_CHANNEL"""
+        self.near_cache_stats["invalidations_sent"] += 1
+        return json.dumps({
+            "origin": self.instance_id,
+            "scope": scope,
+            "keys": keys or [],
+            "tags": tags or [],
+            "clear": clear,
+        })
+
+    async def _publish(self, **message) -> None:
+        if self._use_redis and self._redis:
+            await self._redis.publish(CACHE_INVALIDATION_CHANNEL, self._message(**message))
+
+    def add_invalidation_listener(self, scope: str, callback: Callable) -> None:
+        """
+        Подписать локальный кэш на инвалидации из других процессов.
+
+        callback(keys: List[str], clear: bool) вызывается для сообщений с этим scope.
+        """
+        self._invalidation_listeners.setdefault(scope, []).append(callback)
+
+    def publish_invalidation_nowait(
+        self, scope: str, keys: Optional[List[str]] = None, clear: bool = False
+    ) -> None:
+        """
+        Разослать инвалидацию локального кэша (scope) другим процессам.
+
+        Можно вызывать из синхронного кода и из других потоков: отправка
+        выполняется в event loop менеджера без ожидания результата.
+        """
+        if not (self._use_redis and self._redis and self._loop and self._loop.is_running()):
+            return
+
+        coro = self._publish(keys=keys, clear=clear, scope=scope)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            task = running.create_task(coro)
+            self._publish_tasks.add(task)
+            task.add_done_callback(self._publish_tasks.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _start_subscriber(self) -> None:
+        if self._subscriber is not None and not self._subscriber.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._subscriber = self._loop.create_task(self._listen_invalidations())
+
+    async def _listen_invalidations(self) -> None:
+        """Применять инвалидации других процессов к near cache и локальным кэшам"""
+        while self._use_redis and self._redis:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                # Пока подписки не было, сообщения могли потеряться
+                await self._apply_invalidation({"clear": True, "scope": "*"})
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        await self._apply_invalidation(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.near_cache_stats["resubscribes"] += 1
+                logger.warning(f"Подписка на инвалидации кэша прервана: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def _apply_invalidation(self, message: Dict[str, Any]) -> None:
+        if message.get("origin") == self.instance_id:
+            return
+        self._invalidation_seq += 1
+        self.near_cache_stats["invalidations_received"] += 1
+
+        scope = message.get("scope", "cache")
+        keys = message.get("keys") or []
+        clear = bool(message.get("clear"))
+
+        if scope == VERSIONS_SCOPE:
+            # Версии изменившихся таблиц перечитаются из Redis при следующем запросе
+            table_versions.forget(message.get("tables") or [])
+            return
+        if clear and scope == "*":
+            table_versions.forget()
+
+        if scope in ("cache", "*"):
+            if clear:
+                await self._memory_cache.clear()
+            else:
+                for key in keys:
+                    await self._memory_cache.delete(key)
+                await self._memory_cache.invalidate_tags(message.get("tags") or [])
+
+        for listener_scope, callbacks in self._invalidation_listeners.items():
+            if scope not in (listener_scope, "*"):
+                continue
+            for callback in callbacks:
+                try:
+                    callback(keys, clear)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика инвалидации {listener_scope}: {e}")
+
+    @property
+    def redis_client(self) -> Optional["redis.Redis"]:
+        """Клиент Redis (строковые ответы) или None в режиме memory cache"""
+        return self._redis if self._use_redis else None
+
+    async def versioned_key(self, key: str, tables: List[str]) -> str:
+        """
+        Ключ с версиями таблиц: "dashboard:stats" -> "dashboard:stats:v12.4".
+
+        Версии берутся из памяти процесса, пока подписка на инвалидации
+        доставляет их изменения; иначе - одним MGET из Redis.
+        """
+        tables = sorted(set(tables))
+        if not (self._use_redis and self._redis):
+            return f"{key}:{stamp(table_versions.local(tables))}"
+
+        subscribed = self._subscriber is not None and not self._subscriber.done()
+        versions = table_versions.known(tables) if subscribed else None
+        if versions is None:
+            generation = table_versions.generation
+            try:
+                values = await self._redis.mget([f"{VERSION_KEY_PREFIX}{table}" for table in tables])
+                versions = [int(value or 0) for value in values]
+                table_versions.observe(dict(zip(tables, versions)), generation)
+            except Exception as e:
+                logger.error(f"Ошибка чтения версий таблиц {tables}: {e}")
+                versions = table_versions.local(tables)
+        return f"{key}:{stamp(versions)}"
+
     def get_cache_key(self, prefix: str, *args, **kwargs) -> str:
         """Генерация ключа кэша"""
         # Создаем уникальный ключ на основе префикса и параметров
@@ -433,28 +989,160 @@ class CacheManager:
         
         return ":".join(key_parts)
     
-    async def get_or_set(self, key: str, factory_func, ttl: Optional[int] = None) -> Any:
-        """Получить из кэша или выполнить функцию и закэшировать результат"""
+    async def get_or_set(
+        self,
+        key: str,
+        factory_func,
+        ttl: Optional[int] = None,
+        tags: Optional[List[str]] = None,
+        stale_ttl: Optional[int] = None,
+        depends_on: Optional[List[str]] = None
+    ) -> Any:
+        """
+        Получить из кэша или выполнить функцию и закэшировать результат.
+
+        Пересчет выполняется одним исполнителем на ключ: конкурентные запросы
+        этого процесса ждут его результат, другие процессы - Redis-блокировку
+        с арендой lock_lease секунд.
+
+        stale_ttl - stale-while-revalidate: после ttl значение еще stale_ttl
+        секунд отдается как есть, а пересчет идет в фоне.
+
+        depends_on - таблицы, из которых строится значение: их версии входят
+        в ключ, и любой коммит в эти таблицы делает значение недоступным
+        (см. utils/cache_versions.py).
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        if depends_on:
+            key = await self.versioned_key(key, depends_on)
+
         # Пытаемся получить из кэша
-        cached_value = await self.get(key)
-        if cached_value is not None:
-            return cached_value
-        
+        value, fresh_until = _unwrap(await self._get_raw(key))
+        if value is not None:
+            if fresh_until is not None and fresh_until <= time.time():
+                self.single_flight_stats["stale_served"] += 1
+                self._schedule_refresh(key, factory_func, ttl, tags, stale_ttl)
+            return value
+
+        return await self._single_flight(key, factory_func, ttl, tags, stale_ttl)
+
+    def _schedule_refresh(self, key: str, factory_func, ttl: int, tags, stale_ttl) -> None:
+        """Фоновый пересчет устаревшего значения, если он еще не идет"""
+        if key in self._inflight:
+            return
+
+        async def _refresh():
+            try:
+                await self._single_flight(key, factory_func, ttl, tags, stale_ttl, wait=False)
+            except Exception:
+                # Ошибка уже залогирована, устаревшее значение остается до конца stale_ttl
+                pass
+
+        self.single_flight_stats["background_refreshes"] += 1
+        task = asyncio.get_running_loop().create_task(_refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _single_flight(
+        self, key: str, factory_func, ttl: int, tags, stale_ttl, wait: bool = True
+    ) -> Any:
+        """Пересчитать значение один раз на ключ в пределах процесса"""
+        task = self._inflight.get(key)
+        if task is not None:
+            if not wait:
+                return None
+            self.single_flight_stats["coalesced_waits"] += 1
+            return await asyncio.shield(task)
+
+        # Пересчет - отдельная задача: отмена запроса, который его начал
+        # (клиент отключился), не отменяет его для остальных ожидающих
+        task = asyncio.get_running_loop().create_task(
+            self._compute_shared(key, factory_func, ttl, tags, stale_ttl, wait)
+        )
+        self._inflight[key] = task
+        task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _compute_shared(
+        self, key: str, factory_func, ttl: int, tags, stale_ttl, wait: bool
+    ) -> Any:
+        try:
+            return await self._compute_with_lease(key, factory_func, ttl, tags, stale_ttl, wait)
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    async def _compute_with_lease(
+        self, key: str, factory_func, ttl: int, tags, stale_ttl, wait: bool
+    ) -> Any:
+        """Пересчет под Redis-блокировкой, чтобы ключ считал один процесс"""
+        lock_key = f"{LOCK_KEY_PREFIX}{key}"
+        token = None
+
+        if self._use_redis and self._redis:
+            try:
+                candidate = secrets.token_hex(8)
+                if await self._redis.set(lock_key, candidate, nx=True, px=int(self.lock_lease * 1000)):
+                    token = candidate
+                elif not wait:
+                    return None
+                else:
+                    self.single_flight_stats["lock_waits"] += 1
+                    value = await self._wait_for_value(key)
+                    if value is not None:
+                        return value
+                    # Владелец блокировки не успел за аренду - считаем сами
+            except Exception as e:
+                logger.warning(f"Не удалось взять блокировку пересчета {key}: {e}")
+
         try:
             # Выполняем функцию
             if asyncio.iscoroutinefunction(factory_func):
                 value = await factory_func()
             else:
                 value = factory_func()
-            
+
             # Кэшируем результат
-            await self.set(key, value, ttl)
+            if stale_ttl:
+                await self.set(
+                    key,
+                    {SWR_MARKER: time.time() + ttl, "value": value},
+                    ttl + stale_ttl,
+                    tags
+                )
+            else:
+                await self.set(key, value, ttl, tags)
             return value
-            
+
         except Exception as e:
             logger.error(f"Ошибка выполнения factory_func для ключа {key}: {e}")
             raise
-    
+        finally:
+            if token is not None:
+                await self._release_lock(lock_key, token)
+
+    async def _wait_for_value(self, key: str) -> Optional[Any]:
+        """Ждать, пока другой процесс запишет значение, не дольше аренды блокировки"""
+        deadline = time.monotonic() + self.lock_lease
+        delay = 0.02
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            value, _ = _unwrap(await self._get_raw(key))
+            if value is not None:
+                return value
+            delay = min(delay * 2, 0.25)
+        return None
+
+    async def _release_lock(self, lock_key: str, token: str) -> None:
+        try:
+            if self._release_script is None:
+                self._release_script = self._redis.register_script(_RELEASE_LOCK_LUA)
+            await self._release_script(keys=[lock_key], args=[token])
+        except Exception as e:
+            # Блокировка истечет сама по аренде
+            logger.warning(f"Не удалось снять блокировку {lock_key}: {e}")
+
     async def get_stats(self) -> Dict[str, Any]:
         """Получить статистику кэша с полными метриками для UI"""
         stats = {
@@ -463,7 +1151,7 @@ class CacheManager:
             "redis_connected": self._use_redis,
             "connection_attempts": self._connection_attempts,
             "timestamp": datetime.now().isoformat(),
-            "uptime": 3600,  # Примерное время работы в секундах
+            "uptime": int(time.time() - self._started_at),
         }
         
         try:
@@ -504,18 +1192,19 @@ class CacheManager:
                         "redis_mode": redis_info.get("redis_mode", "standalone"),
                     })
                     
-                    # Получаем статистику по типам ключей (примерная)
+                    # Статистика по типам ключей: размеры множеств тегов
+                    # (могут включать уже истекшие ключи)
                     stats_by_type = {}
                     try:
-                        # Пробуем получить ключи по паттернам (осторожно в production!)
-                        patterns = ["user:*", "dashboard:*", "api:*", "session:*", "tariffs:*", "booking:*"]
-                        for pattern in patterns:
-                            keys = await self._redis.keys(pattern)
-                            if keys:
-                                type_name = pattern.split(':')[0]
+                        type_names = ["user", "dashboard", "api", "session", "tariffs", "booking", "bookings"]
+                        pipeline = self._redis.pipeline(transaction=False)
+                        for type_name in type_names:
+                            pipeline.scard(f"{TAG_KEY_PREFIX}{type_name}")
+                        for type_name, count in zip(type_names, await pipeline.execute()):
+                            if count:
                                 stats_by_type[type_name] = {
-                                    "count": len(keys),
-                                    "size": len(keys) * 1024  # Примерная оценка размера
+                                    "count": count,
+                                    "size": count * 1024  # Примерная оценка размера
                                 }
                     except Exception as e:
                         logger.debug(f"Не удалось получить статистику по типам: {e}")
@@ -529,29 +1218,26 @@ class CacheManager:
                     # Падаем к memory cache статистике
                     
             if not self._use_redis:
-                # Статистика для memory cache
+                # Статистика для memory cache: реальные счетчики MemoryCache
                 memory_keys = await self._memory_cache.keys()
-                total_keys = len(memory_keys)
-                
-                # Генерируем реалистичные метрики для memory cache
-                base_hits = max(total_keys * 5, 10)  # Минимум 10 хитов
-                base_misses = max(total_keys * 2, 5)  # Минимум 5 промахов
-                
+                local = self._memory_cache.get_stats()
+                lookups = local["hits"] + local["misses"]
+
                 stats.update({
-                    "total_keys": total_keys,
-                    "total_size": total_keys * 1024,  # Примерная оценка
-                    "average_ttl": 300,
-                    "hits": base_hits,
-                    "misses": base_misses,
-                    "ops_per_sec": max(5, total_keys // 10),  # Динамичные ops
+                    "total_keys": len(memory_keys),
+                    "total_size": local["bytes"],
+                    "average_ttl": self.default_ttl,
+                    "hits": local["hits"],
+                    "misses": local["misses"],
+                    "ops_per_sec": round(lookups / max(time.time() - self._started_at, 1), 2),
                     "memory": {
-                        "used": total_keys * 1024,
-                        "peak": total_keys * 1200,
-                        "rss": total_keys * 1100,
-                        "fragmentation_ratio": 1.1
+                        "used": local["bytes"],
+                        "peak": local["max_bytes"],
+                        "rss": local["bytes"],
+                        "fragmentation_ratio": 1.0
                     }
                 })
-                
+
                 # Группируем ключи по типам для memory cache
                 stats_by_type = {}
                 for key in memory_keys:
@@ -559,16 +1245,21 @@ class CacheManager:
                     if key_type not in stats_by_type:
                         stats_by_type[key_type] = {"count": 0, "size": 0}
                     stats_by_type[key_type]["count"] += 1
-                    stats_by_type[key_type]["size"] += 1024  # Примерный размер
-                
-                if stats_by_type:
-                    stats["stats_by_type"] = stats_by_type
-                else:
-                    # Если нет ключей, добавляем базовую статистику
-                    stats["stats_by_type"] = {
-                        "system": {"count": 1, "size": 1024},
-                        "demo": {"count": 1, "size": 512}
-                    }
+                    stats_by_type[key_type]["size"] += self._memory_cache.entry_size(key)
+
+                stats["stats_by_type"] = stats_by_type
+
+            # Локальный кэш работает и при Redis (копия последних записей)
+            stats["local_cache"] = self._memory_cache.get_stats()
+            stats["single_flight"] = dict(self.single_flight_stats)
+            stats["codec"] = cache_codec.get_stats()
+            # Hit ratio по пространствам имен и перцентили задержек операций
+            stats.update(cache_metrics.get_stats())
+            stats["table_versions"] = dict(table_versions.stats)
+            stats["near_cache"] = dict(
+                self.near_cache_stats,
+                subscribed=self._subscriber is not None and not self._subscriber.done(),
+            )
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики кэша: {e}")
@@ -593,7 +1284,17 @@ class CacheManager:
     
     async def close(self):
         """Закрыть соединения"""
+        if self._subscriber is not None and not self._subscriber.done():
+            self._subscriber.cancel()
+            try:
+                await self._subscriber
+            except asyncio.CancelledError:
+                pass
+        self._subscriber = None
+        await self._memory_cache.close()
         try:
+            if self._redis_bin:
+                await self._redis_bin.close()
             if self._redis:
                 await self._redis.close()
                 logger.info("Redis соединение закрыто")
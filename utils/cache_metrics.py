@@ -0,0 +1,112 @@
+"""
+Метрики кэша по пространствам имен и уровням хранения.
+
+На каждую операцию get/set/delete CacheManager записывает:
+- счетчики по пространству имен (префикс ключа: dashboard, bookings, ...)
+  и уровню (memory - процесс/fallback, redis);
+- задержку в гистограмму по операции и уровню;
+- размер значения при записи в Redis (по данным cache_codec).
+
+Запись - несколько инкрементов и bisect, без блокировок.
+"""
+from typing import Dict, List, Tuple
+
+from utils.histogram import SIZE_BUCKETS, Histogram, format_labels
+
+OPERATIONS = ("get", "set", "delete")
+TIERS = ("memory", "redis")
+
+
+class CacheMetrics:
+    """Счетчики и гистограммы задержек операций кэша"""
+
+    def __init__(self):
+        # (namespace, tier) -> {"hits", "misses", "sets", "deletes"}
+        self._counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {
+            (op, tier): Histogram() for op in OPERATIONS for tier in TIERS
+        }
+        # namespace -> размер значения после кодека, байт
+        self._payload: Dict[str, Histogram] = {}
+
+    def _counter(self, namespace: str, tier: str) -> Dict[str, int]:
+        counter = self._counters.get((namespace, tier))
+        if counter is None:
+            counter = self._counters[(namespace, tier)] = {
+                "hits": 0, "misses": 0, "sets": 0, "deletes": 0,
+            }
+        return counter
+
+    def record_get(self, namespace: str, tier: str, hit: bool, seconds: float) -> None:
+        self._counter(namespace, tier)["hits" if hit else "misses"] += 1
+        self._latency[("get", tier)].observe(seconds)
+
+    def record_set(self, namespace: str, tier: str, seconds: float) -> None:
+        self._counter(namespace, tier)["sets"] += 1
+        self._latency[("set", tier)].observe(seconds)
+
+    def record_delete(self, namespace: str, tier: str, seconds: float) -> None:
+        self._counter(namespace, tier)["deletes"] += 1
+        self._latency[("delete", tier)].observe(seconds)
+
+    def record_payload(self, namespace: str, size: int) -> None:
+        histogram = self._payload.get(namespace)
+        if histogram is None:
+            histogram = self._payload[namespace] = Histogram(SIZE_BUCKETS)
+        histogram.observe(size)
+
+    def get_stats(self) -> Dict[str, object]:
+        """Hit ratio по пространствам имен и перцентили задержек (мс)"""
+        namespaces: Dict[str, Dict[str, object]] = {}
+        for (namespace, tier), counter in sorted(self._counters.items()):
+            entry = namespaces.setdefault(
+                namespace, {"hits": 0, "misses": 0, "sets": 0, "deletes": 0, "by_tier": {}}
+            )
+            for name, value in counter.items():
+                entry[name] += value
+            entry["by_tier"][tier] = dict(counter)
+
+        for entry in namespaces.values():
+            lookups = entry["hits"] + entry["misses"]
+            entry["hit_ratio"] = round(entry["hits"] / lookups, 4) if lookups else 0.0
+
+        latency = {
+            f"{op}:{tier}": histogram.snapshot(scale=1000)
+            for (op, tier), histogram in self._latency.items()
+            if histogram.count
+        }
+        payload = {
+            namespace: histogram.snapshot(digits=0)
+            for namespace, histogram in sorted(self._payload.items())
+        }
+        return {"namespaces": namespaces, "latency_ms": latency, "payload_bytes": payload}
+
+    def prometheus_lines(self) -> List[str]:
+        """Метрики кэша в формате Prometheus"""
+        lines = [
+            "# HELP cache_requests_total Cache operations by namespace, tier and result",
+            "# TYPE cache_requests_total counter",
+        ]
+        for (namespace, tier), counter in sorted(self._counters.items()):
+            for result, value in counter.items():
+                labels = format_labels({"namespace": namespace, "tier": tier, "result": result})
+                lines.append(f"cache_requests_total{labels} {value}")
+        lines.append("")
+
+        lines.append("# HELP cache_operation_duration_seconds Cache operation latency")
+        lines.append("# TYPE cache_operation_duration_seconds histogram")
+        for (op, tier), histogram in self._latency.items():
+            lines.extend(histogram.prometheus("cache_operation_duration_seconds", {"op": op, "tier": tier}))
+        lines.append("")
+
+        if self._payload:
+            lines.append("# HELP cache_payload_bytes Encoded cache value size")
+            lines.append("# TYPE cache_payload_bytes histogram")
+            for namespace, histogram in sorted(self._payload.items()):
+                lines.extend(histogram.prometheus("cache_payload_bytes", {"namespace": namespace}))
+            lines.append("")
+        return lines
+
+
+# Глобальные метрики кэша
+cache_metrics = CacheMetrics()
@@ -0,0 +1,320 @@
+"""
+Версии таблиц для автоматической инвалидации кэша.
+
+Каждый коммит сессии SQLAlchemy, изменивший строки таблицы, увеличивает
+счетчик версии этой таблицы в Redis (cache:ver:<таблица>). Ключ кэша,
+зависящий от таблиц, содержит их текущие версии (см.
+CacheManager.get_or_set(..., depends_on=[...])), поэтому после коммита
+следующий запрос просто не найдет старое значение - без ручных вызовов
+cache_invalidator и без обхода ключей. Старые значения доживают свой TTL.
+
+Хуки регистрируются на классе Session, поэтому работают для любого пути
+записи: API, бот, Celery, планировщики, очередь записи (там версии
+увеличиваются только после group commit всей группы).
+
+Изменения отслеживаются по ORM: add/изменение/удаление объектов,
+update()/delete() через сессию и текстовые INSERT/UPDATE/DELETE/REPLACE
+(session.execute(text(...)) - таблица берется из SQL). Записи мимо сессии
+(connection.execute, sqlite3) должны вызывать table_versions.bump() сами.
+Таблицы агрегатов дашборда обновляются
+триггерами в той же транзакции, поэтому зависимость от них выражается
+через исходные таблицы (bookings, users, ...).
+
+Другие процессы узнают о новых версиях через канал
+CACHE_INVALIDATION_CHANNEL (сообщение со scope "versions").
+
+Пример:
+    result = await cache_manager.get_or_set(
+        "dashboard:stats", _get_stats, depends_on=["bookings", "users"]
+    )
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy.sql.elements import TextClause
+
+try:
+    import redis as redis_sync
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from config import CACHE_INVALIDATION_CHANNEL, REDIS_URL
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Префикс Redis-счетчиков версий таблиц (без TTL)
+VERSION_KEY_PREFIX = "cache:ver:"
+# Scope сообщения об изменении версий в канале инвалидаций
+VERSIONS_SCOPE = "versions"
+
+# Ключи session.info
+_CHANGED_TABLES = "cache_changed_tables"
+# Множество, куда коммит сессии складывает таблицы вместо увеличения версий
+# (очередь записи увеличивает их сама после коммита внешней транзакции)
+DEFERRED_TABLES = "cache_deferred_tables"
+
+# Пауза перед повторным подключением к Redis после ошибки, сек
+_RETRY_DELAY = 30.0
+
+# Таблица, которую меняет текстовый SQL: INSERT [OR ...] INTO t, UPDATE [OR ...] t,
+# DELETE FROM t, REPLACE INTO t (в том числе после WITH ... AS (...));
+# SET исключен - это ON CONFLICT DO UPDATE SET, а не имя таблицы
+_WRITE_SQL = re.compile(
+    r"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+    r"\s+[\"`\[]?(?!SET\b)(\w+)",
+    re.IGNORECASE,
+)
+
+
+class TableVersions:
+    """
+    Версии таблиц этого процесса и их синхронизация через Redis.
+
+    bump() вызывается в after_commit (в том числе в event loop) и не ждет сеть:
+    версии процесса увеличиваются сразу, а INCR/PUBLISH в Redis выполняет
+    фоновый поток, объединяя накопившиеся таблицы в один pipeline. Чтение
+    версий для ключей кэша выполняет CacheManager через асинхронный клиент.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self._redis_url = redis_url
+        self._redis = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        # Известные процессу версии; таблица без записи читается из Redis
+        self._versions: Dict[str, int] = {}
+        # Растет при каждом forget(): версии, прочитанные из Redis до
+        # сообщения об изменении, не запоминаются
+        self.generation = 0
+        self.origin = f"versions:{os.getpid()}"
+        self.stats = {"bumps": 0, "tables_bumped": 0, "redis_errors": 0, "redis_batches": 0}
+        # Таблицы, чья версия увеличена только в памяти: известная версия из
+        # Redis появится после INCR, до этого ключи читают версии из Redis
+        self._unconfirmed: Set[str] = set()
+        # Таблицы, ожидающие INCR в Redis, и фоновый поток отправки
+        self._pending: Set[str] = set()
+        self._in_flight: Set[str] = set()
+        self._wakeup = threading.Condition(self._lock)
+        self._publisher: Optional[threading.Thread] = None
+        self._publisher_pid = 0
+
+    def _client(self):
+        if not REDIS_AVAILABLE or time.monotonic() < self._retry_at:
+            return None
+        if self._redis is None:
+            self._redis = redis_sync.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_connect_timeout=1,
+                socket_timeout=1,
+            )
+        return self._redis
+
+    def bump(self, tables: Iterable[str]) -> None:
+        """Увеличить версии таблиц после коммита и разослать изменение (без ожидания Redis)"""
+        tables = set(tables)
+        if not tables:
+            return
+
+        self.stats["bumps"] += 1
+        self.stats["tables_bumped"] += len(tables)
+
+        with self._lock:
+            # Версии процесса растут сразу - он больше не читает старые ключи
+            for table in tables:
+                if table not in self._versions and REDIS_AVAILABLE:
+                    self._unconfirmed.add(table)
+                self._versions[table] = self._versions.get(table, 0) + 1
+            if not REDIS_AVAILABLE:
+                return
+            self._pending.update(tables)
+            self._ensure_publisher()
+            self._wakeup.notify()
+
+    def _ensure_publisher(self) -> None:
+        # Вызывается под self._lock; поток не переживает fork - запускаем заново
+        if self._publisher is not None and self._publisher.is_alive() and self._publisher_pid == os.getpid():
+            return
+        self._publisher_pid = os.getpid()
+        self._publisher = threading.Thread(target=self._publish_loop, name="table-versions", daemon=True)
+        self._publisher.start()
+
+    def _publish_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                tables, self._pending = sorted(self._pending), set()
+                self._in_flight = set(tables)
+            try:
+                self._publish(tables)
+            finally:
+                with self._lock:
+                    self._in_flight = set()
+                    self._wakeup.notify_all()
+
+    def _publish(self, tables: List[str]) -> None:
+        """INCR версий в Redis и сообщение другим процессам (фоновый поток)"""
+        client = self._client()
+        if client is None:
+            self._confirm(tables, {})
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for table in tables:
+                pipeline.incr(f"{VERSION_KEY_PREFIX}{table}")
+            pipeline.publish(
+                CACHE_INVALIDATION_CHANNEL,
+                json.dumps({"origin": self.origin, "scope": VERSIONS_SCOPE, "tables": tables}),
+            )
+            self._confirm(tables, dict(zip(tables, pipeline.execute()[:-1])))
+            self.stats["redis_batches"] += 1
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            self._retry_at = time.monotonic() + _RETRY_DELAY
+            logger.warning(f"Не удалось увеличить версии таблиц {tables} в Redis: {e}")
+            self._confirm(tables, {})
+
+    def _confirm(self, tables: List[str], versions: Dict[str, int]) -> None:
+        # Без ответа Redis (versions пуст) остаются версии, увеличенные в памяти
+        with self._lock:
+            self._store(versions)
+            self._unconfirmed.difference_update(tables)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Дождаться отправки накопленных версий в Redis (тесты, завершение процесса)"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._wakeup.wait(remaining)
+        return True
+
+    def known(self, tables: List[str]) -> Optional[List[int]]:
+        """Версии из памяти процесса или None, если какая-то неизвестна"""
+        versions = self._versions
+        if self._unconfirmed and not self._unconfirmed.isdisjoint(tables):
+            return None
+        try:
+            return [versions[table] for table in tables]
+        except KeyError:
+            return None
+
+    def local(self, tables: List[str]) -> List[int]:
+        """Версии процесса (режим без Redis): неизвестные таблицы - 0"""
+        return [self._versions.get(table, 0) for table in tables]
+
+    def observe(self, versions: Dict[str, int], generation: Optional[int] = None) -> None:
+        """
+        Запомнить версии, прочитанные из Redis (версии только растут).
+
+        generation - значение self.generation до чтения: если с тех пор
+        пришло сообщение об изменении, прочитанное могло устареть. Версии
+        таблиц, чей INCR еще не отправлен в Redis, тоже устарели.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            waiting = self._pending | self._in_flight
+            self._store({table: version for table, version in versions.items() if table not in waiting})
+
+    def _store(self, versions: Dict[str, int]) -> None:
+        # Вызывается под self._lock
+        for table, version in versions.items():
+            if version >= self._versions.get(table, 0):
+                self._versions[table] = version
+
+    def forget(self, tables: Optional[Iterable[str]] = None) -> None:
+        """Забыть версии (все или указанных таблиц): следующее чтение пойдет в Redis"""
+        with self._lock:
+            self.generation += 1
+            if tables is None:
+                self._versions.clear()
+                self._unconfirmed.clear()
+            else:
+                for table in tables:
+                    self._versions.pop(table, None)
+                    self._unconfirmed.discard(table)
+
+
+def stamp(versions: List[int]) -> str:
+    """Суффикс ключа кэша по версиям таблиц: [12, 4] -> "v12.4" """
+    return "v" + ".".join(str(int(version)) for version in versions)
+
+
+def _tables_of(instance) -> List[str]:
+    return [table.name for table in sa_inspect(instance).mapper.tables]
+
+
+def _track_flush(session, flush_context) -> None:
+    changed = session.info.setdefault(_CHANGED_TABLES, set())
+    for instance in session.new:
+        changed.update(_tables_of(instance))
+    for instance in session.deleted:
+        changed.update(_tables_of(instance))
+    for instance in session.dirty:
+        if session.is_modified(instance, include_collections=False):
+            changed.update(_tables_of(instance))
+
+
+def _text_write_tables(sql: str) -> Set[str]:
+    """Таблицы, которые меняет текстовый SQL (пустое множество для SELECT)"""
+    return {match.group(1).lower() for match in _WRITE_SQL.finditer(sql)}
+
+
+def _track_bulk(orm_execute_state) -> None:
+    """update()/delete()/insert() через session.execute, query().update() и text()"""
+    statement = orm_execute_state.statement
+    if isinstance(statement, TextClause):
+        names = _text_write_tables(statement.text)
+    elif orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        name = getattr(getattr(statement, "table", None), "name", None)
+        names = {name} if name else set()
+    else:
+        return
+    if names:
+        orm_execute_state.session.info.setdefault(_CHANGED_TABLES, set()).update(names)
+
+
+def _after_commit(session) -> None:
+    changed = session.info.pop(_CHANGED_TABLES, None)
+    if not changed:
+        return
+    deferred = session.info.get(DEFERRED_TABLES)
+    if deferred is not None:
+        deferred.update(changed)
+        return
+    table_versions.bump(changed)
+
+
+def _after_rollback(session) -> None:
+    session.info.pop(_CHANGED_TABLES, None)
+
+
+_hooks_registered = False
+
+
+def register_session_hooks() -> None:
+    """Подключить отслеживание изменений ко всем сессиям SQLAlchemy"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    event.listen(SQLSession, "after_flush", _track_flush)
+    event.listen(SQLSession, "do_orm_execute", _track_bulk)
+    event.listen(SQLSession, "after_commit", _after_commit)
+    event.listen(SQLSession, "after_rollback", _after_rollback)
+    _hooks_registered = True
+
+
+# Глобальные версии таблиц процесса
+table_versions = TableVersions()
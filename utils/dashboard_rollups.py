@@ -0,0 +1,390 @@
+"""
+Дневные агрегаты (rollups) для аналитики дашборда.
+
+Запросы дашборда раньше сканировали users/bookings/tickets целиком на каждый
+запрос, поэтому их стоимость росла вместе с историей. Вместо этого
+поддерживаются таблицы с одной строкой на день (и на день + тариф/промокод):
+
+- daily_stats:           регистрации, конверсия, бронирования, доход, тикеты,
+                         платежи за опенспейс и офисы
+- daily_tariff_stats:    бронирования и доход по тарифам
+- daily_promocode_stats: использования промокодов и доход с ними
+
+Агрегаты обновляются триггерами SQLite в той же транзакции, что и запись
+в исходную таблицу, поэтому синхронны с любыми путями записи (ORM, raw SQL,
+очередь записи). Каждый триггер вычитает вклад старой строки и добавляет
+вклад новой, так что отмена, оплата или перенос бронирования корректно
+переносят счетчики. Запрос за период читает только строки нужных дней.
+
+День строки - date() от сохраненного времени (московское время, как и
+в прежних запросах DATE(created_at)).
+
+Полная перестройка: rebuild_rollups(session), эндпоинт
+POST /optimization/rollups/rebuild или scripts/rebuild_rollups.py.
+
+Пример:
+    from utils.dashboard_rollups import get_period_totals
+    from utils.date_ranges import day_bounds
+
+    first_day, end_day = day_bounds(period_start, period_end)
+    totals = get_period_totals(session, first_day, end_day)
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ROLLUP_TABLES: Dict[str, str] = {
+    "daily_stats": """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            registered_users INTEGER NOT NULL DEFAULT 0,
+            converted_users INTEGER NOT NULL DEFAULT 0,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            paid_bookings INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            tickets INTEGER NOT NULL DEFAULT 0,
+            open_tickets INTEGER NOT NULL DEFAULT 0,
+            openspace_payments INTEGER NOT NULL DEFAULT 0,
+            openspace_revenue REAL NOT NULL DEFAULT 0,
+            office_payments INTEGER NOT NULL DEFAULT 0,
+            office_revenue REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """,
+    "daily_tariff_stats": """
+        CREATE TABLE IF NOT EXISTS daily_tariff_stats (
+            day TEXT NOT NULL,
+            tariff_id INTEGER NOT NULL,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            paid_bookings INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, tariff_id)
+        ) WITHOUT ROWID
+    """,
+    "daily_promocode_stats": """
+        CREATE TABLE IF NOT EXISTS daily_promocode_stats (
+            day TEXT NOT NULL,
+            promocode_id INTEGER NOT NULL,
+            uses INTEGER NOT NULL DEFAULT 0,
+            paid_uses INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            last_used_at TEXT,
+            PRIMARY KEY (day, promocode_id)
+        ) WITHOUT ROWID
+    """,
+}
+
+# Колонки daily_stats, которые суммируются за период
+DAILY_MEASURES = (
+    "new_users",
+    "registered_users",
+    "converted_users",
+    "bookings",
+    "paid_bookings",
+    "revenue",
+    "tickets",
+    "open_tickets",
+    "openspace_payments",
+    "openspace_revenue",
+    "office_payments",
+    "office_revenue",
+)
+
+
+class _Contribution(NamedTuple):
+    """
+    Вклад строки исходной таблицы в агрегат.
+
+    Выражения ключей и мер - SQL над строкой {row} (new./old. в триггерах,
+    алиас таблицы при перестройке). Меры "sum" умножаются на знак вклада,
+    меры "max" только растут (уточняются перестройкой).
+    """
+    name: str
+    source: str
+    table: str
+    keys: Dict[str, str]
+    measures: Dict[str, Tuple[str, str]]
+    watch: Tuple[str, ...]
+    # Только для триггеров: при перестройке значение уже дает другой вклад
+    incremental_only: bool = False
+
+
+_ACTIVE = "coalesce({row}.cancelled, 0) = 0"
+_PAID = "{row}.paid = 1 AND " + _ACTIVE
+_BOOKING_MEASURES = {
+    "bookings": (f"CASE WHEN {_ACTIVE} THEN 1 ELSE 0 END", "sum"),
+    "paid_bookings": (f"CASE WHEN {_PAID} THEN 1 ELSE 0 END", "sum"),
+    "revenue": (f"CASE WHEN {_PAID} THEN {{row}}.amount ELSE 0 END", "sum"),
+}
+_BOOKING_WATCH = ("paid", "cancelled", "amount", "created_at")
+
+CONTRIBUTIONS: List[_Contribution] = [
+    _Contribution(
+        "users_joined", "users", "daily_stats",
+        {"day": "date(coalesce({row}.reg_date, {row}.first_join_time))"},
+        {
+            "new_users": ("1", "sum"),
+            "converted_users": (
+                "EXISTS (SELECT 1 FROM bookings cb WHERE cb.user_id = {row}.id)", "sum"
+            ),
+        },
+        ("reg_date", "first_join_time"),
+    ),
+    _Contribution(
+        "users_registered", "users", "daily_stats",
+        {"day": "date({row}.reg_date)"},
+        {"registered_users": ("1", "sum")},
+        ("reg_date",),
+    ),
+    _Contribution(
+        "bookings", "bookings", "daily_stats",
+        {"day": "date({row}.created_at)"},
+        _BOOKING_MEASURES,
+        _BOOKING_WATCH,
+    ),
+    # Первое бронирование пользователя переводит его в "сконвертированные"
+    # в день его регистрации, удаление последнего - обратно
+    _Contribution(
+        "bookings_conversion", "bookings", "daily_stats",
+        {
+            "day": "(SELECT date(coalesce(cu.reg_date, cu.first_join_time)) "
+                   "FROM users cu WHERE cu.id = {row}.user_id)"
+        },
+        {
+            "converted_users": (
+                "NOT EXISTS (SELECT 1 FROM bookings cb "
+                "WHERE cb.user_id = {row}.user_id AND cb.id != {row}.id)",
+                "sum",
+            ),
+        },
+        ("user_id",),
+        incremental_only=True,
+    ),
+    _Contribution(
+        "bookings_tariff", "bookings", "daily_tariff_stats",
+        {"day": "date({row}.created_at)", "tariff_id": "{row}.tariff_id"},
+        _BOOKING_MEASURES,
+        _BOOKING_WATCH + ("tariff_id",),
+    ),
+    _Contribution(
+        "bookings_promocode", "bookings", "daily_promocode_stats",
+        {"day": "date({row}.created_at)", "promocode_id": "{row}.promocode_id"},
+        {
+            "uses": (f"CASE WHEN {_ACTIVE} THEN 1 ELSE 0 END", "sum"),
+            "paid_uses": (f"CASE WHEN {_PAID} THEN 1 ELSE 0 END", "sum"),
+            "revenue": (f"CASE WHEN {_PAID} THEN {{row}}.amount ELSE 0 END", "sum"),
+            "last_used_at": (f"CASE WHEN {_ACTIVE} THEN {{row}}.created_at END", "max"),
+        },
+        _BOOKING_WATCH + ("promocode_id",),
+    ),
+    _Contribution(
+        "tickets", "tickets", "daily_stats",
+        {"day": "date({row}.created_at)"},
+        {
+            "tickets": ("1", "sum"),
+            "open_tickets": ("CASE WHEN {row}.status = 'OPEN' THEN 1 ELSE 0 END", "sum"),
+        },
+        ("status", "created_at"),
+    ),
+    _Contribution(
+        "openspace_payments", "openspace_payment_history", "daily_stats",
+        {"day": "date({row}.payment_date)"},
+        {
+            "openspace_payments": ("1", "sum"),
+            "openspace_revenue": ("{row}.amount", "sum"),
+        },
+        ("payment_date", "amount"),
+    ),
+    _Contribution(
+        "office_payments", "office_payment_history", "daily_stats",
+        {"day": "date({row}.payment_date)"},
+        {
+            "office_payments": ("1", "sum"),
+            "office_revenue": ("{row}.amount", "sum"),
+        },
+        ("payment_date", "amount"),
+    ),
+]
+
+
+def _upsert_sql(contribution: _Contribution, select_sql: str) -> str:
+    """INSERT ... ON CONFLICT, прибавляющий меры к существующей строке дня"""
+    keys = ", ".join(contribution.keys)
+    columns = ", ".join(list(contribution.keys) + list(contribution.measures))
+
+    updates = []
+    for measure, (_, kind) in contribution.measures.items():
+        if kind == "max":
+            updates.append(
+                f"{measure} = CASE WHEN excluded.{measure} IS NULL OR {measure} >= excluded.{measure} "
+                f"THEN {measure} ELSE excluded.{measure} END"
+            )
+        else:
+            updates.append(f"{measure} = {measure} + excluded.{measure}")
+
+    return (
+        f"INSERT INTO {contribution.table} ({columns}) {select_sql} "
+        f"ON CONFLICT ({keys}) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+def _key_filter(contribution: _Contribution, row: str) -> str:
+    return " AND ".join(
+        f"({expr.format(row=row)}) IS NOT NULL" for expr in contribution.keys.values()
+    )
+
+
+def _apply_sql(contribution: _Contribution, row: str, sign: int) -> str:
+    """Прибавление (sign=1) или вычитание (sign=-1) вклада строки new/old"""
+    values = [expr.format(row=row) for expr in contribution.keys.values()]
+    for expr, kind in contribution.measures.values():
+        if kind == "max":
+            values.append(expr.format(row=row) if sign > 0 else "NULL")
+        else:
+            values.append(f"{sign} * ({expr.format(row=row)})")
+
+    select_sql = f"SELECT {', '.join(values)} WHERE {_key_filter(contribution, row)}"
+    return _upsert_sql(contribution, select_sql)
+
+
+def _rebuild_sql(contribution: _Contribution) -> str:
+    """Агрегация вклада по всей исходной таблице"""
+    row = "src"
+    keys = [expr.format(row=row) for expr in contribution.keys.values()]
+    values = list(keys)
+    for expr, kind in contribution.measures.values():
+        aggregate = "MAX" if kind == "max" else "SUM"
+        values.append(f"{aggregate}({expr.format(row=row)})")
+
+    group_by = ", ".join(str(i) for i in range(1, len(keys) + 1))
+    select_sql = (
+        f"SELECT {', '.join(values)} FROM {contribution.source} AS {row} "
+        f"WHERE {_key_filter(contribution, row)} GROUP BY {group_by}"
+    )
+    return _upsert_sql(contribution, select_sql)
+
+
+def ensure_rollups(session) -> None:
+    """
+    Создает таблицы агрегатов и триггеры (идемпотентно).
+    Новые таблицы сразу заполняются из истории.
+    """
+    created = False
+    for table, ddl in ROLLUP_TABLES.items():
+        exists = session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {"name": table},
+        ).scalar()
+        if not exists:
+            session.execute(text(ddl))
+            created = True
+
+    for contribution in CONTRIBUTIONS:
+        trigger = f"rollup_{contribution.name}"
+        source = contribution.source
+        session.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger}_ai AFTER INSERT ON {source} BEGIN "
+                f"{_apply_sql(contribution, 'new', 1)}; "
+                f"END"
+            )
+        )
+        session.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger}_ad AFTER DELETE ON {source} BEGIN "
+                f"{_apply_sql(contribution, 'old', -1)}; "
+                f"END"
+            )
+        )
+        session.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger}_au "
+                f"AFTER UPDATE OF {', '.join(contribution.watch)} ON {source} BEGIN "
+                f"{_apply_sql(contribution, 'old', -1)}; "
+                f"{_apply_sql(contribution, 'new', 1)}; "
+                f"END"
+            )
+        )
+
+    if created:
+        rebuild_rollups(session)
+        logger.info("Dashboard rollups created")
+
+
+def rebuild_rollups(session) -> Dict[str, int]:
+    """
+    Полная перестройка агрегатов из исходных таблиц.
+
+    Returns:
+        Количество строк в каждой таблице агрегатов
+    """
+    for table in ROLLUP_TABLES:
+        session.execute(text(f"DELETE FROM {table}"))
+
+    for contribution in CONTRIBUTIONS:
+        if not contribution.incremental_only:
+            session.execute(text(_rebuild_sql(contribution)))
+
+    counts = {
+        table: session.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        for table in ROLLUP_TABLES
+    }
+    logger.info(f"Dashboard rollups rebuilt: {counts}")
+    return counts
+
+
+def get_period_totals(session, first_day: str, end_day: str) -> Dict[str, float]:
+    """Суммы мер daily_stats за дни [first_day, end_day)"""
+    sums = ", ".join(f"COALESCE(SUM({m}), 0) AS {m}" for m in DAILY_MEASURES)
+    row = session.execute(
+        text(f"SELECT {sums} FROM daily_stats WHERE day >= :first_day AND day < :end_day"),
+        {"first_day": first_day, "end_day": end_day},
+    ).fetchone()
+    return dict(row._mapping)
+
+
+def get_daily_series(session, first_day: str, end_day: str) -> List[Dict[str, Any]]:
+    """
+    Меры daily_stats по каждому дню [first_day, end_day), включая дни без
+    данных (с нулями).
+    """
+    rows = session.execute(
+        text(
+            f"SELECT day, {', '.join(DAILY_MEASURES)} FROM daily_stats "
+            f"WHERE day >= :first_day AND day < :end_day"
+        ),
+        {"first_day": first_day, "end_day": end_day},
+    ).fetchall()
+    by_day = {row.day: row._mapping for row in rows}
+
+    series = []
+    current = date.fromisoformat(first_day)
+    last = date.fromisoformat(end_day)
+    while current < last:
+        key = current.isoformat()
+        row = by_day.get(key)
+        item = {"day": key}
+        item.update({m: (row[m] if row else 0) for m in DAILY_MEASURES})
+        series.append(item)
+        current += timedelta(days=1)
+    return series
+
+
+def average_check(totals: Dict[str, float], include_office: bool = True) -> float:
+    """Средний чек: оплаченные бронирования + платежи за опенспейс (и офисы)"""
+    count = totals["paid_bookings"] + totals["openspace_payments"]
+    amount = totals["revenue"] + totals["openspace_revenue"]
+    if include_office:
+        count += totals["office_payments"]
+        amount += totals["office_revenue"]
+    return float(amount) / count if count else 0.0
+
+
+def get_first_day(session) -> Optional[str]:
+    """Первый день, за который есть данные"""
+    return session.execute(text("SELECT MIN(day) FROM daily_stats")).scalar()
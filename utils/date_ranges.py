@@ -0,0 +1,77 @@
+"""
+Полуинтервальные фильтры по датам для запросов.
+
+Условия вида strftime('%Y', col) = :year или DATE(col) = :day применяют
+функцию к каждой строке и не могут использовать индекс по col. Тот же фильтр,
+записанный как col >= :start AND col < :end, превращается в поиск по
+диапазону индекса (sargable). Хелперы ниже переводят год/месяц/день/период
+в такие полуинтервалы [start, end).
+
+Даты и время в SQLite хранятся строками ISO ('2024-01-31 10:00:00.000000'),
+поэтому границы для text()-запросов передаются строками того же формата:
+они корректно сравниваются и с датами, и с датой-временем.
+
+Пример:
+    from utils.date_ranges import half_open, month_bounds
+
+    start, end = month_bounds(2024, 1)
+    query = query.filter(half_open(Booking.visit_date, start, end))
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Tuple, Union
+
+from sqlalchemy import and_
+from sqlalchemy.sql.elements import ColumnElement
+
+DateLike = Union[date, datetime]
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """Первый день месяца и первый день следующего месяца"""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def day_range(day: date) -> Tuple[datetime, datetime]:
+    """Сутки [day 00:00, day + 1 00:00) - для колонок DateTime"""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def day_bounds(period_start: datetime, period_end: datetime) -> Tuple[str, str]:
+    """
+    Переводит период [period_start, period_end) в полуинтервал дней.
+
+    Конец периода в полночь не включает этот день, любое другое время
+    (например 23:59:59) включает.
+    """
+    end_day = period_end.date()
+    if period_end.time() != datetime.min.time():
+        end_day += timedelta(days=1)
+    return period_start.date().isoformat(), end_day.isoformat()
+
+
+def sql_bound(value: DateLike) -> str:
+    """Граница диапазона в формате хранения SQLite для text()-запросов"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None).isoformat(sep=" ")
+    return value.isoformat()
+
+
+def half_open(column, start: DateLike, end: DateLike) -> ColumnElement:
+    """ORM-условие column >= start AND column < end"""
+    return and_(column >= start, column < end)
+
+
+def half_open_sql(column: str, name: str) -> str:
+    """
+    Условие для text()-запроса: "{column} >= :{name}_start AND {column} < :{name}_end".
+    Параметры передаются через range_params().
+    """
+    return f"{column} >= :{name}_start AND {column} < :{name}_end"
+
+
+def range_params(name: str, start: DateLike, end: DateLike) -> dict:
+    """Параметры для условия half_open_sql(column, name)"""
+    return {f"{name}_start": sql_bound(start), f"{name}_end": sql_bound(end)}
@@ -0,0 +1,300 @@
+"""
+Очередь записи в SQLite с единственным потоком-писателем и group commit.
+
+SQLite допускает только одного писателя одновременно. Вместо того чтобы
+конкурентные транзакции боролись за блокировку (и ждали в backoff внутри
+safe_execute), операции записи ставятся в очередь и выполняются одним
+потоком. Подряд идущие операции объединяются в одну транзакцию: каждая
+выполняется в своем SAVEPOINT, а COMMIT делается один раз на всю группу.
+
+Через очередь идут пиковые записи, которые и создавали конкуренцию за
+блокировку: создание бронирований, трекинг открытий/кликов писем, статусы
+получателей email-кампаний и рассылок. Остальные записи (админка, тарифы,
+пользователи, тикеты, промокоды, API ключи, ротация refresh токенов) остаются
+на DatabaseManager.safe_execute/get_db с BEGIN IMMEDIATE и backoff:
+- это редкие одиночные операции, которые не создают очередь писателей;
+- обработчики на get_db читают и меняют ORM-объекты одной сессией запроса,
+  перенос в очередь - переписывание каждого обработчика в замыкание;
+- Celery воркеры - отдельные процессы, очередь процесса их не сериализует,
+  поэтому BEGIN IMMEDIATE с backoff нужен в любом случае.
+Новую пиковую запись добавлять через submit()/execute(), а не safe_execute.
+
+Чтение по-прежнему идет через пул соединений DatabaseManager.
+
+Пример:
+    from utils.db_write_queue import db_write_queue
+
+    def _mark_sent(session):
+        session.query(EmailCampaignRecipient).filter(...).update({...})
+
+    await db_write_queue.submit(_mark_sent)      # из async-кода
+    db_write_queue.execute(_mark_sent)           # из синхронного кода
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from models.models import WriterSessionLocal, writer_engine
+from utils.cache_versions import DEFERRED_TABLES, table_versions
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Сколько операций максимум объединять в одну транзакцию
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("DB_WRITE_QUEUE_MAX_BATCH", "64"))
+# Сколько ждать следующие операции перед коммитом группы (мс)
+WRITE_QUEUE_BATCH_WINDOW_MS = float(os.getenv("DB_WRITE_QUEUE_BATCH_WINDOW_MS", "2"))
+# Ограничение длины очереди (0 - без ограничения)
+WRITE_QUEUE_MAX_SIZE = int(os.getenv("DB_WRITE_QUEUE_MAX_SIZE", "10000"))
+
+
+class _WriteJob:
+    """Операция записи в очереди"""
+
+    __slots__ = ("func", "future", "enqueued_at")
+
+    def __init__(self, func: Callable, future: Future):
+        self.func = func
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+_STOP = object()
+
+
+class SQLiteWriteQueue:
+    """Единственный поток-писатель с group commit"""
+
+    def __init__(
+        self,
+        max_batch_size: int = WRITE_QUEUE_MAX_BATCH,
+        batch_window_ms: float = WRITE_QUEUE_BATCH_WINDOW_MS,
+        max_queue_size: int = WRITE_QUEUE_MAX_SIZE,
+        engine=None,
+        session_factory=None,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000
+        self._engine = engine or writer_engine
+        self._session_factory = session_factory or WriterSessionLocal
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._connection = None
+        self._changed_tables: Optional[set] = None
+        self._start_lock = threading.Lock()
+
+        # Статистика
+        self._stats = {
+            "jobs": 0,
+            "failed_jobs": 0,
+            "batches": 0,
+            "failed_commits": 0,
+            "max_batch_size": 0,
+            "total_wait_time": 0.0,
+            "total_commit_time": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Публичный API
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Запуск потока-писателя (идемпотентно)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="db-writer", daemon=True
+            )
+            self._thread.start()
+            logger.info(
+                f"DB write queue started (batch={self.max_batch_size}, "
+                f"window={self.batch_window * 1000:.1f}ms)"
+            )
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Остановка потока после выполнения уже поставленных операций"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("DB write queue did not stop in time")
+        else:
+            logger.info("DB write queue stopped")
+        self._thread = None
+
+    def submit_future(self, func: Callable[[Any], Any]) -> Future:
+        """Поставить операцию в очередь, вернуть concurrent.futures.Future"""
+        future: Future = Future()
+
+        # Запись изнутри другой операции очереди (поток-писатель) - выполняем
+        # сразу в текущей группе, иначе поток будет ждать сам себя
+        if threading.current_thread() is self._thread and self._connection is not None:
+            if future.set_running_or_notify_cancel():
+                _, result, error = self._run_job(
+                    _WriteJob(func, future), self._connection, self._changed_tables
+                )
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            return future
+
+        self.start()
+        self._queue.put(_WriteJob(func, future))
+        return future
+
+    def submit(self, func: Callable[[Any], Any]) -> "asyncio.Future":
+        """Поставить операцию в очередь из async-кода: await db_write_queue.submit(fn)"""
+        return asyncio.wrap_future(self.submit_future(func))
+
+    def execute(self, func: Callable[[Any], Any], timeout: Optional[float] = None) -> Any:
+        """Синхронно выполнить операцию через очередь и вернуть результат"""
+        return self.submit_future(func).result(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди записи"""
+        stats = dict(self._stats)
+        batches = stats["batches"] or 1
+        jobs = stats["jobs"] or 1
+        stats.update(
+            {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": round(stats["jobs"] / batches, 2),
+                "avg_wait_ms": round(stats["total_wait_time"] / jobs * 1000, 3),
+                "avg_commit_ms": round(stats["total_commit_time"] / batches * 1000, 3),
+            }
+        )
+        return stats
+
+    # ------------------------------------------------------------------
+    # Поток-писатель
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stop_requested = False
+            deadline = time.perf_counter() + self.batch_window
+
+            # Добираем операции, пришедшие за время окна группировки
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        next_item = self._queue.get(timeout=remaining)
+                    else:
+                        next_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if next_item is _STOP:
+                    stop_requested = True
+                    break
+                batch.append(next_item)
+
+            try:
+                self._execute_batch(batch)
+            except Exception as e:
+                # _execute_batch сам раздает исключения ожидающим,
+                # здесь только защита потока от падения
+                logger.error(f"Unexpected error in DB write queue: {e}", exc_info=True)
+
+            if stop_requested:
+                return
+
+    def _execute_batch(self, batch: List[_WriteJob]) -> None:
+        started = time.perf_counter()
+        outcomes = []
+
+        for job in batch:
+            self._stats["total_wait_time"] += started - job.enqueued_at
+
+        # Таблицы, измененные операциями группы: версии для кэша
+        # увеличиваются только после коммита всей группы
+        changed_tables = set()
+
+        try:
+            with self._engine.connect() as connection:
+                transaction = connection.begin()
+
+                self._connection = connection
+                self._changed_tables = changed_tables
+                try:
+                    for job in batch:
+                        if job.future.set_running_or_notify_cancel():
+                            outcomes.append(self._run_job(job, connection, changed_tables))
+                finally:
+                    self._connection = None
+                    self._changed_tables = None
+
+                commit_started = time.perf_counter()
+                transaction.commit()
+                self._stats["total_commit_time"] += time.perf_counter() - commit_started
+
+        except Exception as e:
+            # Групповой коммит не прошел - ни одна операция группы не записана
+            self._stats["failed_commits"] += 1
+            logger.error(f"DB write queue group commit failed ({len(batch)} ops): {e}")
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            self._stats["failed_jobs"] += len(batch)
+            return
+
+        if changed_tables:
+            table_versions.bump(changed_tables)
+
+        self._stats["batches"] += 1
+        self._stats["jobs"] += len(outcomes)
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(outcomes))
+
+        for job, result, error in outcomes:
+            if error is not None:
+                self._stats["failed_jobs"] += 1
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+        elapsed = time.perf_counter() - started
+        if elapsed > 1.0:
+            logger.warning(
+                f"Slow group commit: {elapsed:.2f}s for {len(outcomes)} operations"
+            )
+
+    def _run_job(self, job: _WriteJob, connection, changed_tables: set):
+        """Выполняет операцию в собственном SAVEPOINT внешней транзакции"""
+        session = self._session_factory(bind=connection)
+        session.info[DEFERRED_TABLES] = changed_tables
+        try:
+            result = job.func(session)
+            session.commit()
+            return job, result, None
+        except Exception as e:
+            # Откатывается только SAVEPOINT этой операции
+            try:
+                session.rollback()
+            except Exception:
+                pass
+            return job, None, e
+        finally:
+            session.close()
+
+
+# Глобальный экземпляр очереди записи
+db_write_queue = SQLiteWriteQueue()
@@ -0,0 +1,104 @@
+"""
+Гистограммы с фиксированными границами корзин.
+
+Запись - bisect по границам и инкремент счетчика, без блокировок и без
+хранения отдельных значений. Перцентили оцениваются интерполяцией внутри
+корзины; экспорт соответствует формату histogram Prometheus.
+
+Пример:
+    from utils.histogram import Histogram
+
+    latency = Histogram()
+    latency.observe(0.0042)
+    latency.snapshot()  # {"count": 1, "sum": 0.0042, "p50": ..., ...}
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+# Границы корзин для задержек в секундах: от 50 мкс до 10 с
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Границы корзин для размеров в байтах: от 64 Б до 4 МБ
+SIZE_BUCKETS = tuple(64 * 4 ** i for i in range(9))
+
+
+def format_labels(labels: Optional[Dict[str, str]]) -> str:
+    """{"op": "get"} -> '{op="get"}' для экспорта в Prometheus"""
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами.
+
+    Рассчитана на запись из event loop: операции не атомарны между потоками,
+    но при записи из нескольких потоков теряются лишь единичные наблюдения.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Последняя корзина - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Оценка q-перцентиля (q от 0 до 100) линейной интерполяцией в корзине"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                fraction = (rank - seen) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self, scale: float = 1.0, digits: int = 3) -> Dict[str, float]:
+        """Сводка: count, sum, mean, max и p50/p95/p99 (значения умножаются на scale)"""
+        mean = self.sum / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "sum": round(self.sum * scale, digits),
+            "mean": round(mean * scale, digits),
+            "max": round(self.max * scale, digits),
+            "p50": round(self.percentile(50) * scale, digits),
+            "p95": round(self.percentile(95) * scale, digits),
+            "p99": round(self.percentile(99) * scale, digits),
+        }
+
+    def prometheus(self, name: str, labels: Optional[Dict[str, str]] = None) -> List[str]:
+        """Строки _bucket/_sum/_count в формате Prometheus (без HELP/TYPE)"""
+        labels = dict(labels or {})
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': repr(float(bound))})} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
@@ -1,15 +1,23 @@
 """
 Система управления банами IP адресов для защиты от сканеров и ботов
-Использует Redis для хранения забаненных IP и счетчиков подозрительной активности
+Использует Redis для хранения забаненных IP и счетчиков подозрительной активности.
+
+Каждый процесс держит копию списка банов в памяти (CIDRBanTable): проверка
+запроса не обращается к Redis. Изменения рассылаются другим процессам через
+канал инвалидаций cache_manager (scope IP_BANS_SCOPE).
 """
 
 import asyncio
+import ipaddress
 import json
+import math
+import time
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import redis.asyncio as redis
 
 from config import REDIS_URL, ADMIN_TELEGRAM_ID
+from utils.cache_manager import cache_manager
 from utils.logger import get_logger
 from utils.bot_instance import get_bot
 
@@ -40,6 +48,15 @@ WHITELIST_PREFIXES = [
     "185.115.",
 ]
 
+# Минимальная длина префикса подсети для бана (защита от бана "половины интернета")
+MIN_BAN_PREFIX = {4: 16, 6: 48}
+
+# Scope рассылки изменений банов между процессами
+IP_BANS_SCOPE = "ip_bans"
+
+# Интервал очистки истекших банов в памяти и повторной загрузки копии, сек
+BAN_SWEEP_INTERVAL = 300
+
 # Настройки уведомлений в Telegram
 TELEGRAM_NOTIFICATION_ENABLED = True  # Включить/выключить уведомления
 TELEGRAM_NOTIFICATION_THROTTLE = (
@@ -47,6 +64,128 @@ TELEGRAM_NOTIFICATION_THROTTLE = (
 )
 
 
+def parse_ban_target(value: str) -> str:
+    """
+    Нормализует IP адрес или подсеть для бана.
+
+    "10.1.2.3" -> "10.1.2.3", "10.1.2.3/24" -> "10.1.2.0/24", "10.1.2.3/32" -> "10.1.2.3"
+
+    Raises:
+        ValueError: некорректный адрес или слишком широкая подсеть
+    """
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+
+    min_prefix = MIN_BAN_PREFIX[network.version]
+    if network.prefixlen < min_prefix:
+        raise ValueError(f"Подсеть {network} слишком широкая (минимальный префикс /{min_prefix})")
+    return str(network)
+
+
+def _whitelist_addresses() -> List[Any]:
+    addresses = []
+    for value in WHITELIST_IPS:
+        try:
+            addresses.append(ipaddress.ip_address(value))
+        except ValueError:
+            pass  # "localhost" и т.п.
+    return addresses
+
+
+class CIDRBanTable:
+    """
+    Баны в памяти процесса с поиском по подсетям (longest prefix match).
+
+    Для каждой версии IP и длины префикса - словарь {адрес сети (int): бан}.
+    Проверка адреса - один поиск в словаре на каждую встречающуюся длину
+    префикса, от самой длинной (обычно только /32 и /128 плюс пара подсетей).
+    """
+
+    def __init__(self):
+        self._networks: Dict[int, Dict[int, Dict[int, Dict[str, Any]]]] = {4: {}, 6: {}}
+        # Длины префиксов по убыванию - порядок проверки
+        self._prefixes: Dict[int, List[int]] = {4: [], 6: []}
+        self._size = 0
+
+    @staticmethod
+    def _split(target: str) -> Tuple[int, int, int]:
+        network = ipaddress.ip_network(target, strict=False)
+        return network.version, network.prefixlen, int(network.network_address)
+
+    def add(self, target: str, ban: Dict[str, Any]) -> None:
+        """Добавляет или заменяет бан адреса/подсети (ban["expires_at"] - unix time)"""
+        version, prefixlen, network = self._split(target)
+        by_prefix = self._networks[version]
+        table = by_prefix.get(prefixlen)
+        if table is None:
+            table = by_prefix[prefixlen] = {}
+            self._prefixes[version] = sorted(by_prefix, reverse=True)
+        if network not in table:
+            self._size += 1
+        table[network] = ban
+
+    def remove(self, target: str) -> bool:
+        """Удаляет бан адреса/подсети, True если он был"""
+        version, prefixlen, network = self._split(target)
+        by_prefix = self._networks[version]
+        table = by_prefix.get(prefixlen)
+        if not table or table.pop(network, None) is None:
+            return False
+        self._size -= 1
+        if not table:
+            del by_prefix[prefixlen]
+            self._prefixes[version] = sorted(by_prefix, reverse=True)
+        return True
+
+    def get(self, target: str, now: float) -> Optional[Dict[str, Any]]:
+        """Действующий бан именно этого адреса/подсети или None"""
+        version, prefixlen, network = self._split(target)
+        ban = self._networks[version].get(prefixlen, {}).get(network)
+        return ban if ban is not None and ban["expires_at"] > now else None
+
+    def match(self, ip: str, now: float) -> Optional[Dict[str, Any]]:
+        """Самый специфичный действующий бан, покрывающий адрес, или None"""
+        if not self._size:
+            return None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        value = int(address)
+        bits = address.max_prefixlen
+        by_prefix = self._networks[address.version]
+        for prefixlen in self._prefixes[address.version]:
+            shift = bits - prefixlen
+            ban = by_prefix[prefixlen].get(value >> shift << shift)
+            if ban is None:
+                continue
+            if ban["expires_at"] > now:
+                return ban
+            # Ключ в Redis уже истек по TTL - убираем и проверяем подсети шире
+            self.remove(ban["ip"])
+        return None
+
+    def purge(self, now: float) -> int:
+        """Удаляет истекшие баны, возвращает их количество"""
+        expired = [
+            ban["ip"]
+            for by_prefix in self._networks.values()
+            for table in by_prefix.values()
+            for ban in table.values()
+            if ban["expires_at"] <= now
+        ]
+        for target in expired:
+            self.remove(target)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return self._size
+
+
 class IPBanManager:
     """Менеджер для управления банами IP адресов"""
 
@@ -59,6 +198,15 @@ class IPBanManager:
         self.SUSPICIOUS_KEY_PREFIX = "ip_suspicious:"
         self.NOTIFICATION_KEY_PREFIX = "ip_ban_notification:"
 
+        # Локальная копия банов и изменения, пришедшие во время ее перезагрузки
+        self._bans = CIDRBanTable()
+        self._snapshot_loaded = False
+        self._changes_during_reload: Optional[List[Tuple[str, Optional[Dict[str, Any]]]]] = None
+        self._tasks: set = set()
+        self._loading: Optional[asyncio.Task] = None
+        self._next_sweep = 0.0
+        self._whitelist_addresses = _whitelist_addresses()
+
     async def _get_redis(self) -> Optional[redis.Redis]:
         """Получает подключение к Redis"""
         if self._redis is None:
@@ -82,78 +230,197 @@ class IPBanManager:
         return self._redis
 
     def _is_whitelisted(self, ip: str) -> bool:
-        """Проверяет, находится ли IP в whitelist"""
+        """Проверяет, находится ли IP (или подсеть, покрывающая whitelisted IP) в whitelist"""
         if ip in WHITELIST_IPS:
             return True
 
+        if "/" in ip:
+            network = ipaddress.ip_network(ip, strict=False)
+            if any(
+                address.version == network.version and address in network
+                for address in self._whitelist_addresses
+            ):
+                return True
+            ip = str(network.network_address)
+
         for prefix in WHITELIST_PREFIXES:
             if ip.startswith(prefix):
                 return True
 
         return False
 
-    async def is_banned(self, ip: str) -> bool:
-        """
-        Проверяет, забанен ли IP адрес
+    # --- Локальная копия банов ---
 
-        Args:
-            ip: IP адрес для проверки
+    @staticmethod
+    def _ban_entry(target: str, data: Optional[str], ttl: int, now: float) -> Optional[Dict[str, Any]]:
+        """Бан из значения ключа Redis и его TTL (None - ключа нет)"""
+        if not data or ttl == -2:
+            return None
+        ban = json.loads(data)
+        ban["ip"] = target
+        ban["expires_at"] = now + ttl if ttl > 0 else math.inf
+        return ban
+
+    def _apply(self, target: str, ban: Optional[Dict[str, Any]]) -> None:
+        """Применяет изменение к локальной копии (ban=None - разбан)"""
+        if ban is None:
+            self._bans.remove(target)
+        else:
+            self._bans.add(target, ban)
+        if self._changes_during_reload is not None:
+            self._changes_during_reload.append((target, ban))
+
+    async def load_snapshot(self) -> bool:
+        """
+        Перечитывает все баны из Redis в память процесса.
 
         Returns:
-            True если IP забанен, иначе False
+            True если копия загружена
         """
-        if self._is_whitelisted(ip):
+        redis_client = await self._get_redis()
+        if not redis_client or not self._redis_available:
             return False
 
+        self._changes_during_reload = []
+        try:
+            table = CIDRBanTable()
+            prefix_length = len(self.BAN_KEY_PREFIX)
+            keys = [key async for key in redis_client.scan_iter(match=f"{self.BAN_KEY_PREFIX}*", count=500)]
+
+            for offset in range(0, len(keys), 500):
+                batch = keys[offset:offset + 500]
+                pipe = redis_client.pipeline(transaction=False)
+                for key in batch:
+                    pipe.get(key)
+                    pipe.ttl(key)
+                values = await pipe.execute()
+                now = time.time()
+                for index, key in enumerate(batch):
+                    target = key[prefix_length:]
+                    try:
+                        ban = self._ban_entry(parse_ban_target(target), values[2 * index], values[2 * index + 1], now)
+                    except ValueError as e:
+                        logger.warning(f"Пропущен некорректный ключ бана {key}: {e}")
+                        continue
+                    if ban:
+                        table.add(ban["ip"], ban)
+
+            # Изменения этого процесса, сделанные пока шло чтение
+            for target, ban in self._changes_during_reload:
+                if ban is None:
+                    table.remove(target)
+                else:
+                    table.add(target, ban)
+
+            self._bans = table
+            self._snapshot_loaded = True
+            logger.info(f"IPBanManager: загружено банов в память: {len(table)}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка загрузки списка банов из Redis: {e}")
+            return False
+        finally:
+            self._changes_during_reload = None
+
+    async def _refresh(self, targets: List[str]) -> None:
+        """Перечитывает из Redis баны, измененные другим процессом"""
         redis_client = await self._get_redis()
         if not redis_client or not self._redis_available:
-            return False  # Если Redis недоступен, не баним
+            return
 
         try:
-            key = f"{self.BAN_KEY_PREFIX}{ip}"
-            exists = await redis_client.exists(key)
-            return bool(exists)
+            pipe = redis_client.pipeline(transaction=False)
+            for target in targets:
+                key = f"{self.BAN_KEY_PREFIX}{target}"
+                pipe.get(key)
+                pipe.ttl(key)
+            values = await pipe.execute()
+            now = time.time()
+            for index, target in enumerate(targets):
+                self._apply(target, self._ban_entry(target, values[2 * index], values[2 * index + 1], now))
         except Exception as e:
-            logger.error(f"Ошибка проверки бана для {ip}: {e}")
-            return False
+            logger.error(f"Ошибка обновления банов {targets}: {e}")
 
-    async def get_ban_info(self, ip: str) -> Optional[Dict[str, Any]]:
+    def _spawn(self, coro) -> Optional[asyncio.Task]:
+        """Запускает фоновую задачу в текущем event loop (вне loop - ничего)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            return None
+
+        task = loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _on_invalidation(self, keys: List[str], clear: bool) -> None:
+        """Обработчик рассылки изменений банов от других процессов"""
+        self._spawn(self.load_snapshot() if clear else self._refresh(keys))
+
+    def _sweep(self, now: float) -> None:
         """
-        Получает информацию о бане IP адреса
+        Периодическое обслуживание копии: удаляет истекшие баны адресов,
+        которые больше не обращались, и повторяет загрузку копии, если
+        при старте Redis был недоступен
+        """
+        self._next_sweep = now + BAN_SWEEP_INTERVAL
+        purged = self._bans.purge(now)
+        if purged:
+            logger.debug(f"IPBanManager: удалено истекших банов из памяти: {purged}")
+        if not self._snapshot_loaded and (self._loading is None or self._loading.done()):
+            self._loading = self._spawn(self.load_snapshot())
+
+    def find_ban(self, ip: str, exact: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Ищет бан IP адреса в памяти процесса (без обращения к Redis)
 
         Args:
-            ip: IP адрес
+            ip: IP адрес для проверки (при exact - нормализованный адрес или подсеть)
+            exact: искать бан только этого адреса/подсети, без подсетей шире
 
         Returns:
-            Dict с информацией о бане или None если IP не забанен
+            Dict с информацией о бане (ip - забаненный адрес или подсеть) или None
         """
-        if self._is_whitelisted(ip):
+        now = time.time()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        if not len(self._bans) or self._is_whitelisted(ip):
             return None
 
-        redis_client = await self._get_redis()
-        if not redis_client or not self._redis_available:
+        ban = self._bans.get(ip, now) if exact else self._bans.match(ip, now)
+        if ban is None:
             return None
 
-        try:
-            key = f"{self.BAN_KEY_PREFIX}{ip}"
-            data = await redis_client.get(key)
+        ban_info = {key: value for key, value in ban.items() if key != "expires_at"}
+        if ban["expires_at"] != math.inf:
+            ban_info["unbanned_at"] = datetime.fromtimestamp(ban["expires_at"]).isoformat()
+            ban_info["seconds_remaining"] = max(1, int(ban["expires_at"] - now))
+        return ban_info
 
-            if data:
-                ban_info = json.loads(data)
-                # Получаем TTL для вычисления времени разбана
-                ttl = await redis_client.ttl(key)
-                if ttl > 0:
-                    ban_info["unbanned_at"] = (
-                        datetime.now() + timedelta(seconds=ttl)
-                    ).isoformat()
-                    ban_info["seconds_remaining"] = ttl
+    async def is_banned(self, ip: str) -> bool:
+        """
+        Проверяет, забанен ли IP адрес (сам или подсеть, в которую он входит)
 
-                return ban_info
+        Args:
+            ip: IP адрес для проверки
 
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка получения информации о бане для {ip}: {e}")
-            return None
+        Returns:
+            True если IP забанен, иначе False
+        """
+        return self.find_ban(ip) is not None
+
+    async def get_ban_info(self, ip: str) -> Optional[Dict[str, Any]]:
+        """
+        Получает информацию о бане IP адреса
+
+        Args:
+            ip: IP адрес
+
+        Returns:
+            Dict с информацией о бане или None если IP не забанен
+        """
+        return self.find_ban(ip)
 
     async def ban_ip(
         self,
@@ -165,10 +432,10 @@ class IPBanManager:
         admin: str = None,
     ) -> bool:
         """
-        Банит IP адрес
+        Банит IP адрес или подсеть
 
         Args:
-            ip: IP адрес для бана
+            ip: IP адрес или подсеть (CIDR) для бана
             reason: Причина бана
             duration: Длительность бана в секундах (если None, используется duration_type)
             duration_type: Тип длительности ('hour', 'day', 'week', 'month', 'permanent')
@@ -178,6 +445,12 @@ class IPBanManager:
         Returns:
             True если бан успешен, иначе False
         """
+        try:
+            ip = parse_ban_target(ip)
+        except ValueError as e:
+            logger.warning(f"Попытка забанить некорректный адрес {ip}: {e}")
+            return False
+
         if self._is_whitelisted(ip):
             logger.warning(f"Попытка забанить whitelisted IP: {ip}")
             return False
@@ -207,6 +480,10 @@ class IPBanManager:
             # Сохраняем с TTL
             await redis_client.setex(key, duration, json.dumps(ban_info))
 
+            # Копия в памяти этого процесса и рассылка остальным
+            self._apply(ip, {**ban_info, "expires_at": time.time() + duration})
+            cache_manager.publish_invalidation_nowait(IP_BANS_SCOPE, keys=[ip])
+
             # Очищаем счетчик подозрительных запросов
             suspicious_key = f"{self.SUSPICIOUS_KEY_PREFIX}{ip}"
             await redis_client.delete(suspicious_key)
@@ -225,15 +502,21 @@ class IPBanManager:
 
     async def unban_ip(self, ip: str, admin: str = None) -> bool:
         """
-        Разбанивает IP адрес
+        Разбанивает IP адрес или подсеть
 
         Args:
-            ip: IP адрес для разбана
+            ip: IP адрес или подсеть (CIDR) - так же, как она была забанена
             admin: Логин администратора
 
         Returns:
             True если разбан успешен, иначе False
         """
+        try:
+            ip = parse_ban_target(ip)
+        except ValueError as e:
+            logger.warning(f"Попытка разбанить некорректный адрес {ip}: {e}")
+            return False
+
         redis_client = await self._get_redis()
         if not redis_client or not self._redis_available:
             logger.error(f"Не удалось разбанить {ip}: Redis недоступен")
@@ -247,6 +530,9 @@ class IPBanManager:
             suspicious_key = f"{self.SUSPICIOUS_KEY_PREFIX}{ip}"
             await redis_client.delete(suspicious_key)
 
+            self._apply(ip, None)
+            cache_manager.publish_invalidation_nowait(IP_BANS_SCOPE, keys=[ip])
+
             if result:
                 logger.info(
                     f"IP {ip} разбанен{f' администратором {admin}' if admin else ''}"
@@ -448,7 +734,13 @@ class IPBanManager:
         """
         redis_client = await self._get_redis()
         if not redis_client or not self._redis_available:
-            return {"redis_available": False, "total_banned": 0, "total_tracked": 0}
+            return {
+                "redis_available": False,
+                "total_banned": 0,
+                "total_tracked": 0,
+                "snapshot_size": len(self._bans),
+                "snapshot_loaded": self._snapshot_loaded,
+            }
 
         try:
             # Считаем забаненные IP
@@ -482,6 +774,8 @@ class IPBanManager:
                 "ban_duration": BAN_DURATION,
                 "tracking_window": TRACKING_WINDOW,
                 "max_suspicious_requests": MAX_SUSPICIOUS_REQUESTS,
+                "snapshot_size": len(self._bans),
+                "snapshot_loaded": self._snapshot_loaded,
             }
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
@@ -564,6 +858,8 @@ class IPBanManager:
 
     async def close(self):
         """Закрывает подключение к Redis"""
+        for task in list(self._tasks):
+            task.cancel()
         if self._redis:
             try:
                 await self._redis.close()
@@ -574,6 +870,7 @@ class IPBanManager:
 
 # Глобальный экземпляр менеджера
 _ip_ban_manager = IPBanManager()
+cache_manager.add_invalidation_listener(IP_BANS_SCOPE, _ip_ban_manager._on_invalidation)
 
 
 def get_ip_ban_manager() -> IPBanManager:
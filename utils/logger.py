@@ -1,21 +1,29 @@
 """
 Единая система логирования с управлением через .env файл
 Поддерживает JSON и текстовый формат, production и development режимы
+
+Вызов logger.info и т.п. маскирует sensitive данные (фильтр логгера - запись
+может уйти и в обработчики корневого логгера, например у Celery) и кладет
+запись в ограниченную очередь; форматирование и запись в консоль/файл
+выполняет фоновый поток (LogPipeline), поэтому event loop не ждет дискового I/O.
 """
 import os
+import atexit
 import json
 import logging
+import queue
 import sys
+import threading
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pathlib import Path
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 import pytz
 
 # Загружаем настройки из конфигурации
 try:
-    from config import LOG_LEVEL, ENVIRONMENT, LOG_FORMAT, LOG_TO_FILE, LOGS_DIR
+    from config import LOG_LEVEL, ENVIRONMENT, LOG_FORMAT, LOG_TO_FILE, LOGS_DIR, LOG_QUEUE_SIZE
 except ImportError:
     # Fallback для случаев когда config недоступен
     from dotenv import load_dotenv
@@ -25,6 +33,7 @@ except ImportError:
     LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
     LOG_TO_FILE = os.getenv("LOG_TO_FILE", "true").lower() == "true"
     LOGS_DIR = Path(os.getenv("LOGS_DIR", "logs"))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
 MOSCOW_TZ = pytz.timezone("Europe/Moscow")
 
@@ -73,6 +82,8 @@ class JSONFormatter(logging.Formatter):
         # Добавляем информацию об исключении если есть
         if record.exc_info:
             log_entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
 
         # Добавляем дополнительные поля
         if self.include_extra:
@@ -161,11 +172,6 @@ class SensitiveDataFilter(logging.Filter):
         """
         import re
 
-        # Обрабатываем сообщение
-        if hasattr(record, 'msg') and isinstance(record.msg, str):
-            for pattern, replacement, *_ in self.SENSITIVE_PATTERNS:
-                record.msg = re.sub(pattern, replacement, record.msg, flags=re.IGNORECASE)
-
         # Обрабатываем аргументы
         if hasattr(record, 'args') and record.args:
             if isinstance(record.args, dict):
@@ -175,6 +181,18 @@ class SensitiveDataFilter(logging.Filter):
                     self._sanitize_value(arg) for arg in record.args
                 )
 
+            # Подставляем аргументы до маскирования: паттерны ищутся в итоговом тексте
+            try:
+                record.msg = record.getMessage()
+                record.args = None
+            except Exception:
+                return True  # Ошибку форматирования покажет обработчик
+
+        # Обрабатываем сообщение
+        if hasattr(record, 'msg') and isinstance(record.msg, str):
+            for pattern, replacement, *_ in self.SENSITIVE_PATTERNS:
+                record.msg = re.sub(pattern, replacement, record.msg, flags=re.IGNORECASE)
+
         return True
 
     def _sanitize_dict(self, data: dict) -> dict:
@@ -220,6 +238,167 @@ class SensitiveDataFilter(logging.Filter):
         return value
 
 
+# Аргументы, которые можно передать в фоновый поток как есть
+_PRIMITIVE_ARGS = (str, int, float, type(None))
+
+# Форматирование traceback в вызывающем потоке
+_exception_formatter = logging.Formatter()
+
+
+def _freeze_arg(value: Any) -> Any:
+    return value if isinstance(value, _PRIMITIVE_ARGS) else str(value)
+
+
+class _PipelineQueueHandler(QueueHandler):
+    """
+    Обработчик логгера: кладет запись в очередь LogPipeline без ожидания.
+
+    Запись не форматируется в вызывающем потоке (в отличие от
+    QueueHandler.prepare) - это делает фоновый поток. Вызывается только для
+    включенных уровней, поэтому отключенные записи по-прежнему не форматируются.
+    """
+
+    def __init__(self, pipeline: "LogPipeline"):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Изменяемые объекты (ORM-модели, словари) к моменту записи в фоновом
+        # потоке могут измениться или требовать сессию - фиксируем их текст
+        if isinstance(record.args, dict):
+            record.args = {key: _freeze_arg(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(_freeze_arg(arg) for arg in record.args)
+
+        # Traceback держит кадры вызывающего кода - в очередь идет только текст
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.pipeline.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.record_drop(record)
+
+
+class _PipelineListener(QueueListener):
+    """Фоновый поток: форматирует и пишет записи, сообщает о потерях"""
+
+    def __init__(self, pipeline: "LogPipeline", *handlers):
+        super().__init__(pipeline.queue, *handlers, respect_handler_level=True)
+        self.pipeline = pipeline
+
+    def enqueue_sentinel(self) -> None:
+        # QueueListener.stop() кладет сигнал остановки через put_nowait, что
+        # падает на заполненной очереди: ждем, пока поток освободит место
+        while True:
+            try:
+                self.queue.put(self._sentinel, timeout=1.0)
+                return
+            except queue.Full:
+                if self._thread is None or not self._thread.is_alive():
+                    return
+
+    def handle(self, record: logging.LogRecord) -> None:
+        super().handle(record)
+        dropped = self.pipeline.take_unreported_drops()
+        if dropped:
+            super().handle(logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Очередь логов переполнена: отброшено записей - {dropped}", None, None
+            ))
+
+
+class LogPipeline:
+    """
+    Асинхронная запись логов через ограниченную очередь.
+
+    Все логгеры процесса пишут в одну очередь, а один QueueListener владеет
+    консольным и файловым обработчиками. При переполнении очереди записи
+    отбрасываются с подсчетом по уровням - логирование никогда не
+    блокирует вызывающий код.
+    """
+
+    def __init__(self, max_size: int = LOG_QUEUE_SIZE):
+        self.max_size = max_size
+        self.queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self.handlers: List[logging.Handler] = []
+        self.dropped: Dict[str, int] = {}
+        self._unreported_drops = 0
+        self._lock = threading.Lock()
+        self._listener: Optional[_PipelineListener] = None
+
+    @property
+    def started(self) -> bool:
+        return self._listener is not None
+
+    def start(self, handlers: List[logging.Handler]) -> None:
+        """Запускает фоновый поток с обработчиками (один раз на процесс)"""
+        with self._lock:
+            if self._listener is not None:
+                return
+            self.handlers = handlers
+            self._listener = _PipelineListener(self, *handlers)
+            self._listener.start()
+
+    def stop(self) -> None:
+        """Дописывает очередь и останавливает фоновый поток"""
+        with self._lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in self.handlers:
+                try:
+                    handler.flush()
+                except (OSError, ValueError):
+                    pass  # Поток вывода уже закрыт (завершение процесса)
+
+    def create_handler(self) -> logging.Handler:
+        """Обработчик для логгера, ставящий записи в очередь"""
+        return _PipelineQueueHandler(self)
+
+    def record_drop(self, record: logging.LogRecord) -> None:
+        with self._lock:
+            self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+            self._unreported_drops += 1
+
+    def take_unreported_drops(self) -> int:
+        if not self._unreported_drops:
+            return 0
+        with self._lock:
+            dropped, self._unreported_drops = self._unreported_drops, 0
+        return dropped
+
+    def _after_fork(self) -> None:
+        # Поток listener'а не переживает fork: в дочернем процессе - новые очередь и поток
+        self._lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=self.max_size)
+        self._unreported_drops = 0
+        if self._listener is not None:
+            self._listener = None
+            self.start(self.handlers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди логов"""
+        return {
+            "started": self.started,
+            "queued": self.queue.qsize(),
+            "max_size": self.max_size,
+            "dropped": dict(self.dropped),
+            "dropped_total": sum(self.dropped.values()),
+        }
+
+
+# Глобальная очередь логов процесса
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.stop)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=log_pipeline._after_fork)
+
+
 class UnifiedLogger:
     """Единая система логирования с поддержкой JSON и текстового формата"""
 
@@ -250,15 +429,25 @@ class UnifiedLogger:
             return self.log_level
 
     def _setup_logger(self):
-        """Настройка логгера с обработчиками"""
-        # Устанавливаем уровень
+        """Настройка логгера: записи уходят в общую очередь логов процесса"""
+        # Уровень проверяется в вызывающем потоке - отключенные уровни ничего не стоят
         level = getattr(logging, self.effective_log_level)
         self.logger.setLevel(level)
 
-        # Добавляем фильтр для маскирования sensitive данных
-        sensitive_filter = SensitiveDataFilter()
-        self.logger.addFilter(sensitive_filter)
+        # Маскирование до любых обработчиков: запись распространяется и в
+        # корневой логгер (обработчики Celery и сторонних библиотек)
+        self.logger.addFilter(SensitiveDataFilter())
+
+        # Обработчики создаются один раз на процесс и живут в фоновом потоке
+        if not log_pipeline.started:
+            log_pipeline.start(self._create_handlers())
+        self.logger.addHandler(log_pipeline.create_handler())
+
+        # Telegram обработчик для критических ошибок
+        self._add_telegram_handler()
 
+    def _create_handlers(self) -> List[logging.Handler]:
+        """Консольный и файловый обработчики (маскирование sensitive данных - фильтр логгера)"""
         # Создаем форматтеры
         if self.log_format == "json":
             formatter = JSONFormatter()
@@ -273,19 +462,17 @@ class UnifiedLogger:
 
         # Консольный обработчик
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(level)
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
+        handlers: List[logging.Handler] = [console_handler]
 
         # Файловый обработчик
         if self.log_to_file:
-            self._add_file_handler(formatter, level)
+            handlers.append(self._create_file_handler(formatter))
 
-        # Telegram обработчик для критических ошибок
-        self._add_telegram_handler()
+        return handlers
 
-    def _add_file_handler(self, formatter, level):
-        """Добавляет файловый обработчик"""
+    def _create_file_handler(self, formatter) -> logging.Handler:
+        """Создает файловый обработчик"""
         # Создаем директорию для логов
         LOGS_DIR.mkdir(exist_ok=True, parents=True)
 
@@ -311,9 +498,8 @@ class UnifiedLogger:
                 encoding='utf-8'
             )
 
-        file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        return file_handler
 
     def _add_telegram_handler(self):
         """Отключает старые Telegram handlers (новая система работает через notify_error)"""
@@ -326,23 +512,39 @@ class UnifiedLogger:
             # Не логируем ошибку через self.logger чтобы избежать рекурсии
             print(f"Warning: Could not initialize Telegram logging: {e}")
 
-    def debug(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.debug(message, extra=extra or {}, **kwargs)
+    # Аргументы для %-подстановки (logger.info("Бронирование %s", booking_id))
+    # форматируются только если уровень включен, и уже в фоновом потоке.
+    # stacklevel=2 - в записи файл и строка вызывающего кода, а не этой обертки.
+
+    def debug(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(message, *args, extra=extra, stacklevel=2, **kwargs)
+
+    def info(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(message, *args, extra=extra, stacklevel=2, **kwargs)
+
+    def warning(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(message, *args, extra=extra, stacklevel=2, **kwargs)
 
-    def info(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.info(message, extra=extra or {}, **kwargs)
+    def error(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.error(message, *args, extra=extra, stacklevel=2, **kwargs)
 
-    def warning(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.warning(message, extra=extra or {}, **kwargs)
+    def critical(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.CRITICAL):
+            self.logger.critical(message, *args, extra=extra, stacklevel=2, **kwargs)
 
-    def error(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.error(message, extra=extra or {}, **kwargs)
+    def exception(self, message: str, *args, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        if self.logger.isEnabledFor(logging.ERROR):
+            kwargs.setdefault("exc_info", True)
+            self.logger.error(message, *args, extra=extra, stacklevel=2, **kwargs)
 
-    def critical(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.critical(message, extra=extra or {}, **kwargs)
 
-    def exception(self, message: str, extra: Optional[Dict[str, Any]] = None, **kwargs):
-        self.logger.exception(message, extra=extra or {}, **kwargs)
+def get_log_pipeline_stats() -> Dict[str, Any]:
+    """Статистика фоновой очереди логов (размер, отброшенные записи по уровням)"""
+    return log_pipeline.get_stats()
 
 
 # Глобальный кэш логгеров
@@ -1,18 +1,23 @@
 """
-Middleware для FastAPI приложения
+Middleware для FastAPI приложения.
+
+Все проверки и обработка запросов выполняются одним pure-ASGI
+middleware RequestPipelineMiddleware, составленным из стадий (PipelineStage).
 """
 
 import time
 import uuid
 import ipaddress
-from typing import Callable, Optional, Set
-from datetime import datetime
+from typing import List, Optional, Sequence, Set
+from urllib.parse import urlparse
 
 from fastapi import Request, Response, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from utils.rate_limiter import get_rate_limiter
+from utils.request_metrics import request_metrics, route_template
 from utils.logger import get_logger
 import config
 import logging
@@ -238,13 +243,257 @@ def is_internal_request(request: Request) -> bool:
     return _proxy_validator.is_bot_request(request)
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+# ===================================
+# Pure-ASGI конвейер middleware
+# ===================================
+
+class RequestContext:
+    """
+    Состояние одного запроса, общее для всех стадий конвейера.
+
+    IP клиента и признак внутреннего запроса вычисляются один раз
+    и переиспользуются стадиями.
+    """
+
+    __slots__ = (
+        "scope", "request", "path", "method", "status_code",
+        "_client_ip", "_is_internal",
+        "request_id", "started_at", "logged_at", "rate_limit_info", "rate_limit_rule",
+    )
+
+    def __init__(self, scope: Scope, receive: Receive):
+        self.scope = scope
+        self.request = Request(scope, receive)
+        self.path: str = scope["path"]
+        self.method: str = scope["method"]
+        self.status_code: Optional[int] = None
+        self._client_ip: Optional[str] = None
+        self._is_internal: Optional[bool] = None
+        self.request_id: Optional[str] = None
+        self.started_at = 0.0
+        self.logged_at = 0.0
+        self.rate_limit_info = None
+        self.rate_limit_rule: Optional[str] = None
+
+    @property
+    def client_ip(self) -> str:
+        if self._client_ip is None:
+            self._client_ip = get_real_client_ip(self.request)
+        return self._client_ip
+
+    @property
+    def direct_ip(self) -> str:
+        client = self.scope.get("client")
+        return client[0] if client else "unknown"
+
+    @property
+    def is_internal(self) -> bool:
+        if self._is_internal is None:
+            self._is_internal = is_internal_request(self.request)
+        return self._is_internal
+
+
+class PipelineStage:
+    """
+    Стадия конвейера RequestPipelineMiddleware.
+
+    - applies(ctx)        - участвует ли стадия в этом запросе;
+    - before(ctx)         - проверка до обработчика; вернуть Response, чтобы
+                            ответить сразу (внутренние стадии не выполняются);
+    - after(ctx, headers) - заголовки ответа (http.response.start), вызывается
+                            от внутренних стадий к внешним;
+    - failed(ctx, exc)    - обработчик упал до начала ответа.
+    """
+
+    enabled = True
+
+    def applies(self, ctx: RequestContext) -> bool:
+        return True
+
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        return None
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        pass
+
+    def failed(self, ctx: RequestContext, exc: Exception) -> None:
+        pass
+
+
+class OriginValidationStage(PipelineStage):
     """
-    Middleware для автоматического применения rate limiting
+    Валидация Origin и Referer headers на state-changing запросах.
+
+    Защищает от cross-origin атак даже при использовании JWT в Authorization headers.
+    Проверяет что запросы изменяющие состояние (POST/PUT/DELETE/PATCH)
+    приходят только из доверенных источников.
     """
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+        # Получаем список разрешенных origins из config
+        self.allowed_origins = set()
+        if hasattr(config, 'CORS_ORIGINS'):
+            # CORS_ORIGINS может быть строкой с разделителями или списком
+            cors_origins = config.CORS_ORIGINS
+            if isinstance(cors_origins, str):
+                self.allowed_origins = {origin.strip() for origin in cors_origins.split(',') if origin.strip()}
+            elif isinstance(cors_origins, list):
+                self.allowed_origins = set(cors_origins)
+
+        # Добавляем локальные origins для разработки
+        self.allowed_origins.update([
+            'http://localhost:3000',
+            'http://localhost:5173',
+            'http://127.0.0.1:3000',
+            'http://127.0.0.1:5173',
+        ])
+
+        logger.info(f"OriginValidationStage initialized with allowed origins: {self.allowed_origins}")
+
+    def _extract_origin_from_referer(self, referer: str) -> str:
+        """Извлекает origin из Referer header"""
+        try:
+            parsed = urlparse(referer)
+            return f"{parsed.scheme}://{parsed.netloc}"
+        except Exception:
+            return ""
+
+    def _should_skip_validation(self, path: str, method: str) -> bool:
+        """Проверка, нужно ли пропустить валидацию для данного пути"""
+        # Пропускаем проверку для безопасных методов (GET, HEAD, OPTIONS)
+        if method in ("GET", "HEAD", "OPTIONS"):
+            return True
+
+        # Пропускаем для health checks и документации
+        return path.startswith((
+            "/health",
+            "/docs",
+            "/redoc",
+            "/openapi.json",
+            "/static",
+            "/assets",
+        ))
+
+    def applies(self, ctx: RequestContext) -> bool:
+        # Пропускаем валидацию для безопасных методов, специальных путей
+        # и внутренних запросов
+        return not self._should_skip_validation(ctx.path, ctx.method) and not ctx.is_internal
+
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        headers = ctx.request.headers
+        origin = headers.get("origin", "")
+        referer = headers.get("referer", "")
+
+        # Если есть Origin, используем его
+        if origin:
+            request_origin = origin
+        # Иначе пытаемся извлечь из Referer
+        elif referer:
+            request_origin = self._extract_origin_from_referer(referer)
+        else:
+            # Нет ни Origin, ни Referer - блокируем
+            logger.warning(
+                f"Blocked request without Origin/Referer: {ctx.method} {ctx.path}",
+                extra={
+                    "method": ctx.method,
+                    "path": ctx.path,
+                    "client_ip": ctx.direct_ip,
+                    "user_agent": headers.get("user-agent", "")[:100],
+                }
+            )
+            return Response(
+                content="Missing Origin or Referer header",
+                status_code=403,
+                headers={"X-Origin-Validation": "failed"}
+            )
+
+        # Проверяем что origin в списке разрешенных
+        if request_origin not in self.allowed_origins:
+            logger.warning(
+                f"Blocked request from untrusted origin: {request_origin}",
+                extra={
+                    "method": ctx.method,
+                    "path": ctx.path,
+                    "origin": request_origin,
+                    "referer": referer,
+                    "client_ip": ctx.direct_ip,
+                    "allowed_origins": list(self.allowed_origins),
+                }
+            )
+            return Response(
+                content="Untrusted origin",
+                status_code=403,
+                headers={"X-Origin-Validation": "failed"}
+            )
+
+        return None
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        headers["X-Origin-Validation"] = "passed"
+
+
+class IPBanStage(PipelineStage):
+    """
+    Проверка забаненных IP адресов и подсетей.
+    Блокирует запросы от забаненных IP с кодом 403
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def applies(self, ctx: RequestContext) -> bool:
+        # Некоторые пути должны быть доступны всегда (health checks и т.д.)
+        return not ctx.path.startswith(("/health", "/docs", "/redoc", "/openapi.json"))
+
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        try:
+            client_ip = ctx.client_ip
+            if not client_ip:
+                # Если не удалось получить IP, пропускаем запрос
+                return None
+
+            from utils.ip_ban_manager import get_ip_ban_manager
+            ban_manager = get_ip_ban_manager()
+
+            # Поиск в копии банов в памяти процесса - без обращения к Redis
+            ban_info = ban_manager.find_ban(client_ip)
+            if ban_info is None:
+                return None
+
+            headers = {
+                "X-Banned": "true",
+                "X-Ban-Reason": ban_info.get("reason", "Suspicious activity"),
+            }
+
+            # Добавляем время разбана если доступно
+            if "unbanned_at" in ban_info:
+                headers["X-Banned-Until"] = ban_info["unbanned_at"]
+
+            logger.warning(
+                f"Blocked request from banned IP: {client_ip} "
+                f"(path: {ctx.path}, method: {ctx.method})"
+            )
+
+            return Response(
+                content="Access denied: Your IP address has been banned due to suspicious activity",
+                status_code=403,
+                headers=headers
+            )
+
+        except Exception as e:
+            logger.error(f"Error in IPBanStage: {e}")
+            # При ошибке пропускаем запрос (fail-open для доступности)
+            return None
+
+
+class RateLimitStage(PipelineStage):
+    """
+    Автоматическое применение rate limiting
+    """
+
+    def __init__(self, enabled: bool = True):
         self.enabled = enabled
         self.rate_limiter = get_rate_limiter()
 
@@ -294,88 +543,62 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
     def _should_skip_rate_limit(self, path: str) -> bool:
         """Проверка, нужно ли пропустить rate limiting для данного пути"""
-        skip_patterns = [
+        return path.startswith((
             "/static",
             "/assets",
             "/favicon.ico",
             "/docs",
             "/redoc",
             "/openapi.json",
-        ]
-
-        return any(path.startswith(pattern) for pattern in skip_patterns)
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.enabled or self._should_skip_rate_limit(request.url.path):
-            return await call_next(request)
+        ))
 
+    def applies(self, ctx: RequestContext) -> bool:
         # Пропускаем rate limiting для внутренних запросов (используем безопасный метод)
-        if is_internal_request(request):
-            return await call_next(request)
+        return not self._should_skip_rate_limit(ctx.path) and not ctx.is_internal
 
-        # Определяем правило rate limiting
-        rule_key = self._get_rule_key(request.url.path, request.method)
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        rule_key = self._get_rule_key(ctx.path, ctx.method)
 
         try:
-            # Проверяем rate limit
-            rate_info = await self.rate_limiter.check_limit(request, rule_key)
-
-            # Выполняем запрос
-            response = await call_next(request)
-
-            # Добавляем заголовки rate limiting к успешному ответу
-            response.headers["X-RateLimit-Limit"] = str(
-                self.rate_limiter.rules[rule_key].requests
-            )
-            response.headers["X-RateLimit-Remaining"] = str(
-                rate_info.requests_remaining
-            )
-            response.headers["X-RateLimit-Reset"] = str(int(rate_info.reset_time))
-
-            return response
-
+            ctx.rate_limit_info = await self.rate_limiter.check_limit(ctx.request, rule_key)
+            ctx.rate_limit_rule = rule_key
         except HTTPException as e:
             # Rate limit exceeded - правильно возвращаем 429
             if e.status_code == 429:
-                from fastapi.responses import JSONResponse
                 return JSONResponse(
                     status_code=429,
                     content=e.detail,
-                    headers=getattr(e, 'headers', {})
+                    headers=getattr(e, 'headers', None) or {}
                 )
-            else:
-                # Другая HTTPException - пробрасываем дальше
-                raise
+            # Другая HTTPException - пробрасываем дальше
+            raise
         except Exception as e:
-            # Непредвиденная ошибка - логируем и продолжаем
+            # Непредвиденная ошибка лимитера - логируем и продолжаем без лимита
             logger.error(f"Rate limit middleware error: {e}")
-            return await call_next(request)
+        return None
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        rate_info = ctx.rate_limit_info
+        if rate_info is None:
+            return
+        # Заголовки rate limiting к успешному ответу
+        headers["X-RateLimit-Limit"] = str(self.rate_limiter.rules[ctx.rate_limit_rule].requests)
+        headers["X-RateLimit-Remaining"] = str(rate_info.requests_remaining)
+        headers["X-RateLimit-Reset"] = str(int(rate_info.reset_time))
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingStage(PipelineStage):
     """
-    Middleware для логирования запросов и ответов
+    Логирование запросов и ответов
     """
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
+    def __init__(self, enabled: bool = True):
         self.enabled = enabled
 
-    def _get_client_ip(self, request: Request) -> str:
-        """Получение IP адреса клиента (безопасно через TrustedProxyValidator)"""
-        return get_real_client_ip(request)
-
     def _should_skip_logging(self, path: str) -> bool:
         """Проверка, нужно ли пропустить логирование для данного пути"""
         # Базовые паттерны для статических файлов
-        static_patterns = [
-            "/static",
-            "/assets",
-            "/favicon.ico",
-        ]
-
-        # Проверяем статические файлы
-        if any(path.startswith(pattern) for pattern in static_patterns):
+        if path.startswith(("/static", "/assets", "/favicon.ico")):
             return True
 
         # Проверяем настраиваемые исключения из config
@@ -396,134 +619,104 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
                 return logger.logger.isEnabledFor(10)
             else:
                 return False
-        except:
+        except Exception:
             return False
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.enabled or self._should_skip_logging(request.url.path):
-            return await call_next(request)
-
-        # Генерируем уникальный ID для запроса
-        request_id = str(uuid.uuid4())[:8]
-        request.state.request_id = request_id
+    def _log(self, message: str, data: dict) -> None:
+        # Используем соответствующий метод logger в зависимости от уровня
+        if getattr(logging, config.MIDDLEWARE_LOG_LEVEL, logging.INFO) == logging.WARNING:
+            logger.warning(message, extra=data)
+        else:  # INFO или DEBUG
+            logger.info(message, extra=data)
 
-        # Время начала
-        start_time = time.time()
+    def _track(self, ctx: RequestContext, status_code: int) -> None:
+        # Не прерываем выполнение запроса если метрики не работают
+        # (задержки записывает PerformanceStage)
+        try:
+            from routes import monitoring
+            monitoring.track_request(
+                endpoint=route_template(ctx.scope),
+                status_code=status_code,
+            )
+        except Exception as metric_error:
+            logger.debug(f"Failed to track request metrics: {metric_error}")
 
-        # Информация о запросе
-        client_ip = self._get_client_ip(request)
-        is_debug = self._is_debug_enabled()
+    def applies(self, ctx: RequestContext) -> bool:
+        return not self._should_skip_logging(ctx.path)
 
-        # Получаем уровень логирования из config
-        log_level = getattr(logging, config.MIDDLEWARE_LOG_LEVEL, logging.INFO)
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        # Уникальный ID запроса (доступен обработчикам как request.state.request_id)
+        ctx.request_id = str(uuid.uuid4())[:8]
+        ctx.request.state.request_id = ctx.request_id
+        ctx.logged_at = time.time()
 
         # Минимальные данные для INFO/WARNING логов
         minimal_data = {
-            "request_id": request_id,
-            "method": request.method,
-            "path": request.url.path,
-            "client_ip": client_ip,
+            "request_id": ctx.request_id,
+            "method": ctx.method,
+            "path": ctx.path,
+            "client_ip": ctx.client_ip,
         }
 
         # Дополнительные данные только для DEBUG (с фильтрацией sensitive data)
-        if is_debug:
+        if self._is_debug_enabled():
+            request = ctx.request
             minimal_data.update({
                 "query": sanitize_query_params(dict(request.query_params)) if request.query_params else None,
                 "user_agent": request.headers.get("User-Agent", "")[:100],
                 "headers": sanitize_headers(dict(request.headers)),
             })
 
-        # Используем соответствующий метод logger в зависимости от уровня
-        if log_level == logging.WARNING:
-            logger.warning(f"{request.method} {request.url.path}", extra=minimal_data)
-        else:  # INFO или DEBUG
-            logger.info(f"{request.method} {request.url.path}", extra=minimal_data)
-
-        try:
-            # Выполняем запрос
-            response = await call_next(request)
-
-            # Время выполнения
-            duration = time.time() - start_time
-            duration_ms = round(duration * 1000, 2)
-
-            # Отслеживаем метрики производительности
-            try:
-                from routes import monitoring
-                monitoring.track_request(
-                    endpoint=request.url.path,
-                    status_code=response.status_code,
-                    response_time_ms=duration_ms
-                )
-            except Exception as metric_error:
-                # Не прерываем выполнение запроса если метрики не работают
-                logger.debug(f"Failed to track request metrics: {metric_error}")
-
-            # Логируем ответ (используем формат похожий на nginx)
-            response_data = {
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": response.status_code,
+        self._log(f"{ctx.method} {ctx.path}", minimal_data)
+        return None
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        duration_ms = round((time.time() - ctx.logged_at) * 1000, 2)
+        self._track(ctx, ctx.status_code)
+
+        # Логируем ответ (используем формат похожий на nginx)
+        self._log(
+            f"{ctx.method} {ctx.path} -> {ctx.status_code} ({duration_ms}ms)",
+            {
+                "request_id": ctx.request_id,
+                "method": ctx.method,
+                "path": ctx.path,
+                "status_code": ctx.status_code,
                 "duration_ms": duration_ms,
-                "client_ip": client_ip,
-            }
-
-            # Форматируем сообщение в стиле nginx
-            log_message = f"{request.method} {request.url.path} -> {response.status_code} ({duration_ms}ms)"
-
-            # Используем соответствующий метод logger в зависимости от уровня
-            if log_level == logging.WARNING:
-                logger.warning(log_message, extra=response_data)
-            else:  # INFO или DEBUG
-                logger.info(log_message, extra=response_data)
-
-            # Добавляем заголовок с request ID для отладки
-            response.headers["X-Request-ID"] = request_id
-
-            return response
-
-        except Exception as e:
-            # Время выполнения до ошибки
-            duration = time.time() - start_time
-            duration_ms = round(duration * 1000, 2)
-
-            # Логируем ошибку
-            logger.error(
-                f"Request failed",
-                extra={
-                    "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
-                    "error": str(e),
-                    "error_type": type(e).__name__,
-                    "duration_ms": duration_ms,
-                    "client_ip": client_ip,
-                },
-                exc_info=True,
-            )
-
-            # Отслеживаем метрики для failed запросов
-            try:
-                from routes import monitoring
-                monitoring.track_request(
-                    endpoint=request.url.path,
-                    status_code=500,  # Internal server error
-                    response_time_ms=duration_ms
-                )
-            except Exception as metric_error:
-                logger.debug(f"Failed to track error metrics: {metric_error}")
+                "client_ip": ctx.client_ip,
+            },
+        )
+
+        # Добавляем заголовок с request ID для отладки
+        headers["X-Request-ID"] = ctx.request_id
+
+    def failed(self, ctx: RequestContext, exc: Exception) -> None:
+        duration_ms = round((time.time() - ctx.logged_at) * 1000, 2)
+
+        logger.error(
+            f"Request failed",
+            extra={
+                "request_id": ctx.request_id,
+                "method": ctx.method,
+                "path": ctx.path,
+                "error": str(exc),
+                "error_type": type(exc).__name__,
+                "duration_ms": duration_ms,
+                "client_ip": ctx.client_ip,
+            },
+            exc_info=exc,
+        )
 
-            raise
+        # Отслеживаем метрики для failed запросов
+        self._track(ctx, 500)
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersStage(PipelineStage):
     """
-    Middleware для добавления security headers
+    Добавление security headers
     """
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
+    def __init__(self, enabled: bool = True):
         self.enabled = enabled
 
         self.security_headers = {
@@ -534,297 +727,148 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
             "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
         }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-
-        if self.enabled:
-            # Добавляем security headers
-            for header, value in self.security_headers.items():
-                response.headers[header] = value
-
-            # Strengthened Content Security Policy (без unsafe-inline)
-            if request.url.path.startswith("/api") or request.url.path.startswith(
-                "/admin"
-            ):
-                response.headers["Content-Security-Policy"] = (
-                    "default-src 'self'; "
-                    "script-src 'self'; "
-                    "style-src 'self'; "  # Removed 'unsafe-inline' for better security
-                    "img-src 'self' data: https:; "
-                    "font-src 'self'; "
-                    "connect-src 'self'; "
-                    "frame-ancestors 'none'; "
-                    "base-uri 'self'; "
-                    "form-action 'self'; "
-                    "upgrade-insecure-requests"
-                )
-
-        return response
-
-
-class PerformanceMiddleware(BaseHTTPMiddleware):
+        # Strengthened Content Security Policy (без unsafe-inline)
+        self.content_security_policy = (
+            "default-src 'self'; "
+            "script-src 'self'; "
+            "style-src 'self'; "  # Removed 'unsafe-inline' for better security
+            "img-src 'self' data: https:; "
+            "font-src 'self'; "
+            "connect-src 'self'; "
+            "frame-ancestors 'none'; "
+            "base-uri 'self'; "
+            "form-action 'self'; "
+            "upgrade-insecure-requests"
+        )
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        for header, value in self.security_headers.items():
+            headers[header] = value
+
+        if ctx.path.startswith(("/api", "/admin")):
+            headers["Content-Security-Policy"] = self.content_security_policy
+
+
+class PerformanceStage(PipelineStage):
     """
-    Middleware для мониторинга производительности
+    Мониторинг производительности: гистограммы задержек по маршрутам
+    (utils.request_metrics) и лог медленных запросов
     """
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
+    def __init__(self, enabled: bool = True):
         self.enabled = enabled
         # Получаем порог из config (в миллисекундах), конвертируем в секунды
         self.slow_request_threshold = config.LOG_SLOW_REQUEST_THRESHOLD_MS / 1000.0
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.enabled:
-            return await call_next(request)
-
-        start_time = time.time()
-
-        try:
-            response = await call_next(request)
-            duration = time.time() - start_time
-
-            # Логируем медленные запросы
-            if duration > self.slow_request_threshold:
-                logger.warning(
-                    f"Slow request detected: {request.method} {request.url.path} took {round(duration * 1000, 2)}ms",
-                    extra={
-                        "method": request.method,
-                        "path": request.url.path,
-                        "query": str(request.query_params) if request.query_params else None,
-                        "duration_ms": round(duration * 1000, 2),
-                        "threshold_ms": config.LOG_SLOW_REQUEST_THRESHOLD_MS,
-                        "status_code": response.status_code,
-                        "client_ip": (
-                            request.client.host if request.client else "unknown"
-                        ),
-                    },
-                )
-
-            # Добавляем заголовок с временем выполнения
-            response.headers["X-Response-Time"] = f"{duration:.3f}s"
+    async def before(self, ctx: RequestContext) -> Optional[Response]:
+        ctx.started_at = time.perf_counter()
+        return None
 
-            return response
+    def after(self, ctx: RequestContext, headers: MutableHeaders) -> None:
+        duration = time.perf_counter() - ctx.started_at
+        request_metrics.observe(ctx.method, route_template(ctx.scope), ctx.status_code, duration)
 
-        except Exception as e:
-            duration = time.time() - start_time
-            logger.error(
-                f"Request error",
+        # Логируем медленные запросы
+        if duration > self.slow_request_threshold:
+            query_string = ctx.scope.get("query_string", b"")
+            logger.warning(
+                f"Slow request detected: {ctx.method} {ctx.path} took {round(duration * 1000, 2)}ms",
                 extra={
-                    "method": request.method,
-                    "path": request.url.path,
+                    "method": ctx.method,
+                    "path": ctx.path,
+                    "query": query_string.decode("latin-1") if query_string else None,
                     "duration_ms": round(duration * 1000, 2),
-                    "error": str(e),
-                    "error_type": type(e).__name__,
+                    "threshold_ms": config.LOG_SLOW_REQUEST_THRESHOLD_MS,
+                    "status_code": ctx.status_code,
+                    "client_ip": ctx.direct_ip,
                 },
             )
-            raise
-
-
-class OriginValidationMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware для валидации Origin и Referer headers на state-changing запросах.
 
-    Защищает от cross-origin атак даже при использовании JWT в Authorization headers.
-    Проверяет что запросы изменяющие состояние (POST/PUT/DELETE/PATCH)
-    приходят только из доверенных источников.
+        # Добавляем заголовок с временем выполнения (до начала тела ответа)
+        headers["X-Response-Time"] = f"{duration:.3f}s"
+
+    def failed(self, ctx: RequestContext, exc: Exception) -> None:
+        duration = time.perf_counter() - ctx.started_at
+        request_metrics.observe(ctx.method, route_template(ctx.scope), 500, duration)
+
+        logger.error(
+            f"Request error",
+            extra={
+                "method": ctx.method,
+                "path": ctx.path,
+                "duration_ms": round(duration * 1000, 2),
+                "error": str(exc),
+                "error_type": type(exc).__name__,
+            },
+        )
+
+
+def default_stages() -> List[PipelineStage]:
+    """Стадии приложения от внешней к внутренней"""
+    return [
+        # Проверяет Origin/Referer для state-changing запросов
+        OriginValidationStage(),
+        # Проверяет забаненные IP перед обработкой запроса
+        IPBanStage(),
+        RateLimitStage(),
+        RequestLoggingStage(),
+        SecurityHeadersStage(),
+        PerformanceStage(),
+    ]
+
+
+class RequestPipelineMiddleware:
     """
+    Pure-ASGI middleware, выполняющий стадии конвейера в одном вызове.
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
-        self.enabled = enabled
-
-        # Получаем список разрешенных origins из config
-        self.allowed_origins = set()
-        if hasattr(config, 'CORS_ORIGINS'):
-            # CORS_ORIGINS может быть строкой с разделителями или списком
-            cors_origins = config.CORS_ORIGINS
-            if isinstance(cors_origins, str):
-                self.allowed_origins = {origin.strip() for origin in cors_origins.split(',') if origin.strip()}
-            elif isinstance(cors_origins, list):
-                self.allowed_origins = set(cors_origins)
-
-        # Добавляем локальные origins для разработки
-        self.allowed_origins.update([
-            'http://localhost:3000',
-            'http://localhost:5173',
-            'http://127.0.0.1:3000',
-            'http://127.0.0.1:5173',
-        ])
-
-        logger.info(f"OriginValidationMiddleware initialized with allowed origins: {self.allowed_origins}")
-
-    def _extract_origin_from_referer(self, referer: str) -> str:
-        """Извлекает origin из Referer header"""
-        try:
-            from urllib.parse import urlparse
-            parsed = urlparse(referer)
-            return f"{parsed.scheme}://{parsed.netloc}"
-        except Exception:
-            return ""
-
-    def _should_skip_validation(self, path: str, method: str) -> bool:
-        """Проверка, нужно ли пропустить валидацию для данного пути"""
-        # Пропускаем проверку для безопасных методов (GET, HEAD, OPTIONS)
-        if method in ["GET", "HEAD", "OPTIONS"]:
-            return True
-
-        # Пропускаем для health checks и документации
-        skip_patterns = [
-            "/health",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/static",
-            "/assets",
-        ]
-
-        return any(path.startswith(pattern) for pattern in skip_patterns)
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.enabled:
-            return await call_next(request)
-
-        # Пропускаем валидацию для безопасных методов и специальных путей
-        if self._should_skip_validation(request.url.path, request.method):
-            return await call_next(request)
-
-        # Пропускаем валидацию для внутренних запросов (используем безопасный метод)
-        if is_internal_request(request):
-            return await call_next(request)
-
-        # Получаем Origin и Referer headers
-        origin = request.headers.get("origin", "")
-        referer = request.headers.get("referer", "")
-
-        # Если есть Origin, используем его
-        if origin:
-            request_origin = origin
-        # Иначе пытаемся извлечь из Referer
-        elif referer:
-            request_origin = self._extract_origin_from_referer(referer)
-        else:
-            # Нет ни Origin, ни Referer - блокируем
-            logger.warning(
-                f"Blocked request without Origin/Referer: {request.method} {request.url.path}",
-                extra={
-                    "method": request.method,
-                    "path": request.url.path,
-                    "client_ip": request.client.host if request.client else "unknown",
-                    "user_agent": request.headers.get("user-agent", "")[:100],
-                }
-            )
-            return Response(
-                content="Missing Origin or Referer header",
-                status_code=403,
-                headers={"X-Origin-Validation": "failed"}
-            )
+    В отличие от цепочки BaseHTTPMiddleware не создает задачу и поток
+    памяти на каждый слой и не буферизует ответ: заголовки изменяются
+    в сообщении http.response.start, тело (в том числе StreamingResponse
+    экспортов) идет клиенту без задержек.
 
-        # Проверяем что origin в списке разрешенных
-        if request_origin not in self.allowed_origins:
-            logger.warning(
-                f"Blocked request from untrusted origin: {request_origin}",
-                extra={
-                    "method": request.method,
-                    "path": request.url.path,
-                    "origin": request_origin,
-                    "referer": referer,
-                    "client_ip": request.client.host if request.client else "unknown",
-                    "allowed_origins": list(self.allowed_origins),
-                }
-            )
-            return Response(
-                content="Untrusted origin",
-                status_code=403,
-                headers={"X-Origin-Validation": "failed"}
-            )
-
-        # Origin валиден, продолжаем обработку
-        response = await call_next(request)
-        response.headers["X-Origin-Validation"] = "passed"
-        return response
-
-
-class IPBanMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware для проверки забаненных IP адресов
-    Блокирует запросы от забаненных IP с кодом 403
+    Семантика совпадает с вложенными middleware: стадия, вернувшая ответ
+    в before(), отвечает сразу, и after() получают только внешние от нее
+    стадии.
     """
 
-    def __init__(self, app: ASGIApp, enabled: bool = True):
-        super().__init__(app)
-        self.enabled = enabled
-
-    def _get_client_ip(self, request: Request) -> str:
-        """Получение IP адреса клиента (безопасно через TrustedProxyValidator)"""
-        return get_real_client_ip(request)
-
-    def _should_skip_check(self, path: str) -> bool:
-        """
-        Проверка, нужно ли пропустить проверку бана для данного пути
-        Некоторые пути должны быть доступны всегда (health checks и т.д.)
-        """
-        skip_patterns = [
-            "/health",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-        ]
-
-        return any(path.startswith(pattern) for pattern in skip_patterns)
-
-    async def dispatch(self, request: Request, call_next: Callable):
-        """Обработка запроса"""
-        if not self.enabled:
-            return await call_next(request)
-
-        # Пропускаем проверку для определенных путей
-        if self._should_skip_check(request.url.path):
-            return await call_next(request)
+    def __init__(self, app: ASGIApp, stages: Optional[Sequence[PipelineStage]] = None):
+        self.app = app
+        if stages is None:
+            stages = default_stages()
+        self.stages = [stage for stage in stages if stage.enabled]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctx = RequestContext(scope, receive)
+        entered: List[PipelineStage] = []
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                ctx.status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                for stage in reversed(entered):
+                    stage.after(ctx, headers)
+            await send(message)
+
+        for stage in self.stages:
+            if not stage.applies(ctx):
+                continue
+            response = await stage.before(ctx)
+            if response is not None:
+                await response(scope, receive, send_wrapper)
+                return
+            entered.append(stage)
 
         try:
-            # Получаем IP клиента
-            client_ip = self._get_client_ip(request)
-
-            if not client_ip:
-                # Если не удалось получить IP, пропускаем запрос
-                return await call_next(request)
-
-            # Проверяем забанен ли IP
-            from utils.ip_ban_manager import get_ip_ban_manager
-            ban_manager = get_ip_ban_manager()
-
-            is_banned = await ban_manager.is_banned(client_ip)
-
-            if is_banned:
-                # Получаем информацию о бане для заголовков
-                ban_info = await ban_manager.get_ban_info(client_ip)
-
-                # Формируем response с 403 Forbidden
-                headers = {
-                    "X-Banned": "true",
-                    "X-Ban-Reason": ban_info.get("reason", "Suspicious activity") if ban_info else "Suspicious activity",
-                }
-
-                # Добавляем время разбана если доступно
-                if ban_info and "unbanned_at" in ban_info:
-                    headers["X-Banned-Until"] = ban_info["unbanned_at"]
-
-                logger.warning(
-                    f"Blocked request from banned IP: {client_ip} "
-                    f"(path: {request.url.path}, method: {request.method})"
-                )
-
-                return Response(
-                    content="Access denied: Your IP address has been banned due to suspicious activity",
-                    status_code=403,
-                    headers=headers
-                )
-
-            # IP не забанен, продолжаем обработку
-            response = await call_next(request)
-            return response
-
-        except Exception as e:
-            logger.error(f"Error in IPBanMiddleware: {e}")
-            # При ошибке пропускаем запрос (fail-open для доступности)
-            return await call_next(request)
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            if not response_started:
+                for stage in reversed(entered):
+                    stage.failed(ctx, exc)
+            raise
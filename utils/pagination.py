@@ -0,0 +1,133 @@
+"""
+Keyset (cursor) пагинация для списков.
+
+OFFSET заставляет SQLite пройти и выбросить все строки предыдущих страниц,
+поэтому глубокие страницы становятся все медленнее. Keyset-пагинация
+продолжает выборку с последней показанной строки по индексированному
+порядку, например (created_at, id), и стоит одинаково на любой глубине.
+
+Курсор непрозрачен для клиента: это base64 от значений ключа сортировки
+последней строки страницы.
+
+Пример:
+    from utils.pagination import paginate_keyset
+
+    items, next_cursor = paginate_keyset(
+        query, (Booking.created_at, Booking.id), cursor, per_page
+    )
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или не подходит к данному списку"""
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        raise InvalidCursorError("Unknown cursor value type")
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Кодирует значения ключа сортировки в непрозрачный курсор"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    """Декодирует курсор, ожидая ровно size значений ключа"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as e:
+        raise InvalidCursorError(f"Malformed cursor: {e}") from e
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError("Cursor does not match list ordering")
+
+    return tuple(_decode_value(v) for v in values)
+
+
+def paginate_keyset(
+    query: Query,
+    columns: Sequence[Any],
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = True,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Выбирает страницу после курсора по порядку columns.
+
+    Последняя колонка должна быть уникальной (обычно id), чтобы порядок был
+    строгим. Строки с NULL в колонках ключа в keyset-выборку не попадают.
+
+    Returns:
+        (строки страницы, курсор следующей страницы или None)
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    return _fetch_page(query, columns, limit, descending)
+
+
+def paginate_offset(
+    query: Query,
+    columns: Sequence[Any],
+    offset: int,
+    limit: int,
+    descending: bool = True,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Классическая страница через OFFSET, но с тем же строгим порядком и
+    курсором следующей страницы - клиент может перейти на keyset с любой страницы.
+    """
+    return _fetch_page(query, columns, limit, descending, offset=offset)
+
+
+def _fetch_page(
+    query: Query,
+    columns: Sequence[Any],
+    limit: int,
+    descending: bool,
+    offset: int = 0,
+) -> Tuple[List[Any], Optional[str]]:
+    ordering = [c.desc() if descending else c.asc() for c in columns]
+    query = query.order_by(*ordering)
+    if offset:
+        query = query.offset(offset)
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+
+    return rows, next_cursor
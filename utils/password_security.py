@@ -5,8 +5,22 @@ Provides secure password hashing with bcrypt (12 rounds) and backward compatibil
 with existing werkzeug pbkdf2 hashes for seamless migration.
 """
 
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
 import bcrypt
+from fastapi import HTTPException
 from werkzeug.security import check_password_hash
+
+from config import (
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+    PASSWORD_HASH_WORKERS,
+)
+from utils.histogram import Histogram
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -169,6 +183,155 @@ def get_hash_algorithm(password_hash: str) -> str:
     return "unknown"
 
 
+class PasswordHasherBusy(HTTPException):
+    """
+    Raised when the hashing pool is saturated and the request is rejected.
+
+    An HTTPException (503 + Retry-After), so route handlers that re-raise
+    HTTPException pass it to the client as is.
+    """
+
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": "1"},
+        )
+
+
+class PasswordHashPool:
+    """
+    Bounded pool for bcrypt hashing and verification.
+
+    Work runs in worker processes, so a burst of logins cannot pin the event
+    loop or the GIL. At most ``workers`` operations run at once; up to
+    ``max_pending`` (running + waiting) are admitted, the rest are rejected
+    immediately with PasswordHasherBusy. A request that waits longer than
+    ``queue_timeout`` is rejected as well.
+
+    Example:
+        >>> is_valid, needs_upgrade, new_hash = await password_hasher.verify_with_upgrade(
+        ...     admin.password, credentials.password
+        ... )
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_pending = max(max_pending, 1)
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._running = 0
+        self.queue_time = Histogram()
+        self.stats = {"completed": 0, "rejected_full": 0, "rejected_timeout": 0, "errors": 0}
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn: forking a process with running threads (DB executor,
+                # Redis clients) may deadlock the child on inherited locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run ``func(*args)`` in the pool with admission control."""
+        if self._pending >= self.max_pending:
+            self.stats["rejected_full"] += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(self.workers, 1))
+
+        self._pending += 1
+        enqueued = time.perf_counter()
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                raise PasswordHasherBusy("Timed out waiting for a password hashing worker")
+
+            self.queue_time.observe(time.perf_counter() - enqueued)
+            self._running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._get_executor(), func, *args)
+                self.stats["completed"] += 1
+                return result
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self._running -= 1
+                self._semaphore.release()
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str, rounds: int = 12) -> str:
+        """Async counterpart of hash_password_bcrypt."""
+        return await self.run(hash_password_bcrypt, password, rounds)
+
+    async def verify_with_upgrade(
+        self, stored_hash: str, provided_password: str
+    ) -> tuple[bool, bool, str | None]:
+        """Async counterpart of verify_password_with_upgrade."""
+        if not stored_hash or not provided_password:
+            return False, False, None
+        return await self.run(verify_password_with_upgrade, stored_hash, provided_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "process" if self.workers > 0 else "thread",
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "running": self._running,
+            "pending": self._pending,
+            **self.stats,
+            "queue_ms": self.queue_time.snapshot(scale=1000),
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        """Pool metrics in Prometheus text format."""
+        lines = [
+            "# HELP password_hash_operations_total Password hashing operations by outcome",
+            "# TYPE password_hash_operations_total counter",
+        ]
+        for outcome, value in self.stats.items():
+            lines.append(f'password_hash_operations_total{{outcome="{outcome}"}} {value}')
+        lines.append("")
+        lines.append("# HELP password_hash_pending Password hashing operations running or waiting")
+        lines.append("# TYPE password_hash_pending gauge")
+        lines.append(f"password_hash_pending {self._pending}")
+        lines.append("")
+        lines.append("# HELP password_hash_queue_seconds Time spent waiting for a hashing worker")
+        lines.append("# TYPE password_hash_queue_seconds histogram")
+        lines.extend(self.queue_time.prometheus("password_hash_queue_seconds"))
+        lines.append("")
+        return lines
+
+
+# Global pool for password hashing in request handlers
+password_hasher = PasswordHashPool()
+
+
 # Backward compatibility aliases
 hash_password = hash_password_bcrypt
 verify_password = verify_password_simple
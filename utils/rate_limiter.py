@@ -2,16 +2,19 @@
 Модуль для реализации rate limiting с поддержкой Redis и in-memory storage
 """
 
+import asyncio
+import sys
 import time
-import json
+import math
 import hashlib
-from typing import Dict, Optional, Tuple
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
-from collections import defaultdict, deque
 from threading import Lock
-from datetime import datetime, timedelta
 
 from fastapi import Request, HTTPException
+
+from config import RATE_LIMIT_MEMORY_MAX_KEYS, RATE_LIMIT_MEMORY_SHARDS
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -37,72 +40,246 @@ class RateLimitInfo:
     retry_after: Optional[int] = None
 
 
-class InMemoryStore:
-    """In-memory хранилище для rate limiting с TTL"""
+class _WindowCounter:
+    """Счетчики текущего и предыдущего окна одного клиента"""
+
+    __slots__ = ("window_id", "current", "previous", "expires_at", "slot")
+
+    def __init__(self, window_id: int):
+        self.window_id = window_id
+        self.current = 0
+        self.previous = 0
+        self.expires_at = 0.0
+        # Слот колеса, в котором ключ ждет проверки истечения
+        self.slot = 0
+
+
+class _Shard:
+    __slots__ = ("lock", "counters", "wheel")
 
     def __init__(self):
-        self._store: Dict[str, deque] = defaultdict(deque)
-        self._lock = Lock()
-        self._last_cleanup = time.time()
+        self.lock = Lock()
+        # Порядок вставки - порядок вытеснения при переполнении
+        self.counters: Dict[str, _WindowCounter] = {}
+        # Колесо истечения: номер слота -> ключи
+        self.wheel: Dict[int, List[str]] = {}
+
+
+class ShardedWindowStore:
+    """
+    In-memory хранилище rate limiting фиксированного размера на клиента.
+
+    - Скользящее окно приближается двумя счетчиками (текущее и предыдущее
+      окно): оценка = previous * (доля предыдущего окна в скользящем) + current.
+    - Ключи разложены по шардам со своими блокировками; на шард не больше
+      max_keys / shards ключей, при переполнении вытесняется самый старый.
+    - Истекшие ключи удаляет фоновая задача по колесу времени (шаг
+      sweep_interval): за проход обрабатываются только наступившие слоты.
+      Продлившийся ключ переносится в новый слот при проверке, поэтому
+      запрос в колесо не пишет.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = RATE_LIMIT_MEMORY_MAX_KEYS,
+        shards: int = RATE_LIMIT_MEMORY_SHARDS,
+        sweep_interval: float = 1.0,
+    ):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._max_keys_per_shard = max(1, max_keys // len(self._shards))
+        self._swept_slot = int(time.time() // sweep_interval)
+        self._sweeper: Optional[asyncio.Task] = None
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _schedule(self, shard: _Shard, key: str, counter: _WindowCounter) -> None:
+        # Слот после истечения: проверка не раньше expires_at
+        counter.slot = int(counter.expires_at // self.sweep_interval) + 1
+        shard.wheel.setdefault(counter.slot, []).append(key)
+
+    def hit(
+        self, key: str, limit: int, window: int, now: float
+    ) -> Tuple[bool, float, float, Optional[float]]:
+        """
+        Учесть запрос, если он укладывается в лимит.
 
-    def _cleanup_expired(self, current_time: float):
-        """Очистка истекших записей"""
-        if current_time - self._last_cleanup < 60:  # Очистка раз в минуту
+        Returns:
+            (разрешен, оценка числа запросов в окне, reset_time, retry_after в секундах)
+        """
+        shard = self._shards[hash(key) % len(self._shards)]
+        window_id = int(now // window)
+        elapsed = now - window_id * window
+
+        with shard.lock:
+            counter = shard.counters.get(key)
+            if counter is None:
+                if len(shard.counters) >= self._max_keys_per_shard:
+                    del shard.counters[next(iter(shard.counters))]
+                    self.evictions += 1
+                counter = shard.counters[key] = _WindowCounter(window_id)
+                # После конца следующего окна ключ не влияет на лимит
+                counter.expires_at = (window_id + 2) * window
+                self._schedule(shard, key, counter)
+                self._ensure_sweeper()
+            elif counter.window_id != window_id:
+                counter.previous = counter.current if counter.window_id == window_id - 1 else 0
+                counter.current = 0
+                counter.window_id = window_id
+                counter.expires_at = (window_id + 2) * window
+
+            previous, current = counter.previous, counter.current
+            estimated = previous * (1 - elapsed / window) + current
+            if estimated < limit:
+                counter.current += 1
+                return True, estimated + 1, (window_id + 1) * window, None
+
+        # Сколько ждать, пока оценка опустится ниже лимита (без новых запросов)
+        if current < limit:
+            fraction = 1 - (limit - current) / previous
+            retry_after = fraction * window - elapsed
+        else:
+            fraction = 1 - limit / current
+            retry_after = (window - elapsed) + fraction * window
+        retry_after = max(retry_after, 0.0)
+        return False, estimated, now + retry_after, retry_after
+
+    def _ensure_sweeper(self) -> None:
+        """Запустить фоновую очистку в текущем event loop, если она не запущена"""
+        if self._sweeper is not None and not self._sweeper.done():
             return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self) -> None:
+        # Пока ключей нет, задача не нужна: новый ключ запустит ее снова
+        while any(shard.counters for shard in self._shards):
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки in-memory rate limiting: {e}")
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удалить ключи из наступивших слотов колеса. Возвращает число удаленных."""
+        now = time.time() if now is None else now
+        current = int(now // self.sweep_interval)
+        if current <= self._swept_slot:
+            return 0
+
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                # После долгого простоя дешевле пройти по занятым слотам, чем по диапазону
+                if current - self._swept_slot > len(shard.wheel):
+                    due = [slot for slot in shard.wheel if slot <= current]
+                else:
+                    due = range(self._swept_slot + 1, current + 1)
+
+                for slot in due:
+                    for key in shard.wheel.pop(slot, ()):
+                        counter = shard.counters.get(key)
+                        # Ключ вытеснен или уже перенесен в другой слот
+                        if counter is None or counter.slot != slot:
+                            continue
+                        if counter.expires_at <= now:
+                            del shard.counters[key]
+                            removed += 1
+                        else:
+                            self._schedule(shard, key, counter)
+
+        self._swept_slot = current
+        self.expirations += removed
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard.counters) for shard in self._shards)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Число ключей, вытеснения и приблизительный объем памяти"""
+        keys = 0
+        wheel_entries = 0
+        memory = 0
+        sample = []
+        for shard in self._shards:
+            keys += len(shard.counters)
+            wheel_entries += sum(len(slot_keys) for slot_keys in shard.wheel.values())
+            memory += sys.getsizeof(shard.counters) + sys.getsizeof(shard.wheel)
+            if len(sample) < 32:
+                sample.extend(islice(shard.counters, 32 - len(sample)))
+
+        # Ключи и счетчики оцениваются по выборке, без обхода всех ключей
+        key_size = sum(sys.getsizeof(key) for key in sample) / len(sample) if sample else 0
+        memory += int(keys * (key_size + _COUNTER_SIZE) + wheel_entries * _POINTER_SIZE)
+        return {
+            "keys": keys,
+            "max_keys": self.max_keys,
+            "shards": len(self._shards),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "wheel_entries": wheel_entries,
+            "approx_memory_bytes": memory,
+        }
 
-        with self._lock:
-            keys_to_remove = []
-            for key, timestamps in self._store.items():
-                # Удаляем старые временные метки
-                while timestamps and timestamps[0] < current_time - 3600:  # Старше часа
-                    timestamps.popleft()
-
-                # Если очередь пуста, помечаем ключ для удаления
-                if not timestamps:
-                    keys_to_remove.append(key)
 
-            for key in keys_to_remove:
-                del self._store[key]
+_COUNTER_SIZE = sys.getsizeof(_WindowCounter(0))
+_POINTER_SIZE = 8
 
-            self._last_cleanup = current_time
 
-    def add_request(self, key: str, timestamp: float):
-        """Добавить запрос"""
-        with self._lock:
-            self._store[key].append(timestamp)
+# Префикс ключей rate limiting в Redis
+REDIS_KEY_PREFIX = "rl:"
 
-    def get_requests_in_window(self, key: str, window_start: float) -> int:
-        """Получить количество запросов в временном окне"""
-        with self._lock:
-            if key not in self._store:
-                return 0
+# GCRA (generic cell rate algorithm): состояние ключа - одно число, TAT
+# (theoretical arrival time, мс), независимо от размера лимита. Каждый запрос
+# сдвигает TAT на interval = window / requests; запрос отклоняется, если
+# TAT ушел вперед больше чем на window (исчерпан запас в requests запросов).
+#
+# ARGV: now (мс), interval (мс), window (мс)
+# Ответ: {allowed, remaining, reset (мс, когда запас полностью восстановится),
+#         retry_after (мс, только при отказе)}
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
 
-            timestamps = self._store[key]
-            # Удаляем старые запросы
-            while timestamps and timestamps[0] < window_start:
-                timestamps.popleft()
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
 
-            return len(timestamps)
+local new_tat = tat + interval
+if new_tat - now > window then
+    return {0, 0, tat, new_tat - window - now}
+end
 
-    def get_oldest_request(self, key: str) -> Optional[float]:
-        """Получить время старейшего запроса"""
-        with self._lock:
-            if key not in self._store or not self._store[key]:
-                return None
-            return self._store[key][0]
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, math.floor((window - (new_tat - now)) / interval), new_tat, 0}
+"""
 
 
 class RateLimiter:
     """Основной класс rate limiter с поддержкой различных стратегий"""
 
     def __init__(self, redis_client=None):
-        self.redis_client = redis_client
-        self.memory_store = InMemoryStore()
+        self.memory_store = ShardedWindowStore()
         self.rules: Dict[str, RateLimitRule] = {}
+        self.attach_redis(redis_client)
 
         # Предустановленные правила
         self._setup_default_rules()
 
+    def attach_redis(self, redis_client=None) -> None:
+        """Подключить (или отключить) Redis; скрипт GCRA вызывается по SHA"""
+        self.redis_client = redis_client
+        self._gcra_script = (
+            redis_client.register_script(GCRA_SCRIPT) if redis_client is not None else None
+        )
+
     def _setup_default_rules(self):
         """Настройка правил по умолчанию"""
         self.rules = {
@@ -190,55 +367,30 @@ class RateLimiter:
     ) -> Tuple[bool, RateLimitInfo]:
         """Проверка лимита через Redis (если доступен)"""
         current_time = time.time()
-        window_start = current_time - rule.window
+        interval_ms = max(1, round(rule.window * 1000 / rule.requests))
 
         try:
-            # Lua скрипт для атомарной операции
-            lua_script = """
-            local key = KEYS[1]
-            local window_start = tonumber(ARGV[1])
-            local current_time = tonumber(ARGV[2])
-            local max_requests = tonumber(ARGV[3])
-            
-            -- Удаляем старые записи
-            redis.call('ZREMRANGEBYSCORE', key, 0, window_start)
-            
-            -- Получаем текущее количество
-            local current_count = redis.call('ZCARD', key)
-            
-            -- Проверяем лимит
-            if current_count >= max_requests then
-                local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
-                local reset_time = oldest[2] and (oldest[2] + window) or current_time
-                return {current_count, max_requests - current_count, reset_time, 1}
-            end
-            
-            -- Добавляем новую запись
-            redis.call('ZADD', key, current_time, current_time)
-            redis.call('EXPIRE', key, window + 10)
-            
-            return {current_count + 1, max_requests - current_count - 1, current_time + window, 0}
-            """
-
-            result = await self.redis_client.eval(
-                lua_script,
-                1,
-                key,
-                window_start,
-                current_time,
-                rule.requests,
-                rule.window,
+            # EVALSHA; при NOSCRIPT (перезапуск Redis) скрипт загружается заново
+            allowed, remaining, reset_ms, retry_ms = await self._gcra_script(
+                keys=[f"{REDIS_KEY_PREFIX}{key}"],
+                args=[int(current_time * 1000), interval_ms, rule.window * 1000],
             )
 
-            rate_limited = bool(result[3])
+            if allowed:
+                info = RateLimitInfo(
+                    requests_made=rule.requests - remaining,
+                    requests_remaining=remaining,
+                    reset_time=reset_ms / 1000,
+                )
+                return False, info
+
             info = RateLimitInfo(
-                requests_made=result[0],
-                requests_remaining=max(0, result[1]),
-                reset_time=result[2],
-                retry_after=int(result[2] - current_time) if rate_limited else None,
+                requests_made=rule.requests,
+                requests_remaining=0,
+                reset_time=reset_ms / 1000,
+                retry_after=max(1, math.ceil(retry_ms / 1000)),
             )
-
-            return rate_limited, info
+            return True, info
 
         except Exception as e:
             logger.warning(
@@ -250,39 +402,24 @@ class RateLimiter:
         self, key: str, rule: RateLimitRule
     ) -> Tuple[bool, RateLimitInfo]:
         """Проверка лимита через память"""
-        current_time = time.time()
-        window_start = current_time - rule.window
-
-        # Очистка старых записей
-        self.memory_store._cleanup_expired(current_time)
-
-        # Получаем количество запросов в окне
-        requests_in_window = self.memory_store.get_requests_in_window(key, window_start)
-
-        if requests_in_window >= rule.requests:
-            # Получаем время старейшего запроса для расчета reset_time
-            oldest_request = self.memory_store.get_oldest_request(key)
-            reset_time = (
-                (oldest_request + rule.window)
-                if oldest_request
-                else (current_time + rule.window)
-            )
+        allowed, estimated, reset_time, retry_after = self.memory_store.hit(
+            key, rule.requests, rule.window, time.time()
+        )
+        requests_made = min(math.ceil(estimated), rule.requests)
 
+        if not allowed:
             info = RateLimitInfo(
-                requests_made=requests_in_window,
+                requests_made=requests_made,
                 requests_remaining=0,
                 reset_time=reset_time,
-                retry_after=int(reset_time - current_time),
+                retry_after=max(1, math.ceil(retry_after)),
             )
             return True, info
 
-        # Добавляем новый запрос
-        self.memory_store.add_request(key, current_time)
-
         info = RateLimitInfo(
-            requests_made=requests_in_window + 1,
-            requests_remaining=rule.requests - requests_in_window - 1,
-            reset_time=current_time + rule.window,
+            requests_made=requests_made,
+            requests_remaining=rule.requests - requests_made,
+            reset_time=reset_time,
         )
         return False, info
 
@@ -361,11 +498,8 @@ class RateLimiter:
             "rules_count": len(self.rules),
             "rules": {key: asdict(rule) for key, rule in self.rules.items()},
             "backend": "redis" if self.redis_client else "memory",
-            "memory_keys": (
-                len(self.memory_store._store)
-                if hasattr(self.memory_store, "_store")
-                else 0
-            ),
+            "memory_keys": len(self.memory_store),
+            "memory": self.memory_store.get_stats(),
         }
 
 
@@ -384,9 +518,14 @@ def get_rate_limiter() -> RateLimiter:
 
 
 def init_rate_limiter(redis_client=None):
-    """Инициализация rate limiter с Redis клиентом"""
-    global _rate_limiter
-    _rate_limiter = RateLimiter(redis_client)
+    """
+    Инициализация rate limiter с Redis клиентом.
+
+    Глобальный экземпляр сохраняется (middleware держат ссылку на него),
+    меняется только backend.
+    """
+    rate_limiter = get_rate_limiter()
+    rate_limiter.attach_redis(redis_client)
     backend = "redis" if redis_client else "memory"
     logger.info(f"Rate limiter initialized with {backend} backend")
-    return _rate_limiter
+    return rate_limiter
@@ -0,0 +1,81 @@
+"""
+Метрики HTTP запросов: гистограммы задержек по шаблону маршрута и методу.
+
+PerformanceStage записывает каждый ответ - поиск гистограммы в словаре и
+Histogram.observe (bisect и инкременты), без блокировок. Маршрут берется из
+scope["route"] - шаблон пути (/bookings/{booking_id}), поэтому число серий
+ограничено числом маршрутов приложения, а не числом разных URL.
+"""
+from typing import Any, Dict, List, Mapping, Tuple
+
+from utils.histogram import Histogram, format_labels
+
+# Запросы, не попавшие ни в один маршрут (404 сканеров, статика)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_template(scope: Mapping[str, Any]) -> str:
+    """Шаблон пути маршрута, обработавшего запрос, или UNMATCHED_ROUTE"""
+    return getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+
+
+class RequestMetrics:
+    """Гистограммы задержек и счетчики ответов по маршрутам"""
+
+    def __init__(self):
+        # (method, route) -> задержка в секундах
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        # (method, route, status) -> количество ответов
+        self._responses: Dict[Tuple[str, str, int], int] = {}
+        self._total = Histogram()
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float) -> None:
+        histogram = self._latency.get((method, route))
+        if histogram is None:
+            histogram = self._latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+        self._total.observe(seconds)
+
+        key = (method, route, status_code)
+        self._responses[key] = self._responses.get(key, 0) + 1
+
+    def reset(self) -> None:
+        self._latency = {}
+        self._responses = {}
+        self._total = Histogram()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Перцентили задержек (мс) по всем запросам и по маршрутам"""
+        routes: Dict[str, Dict[str, Any]] = {}
+        for (method, route), histogram in sorted(self._latency.items(), key=lambda item: item[0][::-1]):
+            routes[f"{method} {route}"] = histogram.snapshot(scale=1000)
+
+        for (method, route, status_code), count in self._responses.items():
+            statuses = routes[f"{method} {route}"].setdefault("statuses", {})
+            statuses[str(status_code)] = count
+
+        return {"latency_ms": self._total.snapshot(scale=1000), "routes": routes}
+
+    def prometheus_lines(self) -> List[str]:
+        """Метрики запросов в формате Prometheus"""
+        lines = [
+            "# HELP http_request_duration_seconds HTTP request latency by route template and method",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self._latency.items()):
+            lines.extend(histogram.prometheus(
+                "http_request_duration_seconds", {"method": method, "route": route}
+            ))
+        lines.append("")
+
+        lines.append("# HELP http_responses_total HTTP responses by route template, method and status")
+        lines.append("# TYPE http_responses_total counter")
+        for (method, route, status_code), count in sorted(self._responses.items()):
+            labels = format_labels({"method": method, "route": route, "status": str(status_code)})
+            lines.append(f"http_responses_total{labels} {count}")
+        lines.append("")
+        return lines
+
+
+# Глобальные метрики запросов
+request_metrics = RequestMetrics()
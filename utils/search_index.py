@@ -0,0 +1,259 @@
+"""
+Полнотекстовый поиск через SQLite FTS5.
+
+Поиск в админке по LIKE '%q%' с lower() не использует индексы и проходит
+всю таблицу на каждое нажатие клавиши. Вместо этого поддерживаются
+теневые FTS5-индексы:
+
+- users_fts:   full_name, username, phone (+ только цифры), email
+- tariffs_fts: name
+- tickets_fts: description
+
+rowid FTS-таблицы совпадает с id исходной строки. Индексы обновляются
+триггерами SQLite, поэтому синхронны с любыми путями записи (ORM, raw SQL,
+очередь записи). Токенизатор unicode61 сам приводит к одному регистру
+кириллицу и латиницу, ё дополнительно сводится к е.
+
+Для фильтрации используется подзапрос к FTS-таблице (search_subquery) -
+SQLite сам соединяет его с основным запросом, без ограничения числа
+совпадений. search_ids нужен, когда важен порядок по релевантности.
+
+Пример:
+    from utils.search_index import search_subquery
+
+    match = search_subquery("users", "иван петр")
+    query = query.filter(Booking.user_id.in_(match))
+"""
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, column, text
+from sqlalchemy.sql.selectable import TextualSelect
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Сколько id максимум возвращает search_ids (ранжированный поиск)
+SEARCH_MAX_RESULTS = 1000
+
+_TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+
+def _fold(expr: str) -> str:
+    """SQL-выражение со сведением ё -> е (unicode61 их не объединяет)"""
+    return f"replace(replace(coalesce({expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _digits(expr: str) -> str:
+    """
+    SQL-выражение: телефон только цифрами, полностью и без кода страны
+    (последние 10 цифр), чтобы находились и 7999123..., и 999123...
+    """
+    digits = f"coalesce({expr}, '')"
+    for char in (" ", "-", "(", ")", "+", "."):
+        digits = f"replace({digits}, '{char}', '')"
+    return f"{digits} || ' ' || substr({digits}, -10)"
+
+
+# entity -> (исходная таблица, {колонка FTS: SQL-выражение над строкой new./old.})
+SEARCH_INDEXES: Dict[str, tuple] = {
+    "users": (
+        "users",
+        {
+            "full_name": _fold("{row}.full_name"),
+            "username": "coalesce({row}.username, '')",
+            "phone": "coalesce({row}.phone, '')",
+            "phone_digits": _digits("{row}.phone"),
+            "email": "coalesce({row}.email, '')",
+        },
+    ),
+    "tariffs": ("tariffs", {"name": _fold("{row}.name")}),
+    "tickets": ("tickets", {"description": _fold("{row}.description")}),
+}
+
+_available: Optional[bool] = None
+
+
+def _fts_table(entity: str) -> str:
+    return f"{entity}_fts"
+
+
+def _values(columns: Dict[str, str], row: str) -> str:
+    return ", ".join(expr.format(row=row) for expr in columns.values())
+
+
+def _source_columns(columns: Dict[str, str]) -> List[str]:
+    """Колонки исходной таблицы, которые читают выражения индекса (для UPDATE OF)"""
+    names: List[str] = []
+    for expr in columns.values():
+        for name in re.findall(r"\{row\}\.(\w+)", expr):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def ensure_search_index(session) -> bool:
+    """
+    Создает FTS-таблицы и триггеры (идемпотентно) и заполняет новые индексы.
+
+    Returns:
+        True если FTS5 доступен и индексы готовы
+    """
+    global _available
+
+    try:
+        for entity, (source, columns) in SEARCH_INDEXES.items():
+            fts = _fts_table(entity)
+            exists = session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {"name": fts},
+            ).scalar()
+
+            if not exists:
+                session.execute(
+                    text(f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, {_TOKENIZE})")
+                )
+                # Первичное заполнение из существующих строк
+                session.execute(
+                    text(
+                        f"INSERT INTO {fts}(rowid, {', '.join(columns)}) "
+                        f"SELECT id, {_values(columns, source)} FROM {source}"
+                    )
+                )
+                logger.info(f"Search index {fts} created")
+
+            column_list = ", ".join(columns)
+            session.execute(
+                text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+                    f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {_values(columns, 'new')}); "
+                    f"END"
+                )
+            )
+            session.execute(
+                text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+                    f"DELETE FROM {fts} WHERE rowid = old.id; "
+                    f"END"
+                )
+            )
+            session.execute(
+                text(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {', '.join(_source_columns(columns))} ON {source} BEGIN "
+                    f"DELETE FROM {fts} WHERE rowid = old.id; "
+                    f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {_values(columns, 'new')}); "
+                    f"END"
+                )
+            )
+
+        _available = True
+        return True
+
+    except Exception as e:
+        # Сборка SQLite без FTS5 - поиск работает через LIKE
+        logger.warning(f"FTS5 search index unavailable, falling back to LIKE: {e}")
+        _available = False
+        return False
+
+
+def rebuild_search_index(session) -> None:
+    """Полная перестройка индексов из исходных таблиц"""
+    for entity, (source, columns) in SEARCH_INDEXES.items():
+        fts = _fts_table(entity)
+        session.execute(text(f"DELETE FROM {fts}"))
+        session.execute(
+            text(
+                f"INSERT INTO {fts}(rowid, {', '.join(columns)}) "
+                f"SELECT id, {_values(columns, source)} FROM {source}"
+            )
+        )
+    logger.info("Search indexes rebuilt")
+
+
+def is_search_available(session) -> bool:
+    """Созданы ли FTS-индексы (проверка кешируется на процесс)"""
+    global _available
+
+    if _available is None:
+        try:
+            names = {
+                row[0]
+                for row in session.execute(
+                    text("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%_fts'")
+                )
+            }
+            _available = all(_fts_table(entity) in names for entity in SEARCH_INDEXES)
+        except Exception as e:
+            logger.warning(f"Could not check search index: {e}")
+            return False
+
+    return _available
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Превращает пользовательский ввод в безопасное выражение MATCH.
+
+    Каждое слово ищется по префиксу ("ив" найдет "Иван"), слова объединяются
+    через AND. Спецсимволы FTS5 отбрасываются.
+    """
+    folded = query.replace("ё", "е").replace("Ё", "Е")
+    terms = [t for t in re.split(r"[^\w]+", folded) if t]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def match_sql(entity: str, param: str) -> str:
+    """
+    SQL подзапроса id строк, совпавших с :param, для raw SQL:
+    f"t.user_id IN ({match_sql('users', 'users_match')})"
+    """
+    if entity not in SEARCH_INDEXES:
+        raise ValueError(f"Unknown search entity: {entity}")
+    fts = _fts_table(entity)
+    return f"SELECT rowid FROM {fts} WHERE {fts} MATCH :{param}"
+
+
+def search_subquery(entity: str, query: str) -> Optional[TextualSelect]:
+    """
+    Подзапрос id строк сущности, совпавших с поисковой строкой, для column.in_().
+
+    Число совпадений не ограничено - соединение выполняет SQLite.
+
+    Returns:
+        Подзапрос или None, если в строке нет слов для поиска
+    """
+    match = build_match_query(query)
+    if not match:
+        return None
+    param = f"{entity}_match"
+    return text(match_sql(entity, param)).bindparams(**{param: match}).columns(column("rowid", Integer))
+
+
+def search_ids(
+    session, entity: str, query: str, limit: int = SEARCH_MAX_RESULTS
+) -> List[int]:
+    """
+    Ищет по FTS-индексу сущности и возвращает id, отсортированные по релевантности (bm25).
+
+    Args:
+        session: Сессия SQLAlchemy
+        entity: "users", "tariffs" или "tickets"
+        query: Поисковая строка как ее ввел пользователь
+        limit: Максимум результатов
+    """
+    if entity not in SEARCH_INDEXES:
+        raise ValueError(f"Unknown search entity: {entity}")
+
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    fts = _fts_table(entity)
+    rows = session.execute(
+        text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit"),
+        {"match": match, "limit": limit},
+    ).fetchall()
+    return [row[0] for row in rows]
@@ -7,7 +7,11 @@ from datetime import datetime, timedelta
 from sqlalchemy import text, Index
 from sqlalchemy.orm import Session
 
+from utils.dashboard_rollups import average_check, get_daily_series, get_period_totals
+from utils.date_ranges import day_bounds
 from utils.logger import get_logger
+from utils.pagination import decode_cursor, encode_cursor
+from utils.search_index import build_match_query, is_search_available, match_sql
 
 logger = get_logger(__name__)
 
@@ -50,99 +54,9 @@ def get_sparkline_data(session: Session, days: int = 7) -> Dict[str, List[int]]:
 
         logger.info(f"Fetching sparkline data for {days} days: {start_date} - {end_date}")
 
-        # Один оптимизированный запрос для всех метрик
-        sparkline_query = text("""
-            WITH date_range AS (
-                SELECT DATE(:start_date, '+' || value || ' days') as date
-                FROM (
-                    SELECT 0 as value UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL
-                    SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6
-                )
-            ),
-            daily_data AS (
-                -- Пользователи по дням
-                SELECT
-                    DATE(COALESCE(u.reg_date, u.first_join_time)) as date,
-                    'users' as type,
-                    COUNT(*) as count,
-                    0 as avg_value
-                FROM users u
-                WHERE COALESCE(u.reg_date, u.first_join_time) >= :start_date
-                  AND COALESCE(u.reg_date, u.first_join_time) <= :end_date
-                GROUP BY DATE(COALESCE(u.reg_date, u.first_join_time))
-
-                UNION ALL
-
-                -- Бронирования по дням
-                SELECT
-                    DATE(b.created_at) as date,
-                    'bookings' as type,
-                    COUNT(*) as count,
-                    0 as avg_value
-                FROM bookings b
-                WHERE b.created_at >= :start_date AND b.created_at <= :end_date
-                  AND (b.cancelled IS NULL OR b.cancelled = 0)
-                GROUP BY DATE(b.created_at)
-
-                UNION ALL
-
-                -- Тикеты по дням
-                SELECT
-                    DATE(t.created_at) as date,
-                    'tickets' as type,
-                    COUNT(*) as count,
-                    0 as avg_value
-                FROM tickets t
-                WHERE t.created_at >= :start_date AND t.created_at <= :end_date
-                GROUP BY DATE(t.created_at)
-
-                UNION ALL
-
-                -- Средний чек по дням (включая опенспейс и офисы)
-                SELECT
-                    DATE(payment_date) as date,
-                    'avg_booking' as type,
-                    0 as count,
-                    CASE
-                        WHEN COUNT(*) > 0 THEN CAST(SUM(amount) AS REAL) / COUNT(*)
-                        ELSE 0
-                    END as avg_value
-                FROM (
-                    SELECT b.created_at as payment_date, b.amount
-                    FROM bookings b
-                    WHERE b.paid = 1
-                      AND (b.cancelled IS NULL OR b.cancelled = 0)
-                      AND b.created_at >= :start_date
-                      AND b.created_at <= :end_date
-                    UNION ALL
-                    SELECT oph.payment_date, oph.amount
-                    FROM openspace_payment_history oph
-                    WHERE oph.payment_date >= :start_date
-                      AND oph.payment_date <= :end_date
-                    UNION ALL
-                    SELECT ooffph.payment_date, ooffph.amount
-                    FROM office_payment_history ooffph
-                    WHERE ooffph.payment_date >= :start_date
-                      AND ooffph.payment_date <= :end_date
-                ) combined_payments
-                GROUP BY DATE(payment_date)
-            )
-            SELECT
-                dr.date,
-                COALESCE(MAX(CASE WHEN dd.type = 'users' THEN dd.count END), 0) as users_count,
-                COALESCE(MAX(CASE WHEN dd.type = 'bookings' THEN dd.count END), 0) as bookings_count,
-                COALESCE(MAX(CASE WHEN dd.type = 'tickets' THEN dd.count END), 0) as tickets_count,
-                COALESCE(MAX(CASE WHEN dd.type = 'avg_booking' THEN dd.avg_value END), 0) as avg_booking_value
-            FROM date_range dr
-            LEFT JOIN daily_data dd ON dr.date = dd.date
-            GROUP BY dr.date
-            ORDER BY dr.date
-        """)
-
-        results = session.execute(sparkline_query, {
-            'start_date': start_date.strftime('%Y-%m-%d'),
-            'end_date': end_date.strftime('%Y-%m-%d')
-        }).fetchall()
+        # Дневные агрегаты: 7 строк daily_stats вместо сканирования истории
+        first_day, end_day = day_bounds(start_date, end_date)
+        series = get_daily_series(session, first_day, end_day)
 
         # Формируем массивы данных
         users_data = []
@@ -151,13 +65,13 @@ def get_sparkline_data(session: Session, days: int = 7) -> Dict[str, List[int]]:
         avg_booking_data = []
         labels = []
 
-        for row in results:
-            users_data.append(int(row.users_count or 0))
-            bookings_data.append(int(row.bookings_count or 0))
-            tickets_data.append(int(row.tickets_count or 0))
-            avg_booking_data.append(round(float(row.avg_booking_value or 0), 2))
+        for day in series:
+            users_data.append(int(day["new_users"] or 0))
+            bookings_data.append(int(day["bookings"] or 0))
+            tickets_data.append(int(day["tickets"] or 0))
+            avg_booking_data.append(round(average_check(day), 2))
             # Форматируем метку (день недели сокращённо)
-            date_obj = datetime.strptime(row.date, '%Y-%m-%d')
+            date_obj = datetime.strptime(day["day"], '%Y-%m-%d')
             day_names = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
             labels.append(day_names[date_obj.weekday()])
 
@@ -214,6 +128,8 @@ class SQLOptimizer:
             "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
             "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
             "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+            # Индекс по выражению для фильтров по дате появления пользователя
+            "CREATE INDEX IF NOT EXISTS idx_users_joined_at ON users(COALESCE(reg_date, first_join_time))",
         ]
 
         # Индексы для таблицы tickets
@@ -224,6 +140,7 @@ class SQLOptimizer:
             "CREATE INDEX IF NOT EXISTS idx_tickets_updated_at ON tickets(updated_at)",
             "CREATE INDEX IF NOT EXISTS idx_tickets_status_created ON tickets(status, created_at)",
             "CREATE INDEX IF NOT EXISTS idx_tickets_user_status ON tickets(user_id, status)",
+            "CREATE INDEX IF NOT EXISTS idx_tickets_created_day ON tickets(date(created_at))",
         ]
 
         # Индексы для таблицы bookings
@@ -235,6 +152,7 @@ class SQLOptimizer:
             "CREATE INDEX IF NOT EXISTS idx_bookings_confirmed ON bookings(confirmed)",
             "CREATE INDEX IF NOT EXISTS idx_bookings_paid_amount ON bookings(paid, amount)",
             "CREATE INDEX IF NOT EXISTS idx_bookings_created_paid ON bookings(created_at, paid)",
+            "CREATE INDEX IF NOT EXISTS idx_bookings_created_day ON bookings(date(created_at))",
         ]
 
         # Индексы для таблицы admins
@@ -401,268 +319,101 @@ class SQLOptimizer:
                 f"previous period {prev_period_start} - {prev_period_end}"
             )
 
-            # Единый оптимизированный запрос с CTE для обоих периодов
-            stats_query = text("""
-                WITH current_period AS (
-                    SELECT
-                        -- Пользователи за текущий период
-                        COUNT(DISTINCT CASE
-                            WHEN COALESCE(u.reg_date, u.first_join_time) >= :period_start
-                            AND COALESCE(u.reg_date, u.first_join_time) < :period_end
-                            THEN u.id END) as users_count,
-
-                        -- Бронирования за текущий период
-                        COUNT(DISTINCT CASE
-                            WHEN b.created_at >= :period_start
-                            AND b.created_at < :period_end
-                            AND (b.cancelled IS NULL OR b.cancelled = 0)
-                            THEN b.id END) as bookings_count,
-
-                        -- Тикеты за текущий период
-                        COUNT(DISTINCT CASE
-                            WHEN t.created_at >= :period_start
-                            AND t.created_at < :period_end
-                            THEN t.id END) as tickets_count,
-
-                        -- Доход за текущий период
-                        COALESCE(SUM(CASE
-                            WHEN b.paid = 1
-                            AND (b.cancelled IS NULL OR b.cancelled = 0)
-                            AND b.created_at >= :period_start
-                            AND b.created_at < :period_end
-                            THEN b.amount ELSE 0 END), 0) as revenue,
-
-                        -- Средний чек за текущий период (включая опенспейс и офисы)
-                        COALESCE((
-                            SELECT
-                                CASE WHEN COUNT(*) > 0
-                                THEN CAST(SUM(amount) AS REAL) / COUNT(*)
-                                ELSE 0 END
-                            FROM (
-                                SELECT b.amount
-                                FROM bookings b
-                                WHERE b.paid = 1
-                                  AND (b.cancelled IS NULL OR b.cancelled = 0)
-                                  AND b.created_at >= :period_start
-                                  AND b.created_at < :period_end
-                                UNION ALL
-                                SELECT oph.amount
-                                FROM openspace_payment_history oph
-                                WHERE oph.payment_date >= :period_start
-                                  AND oph.payment_date < :period_end
-                                UNION ALL
-                                SELECT ooffph.amount
-                                FROM office_payment_history ooffph
-                                WHERE ooffph.payment_date >= :period_start
-                                  AND ooffph.payment_date < :period_end
-                            )
-                        ), 0) as avg_booking_value,
-
-                        -- Пользователи с хотя бы одним бронированием (для конверсии)
-                        COUNT(DISTINCT CASE
-                            WHEN COALESCE(u.reg_date, u.first_join_time) >= :period_start
-                            AND COALESCE(u.reg_date, u.first_join_time) < :period_end
-                            AND EXISTS (
-                                SELECT 1 FROM bookings b2
-                                WHERE b2.user_id = u.id
-                            )
-                            THEN u.id END) as users_with_bookings
-                    FROM users u
-                    LEFT JOIN bookings b ON u.id = b.user_id
-                    LEFT JOIN tickets t ON u.id = t.user_id
-                ),
-                previous_period AS (
-                    SELECT
-                        -- Пользователи за предыдущий период
-                        COUNT(DISTINCT CASE
-                            WHEN COALESCE(u.reg_date, u.first_join_time) >= :prev_period_start
-                            AND COALESCE(u.reg_date, u.first_join_time) < :prev_period_end
-                            THEN u.id END) as users_count,
-
-                        -- Бронирования за предыдущий период
-                        COUNT(DISTINCT CASE
-                            WHEN b.created_at >= :prev_period_start
-                            AND b.created_at < :prev_period_end
-                            AND (b.cancelled IS NULL OR b.cancelled = 0)
-                            THEN b.id END) as bookings_count,
-
-                        -- Тикеты за предыдущий период
-                        COUNT(DISTINCT CASE
-                            WHEN t.created_at >= :prev_period_start
-                            AND t.created_at < :prev_period_end
-                            THEN t.id END) as tickets_count,
-
-                        -- Доход за предыдущий период
-                        COALESCE(SUM(CASE
-                            WHEN b.paid = 1
-                            AND (b.cancelled IS NULL OR b.cancelled = 0)
-                            AND b.created_at >= :prev_period_start
-                            AND b.created_at < :prev_period_end
-                            THEN b.amount ELSE 0 END), 0) as revenue,
-
-                        -- Средний чек за предыдущий период (включая опенспейс и офисы)
-                        COALESCE((
-                            SELECT
-                                CASE WHEN COUNT(*) > 0
-                                THEN CAST(SUM(amount) AS REAL) / COUNT(*)
-                                ELSE 0 END
-                            FROM (
-                                SELECT b.amount
-                                FROM bookings b
-                                WHERE b.paid = 1
-                                  AND (b.cancelled IS NULL OR b.cancelled = 0)
-                                  AND b.created_at >= :prev_period_start
-                                  AND b.created_at < :prev_period_end
-                                UNION ALL
-                                SELECT oph.amount
-                                FROM openspace_payment_history oph
-                                WHERE oph.payment_date >= :prev_period_start
-                                  AND oph.payment_date < :prev_period_end
-                                UNION ALL
-                                SELECT ooffph.amount
-                                FROM office_payment_history ooffph
-                                WHERE ooffph.payment_date >= :prev_period_start
-                                  AND ooffph.payment_date < :prev_period_end
-                            )
-                        ), 0) as avg_booking_value,
-
-                        -- Пользователи с хотя бы одним бронированием (для конверсии)
-                        COUNT(DISTINCT CASE
-                            WHEN COALESCE(u.reg_date, u.first_join_time) >= :prev_period_start
-                            AND COALESCE(u.reg_date, u.first_join_time) < :prev_period_end
-                            AND EXISTS (
-                                SELECT 1 FROM bookings b2
-                                WHERE b2.user_id = u.id
-                            )
-                            THEN u.id END) as users_with_bookings
-                    FROM users u
-                    LEFT JOIN bookings b ON u.id = b.user_id
-                    LEFT JOIN tickets t ON u.id = t.user_id
-                ),
-                current_status AS (
-                    SELECT
-                        (SELECT COUNT(*) FROM users) as total_users,
-                        (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0)) as total_bookings,
-                        (SELECT COUNT(*) FROM tickets WHERE status != 'CLOSED') as open_tickets,
-                        (SELECT COUNT(*) FROM tariffs WHERE is_active = 1) as active_tariffs,
-                        (SELECT COUNT(*) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1) as paid_bookings,
-                        (SELECT COALESCE(SUM(amount), 0) FROM bookings WHERE (cancelled IS NULL OR cancelled = 0) AND paid = 1) as total_revenue,
-                        (SELECT COUNT(*) FROM tickets WHERE status = 'OPEN') as open_tickets_only,
-                        (SELECT COUNT(*) FROM tickets WHERE status = 'IN_PROGRESS') as in_progress_tickets,
-                        (SELECT COUNT(*) FROM tickets WHERE status = 'CLOSED') as closed_tickets,
-                        (SELECT COUNT(*) FROM notifications WHERE is_read = 0) as unread_notifications
-                )
+            # Суммы за периоды читаются из дневных агрегатов - стоимость
+            # зависит от числа дней в периоде, а не от размера истории
+            current = get_period_totals(session, *day_bounds(period_start, period_end))
+            previous = get_period_totals(session, *day_bounds(prev_period_start, prev_period_end))
+            overall = get_period_totals(session, "0000-00-00", "9999-12-31")
+
+            # Текущее состояние: небольшие выборки по индексированным колонкам
+            status_query = text("""
                 SELECT
-                    cp.users_count as current_users,
-                    cp.bookings_count as current_bookings,
-                    cp.tickets_count as current_tickets,
-                    cp.revenue as current_revenue,
-                    cp.avg_booking_value as current_avg_booking,
-                    cp.users_with_bookings as current_users_with_bookings,
-                    pp.users_count as prev_users,
-                    pp.bookings_count as prev_bookings,
-                    pp.tickets_count as prev_tickets,
-                    pp.revenue as prev_revenue,
-                    pp.avg_booking_value as prev_avg_booking,
-                    pp.users_with_bookings as prev_users_with_bookings,
-                    cs.total_users,
-                    cs.total_bookings,
-                    cs.open_tickets,
-                    cs.active_tariffs,
-                    cs.paid_bookings,
-                    cs.total_revenue,
-                    cs.open_tickets_only,
-                    cs.in_progress_tickets,
-                    cs.closed_tickets,
-                    cs.unread_notifications
-                FROM current_period cp, previous_period pp, current_status cs
+                    (SELECT COUNT(*) FROM tariffs WHERE is_active = 1) as active_tariffs,
+                    (SELECT COUNT(*) FROM tickets WHERE status = 'OPEN') as open_tickets_only,
+                    (SELECT COUNT(*) FROM tickets WHERE status = 'IN_PROGRESS') as in_progress_tickets,
+                    (SELECT COUNT(*) FROM tickets WHERE status = 'CLOSED') as closed_tickets,
+                    (SELECT COUNT(*) FROM notifications WHERE is_read = 0) as unread_notifications
             """)
+            status = session.execute(status_query).fetchone()
 
-            result = session.execute(stats_query, {
-                'period_start': period_start,
-                'period_end': period_end,
-                'prev_period_start': prev_period_start,
-                'prev_period_end': prev_period_end
-            }).fetchone()
+            if not status:
+                logger.warning("No result returned from dashboard status query")
+                raise ValueError("No data returned from dashboard status query")
 
-            if not result:
-                logger.warning("No result returned from dashboard stats comparison query")
-                raise ValueError("No data returned from dashboard stats comparison query")
+            current_avg_booking = average_check(current)
+            prev_avg_booking = average_check(previous)
 
             # Вычисляем проценты изменения
             users_change = calculate_change_percentage(
-                float(result.current_users or 0),
-                float(result.prev_users or 0)
+                float(current["new_users"]), float(previous["new_users"])
             )
             bookings_change = calculate_change_percentage(
-                float(result.current_bookings or 0),
-                float(result.prev_bookings or 0)
+                float(current["bookings"]), float(previous["bookings"])
             )
             tickets_change = calculate_change_percentage(
-                float(result.current_tickets or 0),
-                float(result.prev_tickets or 0)
+                float(current["tickets"]), float(previous["tickets"])
             )
             revenue_change = calculate_change_percentage(
-                float(result.current_revenue or 0),
-                float(result.prev_revenue or 0)
+                float(current["revenue"]), float(previous["revenue"])
             )
             avg_booking_change = calculate_change_percentage(
-                float(result.current_avg_booking or 0),
-                float(result.prev_avg_booking or 0)
+                current_avg_booking, prev_avg_booking
             )
 
             # Вычисляем конверсию (процент пользователей с бронированиями)
-            current_conversion = (float(result.current_users_with_bookings or 0) / float(result.current_users or 1)) * 100 if result.current_users else 0
-            prev_conversion = (float(result.prev_users_with_bookings or 0) / float(result.prev_users or 1)) * 100 if result.prev_users else 0
+            current_conversion = (float(current["converted_users"]) / float(current["new_users"])) * 100 if current["new_users"] else 0
+            prev_conversion = (float(previous["converted_users"]) / float(previous["new_users"])) * 100 if previous["new_users"] else 0
             conversion_change = calculate_change_percentage(current_conversion, prev_conversion)
 
+            open_tickets = int(status.open_tickets_only or 0) + int(status.in_progress_tickets or 0)
+
             # Формируем результат
             stats_data = {
                 "users": {
-                    "current_value": int(result.current_users or 0),
-                    "previous_value": int(result.prev_users or 0),
+                    "current_value": int(current["new_users"]),
+                    "previous_value": int(previous["new_users"]),
                     "change_percentage": users_change,
-                    "total": int(result.total_users or 0)
+                    "total": int(overall["new_users"])
                 },
                 "bookings": {
-                    "current_value": int(result.current_bookings or 0),
-                    "previous_value": int(result.prev_bookings or 0),
+                    "current_value": int(current["bookings"]),
+                    "previous_value": int(previous["bookings"]),
                     "change_percentage": bookings_change,
-                    "total": int(result.total_bookings or 0)
+                    "total": int(overall["bookings"])
                 },
                 "tickets": {
-                    "current_value": int(result.current_tickets or 0),
-                    "previous_value": int(result.prev_tickets or 0),
+                    "current_value": int(current["tickets"]),
+                    "previous_value": int(previous["tickets"]),
                     "change_percentage": tickets_change,
-                    "open": int(result.open_tickets or 0)
+                    "open": open_tickets
                 },
                 "revenue": {
-                    "current_value": float(result.current_revenue or 0),
-                    "previous_value": float(result.prev_revenue or 0),
+                    "current_value": float(current["revenue"]),
+                    "previous_value": float(previous["revenue"]),
                     "change_percentage": revenue_change,
-                    "total": float(result.total_revenue or 0)
+                    "total": float(overall["revenue"])
                 },
                 "average_booking_value": {
-                    "current_value": float(result.current_avg_booking or 0),
-                    "previous_value": float(result.prev_avg_booking or 0),
+                    "current_value": current_avg_booking,
+                    "previous_value": prev_avg_booking,
                     "change_percentage": avg_booking_change
                 },
                 "conversion_rate": {
                     "current_value": round(current_conversion, 1),
                     "previous_value": round(prev_conversion, 1),
                     "change_percentage": conversion_change,
-                    "users_with_bookings": int(result.current_users_with_bookings or 0)
+                    "users_with_bookings": int(current["converted_users"])
                 },
                 # Дополнительная статистика (для обратной совместимости)
-                "active_tariffs": int(result.active_tariffs or 0),
-                "paid_bookings": int(result.paid_bookings or 0),
-                "total_revenue": float(result.total_revenue or 0),
+                "active_tariffs": int(status.active_tariffs or 0),
+                "paid_bookings": int(overall["paid_bookings"]),
+                "total_revenue": float(overall["revenue"]),
                 "ticket_stats": {
-                    "open": int(result.open_tickets_only or 0),
-                    "in_progress": int(result.in_progress_tickets or 0),
-                    "closed": int(result.closed_tickets or 0)
+                    "open": int(status.open_tickets_only or 0),
+                    "in_progress": int(status.in_progress_tickets or 0),
+                    "closed": int(status.closed_tickets or 0)
                 },
-                "unread_notifications": int(result.unread_notifications or 0),
+                "unread_notifications": int(status.unread_notifications or 0),
                 "period_info": {
                     "start": period_start.isoformat(),
                     "end": period_end.isoformat(),
@@ -741,10 +492,15 @@ class SQLOptimizer:
         per_page: int = 20,
         status: str = None,
         user_query: str = None,
+        cursor: str = None,
+        include_total: bool = True,
     ) -> Dict[str, Any]:
         """
         Оптимизированный запрос тикетов с пользователями - с использованием индексов
 
+        Если передан cursor, страница выбирается keyset-условием по
+        (created_at, id) вместо OFFSET.
+
         Returns:
             Dict с тикетами и метаинформацией
         """
@@ -765,7 +521,20 @@ class SQLOptimizer:
             params = {}
 
             # Фильтрация с использованием индексов
-            if user_query and user_query.strip():
+            if user_query and user_query.strip() and is_search_available(session):
+                # Полнотекстовый поиск по имени пользователя и описанию (FTS5)
+                # (подзапросы к FTS-таблицам - без ограничения числа совпадений)
+                match = build_match_query(user_query.strip())
+                if match:
+                    where_conditions.append(
+                        f"(t.user_id IN ({match_sql('users', 'users_match')}) "
+                        f"OR t.id IN ({match_sql('tickets', 'tickets_match')}))"
+                    )
+                    params["users_match"] = match
+                    params["tickets_match"] = match
+                else:
+                    where_conditions.append("0")
+            elif user_query and user_query.strip():
                 query_stripped = user_query.strip()
                 query_lower = query_stripped.lower()
                 query_upper = query_stripped.upper()
@@ -793,32 +562,47 @@ class SQLOptimizer:
                 where_conditions.append("t.status = :status")
                 params["status"] = status.strip()
 
-            if where_conditions:
-                base_query += " WHERE " + " AND ".join(where_conditions)
-
             # Подсчет общего количества (оптимизировано)
-            count_query = f"""
-                SELECT COUNT(*) 
-                FROM tickets t
-                LEFT JOIN users u ON t.user_id = u.id
-                {" WHERE " + " AND ".join(where_conditions) if where_conditions else ""}
-            """
+            total_count = None
+            if include_total:
+                count_query = f"""
+                    SELECT COUNT(*) 
+                    FROM tickets t
+                    LEFT JOIN users u ON t.user_id = u.id
+                    {" WHERE " + " AND ".join(where_conditions) if where_conditions else ""}
+                """
+                total_count = session.execute(text(count_query), params).scalar()
+
+            # Keyset: продолжаем с последней строки предыдущей страницы
+            if cursor:
+                cursor_created_at, cursor_id = decode_cursor(cursor, 2)
+                where_conditions.append("(t.created_at, t.id) < (:cursor_created_at, :cursor_id)")
+                params["cursor_created_at"] = cursor_created_at
+                params["cursor_id"] = cursor_id
 
-            total_count = session.execute(text(count_query), params).scalar()
+            if where_conditions:
+                base_query += " WHERE " + " AND ".join(where_conditions)
 
-            # Основной запрос с сортировкой и пагинацией
+            # Основной запрос с сортировкой и пагинацией (+1 строка для has_more)
             final_query = (
                 base_query
                 + """
-                ORDER BY t.created_at DESC 
+                ORDER BY t.created_at DESC, t.id DESC
                 LIMIT :limit OFFSET :offset
             """
             )
 
-            params.update({"limit": per_page, "offset": (page - 1) * per_page})
+            params.update(
+                {"limit": per_page + 1, "offset": 0 if cursor else (page - 1) * per_page}
+            )
 
             result = session.execute(text(final_query), params).fetchall()
 
+            next_cursor = None
+            if len(result) > per_page:
+                result = result[:per_page]
+                next_cursor = encode_cursor((result[-1].created_at, result[-1].id))
+
             # Формирование результата
             enriched_tickets = []
             for row in result:
@@ -845,14 +629,17 @@ class SQLOptimizer:
                 }
                 enriched_tickets.append(ticket_item)
 
-            total_pages = (total_count + per_page - 1) // per_page
-
             return {
                 "tickets": enriched_tickets,
-                "total_count": int(total_count),
+                "total_count": int(total_count) if total_count is not None else None,
                 "page": int(page),
                 "per_page": int(per_page),
-                "total_pages": int(total_pages),
+                "total_pages": (
+                    int((total_count + per_page - 1) // per_page)
+                    if total_count is not None
+                    else None
+                ),
+                "next_cursor": next_cursor,
             }
 
         except Exception as e:
@@ -0,0 +1,145 @@
+"""
+Отзыв JWT токенов администраторов без обращений к Redis и БД на запрос.
+
+Отозванные токены (jti) и время отзыва всех токенов администратора
+хранятся в памяти процесса. Redis - общий источник для процессов:
+- auth:revoked_jti    - ZSET jti -> exp (истекшие удаляются при записи);
+- auth:revoked_admins - HASH admin_id -> время отзыва.
+
+Изменения рассылаются остальным процессам через канал инвалидаций
+CacheManager (scope "auth"). Значение передается прямо в ключе сообщения:
+"jti:<jti>:<exp>" или "admin:<admin_id>:<revoked_at>". После переподписки
+на канал состояние перечитывается из Redis целиком.
+
+Пример:
+    from utils.token_revocation import token_revocation
+
+    await token_revocation.revoke_token(jti, exp)
+    if token_revocation.is_token_revoked(jti):
+        ...
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+from utils.cache_manager import cache_manager
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+REVOKED_JTI_KEY = "auth:revoked_jti"
+REVOKED_ADMINS_KEY = "auth:revoked_admins"
+
+# Scope сообщений об отзыве в канале инвалидаций
+REVOCATION_SCOPE = "auth"
+
+
+class TokenRevocationStore:
+    """Отозванные токены и отзывы по администраторам в памяти процесса"""
+
+    def __init__(self):
+        self._revoked_jti: Dict[str, float] = {}
+        self._revoked_admins: Dict[int, float] = {}
+        self._reload_tasks: Set[asyncio.Task] = set()
+
+    def is_token_revoked(self, jti: str) -> bool:
+        exp = self._revoked_jti.get(jti)
+        return exp is not None and exp > time.time()
+
+    def is_admin_revoked(self, admin_id: int, issued_at: float) -> bool:
+        """Токен выдан раньше, чем отозваны все токены администратора"""
+        revoked_at = self._revoked_admins.get(admin_id)
+        return revoked_at is not None and issued_at < revoked_at
+
+    def _apply_token(self, jti: str, exp: float) -> None:
+        self._revoked_jti[jti] = exp
+
+    def _apply_admin(self, admin_id: int, revoked_at: float) -> None:
+        if revoked_at > self._revoked_admins.get(admin_id, 0.0):
+            self._revoked_admins[admin_id] = revoked_at
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [jti for jti, exp in self._revoked_jti.items() if exp <= now]
+        for jti in expired:
+            del self._revoked_jti[jti]
+
+    async def revoke_token(self, jti: str, exp: float) -> None:
+        """Отозвать токен до его истечения (exp - unix time)"""
+        self._prune()
+        self._apply_token(jti, exp)
+
+        client = cache_manager.redis_client
+        if client is not None:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.zadd(REVOKED_JTI_KEY, {jti: exp})
+            pipeline.zremrangebyscore(REVOKED_JTI_KEY, "-inf", time.time())
+            await pipeline.execute()
+        cache_manager.publish_invalidation_nowait(REVOCATION_SCOPE, keys=[f"jti:{jti}:{exp}"])
+
+    async def revoke_admin(self, admin_id: int, revoked_at: Optional[float] = None) -> float:
+        """Отозвать все токены администратора, выданные до revoked_at (по умолчанию - сейчас)"""
+        if revoked_at is None:
+            revoked_at = time.time()
+        self._apply_admin(admin_id, revoked_at)
+
+        client = cache_manager.redis_client
+        if client is not None:
+            await client.hset(REVOKED_ADMINS_KEY, str(admin_id), repr(revoked_at))
+        cache_manager.publish_invalidation_nowait(
+            REVOCATION_SCOPE, keys=[f"admin:{admin_id}:{revoked_at!r}"]
+        )
+        return revoked_at
+
+    async def load(self) -> None:
+        """Загрузить состояние из Redis (объединяется с уже известным)"""
+        client = cache_manager.redis_client
+        if client is None:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.zrangebyscore(REVOKED_JTI_KEY, time.time(), "+inf", withscores=True)
+            pipeline.hgetall(REVOKED_ADMINS_KEY)
+            tokens, admins = await pipeline.execute()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить отозванные токены из Redis: {e}")
+            return
+
+        self._prune()
+        for jti, exp in tokens:
+            self._apply_token(jti, float(exp))
+        for admin_id, revoked_at in admins.items():
+            self._apply_admin(int(admin_id), float(revoked_at))
+        logger.info(
+            f"Загружены отозванные токены: {len(self._revoked_jti)} jti, "
+            f"{len(self._revoked_admins)} администраторов"
+        )
+
+    def _on_invalidation(self, keys: List[str], clear: bool) -> None:
+        """Отзывы из других процессов; clear - подписка восстановлена, перечитать Redis"""
+        for key in keys:
+            kind, _, rest = key.partition(":")
+            value, _, timestamp = rest.rpartition(":")
+            try:
+                if kind == "jti":
+                    self._apply_token(value, float(timestamp))
+                elif kind == "admin":
+                    self._apply_admin(int(value), float(timestamp))
+            except ValueError:
+                logger.warning(f"Некорректное сообщение об отзыве токена: {key}")
+
+        if clear:
+            task = asyncio.get_running_loop().create_task(self.load())
+            self._reload_tasks.add(task)
+            task.add_done_callback(self._reload_tasks.discard)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "revoked_tokens": len(self._revoked_jti),
+            "revoked_admins": len(self._revoked_admins),
+        }
+
+
+# Глобальное хранилище отзывов токенов
+token_revocation = TokenRevocationStore()
+cache_manager.add_invalidation_listener(REVOCATION_SCOPE, token_revocation._on_invalidation)